@@ -0,0 +1,108 @@
+import os
+from collections import Counter
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from pydantic import BaseModel
+
+from app.core.database import get_db
+from app.core.security import require_admin
+from app.core import profiling, sharding
+from app.models.training import SessionLog
+from app.models.user import User
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+# --- SCHEMAS ---
+
+class ProfilingConfig(BaseModel):
+    rate: float = 0.0
+    routes: List[str] = []
+
+class ShardSummary(BaseModel):
+    shard: str
+    clubs: int  # clubs placed here by the directory (unlisted clubs live on "default")
+    moving: List[str]
+    users: int
+    session_logs: int
+
+class AdminUser(BaseModel):
+    id: str
+    email: Optional[str] = None
+    name: Optional[str] = None
+    role: Optional[str] = None
+    shard: str
+
+# --- PROFILES ---
+
+@router.get("/profiles")
+def list_profiles():
+    """Most recent request profiles first (in-memory index, PROFILE_KEEP entries)."""
+    return profiling.list_profiles()
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    """Download a profile as a speedscope file (open at https://www.speedscope.app)."""
+    if profiling.get_profile_summary(profile_id) is None:
+        raise HTTPException(404, "Profile not found")
+    path = profiling.profile_path(profile_id)
+    if not os.path.exists(path):
+        raise HTTPException(404, "Profile file has been removed")
+    return FileResponse(path, media_type="application/json", filename=os.path.basename(path))
+
+@router.get("/profiling", response_model=ProfilingConfig)
+def get_profiling_config():
+    return {"rate": profiling.SAMPLING.rate, "routes": profiling.SAMPLING.routes}
+
+@router.put("/profiling", response_model=ProfilingConfig)
+def update_profiling_config(config: ProfilingConfig):
+    """Profile a random fraction of traffic on the given route templates (e.g. /api/v1/programs)."""
+    try:
+        profiling.SAMPLING.configure(rate=config.rate, routes=config.routes)
+    except Exception as e:
+        raise HTTPException(400, f"Invalid route template: {e}")
+    return {"rate": profiling.SAMPLING.rate, "routes": profiling.SAMPLING.routes}
+
+# --- SHARDS ---
+# The only routes besides the global leaderboard that read every shard
+
+@router.get("/shards", response_model=List[ShardSummary])
+def list_shards(db: Session = Depends(get_db)):
+    """Clubs and row counts per shard."""
+    clubs = sharding.DIRECTORY.clubs() if sharding.SHARDS.enabled else {}
+    placed = Counter(p.shard for p in clubs.values())
+    counts = sharding.fan_out(db, lambda s: (s.query(func.count(User.id)).scalar(), s.query(func.count(SessionLog.id)).scalar()))
+    return [
+        {
+            "shard": shard,
+            "clubs": placed[shard],
+            "moving": sorted(club for club, p in clubs.items() if p.shard == shard and p.state == sharding.MOVING),
+            "users": users,
+            "session_logs": logs,
+        }
+        for shard, (users, logs) in counts.items()
+    ]
+
+@router.get("/users", response_model=List[AdminUser])
+def search_users(q: str, limit: int = 50, db: Session = Depends(get_db)):
+    """Users whose email or name starts with `q`, on every shard."""
+    limit = max(1, min(limit, 200))
+    pattern = q.replace("%", r"\%").replace("_", r"\_") + "%"
+
+    def search(s):
+        return (
+            s.query(User.id, User.email, User.name, User.role)
+            .filter((User.email.like(pattern, escape="\\")) | (User.name.like(pattern, escape="\\")))
+            .order_by(User.email)
+            .limit(limit)
+            .all()
+        )
+
+    found = [
+        {"id": u.id, "email": u.email, "name": u.name, "role": u.role, "shard": shard}
+        for shard, rows in sharding.fan_out(db, search).items()
+        for u in rows
+    ]
+    return sorted(found, key=lambda u: u["email"] or "")[:limit]
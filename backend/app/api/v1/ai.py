@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from app.core.database import get_db
+from app.core.security import get_current_user
+from app.models.user import User
+from app.services import plan_generation
+from app.services.plan_generation import PLAN_GENERATOR, PlanGenerationBusy, PlanGenerationError
+
+router = APIRouter()
+
+# --- SCHEMAS ---
+
+class SquadConstraints(BaseModel):
+    players: int = Field(ge=1, le=200)
+    courts: int = Field(ge=1, le=50)
+
+class ProgramRequest(BaseModel):
+    prompt: str = Field("", max_length=2000)
+    weeks: int = Field(4, ge=1, le=plan_generation.MAX_WEEKS)
+    player_id: Optional[str] = None  # coach generating for one of their athletes
+    squad_constraints: Optional[SquadConstraints] = None
+
+class SquadProgramRequest(SquadConstraints):
+    prompt: str = Field("", max_length=2000)
+    weeks: int = Field(4, ge=1, le=plan_generation.MAX_WEEKS)
+
+class SquadSessionRequest(SquadConstraints):
+    prompt: str = Field("", max_length=2000)
+
+# --- HELPERS ---
+
+def run_generation(db: Session, spec: dict):
+    try:
+        plan, cached = PLAN_GENERATOR.generate(db, spec)
+    except PlanGenerationBusy as exc:
+        raise HTTPException(503, str(exc), headers={"Retry-After": "5"})
+    except PlanGenerationError as exc:
+        raise HTTPException(502, str(exc))
+    return {"plan": plan, "cached": cached, "model": PLAN_GENERATOR.model.name}
+
+def require_coach(user: User):
+    if "COACH" not in (user.role or "").upper():
+        raise HTTPException(403, "Only coaches can generate squad plans")
+
+# --- ENDPOINTS ---
+# Same JSON the app's Gemini helpers produced ({title, description, sessions:[{title, items}]}),
+# so the client keeps its hydrate step and just swaps where the plan comes from.
+
+@router.post("/programs")
+def generate_program(
+    body: ProgramRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Personal program built from the athlete's profile, goals and drill history."""
+    athlete = current_user
+    if body.player_id and body.player_id != current_user.id:
+        athlete = db.query(User).filter(User.id == body.player_id, User.coach_id == current_user.id).first()
+        if athlete is None:
+            raise HTTPException(404, "Athlete not found")
+    spec = plan_generation.build_spec(
+        db, plan_generation.PROGRAM, body.prompt, player=athlete, weeks=body.weeks,
+        constraints=body.squad_constraints.model_dump() if body.squad_constraints else None,
+    )
+    return run_generation(db, spec)
+
+@router.post("/squad-programs")
+def generate_squad_program(
+    body: SquadProgramRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    require_coach(current_user)
+    spec = plan_generation.build_spec(
+        db, plan_generation.SQUAD_PROGRAM, body.prompt, weeks=body.weeks,
+        constraints={"players": body.players, "courts": body.courts},
+    )
+    return run_generation(db, spec)
+
+@router.post("/squad-sessions")
+def generate_squad_session(
+    body: SquadSessionRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """A single session adapted to the group; returns {"plan": {"items": [...]}}."""
+    require_coach(current_user)
+    spec = plan_generation.build_spec(
+        db, plan_generation.SQUAD_SESSION, body.prompt,
+        constraints={"players": body.players, "courts": body.courts},
+    )
+    return run_generation(db, spec)
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from app.core.database import get_db
+from app.core.etag import etag_response
+from app.core.security import get_current_user
+from app.models.user import User
+from app.api.v1 import auth, notifications, squads, training
+from app.services.dashboard import build_dashboard
+
+router = APIRouter()
+
+# --- SECTIONS ---
+# Each one is exactly what the app's separate call returns, so a screen can
+# switch to /dashboard without reshaping anything. name: (fn(db, user), cache seconds)
+
+PLAYER_SECTIONS = {
+    "profile": (lambda db, user: auth.read_users_me(current_user=user), 300),                   # /auth/me
+    "active_program": (lambda db, user: training.get_my_active_program(current_user=user, db=db), 120),  # /my-active-program
+    "session_logs": (lambda db, user: training.get_my_session_logs(current_user=user, db=db), 120),      # /my-session-logs
+    "programs": (lambda db, user: training.get_programs(db=db, current_user=user), 120),                 # /programs
+    "unread": (lambda db, user: notifications.get_unread_counts(db=db, current_user=user), 30),          # /notifications/unread-counts
+}
+
+COACH_SECTIONS = {
+    "profile": PLAYER_SECTIONS["profile"],
+    "athletes": (  # /my-athletes
+        lambda db, user: [training.UserResponse.model_validate(a) for a in training.get_my_athletes(current_user=user, db=db)],
+        120,
+    ),
+    "activity": (lambda db, user: training.get_coach_activity(db=db, current_user=user), 30),  # /coach/activity
+    "squads": (lambda db, user: squads.get_my_squads(db=db, current_user=user), 60),           # /squads
+    "programs": PLAYER_SECTIONS["programs"],
+    "unread": PLAYER_SECTIONS["unread"],
+}
+
+def sections_for(user: User):
+    return COACH_SECTIONS if "COACH" in (user.role or "").upper() else PLAYER_SECTIONS
+
+# --- ENDPOINTS ---
+
+@router.get("/dashboard")
+def get_dashboard(
+    request: Request,
+    fields: Optional[str] = None, # Comma separated section names, e.g. "profile,unread" (default: all)
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Everything the dashboard screen needs for this role in one response:
+    {"role", "sections": {name: data}, "errors": {name: reason}}. Sections served
+    from the cache are listed in X-Dashboard-Cached (kept out of the body so the ETag
+    only changes when the data does).
+    """
+    available = sections_for(current_user)
+    wanted = available
+    if fields:
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [n for n in names if n not in available]
+        if unknown:
+            raise HTTPException(400, f"Unknown sections {', '.join(unknown)}; choose from {', '.join(available)}")
+        wanted = {n: available[n] for n in names}
+
+    payload = build_dashboard(db, current_user, wanted)
+    cached = payload.pop("cached")
+    response = etag_response(request, payload)
+    response.headers["X-Dashboard-Cached"] = ",".join(cached)
+    return response
@@ -1,13 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
 from pydantic import BaseModel
-from app.core.database import get_db
-from app.core.security import get_current_user
-from app.models.user import User, MatchEntry, Notification
-import uuid
+from app.core.database import get_db, get_read_db
+from app.core.security import get_current_reader, get_current_user
+from app.models.user import User, MatchEntry, MATCH_FTS_COLUMNS
+from app.core.log import get_logger
+from app.services import activity_feed, match_search, match_stats, notifications
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # --- SCHEMAS ---
 
@@ -40,10 +43,28 @@ class MatchUpdate(BaseModel):
 class MatchFeedback(BaseModel):
     feedback: str
 
+class MatchSearchResult(BaseModel):
+    id: str
+    user_id: str
+    date: Optional[datetime] = None
+    event_name: Optional[str] = None
+    opponent_name: Optional[str] = None
+    score: Optional[str] = None
+    result: Optional[str] = None
+    rank: float
+    snippet: Optional[str] = None
+
 class MatchResponse(MatchCreate):
     id: str
     user_id: str
     coach_feedback: Optional[str] = None
+    outcome: Optional[str] = None
+    sets_won: Optional[int] = None
+    sets_lost: Optional[int] = None
+    games_won: Optional[int] = None
+    games_lost: Optional[int] = None
+    tiebreaks_won: Optional[int] = None
+    tiebreaks_lost: Optional[int] = None
     class Config:
         orm_mode = True
 
@@ -52,26 +73,23 @@ class MatchResponse(MatchCreate):
 def create_notification(db: Session, user_id: str, title: str, message: str, type: str, ref_id: str, related_id: str = None):
     if not user_id: return
     
-    notif = Notification(
-        id=str(uuid.uuid4()),
-        user_id=user_id,
-        title=title,
-        message=message,
-        type=type, 
-        reference_id=ref_id,
-        related_user_id=related_id # ✅ Save Player ID
-    )
-    db.add(notif)
+    # ✅ Repeats for the same match/player fold into one unread digest row
+    notifications.notify(db, user_id, title, message, type, reference_id=ref_id, related_user_id=related_id)
     db.commit()
 
 # --- ENDPOINTS ---
 
+def _require_athlete(db: Session, coach: User, player_id: str):
+    """404 unless player_id is on the coach's roster."""
+    if db.query(User.id).filter(User.id == player_id, User.coach_id == coach.id).first() is None:
+        raise HTTPException(404, "Athlete not found")
+
 @router.get("/", response_model=List[MatchResponse])
 def get_matches(
     player_id: Optional[str] = None, 
     opponent: Optional[str] = None,
-    db: Session = Depends(get_db), 
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db), 
+    current_user: User = Depends(get_current_reader)
 ):
     target_id = current_user.id
     if player_id and "COACH" in current_user.role.upper():
@@ -79,9 +97,44 @@ def get_matches(
     
     query = db.query(MatchEntry).filter(MatchEntry.user_id == target_id)
     if opponent:
-        query = query.filter(MatchEntry.opponent_name.ilike(f"%{opponent}%"))
+        # Prefix match through the full-text index instead of a leading-wildcard scan
+        query = match_search.filter_by_opponent(db, query, opponent)
     return query.order_by(MatchEntry.date.desc()).all()
 
+@router.get("/search", response_model=List[MatchSearchResult])
+def search_matches(
+    q: str,
+    player_id: Optional[str] = None,
+    scope: str = "player", # 'player' | 'roster' (coach: every athlete they coach)
+    limit: int = 20,
+    offset: int = 0,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
+):
+    is_coach = "COACH" in current_user.role.upper()
+    if is_coach and scope == "roster":
+        user_ids = [pid for (pid,) in db.query(User.id).filter(User.coach_id == current_user.id).all()]
+    elif is_coach and player_id and player_id != current_user.id:
+        _require_athlete(db, current_user, player_id)
+        user_ids = [player_id]
+    else:
+        user_ids = [current_user.id]
+
+    return match_search.search_matches(db, user_ids, q, limit=max(1, min(limit, 100)), offset=max(offset, 0))
+
+@router.get("/stats")
+def get_match_stats(
+    player_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
+):
+    """Win %, sets/games/tiebreak record, head-to-head and surface/environment/format splits."""
+    target_id = current_user.id
+    if player_id and player_id != current_user.id and "COACH" in current_user.role.upper():
+        _require_athlete(db, current_user, player_id)
+        target_id = player_id
+    return match_stats.get_player_stats(db, target_id)
+
 @router.post("/", response_model=MatchResponse)
 def create_match_log(
     match: MatchCreate, 
@@ -108,6 +161,18 @@ def create_match_log(
         reflection=match.reflection
     )
     db.add(new_match)
+    match_stats.record_match_change(db, new_match)
+    match_search.index_match(db, new_match)
+
+    # ✅ Fan out to the coach's activity feed in the same transaction
+    if "PLAYER" in current_user.role.upper() and target_id == current_user.id:
+        db.flush()
+        kind = activity_feed.MATCH_RESULT if match.score else activity_feed.MATCH_LOG
+        verb = "Logged a result" if match.score else "Scheduled a match"
+        activity_feed.publish_activity(
+            db, current_user, kind, f"{verb} vs {match.opponent_name}", new_match.id, activity_feed.match_payload(new_match)
+        )
+
     db.commit()
     db.refresh(new_match)
 
@@ -142,11 +207,23 @@ def update_match_details(
         raise HTTPException(status_code=403, detail="Not authorized")
 
     was_scheduled = match.result == 'Scheduled' or not match.score
+    stats_before = match_stats.match_contribution(match)
     
     update_data = updates.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(match, key, value)
-    
+
+    if set(update_data) & set(match_stats.SCORE_FIELDS):
+        match_stats.record_match_change(db, match, before=stats_before)
+
+    if "PLAYER" in current_user.role.upper() and was_scheduled and updates.score and match.user_id == current_user.id:
+        activity_feed.publish_activity(
+            db, current_user, activity_feed.MATCH_RESULT, f"Completed match vs {match.opponent_name}", match.id,
+            activity_feed.match_payload(match)
+        )
+
+    if set(update_data) & set(MATCH_FTS_COLUMNS):
+        match_search.index_match(db, match)
     db.commit()
     
     # ✅ NOTIFY PLAYER: If Coach updates Tactics
@@ -160,7 +237,7 @@ def update_match_details(
     if "PLAYER" in current_user.role.upper() and was_scheduled and updates.score:
         player = db.query(User).filter(User.id == current_user.id).first()
         coach_id = getattr(player, 'coach_id', None)
-        print(f"DEBUG: Player {player.name} scheduling match. Coach ID: {coach_id}")
+        logger.debug("match.completed", extra={"match_id": match.id, "player_id": player.id, "coach_id": coach_id})
         
         if coach_id:
              background_tasks.add_task(
@@ -186,6 +263,7 @@ def update_coach_feedback(
         raise HTTPException(status_code=404, detail="Match not found")
         
     match.coach_feedback = feedback.feedback
+    match_search.index_match(db, match)
     db.commit()
     
     # ✅ NOTIFY PLAYER: Coach leaves feedback
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from datetime import datetime
-from typing import List
-from pydantic import BaseModel
+from typing import List, Optional
+from pydantic import BaseModel, field_validator
 
-from app.core.database import get_db
-from app.core.security import get_current_user
-from app.models.user import User, Notification
+from app.core.database import get_db, get_read_db
+from app.core.security import get_current_reader, get_current_user
+from app.models.user import User, Notification, ArchivedNotification
+from app.services.notifications import last_activity
 
 router = APIRouter()
 
@@ -18,18 +20,43 @@ class NotificationSchema(BaseModel):
     reference_id: str | None
     is_read: bool
     created_at: datetime
+    count: int = 1  # ✅ digest: how many notifications this row stands for
+    last_at: datetime | None = None
+
+    @field_validator("count", mode="before")
+    @classmethod
+    def default_count(cls, value):
+        return value or 1  # rows from before digests
 
     class Config:
         orm_mode = True
 
+class ArchivedNotificationSchema(NotificationSchema):
+    is_read: bool = True
+    archived_at: datetime | None = None
+
 @router.get("/", response_model=List[NotificationSchema])
 def get_my_notifications(
-    db: Session = Depends(get_db), 
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db), 
+    current_user: User = Depends(get_current_reader)
 ):
+    # Digest rows move to the top when they're bumped; old read ones live in /archive
     return db.query(Notification).filter(
         Notification.user_id == current_user.id
-    ).order_by(Notification.created_at.desc()).all()
+    ).order_by(last_activity().desc()).all()
+
+@router.get("/archive", response_model=List[ArchivedNotificationSchema])
+def get_archived_notifications(
+    before: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
+):
+    """Read notifications moved out by the retention job, newest first (page with ?before=<created_at>)."""
+    query = db.query(ArchivedNotification).filter(ArchivedNotification.user_id == current_user.id)
+    if before is not None:
+        query = query.filter(ArchivedNotification.created_at < before)
+    return query.order_by(ArchivedNotification.created_at.desc()).limit(limit).all()
 
 @router.post("/{notif_id}/read")
 def mark_as_read(
@@ -51,24 +78,23 @@ def mark_as_read(
 
 @router.get("/unread-counts")
 def get_unread_counts(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
 ):
-    # Fetch all unread notifications for this user (Coach)
-    unread = db.query(Notification).filter(
+    # One grouped query; a digest row counts for every notification it holds
+    rows = db.query(
+        Notification.related_user_id, func.sum(func.coalesce(Notification.count, 1))
+    ).filter(
         Notification.user_id == current_user.id,
         Notification.is_read == False
-    ).all()
+    ).group_by(Notification.related_user_id).all()
     
-    total = len(unread)
+    total = sum(int(n) for _, n in rows)
     
     # Group by Player (related_user_id)
-    player_counts = {}
-    for n in unread:
-        if n.related_user_id:
-            player_counts[n.related_user_id] = player_counts.get(n.related_user_id, 0) + 1
+    player_counts = {player_id: int(n) for player_id, n in rows if player_id}
             
     return {
         "total": total,
         "players": player_counts # { "player_id_1": 2, "player_id_2": 5 }
-    }
\ No newline at end of file
+    }
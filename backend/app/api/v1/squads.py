@@ -1,14 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import List, Optional
 from pydantic import BaseModel
 from sqlalchemy import func, desc
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
-from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.database import get_db, get_read_db
+from app.core.security import get_current_reader, get_current_user
 from app.models.user import User, Squad, SquadMember
-from app.models.training import SquadAttendance, SessionLog, DrillPerformance, Program
+from app.models.training import SquadAttendance, SessionLog, DrillPerformance, Program, ProgramAssignment
+from app.services import attendance, session_archive
+from app.services.program_templates import program_drill_counts
+from app.services.xp import period_bounds
 
 router = APIRouter()
 
@@ -51,11 +54,51 @@ class LeaderboardEntry(BaseModel):
     drill_score: int
 
 
-# --- 2. ENDPOINTS ---
+# --- 2. HELPERS ---
 
-@router.get("", response_model=List[SquadResponse])
-def get_my_squads(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    squads = db.query(Squad).filter(Squad.coach_id == current_user.id).all()
+def load_squad_program_progress(db: Session, squad_ids: List[str]):
+    """
+    Batch-loads, for every member of the given squads, the latest program
+    assigned to them for that squad plus session/completion counts.
+    Returns {(squad_id, player_id): (program, completed, total)} using a
+    constant number of queries regardless of squad or roster size.
+    """
+    if not squad_ids:
+        return {}
+
+    rows = (
+        db.query(Program, ProgramAssignment.player_id)
+        .join(ProgramAssignment, ProgramAssignment.program_id == Program.id)
+        .filter(Program.squad_id.in_(squad_ids))
+        .order_by(Program.created_at)
+        .all()
+    )
+    # Ascending order -> later rows overwrite, leaving the latest program
+    latest = {(program.squad_id, player_id): program for program, player_id in rows}
+    program_ids = {program.id for program in latest.values()}
+    if not program_ids:
+        return {}
+
+    total_sessions = program_drill_counts(db, program_ids)
+    completed = {
+        (program_id, player_id): n
+        for program_id, player_id, n in db.query(SessionLog.program_id, SessionLog.player_id, func.count(SessionLog.id))
+        .filter(SessionLog.program_id.in_(program_ids))
+        .group_by(SessionLog.program_id, SessionLog.player_id)
+        .all()
+    }
+    for key, n in session_archive.program_session_counts(db, {pid for _, pid in latest}, program_ids).items():
+        completed[key] = completed.get(key, 0) + n
+
+    return {
+        key: (program, completed.get((program.id, key[1]), 0), total_sessions.get(program.id, 0))
+        for key, program in latest.items()
+    }
+
+
+def serialize_squads(db: Session, squads: List[Squad]) -> List[dict]:
+    """SquadResponse dicts (members + players loaded) - shared by /squads and /sync."""
+    progress = load_squad_program_progress(db, [s.id for s in squads])
     
     results = []
     for s in squads:
@@ -67,24 +110,13 @@ def get_my_squads(db: Session = Depends(get_db), current_user: User = Depends(ge
         for member in s.members:
             if not member.player: continue
 
-            # Find the latest program for this player THAT IS ASSIGNED TO THIS SQUAD
-            player_squad_program = db.query(Program).filter(
-                Program.player_id == member.player.id,
-                Program.squad_id == s.id
-            ).order_by(Program.created_at.desc()).first()
-
-            if player_squad_program:
+            # Latest program for this player THAT IS ASSIGNED TO THIS SQUAD
+            entry = progress.get((s.id, member.player.id))
+            if entry:
+                player_squad_program, completed_count, total_sessions = entry
                 program_name_display = player_squad_program.title # Use the title from one of them
                 
-                # Calculate progress for this specific player & program
-                total_sessions = len(player_squad_program.sessions) if player_squad_program.sessions else 0
-                
                 if total_sessions > 0:
-                    completed_count = db.query(SessionLog).filter(
-                        SessionLog.program_id == player_squad_program.id,
-                        SessionLog.player_id == member.player.id
-                    ).count()
-                    
                     pct = (completed_count / total_sessions) * 100
                     total_member_completion += min(pct, 100)
                     active_members_count += 1
@@ -105,32 +137,35 @@ def get_my_squads(db: Session = Depends(get_db), current_user: User = Depends(ge
 
     return results
 
+
+# --- 3. ENDPOINTS ---
+
+@router.get("", response_model=List[SquadResponse])
+def get_my_squads(db: Session = Depends(get_read_db), current_user: User = Depends(get_current_reader)):
+    squads = (
+        db.query(Squad)
+        .options(selectinload(Squad.members).joinedload(SquadMember.player))
+        .filter(Squad.coach_id == current_user.id)
+        .all()
+    )
+    return serialize_squads(db, squads)
+
 @router.get("/{squad_id}/progress", response_model=List[MemberProgress])
-def get_squad_program_progress(squad_id: str, db: Session = Depends(get_db)):
+def get_squad_program_progress(squad_id: str, db: Session = Depends(get_read_db)):
     # Get Members
-    members = db.query(SquadMember).filter(SquadMember.squad_id == squad_id).all()
+    members = db.query(SquadMember).options(joinedload(SquadMember.player)).filter(SquadMember.squad_id == squad_id).all()
+    progress = load_squad_program_progress(db, [squad_id])
     
     progress_list = []
     for m in members:
         if not m.player: continue
         
-        # ✅ Fetch the SPECIFIC program assigned to this player for this squad
-        player_program = db.query(Program).filter(
-            Program.player_id == m.player_id,
-            Program.squad_id == squad_id
-        ).order_by(Program.created_at.desc()).first()
-
-        completed = 0
-        total = 0
-        pct = 0
-
-        if player_program:
-            total = len(player_program.sessions) if player_program.sessions else 0
+        # ✅ The SPECIFIC program assigned to this player for this squad
+        completed, total, pct = 0, 0, 0
+        entry = progress.get((squad_id, m.player_id))
+        if entry:
+            _, completed, total = entry
             if total > 0:
-                completed = db.query(SessionLog).filter(
-                    SessionLog.program_id == player_program.id,
-                    SessionLog.player_id == m.player_id
-                ).count()
                 pct = int((completed / total) * 100)
 
         progress_list.append({
@@ -144,7 +179,7 @@ def get_squad_program_progress(squad_id: str, db: Session = Depends(get_db)):
     return progress_list
 
 @router.get("/athletes")
-def get_my_athletes(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_my_athletes(db: Session = Depends(get_read_db), current_user: User = Depends(get_current_reader)):
     athletes = db.query(User).filter(User.coach_id == current_user.id).all()
     return athletes
 
@@ -173,7 +208,7 @@ def create_squad(squad_data: SquadCreate, db: Session = Depends(get_db), current
     return {"status": "success", "squad_id": new_squad.id}
 
 @router.get("/{squad_id}/members")
-def get_squad_members(squad_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_squad_members(squad_id: str, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_reader)):
     squad = db.query(Squad).filter(Squad.id == squad_id).first()
     if not squad: raise HTTPException(404, "Squad not found")
     return [m.player for m in squad.members if m.player]
@@ -199,27 +234,92 @@ def remove_member(squad_id: str, player_id: str, db: Session = Depends(get_db)):
 def mark_attendance(squad_id: str, data: AttendanceRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     if current_user.role != "COACH": raise HTTPException(403, "Only coaches can mark attendance.")
     date_val = data.date or datetime.utcnow()
-    count = 0
-    for pid in data.player_ids:
-        existing = db.query(SquadAttendance).filter(SquadAttendance.squad_id == squad_id, SquadAttendance.player_id == pid, func.date(SquadAttendance.date) == date_val.date()).first()
-        if not existing:
-            rec = SquadAttendance(squad_id=squad_id, player_id=pid, date=date_val)
-            db.add(rec)
-            count += 1
+    player_ids = list(dict.fromkeys(pid for pid in data.player_ids if pid))
+    if not player_ids:
+        return {"status": "success", "marked": 0}
+    already = {pid for (pid,) in db.query(SquadAttendance.player_id).filter(SquadAttendance.squad_id == squad_id, SquadAttendance.player_id.in_(player_ids), func.date(SquadAttendance.date) == date_val.date()).all()}
+    new_ids = [pid for pid in player_ids if pid not in already]
+    db.add_all([SquadAttendance(squad_id=squad_id, player_id=pid, date=date_val) for pid in new_ids])
+    # ✅ Day bitmaps for the analytics endpoints, in the same transaction
+    attendance.record_attendance(db, squad_id, player_ids, date_val.date())
     db.commit()
-    return {"status": "success", "marked": count}
+    return {"status": "success", "marked": len(new_ids)}
+
+def attendance_range(start: Optional[date], end: Optional[date]):
+    """[start, end) - defaults to the current season up to and including today."""
+    season_start, _ = period_bounds("season")
+    start = start or season_start.date()
+    end = end + timedelta(days=1) if end else datetime.utcnow().date() + timedelta(days=1)
+    if end <= start: raise HTTPException(400, "end must not be before start")
+    if (end - start).days > 3 * 366: raise HTTPException(400, "Range is limited to three years")
+    return start, end
+
+def load_squad_for_attendance(db: Session, squad_id: str, current_user: User):
+    squad = db.query(Squad).filter(Squad.id == squad_id).first()
+    if not squad: raise HTTPException(404, "Squad not found")
+    members = db.query(User.id, User.name).join(SquadMember, SquadMember.player_id == User.id).filter(SquadMember.squad_id == squad_id).all()
+    if squad.coach_id != current_user.id and current_user.id not in {m.id for m in members}:
+        raise HTTPException(403, "Not a member of this squad")
+    return squad, members
+
+@router.get("/{squad_id}/attendance/stats")
+def get_attendance_stats(squad_id: str, start: Optional[date] = None, end: Optional[date] = None, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_reader)):
+    """Per-member attendance rate and current/longest streak (in squad sessions) for a date range."""
+    start, end = attendance_range(start, end)
+    squad, members = load_squad_for_attendance(db, squad_id, current_user)
+    bitmaps = attendance.load_range(db, squad_id, start, end)
+    stats = attendance.attendance_stats(bitmaps, [m.id for m in members], start)
+    rows = [{"player_id": m.id, "name": m.name, **stats["players"][m.id]} for m in members]
+    rows.sort(key=lambda r: (-r["rate"], -r["current_streak"], r["name"] or ""))
+    total_attended = sum(r["attended"] for r in rows)
+    return {
+        "squad_id": squad_id,
+        "start": start,
+        "end": end - timedelta(days=1),
+        "sessions": stats["sessions"],
+        "last_session": stats["last_session"],
+        "squad_rate": round(total_attended / (stats["sessions"] * len(rows)), 3) if stats["sessions"] and rows else 0.0,
+        "members": rows,
+    }
+
+@router.get("/{squad_id}/attendance/heatmap")
+def get_attendance_heatmap(squad_id: str, start: Optional[date] = None, end: Optional[date] = None, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_reader)):
+    """
+    Head count per day from `start`: counts[i] is the day start + i (0 on days
+    the squad didn't meet, see session_days). Current members only.
+    """
+    start, end = attendance_range(start, end)
+    squad, members = load_squad_for_attendance(db, squad_id, current_user)
+    member_ids = [m.id for m in members]
+    bitmaps = attendance.load_range(db, squad_id, start, end, player_ids=member_ids)
+    length = (end - start).days
+    squad_bits = bitmaps.get(attendance.SQUAD_DAYS, 0)
+    return {
+        "squad_id": squad_id,
+        "start": start,
+        "end": end - timedelta(days=1),
+        "members": len(member_ids),
+        "counts": attendance.day_counts((bitmaps[pid] for pid in member_ids if pid in bitmaps), length),
+        "session_days": [start + timedelta(days=i) for i in range(length) if squad_bits >> i & 1],
+    }
 
 @router.get("/{squad_id}/leaderboard", response_model=List[LeaderboardEntry])
-def get_squad_leaderboard(squad_id: str, db: Session = Depends(get_db)):
-    members = db.query(SquadMember).filter(SquadMember.squad_id == squad_id).all()
-    if not members: return []
+def get_squad_leaderboard(squad_id: str, db: Session = Depends(get_read_db)):
+    members = db.query(SquadMember).options(joinedload(SquadMember.player)).filter(SquadMember.squad_id == squad_id).all()
+    players = [m.player for m in members if m.player]
+    if not players: return []
+    player_ids = [p.id for p in players]
+
+    # One grouped query per stat instead of three queries per member
+    attended = attendance.lifetime_counts(db, squad_id, player_ids)  # popcount over day bitmaps
+    sessions = dict(db.query(SessionLog.player_id, func.count(SessionLog.id)).filter(SessionLog.player_id.in_(player_ids)).group_by(SessionLog.player_id).all())
+    drill_scores = dict(db.query(SessionLog.player_id, func.sum(DrillPerformance.achieved_value)).join(SessionLog, DrillPerformance.session_log_id == SessionLog.id).filter(SessionLog.player_id.in_(player_ids)).group_by(SessionLog.player_id).all())
+    for player_id, (archived_sessions, archived_score) in session_archive.player_totals(db, player_ids).items():
+        sessions[player_id] = sessions.get(player_id, 0) + archived_sessions
+        drill_scores[player_id] = (drill_scores.get(player_id) or 0) + archived_score
+
     stats = []
-    for m in members:
-        player = m.player
-        if not player: continue
-        attendance_count = db.query(SquadAttendance).filter(SquadAttendance.squad_id == squad_id, SquadAttendance.player_id == player.id).count()
-        sessions_completed = db.query(SessionLog).filter(SessionLog.player_id == player.id).count()
-        drill_score = db.query(func.sum(DrillPerformance.achieved_value)).join(SessionLog, DrillPerformance.session_log_id == SessionLog.id).filter(SessionLog.player_id == player.id).scalar() or 0
-        stats.append({"player_id": player.id, "name": player.name, "avatar": None, "attendance_count": attendance_count, "sessions_completed": sessions_completed, "drill_score": int(drill_score)})
+    for player in players:
+        stats.append({"player_id": player.id, "name": player.name, "avatar": None, "attendance_count": attended.get(player.id, 0), "sessions_completed": sessions.get(player.id, 0), "drill_score": int(drill_scores.get(player.id) or 0)})
     stats.sort(key=lambda x: x['sessions_completed'], reverse=True)
-    return stats
\ No newline at end of file
+    return stats
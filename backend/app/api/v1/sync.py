@@ -0,0 +1,124 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import Optional
+
+from app.core.database import get_read_db
+from app.core.security import get_current_reader
+from app.core.sharding import CURRENT_PLACEMENT
+from app.models.training import Drill, Program, ProgramAssignment, SessionLog
+from app.models.user import User, MatchEntry, Notification, Squad, SquadMember
+from app.api.v1.training import UserResponse, enrich_logs_with_names, serialize_programs
+from app.api.v1.matches import MatchResponse
+from app.api.v1.squads import serialize_squads
+from app.api.v1.notifications import NotificationSchema
+from app.services import sync
+
+router = APIRouter()
+
+# --- LOADERS ---
+# Each takes the changed ids for one collection and returns {id: payload} for
+# the ones the user can still see, in the same shape as the collection's own
+# endpoint. Anything missing from the result is sent as a tombstone.
+
+def load_programs(db: Session, user: User, ids):
+    query = db.query(Program).filter(Program.id.in_(ids))
+    if "COACH" in user.role.upper():
+        programs = query.filter(Program.creator_id == user.id).all()
+    else:
+        programs = (
+            query.join(ProgramAssignment, Program.id == ProgramAssignment.program_id)
+            .filter(ProgramAssignment.player_id == user.id)
+            .all()
+        )
+    return {p["id"]: p for p in serialize_programs(db, programs, user)}
+
+def load_session_logs(db: Session, user: User, ids):
+    logs = (
+        db.query(SessionLog)
+        .options(joinedload(SessionLog.drill_performances))
+        .filter(SessionLog.id.in_(ids), SessionLog.player_id == user.id)
+        .all()
+    )
+    return {log.id: log for log in enrich_logs_with_names(logs, db)}
+
+def load_matches(db: Session, user: User, ids):
+    matches = db.query(MatchEntry).filter(MatchEntry.id.in_(ids), MatchEntry.user_id == user.id).all()
+    return {m.id: MatchResponse.model_validate(m, from_attributes=True) for m in matches}
+
+def load_notifications(db: Session, user: User, ids):
+    notifs = db.query(Notification).filter(Notification.id.in_(ids), Notification.user_id == user.id).all()
+    return {n.id: NotificationSchema.model_validate(n, from_attributes=True) for n in notifs}
+
+def load_squads(db: Session, user: User, ids):
+    squads = (
+        db.query(Squad)
+        .options(selectinload(Squad.members).joinedload(SquadMember.player))
+        .filter(Squad.id.in_(ids))
+        .all()
+    )
+    visible = [s for s in squads if s.coach_id == user.id or any(m.player_id == user.id for m in s.members)]
+    return {s["id"]: s for s in serialize_squads(db, visible)}
+
+def load_profile(db: Session, user: User, ids):
+    return {user.id: UserResponse.model_validate(user)} if user.id in ids else {}
+
+def load_drills(db: Session, user: User, ids):
+    return {d.id: d for d in db.query(Drill).filter(Drill.id.in_(ids)).all()}
+
+LOADERS = {
+    "programs": load_programs,
+    "session_logs": load_session_logs,
+    "matches": load_matches,
+    "notifications": load_notifications,
+    "squads": load_squads,
+    "profile": load_profile,
+    "drills": load_drills,
+}
+
+# --- ENDPOINTS ---
+
+@router.get("/sync")
+def sync_changes(
+    since: Optional[str] = None,
+    limit: int = 500,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
+):
+    """
+    Everything that changed for this user since `since`, across collections:
+    {collection: {"upserts": [...], "deletes": [ids]}}. Pass `next` back as
+    `since`; keep calling while `has_more`. With no token the client gets
+    `reset: true` plus a token to start from after its full fetch.
+    """
+    epoch = CURRENT_PLACEMENT.get().moves
+
+    def reset():
+        return {"reset": True, "changes": {}, "next": sync.encode_token(sync.latest_seq(db, current_user.id), epoch), "has_more": False}
+
+    if not since:
+        return reset()
+    try:
+        since_seq, since_epoch = sync.decode_token(since)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid sync token")
+    if since_epoch != epoch:
+        # The club has moved to another shard since: its change log started over there
+        return reset()
+    if sync.is_expired(db, since_seq):
+        # Offline for longer than SYNC_RETENTION_DAYS: the changes it missed are gone
+        return reset()
+
+    changes, last_seq, has_more = sync.read_changes(db, current_user.id, since_seq, limit=limit)
+    payload = {}
+    for entity, ops in changes.items():
+        loader = LOADERS.get(entity)
+        if loader is None:
+            continue
+        upsert_ids = [entity_id for entity_id, op in ops.items() if op == sync.UPSERT]
+        found = loader(db, current_user, upsert_ids) if upsert_ids else {}
+        payload[entity] = {
+            "upserts": list(found.values()),
+            # Explicit tombstones, plus anything this user can no longer see
+            "deletes": [entity_id for entity_id in ops if entity_id not in found],
+        }
+    return {"reset": False, "changes": payload, "next": sync.encode_token(last_seq, epoch), "has_more": has_more}
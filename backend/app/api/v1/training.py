@@ -1,17 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session, joinedload 
 from sqlalchemy import func, desc
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 from datetime import datetime
+import json
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.training import Drill, Program, ProgramAssignment, ProgramSession, SessionLog, DrillPerformance, generate_id
 from app.models.user import User, SquadMember
-from app.core.security import get_current_user
+from app.core.security import get_current_reader, get_current_user
+from app.core.log import get_logger
+from app.core.etag import etag_response
+from app.services import activity_feed, session_archive, xp as xp_ledger
+from app.services.drill_search import DRILL_INDEX
+from app.services.leaderboard import SCOPES, leaderboard_view
+from app.services.program_templates import (
+    schedule_from_sessions, get_or_create_template, load_program_schedules, program_schedule_stats,
+)
 
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # =======================
 # 1. PYDANTIC SCHEMAS
@@ -42,6 +52,9 @@ class ProgramCreateSchema(BaseModel):
 class ProgramStatusUpdate(BaseModel):
     status: str 
 
+class ScheduleUpdateSchema(BaseModel):
+    sessions: List[SessionSchema]
+
 # --- Session Logging Schemas ---
 class DrillPerformanceCreate(BaseModel):
     drill_id: str
@@ -63,6 +76,13 @@ class SessionLogCreate(BaseModel):
     notes: Optional[str] = None
     drill_performances: List[DrillPerformanceCreate] = []
 
+class SessionLogBatchItem(SessionLogCreate):
+    client_id: Optional[str] = None # Echoed back so the app can clear its offline queue
+    date_completed: Optional[datetime] = None # When it was actually played (offline uploads)
+
+class SessionLogBatchCreate(BaseModel):
+    sessions: List[SessionLogBatchItem]
+
 class SessionLogSchema(SessionLogCreate):
     id: str
     date_completed: datetime 
@@ -101,9 +121,9 @@ def enrich_logs_with_names(logs: List[SessionLog], db: Session) -> List[SessionL
     if not logs:
         return []
 
-    # 1. Fetch all drills for lookup
-    all_drills = db.query(Drill).all()
-    drill_map = {d.id: d.name for d in all_drills}
+    # 1. Fetch only the drills these logs reference
+    drill_ids = {perf.drill_id for log in logs for perf in log.drill_performances if perf.drill_id}
+    drill_map = dict(db.query(Drill.id, Drill.name).filter(Drill.id.in_(drill_ids)).all()) if drill_ids else {}
 
     # 2. Convert and Enrich
     results = []
@@ -122,6 +142,114 @@ def enrich_logs_with_names(logs: List[SessionLog], db: Session) -> List[SessionL
     
     return results
 
+def serialize_programs(db: Session, programs, current_user: User):
+    """The /programs list shape for these programs, as seen by current_user (also used by /sync)."""
+    is_coach = "COACH" in current_user.role.upper()
+    program_ids = [p.id for p in programs]
+    if not program_ids:
+        return []
+
+    # Batch-load every relation once instead of querying per program (N+1)
+    my_status, my_overrides = {}, {}
+    if not is_coach:
+        my_rows = (
+            db.query(ProgramAssignment.program_id, ProgramAssignment.status, ProgramAssignment.template_id)
+            .filter(ProgramAssignment.program_id.in_(program_ids), ProgramAssignment.player_id == current_user.id)
+            .all()
+        )
+        my_status = {program_id: a_status for program_id, a_status, _ in my_rows}
+        my_overrides = {program_id: tid for program_id, _, tid in my_rows if tid}
+
+    assignments_by_program = {pid: [] for pid in program_ids}
+    assignment_rows = (
+        db.query(ProgramAssignment.program_id, ProgramAssignment.player_id, ProgramAssignment.status, ProgramAssignment.template_id, User.name)
+        .outerjoin(User, User.id == ProgramAssignment.player_id)
+        .filter(ProgramAssignment.program_id.in_(program_ids))
+        .all()
+    )
+    for program_id, player_id, a_status, override_id, player_name in assignment_rows:
+        assignments_by_program[program_id].append({
+            "id": player_id,
+            "name": player_name or "Unknown",
+            "status": a_status,
+            "custom_schedule": override_id is not None
+        })
+
+    creator_ids = {p.creator_id for p in programs if p.creator_id}
+    creator_names = dict(db.query(User.id, User.name).filter(User.id.in_(creator_ids)).all()) if creator_ids else {}
+
+    # Shared templates come from the in-process cache; legacy programs from program_sessions
+    schedules = load_program_schedules(db, programs, overrides=my_overrides)
+
+    results = []
+    for p in programs:
+        # Determine Status (Overall)
+        status = "ACTIVE" if is_coach else my_status.get(p.id, "PENDING")
+        creator_name = creator_names.get(p.creator_id) or "System"
+        created_at_val = getattr(p, "created_at", None) or "2023-01-01T00:00:00Z"
+
+        results.append({
+            "id": p.id,
+            "title": p.title,
+            "description": p.description,
+            "coach_name": creator_name,
+            "status": status,
+            "created_at": created_at_val,
+            # ✅ NEW: Explicitly return these fields
+            "program_type": getattr(p, "program_type", "PLAYER_PLAN"), 
+            "squad_id": getattr(p, "squad_id", None),
+            "assigned_to": assignments_by_program[p.id],
+            "schedule": schedules[p.id]
+        })
+    return results
+
+MAX_SESSION_BATCH = 100
+
+def xp_for_session(session_data: SessionLogCreate) -> int:
+    return (session_data.duration_minutes or 0) * 10
+
+def build_session_logs(db: Session, player: User, items) -> List[SessionLog]:
+    """
+    Adds SessionLog + DrillPerformance rows (ids assigned up front, so the
+    flush writes each table with one multi-row INSERT) and the coach feed
+    entries for them. No commit and no XP - callers apply one increment.
+    """
+    now = datetime.utcnow()
+    drill_ids = {perf.drill_id for item in items for perf in item.drill_performances if perf.drill_id}
+    drill_names = dict(db.query(Drill.id, Drill.name).filter(Drill.id.in_(drill_ids)).all()) if drill_ids else {}
+
+    logs, perfs = [], []
+    for item in items:
+        log = SessionLog(
+            id=generate_id(),
+            player_id=player.id,
+            program_id=item.program_id,
+            session_id=item.session_id,
+            duration_minutes=item.duration_minutes,
+            rpe=item.rpe,
+            notes=item.notes,
+            date_completed=getattr(item, "date_completed", None) or now
+        )
+        log_perfs = [
+            DrillPerformance(
+                id=generate_id(),
+                session_log_id=log.id,
+                drill_id=perf.drill_id,
+                outcome=perf.outcome,
+                achieved_value=perf.achieved_value
+            )
+            for perf in item.drill_performances
+        ]
+        logs.append(log)
+        perfs.extend(log_perfs)
+        activity_feed.publish_activity(
+            db, player, activity_feed.SESSION_LOG, "Logged a training session", log.id,
+            activity_feed.session_log_payload(db, log, log_perfs, drill_names), created_at=log.date_completed
+        )
+    db.add_all(logs)
+    db.add_all(perfs)
+    return logs
+
 # =======================
 # 3. ENDPOINTS
 # =======================
@@ -143,13 +271,35 @@ def seed_drills(db: Session = Depends(get_db)):
     return {"message": "Database seeded!"}
 
 @router.get("/drills")
-def get_drills(db: Session = Depends(get_db)):
+def get_drills(db: Session = Depends(get_read_db)):
     return db.query(Drill).all()
 
+@router.get("/drills/search")
+def search_drills(
+    q: str = "",
+    category: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    is_premium: Optional[bool] = None,
+    limit: int = 20,
+    offset: int = 0,
+    # Primary on purpose: searches are served from memory, and the rare
+    # (re)build feeds the process-wide index that create_drill adds to - built
+    # from a lagging replica it would drop just-created drills until the next resync
+    db: Session = Depends(get_db)
+):
+    """Typeahead + faceted drill search served from the in-memory index."""
+    DRILL_INDEX.ensure_fresh(db)
+    return DRILL_INDEX.search(
+        q,
+        filters={"category": category, "difficulty": difficulty, "is_premium": is_premium},
+        limit=max(1, min(limit, 100)),
+        offset=max(offset, 0)
+    )
+
 @router.get("/programs")
 def get_programs(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
 ):
     try:
         # Fetch logic
@@ -163,66 +313,86 @@ def get_programs(
                 .all()
             )
         
-        results = []
-        for p in programs:
-            # Determine Status (Overall)
-            status = "PENDING"
-            if "COACH" in current_user.role.upper():
-                status = "ACTIVE"
-            else:
-                assignment = db.query(ProgramAssignment).filter(
-                    ProgramAssignment.program_id == p.id,
-                    ProgramAssignment.player_id == current_user.id
-                ).first()
-                if assignment:
-                    status = assignment.status
-
-            # Fetch Relations With Status Details
-            assignments = db.query(ProgramAssignment).filter(ProgramAssignment.program_id == p.id).all()
-            assignments_data = []
-            for a in assignments:
-                player = db.query(User).filter(User.id == a.player_id).first()
-                assignments_data.append({
-                    "id": a.player_id,
-                    "name": player.name if player else "Unknown",
-                    "status": a.status 
-                })
-
-            creator_name = "System"
-            try:
-                creator = db.query(User).filter(User.id == p.creator_id).first()
-                if creator: creator_name = creator.name
-            except: pass
-
-            sessions = db.query(ProgramSession).filter(ProgramSession.program_id == p.id).order_by(ProgramSession.day_order).all()
-            created_at_val = getattr(p, "created_at", None) or "2023-01-01T00:00:00Z"
-
-            results.append({
-                "id": p.id,
-                "title": p.title,
-                "description": p.description,
-                "coach_name": creator_name,
-                "status": status,
-                "created_at": created_at_val,
-                # ✅ NEW: Explicitly return these fields
-                "program_type": getattr(p, "program_type", "PLAYER_PLAN"), 
-                "squad_id": getattr(p, "squad_id", None),
-                "assigned_to": assignments_data,
-                "schedule": [
-                    {
-                        "day_order": s.day_order,
-                        "drill_id": s.drill_id,
-                        "drill_name": s.drill_name,
-                        "duration_minutes": s.duration_minutes,
-                        "notes": s.notes,
-                        "target_value": s.target_value,
-                        "target_prompt": s.target_prompt
-                    } for s in sessions
-                ]
-            })
-        return results
-    except Exception as e:
-        print(f"Error fetching programs: {e}")
+        return serialize_programs(db, programs, current_user)
+    except Exception:
+        logger.exception("programs.fetch_failed", extra={"user_id": current_user.id})
+        raise HTTPException(status_code=500, detail="Could not load programs")
+
+@router.get("/programs/summary")
+def get_program_summaries(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
+):
+    """
+    The list screens' view of /programs: no schedules or assignee arrays, just
+    per-program counts aggregated in SQL. Open one with GET /programs/{id}.
+    """
+    is_coach = "COACH" in current_user.role.upper()
+    query = db.query(Program, User.name).outerjoin(User, User.id == Program.creator_id)
+    my_status, my_overrides = {}, {}
+    if is_coach:
+        rows = query.filter(Program.creator_id == current_user.id).all()
+    else:
+        rows = (
+            query.add_columns(ProgramAssignment.status, ProgramAssignment.template_id)
+            .join(ProgramAssignment, Program.id == ProgramAssignment.program_id)
+            .filter(ProgramAssignment.player_id == current_user.id)
+            .all()
+        )
+        my_status = {r[0].id: r[2] for r in rows}
+        my_overrides = {r[0].id: r[3] for r in rows if r[3]}
+    programs = [r[0] for r in rows]
+    creator_names = {r[0].id: r[1] for r in rows}
+    if not programs:
+        return []
+
+    stats = program_schedule_stats(db, programs, overrides=my_overrides)
+    status_counts = {p.id: {} for p in programs}
+    breakdown = (
+        db.query(ProgramAssignment.program_id, ProgramAssignment.status, func.count(ProgramAssignment.id))
+        .filter(ProgramAssignment.program_id.in_(list(status_counts)))
+        .group_by(ProgramAssignment.program_id, ProgramAssignment.status)
+        .all()
+    )
+    for program_id, a_status, count in breakdown:
+        status_counts[program_id][a_status or "UNKNOWN"] = count
+
+    return [
+        {
+            "id": p.id,
+            "title": p.title,
+            "description": p.description,
+            "coach_name": creator_names.get(p.id) or "System",
+            "status": "ACTIVE" if is_coach else my_status.get(p.id, "PENDING"),
+            "created_at": p.created_at or "2023-01-01T00:00:00Z",
+            "program_type": p.program_type or "PLAYER_PLAN",
+            "squad_id": p.squad_id,
+            "custom_schedule": p.id in my_overrides,
+            **stats[p.id],
+            "assignee_count": sum(status_counts[p.id].values()),
+            "status_counts": status_counts[p.id],
+        }
+        for p in programs
+    ]
+
+@router.get("/programs/{program_id}")
+def get_program(
+    program_id: str,
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
+):
+    """One program in the /programs shape (schedule + assignees), with a strong ETag."""
+    program = db.query(Program).filter(Program.id == program_id).first()
+    if program and program.creator_id != current_user.id:
+        assigned = db.query(ProgramAssignment.id).filter(
+            ProgramAssignment.program_id == program_id, ProgramAssignment.player_id == current_user.id
+        ).first()
+        if not assigned:
+            program = None
+    if not program:
+        raise HTTPException(status_code=404, detail="Program not found")
+    return etag_response(request, serialize_programs(db, [program], current_user)[0])
 
 @router.post("/programs")
 def create_program(
@@ -231,9 +401,12 @@ def create_program(
     current_user: User = Depends(get_current_user)
 ):
     try:
-        print(f"📝 CREATING PROGRAM: {program_in.title} (Type: {program_in.program_type})")
+        logger.info("program.create", extra={"title": program_in.title, "program_type": program_in.program_type})
+
+        # 1. Sessions & Drills -> shared content-hashed template (stored once per distinct schedule)
+        template_id = get_or_create_template(db, schedule_from_sessions(program_in.sessions))
 
-        # 1. Create the Program Record
+        # 2. Create the Program Record
         new_program = Program(
             title=program_in.title,
             description=program_in.description,
@@ -241,32 +414,16 @@ def create_program(
             created_at=datetime.utcnow(),
             # ✅ Ensure these fields are saved
             program_type=program_in.program_type, 
-            squad_id=program_in.squad_id
+            squad_id=program_in.squad_id,
+            template_id=template_id
         )
         db.add(new_program)
-        db.commit()
-        db.refresh(new_program)
-
-        # 2. Add Sessions & Drills
-        for sess in program_in.sessions:
-            for drill in sess.drills: 
-                db_session = ProgramSession(
-                    program_id=new_program.id,
-                    day_order=sess.day,
-                    drill_id=drill.drill_id,
-                    drill_name=drill.drill_name,
-                    duration_minutes=drill.duration,
-                    notes=drill.notes or "",
-                    target_value=drill.target_value,
-                    target_prompt=drill.target_prompt
-                )
-                db.add(db_session)
+        db.flush()
 
         # 3. Handle Assignments
         # ✅ CRITICAL FIX: Only create assignments if it is a PLAYER_PLAN.
         # SQUAD_SESSIONs are owned by the coach and do NOT generate invites.
         if program_in.program_type == "PLAYER_PLAN":
-            print("   -> Generating Player Assignments...")
             raw_targets = program_in.assigned_to
             final_player_ids = set()
 
@@ -300,23 +457,22 @@ def create_program(
                     assigned_at=datetime.utcnow()
                 )
                 db.add(assignment)
+            logger.debug("program.assignments", extra={"program_id": new_program.id, "players": len(final_player_ids)})
         else:
-            print("   -> SQUAD_SESSION: Skipping assignments (Coach Only)")
+            logger.debug("program.assignments_skipped", extra={"program_id": new_program.id, "reason": "SQUAD_SESSION"})
 
         db.commit()
         return {"status": "success", "program_id": new_program.id}
 
     except Exception as e:
         db.rollback() 
-        print(f"CRITICAL ERROR in create_program: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("program.create_failed", extra={"user_id": current_user.id})
         raise HTTPException(status_code=500, detail=f"Server Error: {str(e)}")
 
 @router.get("/my-active-program")
 def get_my_active_program(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     assignment = db.query(ProgramAssignment).filter(
         ProgramAssignment.player_id == current_user.id,
@@ -329,9 +485,8 @@ def get_my_active_program(
     program = db.query(Program).filter(Program.id == assignment.program_id).first()
     if not program: return None
 
-    sessions_data = db.query(ProgramSession).filter(
-        ProgramSession.program_id == program.id
-    ).order_by(ProgramSession.day_order).all()
+    overrides = {program.id: assignment.template_id} if assignment.template_id else None
+    sessions_data = load_program_schedules(db, [program], overrides=overrides)[program.id]
 
     coach = db.query(User).filter(User.id == assignment.coach_id).first()
     
@@ -359,12 +514,69 @@ def update_program_status(
     if not assignment:
         raise HTTPException(404, "Assignment not found")
 
+    was_active = (assignment.status or "").upper() == "ACTIVE"
     assignment.status = status_update.status
+
+    if not was_active and (status_update.status or "").upper() == "ACTIVE":
+        program = db.query(Program).filter(Program.id == program_id).first()
+        title = program.title if program else "a program"
+        activity_feed.publish_activity(
+            db, current_user, activity_feed.PROGRAM_ACCEPTED, f"Accepted {title}", program_id,
+            {"program_id": program_id, "program_title": title}
+        )
+
     db.commit()
     return {"status": "success", "new_status": assignment.status}
 
+@router.put("/programs/{program_id}/players/{player_id}/schedule")
+def override_player_schedule(
+    program_id: str,
+    player_id: str,
+    schedule: ScheduleUpdateSchema,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Copy-on-write: give one player their own schedule without touching the shared template."""
+    program = db.query(Program).filter(Program.id == program_id, Program.creator_id == current_user.id).first()
+    if not program:
+        raise HTTPException(404, "Program not found")
+    assignment = db.query(ProgramAssignment).filter(
+        ProgramAssignment.program_id == program_id,
+        ProgramAssignment.player_id == player_id
+    ).first()
+    if not assignment:
+        raise HTTPException(404, "Assignment not found")
+
+    template_id = get_or_create_template(db, schedule_from_sessions(schedule.sessions))
+    # Writing the program's own schedule back just drops the override
+    assignment.template_id = None if template_id == program.template_id else template_id
+    db.commit()
+    return {"status": "success", "template_id": template_id, "custom_schedule": assignment.template_id is not None}
+
+@router.delete("/programs/{program_id}/players/{player_id}/schedule")
+def reset_player_schedule(
+    program_id: str,
+    player_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    assignment = (
+        db.query(ProgramAssignment)
+        .join(Program, Program.id == ProgramAssignment.program_id)
+        .filter(
+            ProgramAssignment.program_id == program_id,
+            ProgramAssignment.player_id == player_id,
+            Program.creator_id == current_user.id
+        ).first()
+    )
+    if not assignment:
+        raise HTTPException(404, "Assignment not found")
+    assignment.template_id = None
+    db.commit()
+    return {"status": "success", "custom_schedule": False}
+
 @router.get("/my-athletes", response_model=List[UserResponse])
-def get_my_athletes(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_my_athletes(current_user: User = Depends(get_current_reader), db: Session = Depends(get_read_db)):
     if current_user.role != "COACH": return []
     return db.query(User).filter(User.coach_id == current_user.id).all()
 
@@ -374,53 +586,66 @@ def create_session_log(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    print(f"👉 RECEIVING SESSION ID: {session_data.session_id}")
-    print(f"👉 DRILLS: {len(session_data.drill_performances)}")
-
-    # 1. Create Log
-    new_log = SessionLog(
-        player_id=current_user.id,
-        program_id=session_data.program_id,
-        session_id=session_data.session_id,
-        duration_minutes=session_data.duration_minutes,
-        rpe=session_data.rpe,
-        notes=session_data.notes,
-        date_completed=datetime.utcnow()
-    )
-    db.add(new_log)
-    db.commit()
-    db.refresh(new_log)
-    
-    # 2. Add Performances
-    for perf in session_data.drill_performances:
-        db_perf = DrillPerformance(
-            session_log_id=new_log.id,
-            drill_id=perf.drill_id,
-            outcome=perf.outcome,
-            achieved_value=perf.achieved_value
-        )
-        db.add(db_perf)
-
-    # 3. Update XP
-    xp_earned = (session_data.duration_minutes or 0) * 10
-    current_user.xp = (current_user.xp or 0) + xp_earned
+    # Log + performances + feed entry + XP in one transaction
+    (new_log,) = build_session_logs(db, current_user, [session_data])
+    xp_earned = xp_ledger.award_xp(db, current_user, [(xp_for_session(session_data), xp_ledger.SESSION_LOG, new_log.id)])
     
     db.commit()
-    print("✅ SAVED")
+    logger.info("session_log.create", extra={
+        "log_id": new_log.id, "session_id": session_data.session_id,
+        "drills": len(session_data.drill_performances), "xp_earned": xp_earned
+    })
     return {"status": "success", "log_id": new_log.id, "xp_earned": xp_earned}
 
+@router.post("/sessions/batch")
+def create_session_logs_batch(
+    batch: SessionLogBatchCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Upload a queue of offline sessions: one transaction, one XP increment, per-item results."""
+    if len(batch.sessions) > MAX_SESSION_BATCH:
+        raise HTTPException(400, f"Too many sessions in one batch (max {MAX_SESSION_BATCH}).")
+
+    results, valid = [], []
+    for index, item in enumerate(batch.sessions):
+        if item.duration_minutes < 0 or not (0 <= item.rpe <= 10):
+            results.append({"index": index, "client_id": item.client_id, "status": "rejected", "error": "duration_minutes must be >= 0 and rpe 0-10"})
+            continue
+        valid.append((index, item))
+        results.append(None)
+
+    logs = build_session_logs(db, current_user, [item for _, item in valid])
+    awards = []
+    for (index, item), log in zip(valid, logs):
+        xp = xp_for_session(item)
+        awards.append((xp, xp_ledger.SESSION_LOG, log.id))
+        results[index] = {"index": index, "client_id": item.client_id, "status": "created", "log_id": log.id, "xp_earned": xp}
+    # One ledger row per session, one increment on the cached total
+    xp_total = xp_ledger.award_xp(db, current_user, awards)
+
+    db.commit()
+    logger.info("session_log.batch_create", extra={"sessions_created": len(logs), "rejected": len(batch.sessions) - len(logs), "xp_earned": xp_total})
+    return {"status": "success", "created": len(logs), "xp_earned": xp_total, "xp": current_user.xp, "results": results}
+
 @router.get("/my-profile", response_model=UserResponse)
-def get_my_profile(current_user: User = Depends(get_current_user)):
+def get_my_profile(current_user: User = Depends(get_current_reader)):
     return current_user
 
 @router.get("/my-session-logs", response_model=List[SessionLogSchema])
-def get_my_session_logs(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_my_session_logs(current_user: User = Depends(get_current_reader), db: Session = Depends(get_read_db)):
     # Fetch logs with joined drills
     logs = db.query(SessionLog).options(joinedload(SessionLog.drill_performances)).filter(SessionLog.player_id == current_user.id).order_by(desc(SessionLog.date_completed)).all()
+    logs = session_archive.with_archived_logs(db, current_user.id, logs)  # + seasons moved to the cold archive
     
     # Enrich with Drill Names using helper
     return enrich_logs_with_names(logs, db)
 
+@router.get("/my-xp")
+def get_my_xp(current_user: User = Depends(get_current_reader), db: Session = Depends(get_read_db)):
+    """Total XP plus this week / month / season and the latest ledger entries."""
+    return xp_ledger.xp_summary(db, current_user)
+
 @router.put("/my-profile")
 def update_my_profile(profile_data: UserUpdateSchema, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     current_user.goals = ",".join(profile_data.goals) 
@@ -428,54 +653,84 @@ def update_my_profile(profile_data: UserUpdateSchema, current_user: User = Depen
     return {"status": "success", "goals": current_user.goals}
 
 @router.get("/leaderboard")
-def get_leaderboard(db: Session = Depends(get_db)):
-    return []
+def get_leaderboard(
+    scope: str = "global", # 'global' | 'coach' | 'squad' | 'level'
+    scope_id: Optional[str] = None,
+    limit: int = 10,
+    around: int = 2,
+    # Primary on purpose: ranks come from the in-memory boards, and a board
+    # built from a lagging replica would miss XP deltas already applied to the
+    # other boards (they only self-correct after LEADERBOARD_TTL_SECONDS)
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Top-K for the scope plus the caller's rank with `around` neighbours either side."""
+    if scope not in SCOPES:
+        raise HTTPException(400, f"scope must be one of {', '.join(SCOPES)}")
+    if scope == "coach" and not scope_id:
+        scope_id = current_user.id if "COACH" in current_user.role.upper() else current_user.coach_id
+    elif scope == "level" and not scope_id:
+        scope_id = current_user.level
+    elif scope == "squad" and not scope_id:
+        raise HTTPException(400, "scope_id (squad id) is required for squad leaderboards")
+    if scope != "global" and not scope_id:
+        return {"scope": scope, "scope_id": None, "total": 0, "top": [], "me": None, "neighbours": []}
+
+    return leaderboard_view(
+        db, scope, scope_id or "", current_user,
+        limit=max(1, min(limit, 100)), around=max(0, min(around, 25))
+    )
 
 @router.get("/athletes/{player_id}/logs", response_model=List[SessionLogSchema])
 def get_player_logs(
     player_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     if current_user.role != "COACH":
         raise HTTPException(403, "Only coaches can view athlete logs.")
     
     logs = db.query(SessionLog).options(joinedload(SessionLog.drill_performances)).filter(SessionLog.player_id == player_id).order_by(desc(SessionLog.date_completed)).all()
+    logs = session_archive.with_archived_logs(db, player_id, logs)
     
     return enrich_logs_with_names(logs, db)
 
 @router.get("/coach/activity")
 def get_coach_activity(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
 ):
+    """Latest 20 athlete session logs (with player_name), served from the materialized feed."""
     if current_user.role != "COACH":
         return []
-    
-    players = db.query(User).filter(User.coach_id == current_user.id).all()
-    player_ids = [p.id for p in players]
-    
-    if not player_ids:
-        return []
 
-    logs = db.query(SessionLog).options(joinedload(SessionLog.drill_performances)).filter(SessionLog.player_id.in_(player_ids)).order_by(desc(SessionLog.date_completed)).limit(20).all()
-    
-    # Enrich with Drill Names first
-    enriched_logs = enrich_logs_with_names(logs, db)
-    
-    # Add Player Names (Need to return dicts, not Pydantic models here since schema doesn't have player_name)
+    entries, _ = activity_feed.read_feed(db, current_user.id, limit=20, types=[activity_feed.SESSION_LOG])
     results = []
-    for log_model, original_log in zip(enriched_logs, logs):
-        player = next((p for p in players if p.id == original_log.player_id), None)
-        player_name = player.name if player else "Unknown Athlete"
-        
-        # Convert back to dict to add extra field
-        log_dict = log_model.model_dump()
-        log_dict['player_name'] = player_name
+    for entry in entries:
+        log_dict = json.loads(entry.data) if entry.data else {}
+        log_dict['player_name'] = entry.player_name or "Unknown Athlete"
         results.append(log_dict)
-
     return results
 
+@router.get("/coach/feed")
+def get_coach_feed(
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    types: Optional[str] = None, # Comma separated, e.g. "SESSION_LOG,MATCH_RESULT"
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_reader)
+):
+    if current_user.role != "COACH":
+        raise HTTPException(403, "Only coaches have an activity feed.")
+    try:
+        entries, next_cursor = activity_feed.read_feed(
+            db, current_user.id, limit=limit, cursor=cursor,
+            types=[t for t in types.split(",") if t] if types else None
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+    return {"items": [activity_feed.entry_to_dict(e) for e in entries], "next_cursor": next_cursor}
+
 @router.post("/drills")
 def create_drill(
     drill_data: DrillCreate,
@@ -495,13 +750,14 @@ def create_drill(
     db.add(new_drill)
     db.commit()
     db.refresh(new_drill)
+    DRILL_INDEX.add(new_drill)
     return new_drill
 
 @router.get("/sessions")
 def get_session_logs(
     user_id: Optional[str] = None, # ✅ Allow filtering by specific user ID
-    db: Session = Depends(get_db), 
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db), 
+    current_user: User = Depends(get_current_reader)
 ):
     target_id = current_user.id
     
@@ -0,0 +1,36 @@
+"""
+Background job helpers.
+
+Periodic jobs (Idempotency-Key purge, XP ledger compaction) run their DB
+work in the threadpool. On shutdown the app cancels them; `run_job` lets a
+call that is already running finish - and commit its batch - before the
+cancellation goes through, so stopping a worker never cuts a batch in half.
+
+Config (env):
+    JOB_DRAIN_SECONDS   how long shutdown waits for a running job, default 30
+"""
+import asyncio
+import os
+
+from starlette.concurrency import run_in_threadpool
+
+DRAIN_SECONDS = float(os.getenv("JOB_DRAIN_SECONDS", "30"))
+
+
+async def run_job(fn, *args):
+    """run_in_threadpool, but a cancel waits for the call in progress to return."""
+    job = asyncio.ensure_future(run_in_threadpool(fn, *args))
+    try:
+        return await asyncio.shield(job)
+    except asyncio.CancelledError:
+        await asyncio.wait([job], timeout=DRAIN_SECONDS)
+        raise
+
+
+async def stop_jobs(tasks):
+    """Cancel background tasks and wait until each has let go."""
+    tasks = [t for t in tasks if t is not None]
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,42 @@
+"""
+Strong ETags for JSON reads.
+
+The tag is a hash of the exact bytes we would send, so two responses share a
+tag only if they are byte-identical (a strong validator). A client that sends
+the tag back in If-None-Match gets an empty 304 instead of the body.
+"""
+import hashlib
+import json
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+CACHE_CONTROL = "private, no-cache"  # per-user data; always revalidate, never serve blind
+
+
+def render_json(payload) -> bytes:
+    # Same settings as JSONResponse, so the hash covers exactly the bytes on the wire
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """RFC 9110: weak comparison for If-None-Match, `*` matches anything."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+
+def etag_response(request: Request, payload) -> Response:
+    body = render_json(payload)
+    etag = etag_for(body)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if if_none_match(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
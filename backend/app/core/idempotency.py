@@ -0,0 +1,279 @@
+"""
+Idempotency-Key support for retried writes.
+
+Mobile clients on flaky networks retry POSTs whose response they never saw.
+For the routes in IDEMPOTENT_ROUTES a request carrying `Idempotency-Key`
+is executed at most once per (user, key):
+
+  * first request   -> key row inserted as IN_PROGRESS, request runs, the
+                       response (status, headers, body) is stored on the row
+  * retry           -> stored response replayed (`Idempotent-Replayed: true`),
+                       the endpoint is not called again
+  * concurrent dup  -> the unique (principal, key) insert fails, so it waits
+                       for the first one to finish and then replays it
+  * same key, different body or different route -> 422
+
+5xx responses are not stored (the key is released so a retry can run).
+Keys expire after IDEMPOTENCY_TTL_HOURS and are purged by a background task
+(or `python manage.py purge-idempotency-keys`).
+
+Config (env):
+    IDEMPOTENCY_TTL_HOURS       how long a key is remembered, default 24
+    IDEMPOTENCY_WAIT_SECONDS    how long a duplicate waits for the original, default 10
+    IDEMPOTENCY_PURGE_SECONDS   background purge interval, default 600
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import compile_path
+
+from app.core.background import run_job
+from app.core.database import SessionLocal
+from app.core.log import get_logger
+from app.core.security import bearer_claims
+from app.models.idempotency import IdempotencyKey
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+IDEMPOTENT_ROUTES = (
+    ("POST", "/api/v1/sessions"),
+    ("POST", "/api/v1/sessions/batch"),
+    ("POST", "/api/v1/matches/"),
+    ("POST", "/api/v1/programs"),
+)
+TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+PURGE_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_SECONDS", "600"))
+# An IN_PROGRESS row older than this belongs to a crashed worker and may be taken over
+STALE_AFTER = timedelta(seconds=float(os.getenv("IDEMPOTENCY_STALE_SECONDS", "300")))
+PURGE_BATCH = 1000
+
+IN_PROGRESS, COMPLETED = "IN_PROGRESS", "COMPLETED"
+
+logger = get_logger(__name__)
+
+
+# =======================
+# 1. KEY STORE
+# =======================
+
+def claim_key(principal: str, key: str, method: str, path: str, request_hash: str, session_factory=SessionLocal):
+    """
+    Try to take ownership of (principal, key).
+    Returns ("claimed", None) or ("exists", row snapshot dict).
+    """
+    db = session_factory()
+    try:
+        now = datetime.utcnow()
+        row = db.query(IdempotencyKey).filter(IdempotencyKey.principal == principal, IdempotencyKey.key == key).first()
+        if row is not None:
+            reclaim = row.expires_at <= now or (row.state == IN_PROGRESS and row.created_at <= now - STALE_AFTER)
+            if not reclaim:
+                return "exists", _snapshot(row)
+            db.delete(row)
+            db.flush()
+        db.add(IdempotencyKey(
+            principal=principal, key=key, method=method, path=path, request_hash=request_hash,
+            state=IN_PROGRESS, created_at=now, expires_at=now + TTL,
+        ))
+        db.commit()
+        return "claimed", None
+    except IntegrityError:
+        # Lost the race to a concurrent duplicate
+        db.rollback()
+        row = db.query(IdempotencyKey).filter(IdempotencyKey.principal == principal, IdempotencyKey.key == key).first()
+        return "exists", _snapshot(row) if row else None
+    finally:
+        db.close()
+
+
+def load_key(principal: str, key: str, session_factory=SessionLocal) -> Optional[dict]:
+    db = session_factory()
+    try:
+        row = db.query(IdempotencyKey).filter(IdempotencyKey.principal == principal, IdempotencyKey.key == key).first()
+        return _snapshot(row) if row else None
+    finally:
+        db.close()
+
+
+def complete_key(principal: str, key: str, status: int, headers, body: bytes, session_factory=SessionLocal):
+    db = session_factory()
+    try:
+        db.query(IdempotencyKey).filter(IdempotencyKey.principal == principal, IdempotencyKey.key == key).update({
+            IdempotencyKey.state: COMPLETED,
+            IdempotencyKey.response_status: status,
+            IdempotencyKey.response_headers: json.dumps([[n.decode("latin-1"), v.decode("latin-1")] for n, v in headers]),
+            IdempotencyKey.response_body: body.decode("utf-8"),
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def release_key(principal: str, key: str, session_factory=SessionLocal):
+    db = session_factory()
+    try:
+        db.query(IdempotencyKey).filter(
+            IdempotencyKey.principal == principal, IdempotencyKey.key == key, IdempotencyKey.state == IN_PROGRESS
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def purge_expired_keys(session_factory=SessionLocal, batch_size: int = PURGE_BATCH) -> int:
+    """Delete expired keys in small batches (short write locks). Returns rows deleted."""
+    deleted = 0
+    db = session_factory()
+    try:
+        while True:
+            ids = [i for (i,) in db.query(IdempotencyKey.id).filter(IdempotencyKey.expires_at <= datetime.utcnow()).limit(batch_size).all()]
+            if not ids:
+                return deleted
+            db.query(IdempotencyKey).filter(IdempotencyKey.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            deleted += len(ids)
+    finally:
+        db.close()
+
+
+def _snapshot(row: IdempotencyKey) -> dict:
+    return {
+        "state": row.state,
+        "method": row.method,
+        "path": row.path,
+        "request_hash": row.request_hash,
+        "status": row.response_status,
+        "headers": row.response_headers,
+        "body": row.response_body,
+    }
+
+
+async def purge_loop(interval: float = PURGE_SECONDS):
+    """Background task started by the app: purge expired keys every `interval` seconds."""
+    while True:
+        try:
+            deleted = await run_job(purge_expired_keys)
+            if deleted:
+                logger.info("idempotency.purged", extra={"deleted": deleted})
+        except Exception:
+            logger.exception("idempotency.purge_failed")
+        await asyncio.sleep(interval)
+
+
+# =======================
+# 2. ASGI MIDDLEWARE
+# =======================
+
+def _principal(scope) -> str:
+    return str((bearer_claims(scope) or {}).get("sub") or "anonymous")
+
+
+async def _send_json(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _replay(send, snapshot: dict):
+    headers = [(n.encode("latin-1"), v.encode("latin-1")) for n, v in json.loads(snapshot["headers"] or "[]")]
+    headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": snapshot["status"], "headers": headers})
+    await send({"type": "http.response.body", "body": (snapshot["body"] or "").encode("utf-8")})
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, routes=IDEMPOTENT_ROUTES, session_factory=SessionLocal):
+        self.app = app
+        self.routes = [(method, compile_path(path)[0]) for method, path in routes]
+        self.session_factory = session_factory
+
+    def _applies(self, scope) -> bool:
+        return any(scope["method"] == method and pattern.match(scope["path"]) for method, pattern in self.routes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._applies(scope):
+            await self.app(scope, receive, send)
+            return
+        key = next((v.decode("latin-1") for n, v in scope.get("headers", []) if n == IDEMPOTENCY_HEADER), None)
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > 255:
+            await _send_json(send, 400, "Idempotency-Key must be at most 255 characters")
+            return
+
+        # Read the body once (to fingerprint it) and hand it back to the app unchanged
+        chunks, more = [], True
+        while more:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more = message.get("more_body", False)
+        body = b"".join(chunks)
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        principal = _principal(scope)
+        request_hash = hashlib.sha256(body).hexdigest()
+        outcome, snapshot = await run_in_threadpool(
+            claim_key, principal, key, scope["method"], scope["path"], request_hash, self.session_factory
+        )
+
+        if outcome == "exists":
+            deadline = time.monotonic() + WAIT_SECONDS
+            while snapshot is not None and snapshot["state"] == IN_PROGRESS and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                snapshot = await run_in_threadpool(load_key, principal, key, self.session_factory)
+            if snapshot is None:
+                # The original failed and released the key - run this one normally
+                await self(scope, replay_receive, send)
+                return
+            if (snapshot["method"], snapshot["path"]) != (scope["method"], scope["path"]):
+                # Same key on another route: its stored response is not this request's answer
+                await _send_json(send, 422, f"Idempotency-Key was already used for {snapshot['method']} {snapshot['path']}")
+                return
+            if snapshot["request_hash"] != request_hash:
+                await _send_json(send, 422, "Idempotency-Key was already used with a different request body")
+                return
+            if snapshot["state"] == IN_PROGRESS:
+                await _send_json(send, 409, "A request with this Idempotency-Key is still being processed")
+                return
+            logger.info("idempotency.replayed", extra={"path": scope["path"]})
+            await _replay(send, snapshot)
+            return
+
+        # We own the key: run the endpoint and capture its response
+        status_holder, headers_holder, body_parts = [500], [[]], []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                headers_holder[0] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                body_parts.append(message.get("body", b""))
+            await send(message)
+
+        completed = False
+        try:
+            await self.app(scope, replay_receive, send_wrapper)
+            if status_holder[0] < 500:
+                await run_in_threadpool(
+                    complete_key, principal, key, status_holder[0], headers_holder[0], b"".join(body_parts), self.session_factory
+                )
+                completed = True
+        finally:
+            if not completed:
+                await run_in_threadpool(release_key, principal, key, self.session_factory)
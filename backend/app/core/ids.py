@@ -0,0 +1,163 @@
+"""
+Time-ordered ids.
+
+`new_id()` returns a UUIDv7 (RFC 9562): 48 bits of Unix milliseconds, a
+12-bit counter that keeps ids from one process strictly increasing within a
+millisecond, then 62 random bits. It is still a 36-character UUID string, so
+clients and URLs don't change, but new rows land at the right-hand edge of
+the primary-key B-tree instead of on a random page (no page splits, no
+half-empty index pages, recent rows stay in cache).
+
+The high-volume tables can also store their ids as 16 raw bytes instead of
+36 characters (`CompactId`). Python code and the API only ever see the
+string; the type converts at the database boundary. Which tables are compact
+is read from each database's schema (main, every shard, every replica) at
+startup and every ID_STORAGE_CHECK_SECONDS (`detect_id_storage`), and kept
+per engine - shards are converted one at a time; new databases get
+compact ids when ID_STORAGE=binary, existing ones are converted online by
+`python manage.py migrate-compact-ids` (see app/services/compact_ids.py).
+
+Config (env):
+    ID_STORAGE                  text | binary - storage for COMPACT_TABLES in newly created tables, default text
+    ID_STORAGE_CHECK_SECONDS    how often workers re-read the storage (to follow a migration), default 5
+"""
+import os
+import secrets
+import threading
+import time
+import uuid
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import BINARY, LargeBinary, String, inspect
+from sqlalchemy.types import TypeDecorator
+
+# Tables whose ids can be stored compactly (drill_performances.session_log_id goes with its table)
+COMPACT_TABLES = ("session_logs", "drill_performances", "notifications", "notifications_archive", "squad_attendance")
+BINARY_STORAGE = os.getenv("ID_STORAGE", "text") == "binary"
+CHECK_SECONDS = float(os.getenv("ID_STORAGE_CHECK_SECONDS", "5"))
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+# Tables holding 16-byte ids, per database. Keyed by the engine's dialect, which is
+# what type processors and compiled statements are built for; a database nobody
+# has inspected yet is assumed to follow ID_STORAGE
+_binary_tables: "WeakKeyDictionary[object, set]" = WeakKeyDictionary()
+DEFAULT_BINARY_TABLES = frozenset(COMPACT_TABLES if BINARY_STORAGE else ())
+
+
+# =======================
+# 1. GENERATION
+# =======================
+
+def new_id() -> str:
+    """UUIDv7 string, monotonic within this process."""
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms, _counter = ms, secrets.randbits(11)  # random start, room to count up
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # 4096 ids in one millisecond (or the clock went back): borrow the next one
+                _last_ms, _counter = _last_ms + 1, 0
+        value = _last_ms << 80 | 0x7 << 76 | _counter << 64 | 0b10 << 62 | secrets.randbits(62)
+    return str(uuid.UUID(int=value))
+
+
+def to_bytes(value: str) -> bytes:
+    return uuid.UUID(value).bytes
+
+
+def from_bytes(value: bytes) -> str:
+    return str(uuid.UUID(bytes=bytes(value)))
+
+
+def is_uuid(value) -> bool:
+    try:
+        uuid.UUID(value)
+        return len(value) == 36
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+
+# =======================
+# 2. COLUMN TYPE
+# =======================
+
+class CompactId(TypeDecorator):
+    """A string id, stored as text or as 16 bytes depending on `table`'s storage."""
+
+    impl = String
+    cache_ok = True
+
+    def __init__(self, table: str):
+        super().__init__()
+        self.table = table
+
+    def is_binary(self, dialect) -> bool:
+        return self.table in binary_tables(dialect)
+
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(binary_column_type(dialect.name) if self.is_binary(dialect) else String())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not self.is_binary(dialect) or isinstance(value, (bytes, bytearray)):
+            return value
+        return to_bytes(value)
+
+    def process_result_value(self, value, dialect):
+        # Either storage reads back as the string form
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return from_bytes(value)
+        return value
+
+
+def binary_column_type(dialect_name: str):
+    return BINARY(16) if dialect_name == "mysql" else LargeBinary(16)
+
+
+def _dialect(bind):
+    return getattr(bind, "dialect", bind)
+
+
+def binary_tables(bind) -> frozenset:
+    """Compact tables holding 16-byte ids in this engine's database."""
+    return frozenset(_binary_tables.get(_dialect(bind), DEFAULT_BINARY_TABLES))
+
+
+def set_binary(bind, table: str, binary: bool):
+    tables = set(binary_tables(bind))
+    if binary:
+        tables.add(table)
+    else:
+        tables.discard(table)
+    _binary_tables[_dialect(bind)] = tables
+
+
+def detect_id_storage(bind):
+    """Match each compact table's storage to this database's live schema (run before serving queries)."""
+    inspector = inspect(bind)
+    before = binary_tables(bind)
+    for table in COMPACT_TABLES:
+        if not inspector.has_table(table):
+            continue
+        id_type = next(str(c["type"]).upper() for c in inspector.get_columns(table) if c["name"] == "id")
+        set_binary(bind, table, "BLOB" in id_type or "BINARY" in id_type)
+    if binary_tables(bind) != before:
+        forget_compiled(bind)
+
+
+def forget_compiled(bind):
+    """Drop cached statements and type processors built for the previous storage."""
+    engine = getattr(bind, "engine", bind)
+    engine.clear_compiled_cache()
+    memos = engine.dialect._type_memos
+    for type_ in [t for t in list(memos.keys()) if isinstance(t, CompactId)]:
+        memos.pop(type_, None)
+
+
+def sqlite_compact_id(value):
+    """SQL function used by the migration's mirror triggers on SQLite (registered on every connection)."""
+    return None if value is None else to_bytes(value)
@@ -0,0 +1,181 @@
+"""
+Structured, non-blocking logging.
+
+Request handlers log through `get_logger(__name__)`. Records are sampled per
+level, tagged with the current request id and pushed onto a bounded queue;
+a QueueListener thread does the JSON formatting and the actual stdout write,
+so a slow terminal or log shipper never adds latency to a request. If the
+queue is full the record is dropped (and counted) rather than blocking.
+
+Config (env):
+    LOG_LEVEL          minimum level, default INFO
+    LOG_SAMPLE_DEBUG   fraction of DEBUG records kept, default 1.0
+    LOG_SAMPLE_INFO    fraction of INFO records kept, default 1.0
+    LOG_QUEUE_SIZE     max queued records before dropping, default 10000
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+ROOT_LOGGER = "setplai"
+REQUEST_ID_HEADER = b"x-request-id"
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Attributes every LogRecord has - anything else was passed via `extra=`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+# =======================
+# 1. HANDLERS / FORMATTERS
+# =======================
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, event, request_id + extras."""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            payload["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a configurable fraction of records per level (WARNING+ always kept)."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller and defers formatting."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Only cheap work on the request thread: resolve the message, pin the
+        # request id (contextvars don't cross into the listener thread) and
+        # render any traceback while the frames are still alive.
+        record.request_id = _request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+# =======================
+# 2. SETUP
+# =======================
+
+def setup_logging():
+    """Idempotent: install the queue handler on the `setplai` logger tree."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter({
+        logging.DEBUG: float(os.getenv("LOG_SAMPLE_DEBUG", "1.0")),
+        logging.INFO: float(os.getenv("LOG_SAMPLE_INFO", "1.0")),
+    }))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Loggers live under `setplai.` so they share the queue handler."""
+    if not name.startswith(ROOT_LOGGER):
+        name = f"{ROOT_LOGGER}.{name}"
+    return logging.getLogger(name)
+
+
+# =======================
+# 3. REQUEST ID MIDDLEWARE
+# =======================
+
+class RequestIdMiddleware:
+    """Reads X-Request-ID (or generates one), exposes it to loggers and echoes it back."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = _request_id.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_id.reset(token)
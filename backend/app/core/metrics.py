@@ -0,0 +1,345 @@
+"""
+Lightweight Prometheus-style metrics.
+
+A tiny in-process registry (counters, gauges, histograms) rendered in the
+Prometheus text exposition format, an ASGI middleware that records per-route
+request counts / latency / in-flight requests, and SQLAlchemy engine hooks
+that attribute SQL statement counts and time to the request that issued them.
+
+Everything is kept deliberately cheap: a dict lookup plus a lock per
+observation, no label validation and no external dependencies.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+
+# Default latency buckets (seconds) - tuned for a small JSON API
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+# =======================
+# 1. METRIC TYPES
+# =======================
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, *labels, value: float):
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 2)
+            row[idx] += 1
+            row[-1] += value
+
+    def count(self, *labels) -> int:
+        row = self._values.get(labels)
+        return sum(row[:-1]) if row else 0
+
+    def render(self):
+        lines = self.header()
+        for labels, row in sorted(self._values.items()):
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += hits
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors = []
+
+    def register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, fn):
+        """Register a callable run just before each scrape (for sampled gauges)."""
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception:
+                pass
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# =======================
+# 2. CORE METRICS
+# =======================
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Total HTTP requests by route template, method and status.",
+    ("method", "route", "status"),
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route"),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "Requests currently being served.", ("method",),
+)
+SQL_STATEMENTS = REGISTRY.counter(
+    "db_statements_total", "SQL statements executed, by route template.", ("route",),
+)
+SQL_PER_REQUEST = REGISTRY.histogram(
+    "db_statements_per_request", "SQL statements executed per request.",
+    ("route",), buckets=SQL_COUNT_BUCKETS,
+)
+SQL_TIME_PER_REQUEST = REGISTRY.histogram(
+    "db_time_per_request_seconds", "Time spent in SQL per request.", ("route",),
+)
+THREADPOOL_BORROWED = REGISTRY.gauge(
+    "threadpool_busy_threads", "Worker threads currently running sync endpoints.",
+)
+THREADPOOL_WAITING = REGISTRY.gauge(
+    "threadpool_queue_depth", "Sync endpoint calls waiting for a worker thread.",
+)
+THREADPOOL_CAPACITY = REGISTRY.gauge(
+    "threadpool_capacity", "Worker thread limit for sync endpoints.",
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "cache_requests_total", "Cache lookups by cache name and result (hit/miss).",
+    ("cache", "result"),
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """Call from any in-process cache to feed the cache hit-rate metrics."""
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+# =======================
+# 3. PER-REQUEST SQL ACCOUNTING
+# =======================
+
+class RequestStats:
+    __slots__ = ("route", "sql_count", "sql_time")
+
+    def __init__(self, route: str = "unmatched"):
+        self.route = route
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _current_stats.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_start"].pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_time += time.perf_counter() - started
+
+
+def instrument_engine(engine):
+    """Attach statement counting/timing hooks to an Engine (idempotent)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _sample_threadpool():
+    from anyio import to_thread
+    try:
+        limiter = to_thread.current_default_thread_limiter()
+    except Exception:
+        # Not inside an event loop (e.g. rendered from a script)
+        return
+    stats = limiter.statistics()
+    THREADPOOL_BORROWED.set(value=stats.borrowed_tokens)
+    THREADPOOL_WAITING.set(value=stats.tasks_waiting)
+    THREADPOOL_CAPACITY.set(value=stats.total_tokens)
+
+
+REGISTRY.add_collector(_sample_threadpool)
+
+
+# =======================
+# 4. ASGI MIDDLEWARE
+# =======================
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (cheaper than BaseHTTPMiddleware - no extra task or
+    response buffering). The route label is the matched path *template*
+    (e.g. /api/v1/programs/{program_id}/status), never the raw URL, so the
+    label cardinality stays bounded.
+    """
+
+    def __init__(self, app, exclude_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        status_holder = [500]
+        # The route template is only known after routing, so in-flight is per method
+        HTTP_IN_FLIGHT.inc(method)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec(method)
+            route = _route_template(scope)
+            stats.route = route
+            HTTP_REQUESTS.inc(method, route, str(status_holder[0]))
+            HTTP_LATENCY.observe(method, route, value=elapsed)
+            if stats.sql_count:
+                SQL_STATEMENTS.inc(route, amount=stats.sql_count)
+            SQL_PER_REQUEST.observe(route, value=stats.sql_count)
+            SQL_TIME_PER_REQUEST.observe(route, value=stats.sql_time)
+            _current_stats.reset(token)
+
+
+def render_latest() -> str:
+    return REGISTRY.render()
+
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,321 @@
+"""
+On-demand sampling profiler for individual requests.
+
+A request is profiled when either
+  * an ADMIN sends the `X-Profile: 1` header (or `?__profile=1`), or
+  * its route template is in the sampled-route config and it wins the
+    PROFILE_SAMPLE_RATE coin toss.
+
+While profiled, a sampler thread snapshots the Python stacks of the threads
+serving that request every PROFILE_INTERVAL seconds (sys._current_frames, no
+tracing hooks, so overhead is paid only by profiled requests), and SQL
+statements issued by the request are timed through engine events. The result
+is written as a speedscope file (https://www.speedscope.app) containing a
+sampled flamegraph plus an evented SQL timeline, and listed under
+/api/v1/admin/profiles.
+
+Sync endpoints and dependencies run on anyio worker threads. A worker is
+sampled while the call it is running carries this request's context (read
+off the worker's frame), so CPU spent before the first SQL statement
+counts too. Other threads are attributed once they issue SQL for the
+request, and the event-loop thread always is.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import compile_path
+
+from app.core.security import bearer_claims
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_FLAG = "__profile=1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+# Files that mean "this thread is idle" - samples ending here are dropped
+_IDLE_LEAF_FILES = ("selectors.py", "threading.py", "queue.py")
+
+try:
+    from anyio._backends._asyncio import WorkerThread as _AnyioWorker
+    # The worker loop's frame holds the contextvars.Context of the call it is running
+    _WORKER_RUN = _AnyioWorker.run.__code__
+except (ImportError, AttributeError):  # anyio internals moved - fall back to SQL attribution only
+    _WORKER_RUN = None
+
+
+# =======================
+# 1. SAMPLED-TRAFFIC CONFIG
+# =======================
+
+class SamplingConfig:
+    """Routes (path templates) profiled for a random fraction of traffic."""
+
+    def __init__(self):
+        self.rate = 0.0
+        self.routes: List[str] = []
+        self._patterns = []
+        self.configure(
+            rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            routes=[r for r in os.getenv("PROFILE_SAMPLE_ROUTES", "").split(",") if r],
+        )
+
+    def configure(self, rate: float, routes: List[str]):
+        self.rate = max(0.0, min(rate, 1.0))
+        self.routes = list(routes)
+        self._patterns = [compile_path(r)[0] for r in self.routes]
+
+    def should_sample(self, path: str) -> bool:
+        if self.rate <= 0 or not self._patterns:
+            return False
+        if not any(p.match(path) for p in self._patterns):
+            return False
+        return random.random() < self.rate
+
+
+SAMPLING = SamplingConfig()
+
+
+# =======================
+# 2. PROFILE SESSION + SAMPLER
+# =======================
+
+class ProfileSession:
+    def __init__(self, method: str, path: str, reason: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.route = path
+        self.status = None
+        self.created_at = datetime.utcnow()
+        self.threads = {threading.get_ident()}
+        self.stacks: Dict[tuple, int] = {}
+        self.sql: List[tuple] = []  # (start offset, end offset, statement)
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name=f"profiler-{self.id}", daemon=True)
+
+    # --- sampling ---
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        self._stop.set()
+        self._sampler.join()
+
+    def _run(self):
+        sampler = threading.get_ident()
+        while not self._stop.wait(PROFILE_INTERVAL):
+            for ident, frame in sys._current_frames().items():
+                if ident == sampler:
+                    continue
+                stack, context = [], None
+                while frame is not None:
+                    code = frame.f_code
+                    if code is _WORKER_RUN:
+                        context = frame.f_locals.get("context")
+                    stack.append((code.co_name, code.co_filename, frame.f_lineno))
+                    frame = frame.f_back
+                if context is not None:
+                    # A pool thread: ours only while it runs a call from this request
+                    if context.get(_active_profile) is not self:
+                        continue
+                elif ident not in self.threads:
+                    continue
+                if not stack or stack[0][1].endswith(_IDLE_LEAF_FILES):
+                    continue
+                key = tuple(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    # --- SQL ---
+
+    def record_sql(self, started: float, ended: float, statement: str):
+        self.threads.add(threading.get_ident())
+        self.sql.append((started - self.started, ended - self.started, statement))
+
+    # --- export ---
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "reason": self.reason,
+            "created_at": self.created_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": sum(self.stacks.values()),
+            "sql_count": len(self.sql),
+            "sql_ms": round(sum(end - start for start, end, _ in self.sql) * 1000, 2),
+        }
+
+    def to_speedscope(self):
+        frames, frame_index = [], {}
+
+        def index_of(name, file, line):
+            key = (name, file, line)
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                frames.append({"name": name, "file": file, "line": line})
+            return frame_index[key]
+
+        samples, weights = [], []
+        for stack, hits in self.stacks.items():
+            samples.append([index_of(*f) for f in stack])
+            weights.append(hits * PROFILE_INTERVAL)
+
+        sql_events = []
+        for start, end, statement in self.sql:
+            idx = index_of(" ".join(statement.split())[:120], "sql", 0)
+            sql_events.append({"type": "O", "frame": idx, "at": start})
+            sql_events.append({"type": "C", "frame": idx, "at": end})
+
+        title = f"{self.method} {self.route}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": title,
+            "exporter": "setplai-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled", "name": f"{title} (cpu samples)", "unit": "seconds",
+                    "startValue": 0, "endValue": self.duration,
+                    "samples": samples, "weights": weights,
+                },
+                {
+                    "type": "evented", "name": f"{title} (SQL)", "unit": "seconds",
+                    "startValue": 0, "endValue": self.duration, "events": sql_events,
+                },
+            ],
+        }
+
+
+_active_profile: ContextVar[Optional[ProfileSession]] = ContextVar("active_profile", default=None)
+
+
+# =======================
+# 3. STORAGE
+# =======================
+
+_recent = deque(maxlen=PROFILE_KEEP)
+_recent_lock = threading.Lock()
+
+
+def profile_path(profile_id: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.speedscope.json")
+
+
+def save_profile(session: ProfileSession):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(profile_path(session.id), "w") as f:
+        json.dump(session.to_speedscope(), f)
+    with _recent_lock:
+        if len(_recent) == _recent.maxlen:
+            evicted = _recent[0]
+            try:
+                os.remove(profile_path(evicted["id"]))
+            except OSError:
+                pass
+        _recent.append(session.summary())
+
+
+def list_profiles():
+    with _recent_lock:
+        return list(reversed(_recent))
+
+
+def get_profile_summary(profile_id: str):
+    with _recent_lock:
+        return next((p for p in _recent if p["id"] == profile_id), None)
+
+
+# =======================
+# 4. SQL HOOKS
+# =======================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_profile.get() is not None:
+        conn.info["profile_query_start"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    session = _active_profile.get()
+    if session is not None:
+        started = conn.info.pop("profile_query_start", None)
+        if started is not None:
+            session.record_sql(started, time.perf_counter(), statement)
+
+
+def instrument_engine(engine):
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# =======================
+# 5. ASGI MIDDLEWARE
+# =======================
+
+def _is_admin_request(scope) -> bool:
+    return str((bearer_claims(scope) or {}).get("role", "")).upper() == "ADMIN"
+
+
+def _profile_reason(scope) -> Optional[str]:
+    requested = any(name == PROFILE_HEADER and value in (b"1", b"true") for name, value in scope.get("headers", []))
+    requested = requested or PROFILE_QUERY_FLAG in scope.get("query_string", b"").decode("latin-1")
+    if requested and _is_admin_request(scope):
+        return "requested"
+    if SAMPLING.should_sample(scope["path"]):
+        return "sampled"
+    return None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        reason = _profile_reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(scope["method"], scope["path"], reason)
+        token = _active_profile.set(session)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                session.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", session.id.encode())]
+            await send(message)
+
+        session.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session.stop()
+            route = scope.get("route")
+            if route is not None:
+                session.route = getattr(route, "path", session.path)
+            _active_profile.reset(token)
+            await run_in_threadpool(save_profile, session)
@@ -0,0 +1,345 @@
+"""
+Per-principal rate limiting and load shedding.
+
+Every request is put in a route class and charged one token from the
+caller's bucket for that class (principal = JWT subject, or the client IP
+for anonymous calls and for /auth, where there is no token yet). An empty
+bucket is answered with 429 and a Retry-After of when the next token lands,
+without touching the database:
+
+    auth   /api/v1/auth/*                          login/register attempts per IP
+    poll   the endpoints the app polls on a timer   e.g. the 10 s pending-invite badge
+           (one bucket per polled route, so opening a few screens can't
+           spend the badge's tokens)
+    write  POST/PUT/PATCH/DELETE
+    read   every other GET
+
+Buckets live in a per-worker dict (`local`) or in Redis (`redis`, shared by
+all workers and hosts; falls back to the local buckets if Redis is down, so
+a cache outage never takes the API with it). With N workers on the local
+store a client gets up to N times its limit.
+
+Behind the buckets, admission control caps the requests running at once at
+what the DB pool can serve (database.POOL_CAPACITY), so a spike queues here
+instead of timing out on a pool checkout. A full house queues writes/reads
+for up to ADMISSION_QUEUE_SECONDS; polls only get the first
+ADMISSION_POLL_SHARE of the slots and are never queued. Anything that can't
+get in is answered 503 + Retry-After. Shed requests are counted in
+http_requests_shed_total{reason, route_class}.
+
+Config (env):
+    RATE_LIMIT_ENABLED          default 1
+    RATE_LIMIT_STORE            local | redis, default local
+    RATE_LIMIT_REDIS_URL        default redis://localhost:6379/0
+    RATE_LIMIT_AUTH             "<requests>/<seconds>", default 10/60 ("0" = unlimited)
+    RATE_LIMIT_POLL             per polled route, default 30/60 - 5x the fastest
+                                timer (6/min) with room for focus refreshes
+    RATE_LIMIT_WRITE            default 60/60
+    RATE_LIMIT_READ             default 300/60
+    MAX_CONCURRENT_REQUESTS     per worker, default the DB pool capacity (0 = no cap)
+    ADMISSION_QUEUE_SIZE        requests waiting for a slot, default 2x the cap
+    ADMISSION_QUEUE_SECONDS     how long one waits, default 2
+    ADMISSION_POLL_SHARE        fraction of slots polls may use, default 0.5
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from starlette.routing import compile_path
+
+from app.core.database import POOL_CAPACITY
+from app.core.log import get_logger
+from app.core.metrics import REGISTRY
+from app.core.security import bearer_claims
+
+AUTH, POLL, WRITE, READ = "auth", "poll", "write", "read"
+
+AUTH_PREFIX = "/api/v1/auth/"
+# GETs the app repeats on a timer or on every screen focus
+POLLING_ROUTES = (
+    "/api/v1/dashboard",
+    "/api/v1/programs",
+    "/api/v1/programs/summary",
+    "/api/v1/my-active-program",
+    "/api/v1/notifications/",
+    "/api/v1/notifications/unread-counts",
+    "/api/v1/sync",
+    "/api/v1/coach/activity",
+    "/api/v1/coach/feed",
+)
+EXEMPT_PATHS = ("/", "/metrics")
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+STORE_KIND = os.getenv("RATE_LIMIT_STORE", "local")
+REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+MAX_CONCURRENT = int(os.getenv("MAX_CONCURRENT_REQUESTS", str(POOL_CAPACITY or 0)))
+QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", str(2 * MAX_CONCURRENT)))
+QUEUE_SECONDS = float(os.getenv("ADMISSION_QUEUE_SECONDS", "2"))
+POLL_SHARE = float(os.getenv("ADMISSION_POLL_SHARE", "0.5"))
+OVERLOAD_RETRY_AFTER = 1
+MAX_LOCAL_KEYS = 100_000
+
+logger = get_logger(__name__)
+
+REQUESTS_SHED = REGISTRY.counter(
+    "http_requests_shed_total", "Requests rejected before reaching a route, by reason and route class.",
+    ("reason", "route_class"),
+)
+ADMITTED = REGISTRY.gauge(
+    "http_admitted_requests", "Requests holding an admission slot.",
+)
+ADMISSION_QUEUE = REGISTRY.gauge(
+    "http_admission_queue_depth", "Requests waiting for an admission slot.",
+)
+STORE_ERRORS = REGISTRY.counter(
+    "rate_limit_store_errors_total", "Shared rate-limit store failures (answered from local buckets).",
+)
+
+
+def parse_limit(spec: str) -> Optional[Tuple[float, float]]:
+    """"30/60" -> (capacity 30, refill 0.5 tokens/s); "0" -> None (unlimited)."""
+    requests, _, seconds = spec.partition("/")
+    if float(requests) <= 0:
+        return None
+    return float(requests), float(requests) / float(seconds or 1)
+
+
+LIMITS: Dict[str, Optional[Tuple[float, float]]] = {
+    AUTH: parse_limit(os.getenv("RATE_LIMIT_AUTH", "10/60")),
+    POLL: parse_limit(os.getenv("RATE_LIMIT_POLL", "30/60")),
+    WRITE: parse_limit(os.getenv("RATE_LIMIT_WRITE", "60/60")),
+    READ: parse_limit(os.getenv("RATE_LIMIT_READ", "300/60")),
+}
+
+
+# =======================
+# 1. BUCKET STORES
+# =======================
+
+class LocalBucketStore:
+    """Token buckets in a dict, per worker process. Also the stand-in for the shared store."""
+
+    def __init__(self, max_keys: int = MAX_LOCAL_KEYS):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, list] = {}  # key -> [tokens, updated_at, full_at]
+
+    def take_now(self, key: str, capacity: float, rate: float, now: float) -> float:
+        """Take a token. Returns 0 if granted, else seconds until one is available."""
+        bucket = self._buckets.get(key)
+        tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        if bucket is None and len(self._buckets) >= self.max_keys:
+            self._prune(now)
+        self._buckets[key] = [tokens, now, now + (capacity - tokens) / rate]
+        return wait
+
+    async def take(self, key: str, capacity: float, rate: float) -> float:
+        return self.take_now(key, capacity, rate, time.monotonic())
+
+    def _prune(self, now: float):
+        # A bucket that has refilled is the same as no bucket
+        for key in [k for k, b in self._buckets.items() if b[2] <= now]:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+
+    def clear(self):
+        self._buckets.clear()
+
+
+# KEYS[1] bucket; ARGV capacity, refill/s. Redis' clock, so every worker agrees on "now".
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """Buckets shared by every worker, via redis-py's asyncio client (imported lazily - only needed when enabled)."""
+
+    def __init__(self, url: str, fallback: Optional[LocalBucketStore] = None):
+        self.url = url
+        self.fallback = fallback or LocalBucketStore()
+        self._script = None
+
+    def _take_script(self):
+        if self._script is None:
+            import redis.asyncio as redis
+            client = redis.from_url(self.url, socket_timeout=0.25, socket_connect_timeout=0.25)
+            self._script = client.register_script(TOKEN_BUCKET_LUA)
+        return self._script
+
+    async def take(self, key: str, capacity: float, rate: float) -> float:
+        try:
+            return float(await self._take_script()(keys=[f"ratelimit:{key}"], args=[capacity, rate]))
+        except Exception:
+            STORE_ERRORS.inc()
+            logger.warning("rate_limit.store_unavailable", exc_info=True)
+            return await self.fallback.take(key, capacity, rate)
+
+    def clear(self):
+        self.fallback.clear()
+
+
+def default_store():
+    if STORE_KIND == "redis":
+        return RedisBucketStore(REDIS_URL)
+    return LocalBucketStore()
+
+
+STORE = default_store()
+
+
+# =======================
+# 2. ADMISSION CONTROL
+# =======================
+
+class AdmissionControl:
+    """
+    At most `limit` requests in flight per worker; the rest wait in a FIFO
+    for a freed slot (handed over directly, so a newcomer can't jump the queue).
+    """
+
+    def __init__(self, limit: int = MAX_CONCURRENT, queue_size: int = QUEUE_SIZE,
+                 queue_seconds: float = QUEUE_SECONDS, poll_share: float = POLL_SHARE):
+        self.limit = limit
+        self.poll_limit = max(1, int(limit * poll_share))
+        self.queue_size = queue_size
+        self.queue_seconds = queue_seconds
+        self.in_flight = 0
+        self._waiters: deque = deque()
+
+    async def acquire(self, route_class: str) -> Optional[str]:
+        """None once a slot is held, else the shed reason."""
+        if route_class == POLL:
+            if self.in_flight >= self.poll_limit or self._waiters:
+                return "overloaded"
+        elif self.in_flight >= self.limit or self._waiters:
+            if len(self._waiters) >= self.queue_size:
+                return "overloaded"
+            return await self._wait()
+        self.in_flight += 1
+        ADMITTED.set(value=self.in_flight)
+        return None
+
+    async def _wait(self) -> Optional[str]:
+        slot = asyncio.get_running_loop().create_future()
+        self._waiters.append(slot)
+        ADMISSION_QUEUE.set(value=len(self._waiters))
+        try:
+            await asyncio.wait_for(slot, self.queue_seconds)
+            return None
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # Client went away right after being handed a slot - pass it on
+            if slot.done() and not slot.cancelled():
+                self.release()
+            raise
+        finally:
+            if slot in self._waiters:
+                self._waiters.remove(slot)
+            ADMISSION_QUEUE.set(value=len(self._waiters))
+
+    def release(self):
+        while self._waiters:
+            slot = self._waiters.popleft()
+            if not slot.done():
+                slot.set_result(True)  # the slot moves to the waiter, in_flight is unchanged
+                ADMISSION_QUEUE.set(value=len(self._waiters))
+                return
+        self.in_flight -= 1
+        ADMITTED.set(value=self.in_flight)
+
+
+# =======================
+# 3. ASGI MIDDLEWARE
+# =======================
+
+def _principal(scope, route_class: str) -> str:
+    if route_class != AUTH:
+        subject = (bearer_claims(scope) or {}).get("sub")
+        if subject:
+            return f"user:{subject}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, limits=None, store=None, admission: Optional[AdmissionControl] = None,
+                 polling_routes=POLLING_ROUTES, enabled: bool = ENABLED):
+        self.app = app
+        self.limits = LIMITS if limits is None else limits
+        self.store = store or STORE
+        self.admission = admission or AdmissionControl()
+        self.polling = [(path, compile_path(path)[0]) for path in polling_routes]
+        self.enabled = enabled
+
+    def bucket(self, scope) -> Tuple[str, str]:
+        """(route class, bucket name) - polled routes each get their own bucket."""
+        path = scope["path"]
+        if path.startswith(AUTH_PREFIX):
+            return AUTH, AUTH
+        if scope["method"] not in READ_METHODS:
+            return WRITE, WRITE
+        for route, pattern in self.polling:
+            if pattern.match(path):
+                return POLL, f"{POLL}:{route}"
+        return READ, READ
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        route_class, bucket = self.bucket(scope)
+        limit = self.limits.get(route_class)
+        if limit is not None:
+            wait = await self.store.take(f"{bucket}:{_principal(scope, route_class)}", *limit)
+            if wait > 0:
+                REQUESTS_SHED.inc("rate_limited", route_class)
+                await _reject(send, 429, "Too many requests, slow down", wait)
+                return
+
+        if self.admission.limit <= 0:
+            await self.app(scope, receive, send)
+            return
+        reason = await self.admission.acquire(route_class)
+        if reason is not None:
+            REQUESTS_SHED.inc(reason, route_class)
+            await _reject(send, 503, "Server is busy, try again shortly", OVERLOAD_RETRY_AFTER)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.release()
@@ -0,0 +1,274 @@
+"""
+Read/write split.
+
+Routes that only read take `Depends(get_read_db)` (and `get_current_reader`
+for the user lookup); everything else keeps `get_db`, which is always the
+primary. For each GET the read router picks where get_read_db points:
+
+    DATABASE_REPLICA_URLS set      the replicas, round-robin over those whose lag
+                                   is within REPLICA_MAX_LAG_SECONDS
+    a SQLite file, no replica URLs a pool of read-only connections to the same
+                                   file (WAL: they read while the primary writes,
+                                   and can't write by mistake)
+    otherwise                      the primary
+
+Read-your-writes: when a user's write (any non-GET request) answers, their
+reads go to the primary for READ_YOUR_WRITES_SECONDS, so a screen that saves
+and reloads sees its own change. The marks are kept per worker, or in Redis
+when RATE_LIMIT_STORE=redis, so every worker honours them.
+
+Lag is measured the pt-heartbeat way: each worker rewrites one row of
+replica_heartbeat on the primary every REPLICA_LAG_CHECK_SECONDS and reads
+it back from every replica; replica time behind = now - the beat it sees.
+Exported as db_replica_lag_seconds{replica} (+Inf when unreachable).
+
+Cached views (dashboard, leaderboards) keep reading the primary: a lagging
+replica read would be cached for the whole TTL. Clubs on another shard
+(app/core/sharding.py) read their shard's primary - replicas are for the
+main database.
+
+Config (env):
+    DATABASE_REPLICA_URLS       comma separated read replicas of DATABASE_URL
+    READ_REPLICAS_ENABLED       default 1 (0 = every read on the primary)
+    SQLITE_READ_POOL            read-only pool on the primary's SQLite file, default 1
+    READ_YOUR_WRITES_SECONDS    default 5
+    REPLICA_MAX_LAG_SECONDS     replicas further behind are skipped, default 10
+    REPLICA_LAG_CHECK_SECONDS   default 5
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import sessionmaker
+
+from app.core.background import run_job
+from app.core.database import (
+    CURRENT_READ_SESSION_FACTORY, CURRENT_SESSION_FACTORY, IS_MEMORY_SQLITE, IS_SQLITE,
+    SQLALCHEMY_DATABASE_URL, SessionLocal, make_engine,
+)
+from app.core.log import get_logger
+from app.core.metrics import REGISTRY
+from app.core.rate_limit import REDIS_URL, STORE_KIND
+from app.core.security import bearer_claims
+from app.models.replication import ReplicaHeartbeat
+
+ENABLED = os.getenv("READ_REPLICAS_ENABLED", "1") != "0"
+REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+SQLITE_READ_POOL = os.getenv("SQLITE_READ_POOL", "1") != "0"
+STICKY_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+MAX_LAG = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "5"))
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+MAX_STICKY_KEYS = 100_000
+
+logger = get_logger(__name__)
+
+REPLICA_LAG = REGISTRY.gauge(
+    "db_replica_lag_seconds", "How far each read replica is behind the primary (heartbeat age).", ("replica",),
+)
+READS = REGISTRY.counter(
+    "db_read_requests_total", "GET requests by where their reads went (replica, primary, sticky).", ("target",),
+)
+
+
+def default_replica_urls() -> Dict[str, str]:
+    if REPLICA_URLS:
+        return {f"replica{i + 1}": url for i, url in enumerate(REPLICA_URLS)}
+    if IS_SQLITE and not IS_MEMORY_SQLITE and SQLITE_READ_POOL:
+        path = SQLALCHEMY_DATABASE_URL[len("sqlite:///"):]
+        return {"sqlite-readonly": f"sqlite:///file:{path}?mode=ro&uri=true"}
+    return {}
+
+
+# =======================
+# 1. REPLICA POOLS
+# =======================
+
+class ReplicaSet:
+    """An engine per replica, the lag last measured for each, and round-robin over the fresh ones."""
+
+    def __init__(self, urls: Dict[str, str], max_lag: float = MAX_LAG, enabled: bool = ENABLED):
+        self.urls = urls if enabled else {}
+        self.max_lag = max_lag
+        self.engines = {name: make_engine(url) for name, url in self.urls.items()}
+        self.factories = {
+            name: sessionmaker(autocommit=False, autoflush=False, bind=engine) for name, engine in self.engines.items()
+        }
+        # Unmeasured replicas count as fresh until the first heartbeat check says otherwise
+        self.lag: Dict[str, Optional[float]] = {name: None for name in self.urls}
+        self._cycle = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.urls)
+
+    def fresh(self) -> List[str]:
+        return [name for name, lag in self.lag.items() if lag is None or lag <= self.max_lag]
+
+    def session_factory(self) -> Optional[sessionmaker]:
+        """A replica within the lag limit, or None (read from the primary)."""
+        fresh = self.fresh()
+        if not fresh:
+            return None
+        return self.factories[fresh[next(self._cycle) % len(fresh)]]
+
+    def check_lag(self, primary_factory=SessionLocal) -> Dict[str, float]:
+        db = primary_factory()
+        try:
+            db.merge(ReplicaHeartbeat(id=1, beat_at=datetime.utcnow()))
+            db.commit()
+        finally:
+            db.close()
+        for name, factory in self.factories.items():
+            replica = factory()
+            try:
+                beat = replica.query(ReplicaHeartbeat.beat_at).filter(ReplicaHeartbeat.id == 1).scalar()
+                lag = max(0.0, (datetime.utcnow() - beat).total_seconds()) if beat else float("inf")
+            except Exception:
+                logger.warning("replicas.unreachable", extra={"replica": name}, exc_info=True)
+                lag = float("inf")
+            finally:
+                replica.close()
+            self.lag[name] = lag
+            REPLICA_LAG.set(name, value=lag)
+        return dict(self.lag)
+
+    def instrument(self, *hooks):
+        for engine in self.engines.values():
+            for hook in hooks:
+                hook(engine)
+
+    def dispose(self):
+        for engine in self.engines.values():
+            engine.dispose()
+
+
+REPLICAS = ReplicaSet(default_replica_urls())
+
+
+async def lag_loop(interval: float = LAG_CHECK_SECONDS):
+    """Background task started by the app (only when there are replicas)."""
+    while True:
+        try:
+            await run_job(REPLICAS.check_lag)
+        except Exception:
+            logger.exception("replicas.lag_check_failed")
+        await asyncio.sleep(interval)
+
+
+# =======================
+# 2. READ-YOUR-WRITES MARKS
+# =======================
+
+class LocalStickyStore:
+    """principal -> primary-reads-until, per worker process."""
+
+    def __init__(self, max_keys: int = MAX_STICKY_KEYS):
+        self.max_keys = max_keys
+        self._until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    async def mark(self, principal: str, seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._until) >= self.max_keys:
+                for key in [k for k, until in self._until.items() if until <= now]:
+                    del self._until[key]
+                if len(self._until) >= self.max_keys:
+                    self._until.clear()
+            self._until[principal] = now + seconds
+
+    async def is_marked(self, principal: str) -> bool:
+        until = self._until.get(principal)
+        return until is not None and until > time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._until.clear()
+
+
+class RedisStickyStore:
+    """Marks shared by every worker (redis-py asyncio, imported lazily); falls back to local ones."""
+
+    def __init__(self, url: str, fallback: Optional[LocalStickyStore] = None):
+        self.url = url
+        self.fallback = fallback or LocalStickyStore()
+        self._client = None
+
+    def _redis(self):
+        if self._client is None:
+            import redis.asyncio as redis
+            self._client = redis.from_url(self.url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        return self._client
+
+    async def mark(self, principal: str, seconds: float):
+        await self.fallback.mark(principal, seconds)
+        try:
+            await self._redis().set(f"rw:{principal}", 1, px=int(seconds * 1000))
+        except Exception:
+            logger.warning("replicas.sticky_store_unavailable", exc_info=True)
+
+    async def is_marked(self, principal: str) -> bool:
+        try:
+            return bool(await self._redis().exists(f"rw:{principal}"))
+        except Exception:
+            return await self.fallback.is_marked(principal)
+
+    def clear(self):
+        self.fallback.clear()
+
+
+STICKY = RedisStickyStore(REDIS_URL) if STORE_KIND == "redis" else LocalStickyStore()
+
+
+# =======================
+# 3. ASGI MIDDLEWARE
+# =======================
+
+class ReadRoutingMiddleware:
+    """Chooses get_read_db's session for GETs and marks writers for read-your-writes."""
+
+    def __init__(self, app, replicas: ReplicaSet = REPLICAS, sticky=None, sticky_seconds: float = STICKY_SECONDS):
+        self.app = app
+        self.replicas = replicas
+        self.sticky = sticky or STICKY
+        self.sticky_seconds = sticky_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.replicas.enabled:
+            await self.app(scope, receive, send)
+            return
+        subject = (bearer_claims(scope) or {}).get("sub")
+
+        if scope["method"] not in READ_METHODS:
+            if subject is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_marked(message):
+                # Before the response leaves: the client's next read must already see the mark
+                if message["type"] == "http.response.start":
+                    await self.sticky.mark(subject, self.sticky_seconds)
+                await send(message)
+
+            await self.app(scope, receive, send_marked)
+            return
+
+        shard_factory = CURRENT_SESSION_FACTORY.get()
+        if shard_factory not in (None, SessionLocal):
+            target, factory = "shard", None  # the club's own shard primary
+        elif subject is not None and await self.sticky.is_marked(subject):
+            target, factory = "sticky", None
+        else:
+            factory = self.replicas.session_factory()
+            target = "replica" if factory is not None else "primary"
+        READS.inc(target)
+        token = CURRENT_READ_SESSION_FACTORY.set(factory)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            CURRENT_READ_SESSION_FACTORY.reset(token)
@@ -6,7 +6,7 @@ import hashlib
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.models.user import User
 
 # Configuration
@@ -37,6 +37,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 # --- KEY FUNCTION FOR TOKEN VALIDATION ---
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    return user_for_token(token, db)
+
+# Read-only routes: the user lookup runs on the same read session as the route (see app/core/replicas.py)
+async def get_current_reader(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    return user_for_token(token, db)
+
+def user_for_token(token: str, db: Session) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -54,4 +61,22 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     if user is None:
         raise credentials_exception
         
-    return user
\ No newline at end of file
+    return user
+
+def bearer_claims(scope) -> Optional[dict]:
+    """Claims of a valid bearer token on an ASGI request, for middleware (None if absent/invalid)."""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            auth = value.decode("latin-1")
+            if auth.lower().startswith("bearer "):
+                try:
+                    return jwt.decode(auth[7:], SECRET_KEY, algorithms=[ALGORITHM])
+                except JWTError:
+                    return None
+            return None
+    return None
+
+def require_admin(current_user: User = Depends(get_current_user)):
+    if (current_user.role or "").upper() != "ADMIN":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
@@ -0,0 +1,295 @@
+"""
+Per-club database shards.
+
+Every club - a head coach plus the coaches and players under them
+(users.coach_id) - lives in exactly one database, its shard. The main
+database (DATABASE_URL) is the "default" shard and also holds the shard
+directory (club_shards); the other shards are listed in SHARDS and carry
+the full schema. Clubs missing from the directory live on the default shard.
+
+Requests are routed before any DB work: the login token carries the
+caller's club id (a "club" claim), the directory (cached per worker) names
+the club's shard, and get_db hands the endpoint a session from that shard's
+pool. A club's rows never span shards, so endpoints don't change. Only the
+global leaderboard and the admin queries read every shard (`fan_out`).
+Tokens without the claim (issued before sharding) use the default shard.
+
+`python manage.py move-club` moves a club between shards while it keeps
+working (app/services/shard_moves.py); writes for that club are answered
+503 + Retry-After during the few seconds the cut-over takes.
+
+Config (env):
+    SHARDS                        extra shards as name=url, comma separated (empty = one database)
+    SHARD_DIRECTORY_TTL_SECONDS   how long a worker trusts its cached directory entry, default 5
+                                  (a move waits this long for every worker to see its changes)
+"""
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from app.core.database import CURRENT_SESSION_FACTORY, SessionLocal, engine as main_engine, make_engine
+from app.core.metrics import REGISTRY
+from app.core.security import bearer_claims
+from app.models.tenancy import ClubShard
+from app.models.user import User
+
+DEFAULT_SHARD = "default"
+CLUB_CLAIM = "club"
+ACTIVE, MOVING = "ACTIVE", "MOVING"
+DIRECTORY_TTL = float(os.getenv("SHARD_DIRECTORY_TTL_SECONDS", "5"))
+MAX_CLUB_DEPTH = 10  # coach_id hops followed to find the head coach
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+SHARD_REQUESTS = REGISTRY.counter(
+    "shard_requests_total", "Requests routed to each shard.", ("shard",),
+)
+SHARD_WRITES_REFUSED = REGISTRY.counter(
+    "shard_writes_refused_total", "Writes answered 503 because their club was being moved.",
+)
+
+
+class Placement(NamedTuple):
+    shard: str
+    state: str
+    moves: int  # times the club has changed shards (change_log seqs restart on each)
+
+
+UNLISTED = Placement(DEFAULT_SHARD, ACTIVE, 0)
+# The current request's club placement (set by ShardRoutingMiddleware)
+CURRENT_PLACEMENT: ContextVar[Placement] = ContextVar("current_placement", default=UNLISTED)
+
+
+def parse_shards(spec: str) -> Dict[str, str]:
+    """"east=sqlite:///./east.db,west=mysql+mysqlconnector://..." -> {name: url}"""
+    shards = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, url = part.partition("=")
+        if not url or name == DEFAULT_SHARD:
+            raise ValueError(f"Bad SHARDS entry {part!r}: expected name=url (and not {DEFAULT_SHARD!r})")
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+# =======================
+# 1. SHARD CONNECTIONS
+# =======================
+
+class ShardRegistry:
+    """One engine (connection pool) and session factory per shard, created on first use."""
+
+    def __init__(self, urls: Dict[str, str]):
+        self.urls = urls
+        self._engines = {}
+        self._factories: Dict[str, sessionmaker] = {}
+        self._hooks: List[Callable] = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.urls)
+
+    @property
+    def names(self) -> List[str]:
+        return [DEFAULT_SHARD, *self.urls]
+
+    def engine(self, name: str):
+        if name == DEFAULT_SHARD:
+            return main_engine
+        with self._lock:
+            if name not in self._engines:
+                if name not in self.urls:
+                    raise KeyError(f"Unknown shard {name!r}")
+                engine = self._engines[name] = make_engine(self.urls[name])
+                for hook in self._hooks:
+                    hook(engine)
+            return self._engines[name]
+
+    def session_factory(self, name: str) -> sessionmaker:
+        if name == DEFAULT_SHARD:
+            return SessionLocal
+        factory = self._factories.get(name)
+        if factory is None:
+            factory = self._factories[name] = sessionmaker(autocommit=False, autoflush=False, bind=self.engine(name))
+        return factory
+
+    def engines(self) -> list:
+        """Engines created so far (the default shard's is the main engine, not listed)."""
+        with self._lock:
+            return list(self._engines.values())
+
+    def instrument(self, *hooks: Callable):
+        """Run hook(engine) on every shard engine, now and as they're created (metrics, profiling)."""
+        with self._lock:
+            self._hooks.extend(hooks)
+            engines = list(self._engines.values())
+        for engine in engines:
+            for hook in hooks:
+                hook(engine)
+
+    def dispose(self):
+        with self._lock:
+            engines = list(self._engines.values())
+        for engine in engines:
+            engine.dispose()
+
+
+SHARDS = ShardRegistry(parse_shards(os.getenv("SHARDS", "")))
+
+
+# =======================
+# 2. DIRECTORY
+# =======================
+
+class ShardDirectory:
+    """club_id -> Placement from the main database's club_shards, cached for DIRECTORY_TTL."""
+
+    def __init__(self, ttl: float = DIRECTORY_TTL, session_factory=SessionLocal):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self._entries: Dict[str, Tuple[float, Placement]] = {}
+        self._lock = threading.Lock()
+
+    def cached(self, club_id: str) -> Optional[Placement]:
+        with self._lock:
+            entry = self._entries.get(club_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def lookup(self, club_id: str) -> Placement:
+        placement = self.cached(club_id)
+        if placement is not None:
+            return placement
+        db = self.session_factory()
+        try:
+            row = db.get(ClubShard, club_id)
+            placement = Placement(row.shard, row.state, row.moves or 0) if row is not None else UNLISTED
+        finally:
+            db.close()
+        with self._lock:
+            self._entries[club_id] = (time.monotonic() + self.ttl, placement)
+        return placement
+
+    def assign(self, club_id: str, shard: str, state: str = ACTIVE):
+        """Set the club's shard and state; a new shard counts as a move."""
+        db = self.session_factory()
+        try:
+            row = db.get(ClubShard, club_id)
+            if row is None:
+                row = ClubShard(club_id=club_id, shard=DEFAULT_SHARD, moves=0)
+                db.add(row)
+            if row.shard != shard:
+                row.moves = (row.moves or 0) + 1
+            row.shard, row.state = shard, state
+            db.commit()
+        finally:
+            db.close()
+        self.forget(club_id)
+
+    def clubs(self) -> Dict[str, Placement]:
+        db = self.session_factory()
+        try:
+            return {row.club_id: Placement(row.shard, row.state, row.moves or 0) for row in db.query(ClubShard)}
+        finally:
+            db.close()
+
+    def forget(self, club_id: Optional[str] = None):
+        with self._lock:
+            if club_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(club_id, None)
+
+
+DIRECTORY = ShardDirectory()
+
+
+# =======================
+# 3. CLUBS AND FAN-OUT
+# =======================
+
+def club_of(db: Session, user: User) -> str:
+    """The head coach at the top of the user's coach_id chain (the user themself if they have no coach)."""
+    club, coach_id, seen = user.id, user.coach_id, {user.id}
+    while coach_id and coach_id not in seen and len(seen) < MAX_CLUB_DEPTH:
+        seen.add(coach_id)
+        club = coach_id
+        coach_id = db.query(User.coach_id).filter(User.id == coach_id).scalar()
+    return club
+
+
+def fan_out(db: Session, fn: Callable[[Session], object]) -> Dict[str, object]:
+    """{shard: fn(session)} over every shard, one at a time; {"default": fn(db)} when unsharded."""
+    if not SHARDS.enabled:
+        return {DEFAULT_SHARD: fn(db)}
+    return for_each_shard(fn)
+
+
+def for_each_shard(fn: Callable[[Session], object]) -> Dict[str, object]:
+    """{shard: fn(session)} with a fresh session on each shard (background jobs, tooling)."""
+    results = {}
+    for name in SHARDS.names:
+        session = SHARDS.session_factory(name)()
+        try:
+            results[name] = fn(session)
+        finally:
+            session.close()
+    return results
+
+
+def locate_user(db: Session, email: str) -> Tuple[Optional[User], Optional[str]]:
+    """(user, club id) for an email, whichever shard holds them - for login and sign-up."""
+    for found in fan_out(db, lambda s: _user_and_club(s, email)).values():
+        if found[0] is not None:
+            return found
+    return None, None
+
+
+def _user_and_club(db: Session, email: str):
+    user = db.query(User).filter(User.email == email).first()
+    return (user, club_of(db, user)) if user is not None else (None, None)
+
+
+# =======================
+# 4. REQUEST ROUTING
+# =======================
+
+class ShardRoutingMiddleware:
+    """Points get_db at the caller's club shard for the rest of the request."""
+
+    def __init__(self, app, registry: ShardRegistry = SHARDS, directory: ShardDirectory = DIRECTORY):
+        self.app = app
+        self.registry = registry
+        self.directory = directory
+
+    async def __call__(self, scope, receive, send):
+        club = (bearer_claims(scope) or {}).get(CLUB_CLAIM) if scope["type"] == "http" and self.registry.enabled else None
+        if club is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Cached entries are answered on the event loop; a miss is one primary-key read
+        placement = self.directory.cached(club) or await run_in_threadpool(self.directory.lookup, club)
+        if placement.state == MOVING and scope["method"] not in READ_METHODS:
+            SHARD_WRITES_REFUSED.inc()
+            response = JSONResponse(
+                {"detail": "Your club's data is being moved, try again in a few seconds"}, status_code=503,
+                headers={"Retry-After": str(max(1, round(self.directory.ttl)))},
+            )
+            await response(scope, receive, send)
+            return
+
+        SHARD_REQUESTS.inc(placement.shard)
+        factory_token = CURRENT_SESSION_FACTORY.set(self.registry.session_factory(placement.shard))
+        placement_token = CURRENT_PLACEMENT.set(placement)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            CURRENT_PLACEMENT.reset(placement_token)
+            CURRENT_SESSION_FACTORY.reset(factory_token)
@@ -1,40 +1,175 @@
-from fastapi import FastAPI
-from app.core.database import engine, Base
-from app.api.v1 import auth, training, squads, matches, notifications  # <--- IMPORT TRAINING ROUTER here
+import asyncio
+import os
+from fastapi import FastAPI, Response
+from app.core.database import engine, Base, add_missing_columns
+from app.core.ids import detect_id_storage
+from app.core.background import stop_jobs
+from app.core.metrics import MetricsMiddleware, instrument_engine, render_latest, CONTENT_TYPE_LATEST
+from app.core import profiling
+from app.core.idempotency import IdempotencyMiddleware, purge_loop
+from app.core.rate_limit import RateLimitMiddleware
+from app.core.sharding import SHARDS, ShardRoutingMiddleware
+from app.core.replicas import REPLICAS, ReadRoutingMiddleware, lag_loop as replica_lag_loop
+from app.services.compact_ids import storage_loop as id_storage_loop
+from app.services.match_search import ensure_match_search_index
+from app.services.attendance import ensure_bitmaps
+from app.services.sync import install_change_log, purge_loop as change_log_purge_loop
+from app.services.leaderboard import install_leaderboard_hooks
+from app.services.dashboard import install_dashboard_hooks
+from app.services.xp import compaction_loop as xp_compaction_loop
+from app.services.notifications import retention_loop as notification_retention_loop
+from app.core.log import RequestIdMiddleware, get_logger, setup_logging, shutdown_logging
+from app.api.v1 import admin, ai, auth, dashboard, training, squads, matches, notifications, sync  # <--- IMPORT TRAINING ROUTER here
 from fastapi.middleware.cors import CORSMiddleware
 
 # --- IMPORT MODELS HERE (Crucial for creating tables) ---
-from app.models import user, training as training_models 
-
-
-# Create all tables in the database
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI()
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allows ALL origins (perfect for dev)
-    allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods (POST, GET, etc.)
-    allow_headers=["*"],  # Allows all headers
-)
-
-# Include the routers
-app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
-app.include_router(training.router, prefix="/api/v1", tags=["training"])
-app.include_router(squads.router, prefix="/api/v1/squads", tags=["squads"])
-app.include_router(matches.router, prefix="/api/v1/matches", tags=["Matches"])
-app.include_router(notifications.router, prefix="/api/v1/notifications", tags=["Notifications"])
-
-@app.get("/")
-def read_root():
-    return {"message": "Tennis App Backend is Live!"}
-
-@app.on_event("startup")
-def list_routes():
-    print("\n--- 🚀 ACTIVE ROUTES ---")
-    for route in app.routes:
-        if hasattr(route, "path"):
-            print(f"📍 {route.path}")
-    print("------------------------\n")
\ No newline at end of file
+from app.models import user, activity, idempotency, replication, tenancy, training as training_models
+
+
+# JSON logs written from a background thread (see app/core/log.py)
+setup_logging()
+logger = get_logger(__name__)
+
+# Set by `manage.py serve` once it has migrated the schema, so N workers
+# starting at the same time don't all run DDL against the same database
+SCHEMA_READY_ENV = "SETPLAI_SCHEMA_READY"
+
+
+def prepare_database():
+    """
+    Create missing tables/columns and the match search index on every shard,
+    and build attendance bitmaps where only raw attendance exists (safe to re-run).
+    """
+    for name in SHARDS.names:
+        shard_engine = SHARDS.engine(name)
+        Base.metadata.create_all(bind=shard_engine)
+        add_missing_columns(shard_engine)
+        ensure_match_search_index(shard_engine)
+        with SHARDS.session_factory(name)() as db:
+            ensure_bitmaps(db)
+
+
+def create_app() -> FastAPI:
+    """
+    App factory. `manage.py serve` starts workers with
+    `uvicorn app.main:create_app --factory`; each worker process builds its
+    own app (and its own connection pool, see app/core/database.py).
+    """
+    if not os.getenv(SCHEMA_READY_ENV):
+        prepare_database()
+    # Text or 16-byte ids for the high-volume tables, whichever the schema has
+    # (shard and replica engines get the same check from the instrument hooks below)
+    detect_id_storage(engine)
+
+    # Count/time every SQL statement and attribute it to the current request
+    instrument_engine(engine)
+    profiling.instrument_engine(engine)
+    SHARDS.instrument(instrument_engine, profiling.instrument_engine, detect_id_storage)
+    REPLICAS.instrument(instrument_engine, profiling.instrument_engine, detect_id_storage)
+
+    # Every flushed write to a synced model lands in change_log (see /api/v1/sync)
+    install_change_log()
+    # Committed XP / membership changes move the in-memory leaderboards
+    install_leaderboard_hooks()
+    # ...and drop the cached /dashboard sections they change
+    install_dashboard_hooks()
+
+    app = FastAPI()
+
+    # Innermost: replays stored responses for retried writes (Idempotency-Key header)
+    app.add_middleware(IdempotencyMiddleware)
+    # GETs on read-only routes go to a replica unless the user has just written
+    app.add_middleware(ReadRoutingMiddleware)
+    # Points get_db at the caller's club shard (no-op unless SHARDS is set)
+    app.add_middleware(ShardRoutingMiddleware)
+    # Per-user token buckets (429) and a cap on concurrent requests (503) - before any DB work
+    app.add_middleware(RateLimitMiddleware)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allows ALL origins (perfect for dev)
+        allow_credentials=True,
+        allow_methods=["*"],  # Allows all methods (POST, GET, etc.)
+        allow_headers=["*"],  # Allows all headers
+    )
+
+    # Per-route request counts, latency histograms and in-flight gauges (see /metrics)
+    app.add_middleware(MetricsMiddleware)
+    # Opt-in request profiler (X-Profile header from an ADMIN, or sampled routes)
+    app.add_middleware(profiling.ProfilingMiddleware)
+    # Outermost: tags every log line and response with X-Request-ID
+    app.add_middleware(RequestIdMiddleware)
+
+    # Include the routers
+    app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
+    app.include_router(training.router, prefix="/api/v1", tags=["training"])
+    app.include_router(squads.router, prefix="/api/v1/squads", tags=["squads"])
+    app.include_router(matches.router, prefix="/api/v1/matches", tags=["Matches"])
+    app.include_router(notifications.router, prefix="/api/v1/notifications", tags=["Notifications"])
+    app.include_router(sync.router, prefix="/api/v1", tags=["Sync"])
+    app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
+    app.include_router(ai.router, prefix="/api/v1/ai", tags=["AI"])
+    app.include_router(dashboard.router, prefix="/api/v1", tags=["Dashboard"])
+
+    @app.get("/")
+    def read_root():
+        return {"message": "Tennis App Backend is Live!"}
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        # async on purpose: samples the threadpool limiter from the event loop
+        return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    @app.on_event("startup")
+    def list_routes():
+        setup_logging()  # no-op unless a previous shutdown stopped the writer
+        routes = [route.path for route in app.routes if hasattr(route, "path")]
+        logger.info("app.startup", extra={"routes": routes, "pid": os.getpid()})
+
+    @app.on_event("startup")
+    async def start_background_jobs():
+        # Expired Idempotency-Key rows are deleted in the background
+        app.state.idempotency_purge = asyncio.create_task(purge_loop())
+        # Old XP ledger rows are folded into weekly snapshots
+        app.state.xp_compaction = asyncio.create_task(xp_compaction_loop())
+        # Unread duplicates are collapsed and old read notifications archived
+        app.state.notification_retention = asyncio.create_task(notification_retention_loop())
+        # /sync change log rows past SYNC_RETENTION_DAYS are deleted
+        app.state.change_log_purge = asyncio.create_task(change_log_purge_loop())
+        # Picks up a migrate-compact-ids swap without a restart
+        app.state.id_storage = asyncio.create_task(id_storage_loop())
+        # Replica lag (heartbeat) decides which replicas serve reads
+        if REPLICAS.enabled:
+            app.state.replica_lag = asyncio.create_task(replica_lag_loop())
+
+    # Shutdown runs after the server has stopped accepting and drained in-flight
+    # requests (uvicorn --timeout-graceful-shutdown), in registration order
+    @app.on_event("shutdown")
+    async def stop_background_jobs():
+        # A job in the middle of a batch finishes it first (see app/core/background.py)
+        await stop_jobs(getattr(app.state, name, None) for name in (
+            "idempotency_purge", "xp_compaction", "notification_retention", "change_log_purge", "replica_lag", "id_storage"
+        ))
+
+    @app.on_event("shutdown")
+    def close_connections():
+        engine.dispose()
+        SHARDS.dispose()
+        REPLICAS.dispose()
+
+    @app.on_event("shutdown")
+    def flush_logs():
+        logger.info("app.shutdown", extra={"pid": os.getpid()})
+        shutdown_logging()
+
+    return app
+
+
+def __getattr__(name):
+    # `uvicorn app.main:app` and `from app.main import app` still work; the
+    # module-level app is only built when asked for, so factory workers don't
+    # build two
+    if name == "app":
+        globals()["app"] = application = create_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
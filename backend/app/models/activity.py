@@ -0,0 +1,57 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from app.core.database import Base
+from app.models.training import generate_id
+from datetime import datetime
+
+
+class ActivityFeedEntry(Base):
+    """
+    Materialized coach activity feed (fan-out on write).
+
+    One row per player event, written to the coach's feed at the time the
+    player logs a session, logs/completes a match or accepts a program. Rows
+    carry everything the feed renders (`data` is a JSON blob), so reading a
+    feed is a single indexed range scan on (coach_id, created_at, id).
+    """
+    __tablename__ = "activity_feed"
+
+    id = Column(String, primary_key=True, default=generate_id)
+    coach_id = Column(String, nullable=False)
+    player_id = Column(String, nullable=False)
+    player_name = Column(String(255))
+
+    type = Column(String(50))  # SESSION_LOG | MATCH_LOG | MATCH_RESULT | PROGRAM_ACCEPTED
+    reference_id = Column(String, nullable=True)
+    title = Column(String(255))
+    data = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_activity_feed_coach_created", "coach_id", "created_at", "id"),
+    )
+
+
+class ChangeLogEntry(Base):
+    """
+    Per-user change log behind /sync (one row per user whose view changed).
+
+    Written in the same transaction as the change by the session hook in
+    app/services/sync.py. `seq` is strictly increasing, so a client's sync
+    token is just the last seq it has seen (rows are held back for a few
+    seconds so a seq that commits late isn't skipped, see SYNC_SETTLE_SECONDS). op is "upsert" or "delete"
+    (a tombstone). user_id "*" marks changes visible to everyone (drills).
+    """
+    __tablename__ = "change_log"
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    entity = Column(String(30), nullable=False)  # programs | session_logs | matches | notifications | squads | profile | drills
+    entity_id = Column(String, nullable=False)
+    op = Column(String(10), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_change_log_user_seq", "user_id", "seq"),
+        {"sqlite_autoincrement": True},  # never reuse a seq, even after purging the tail
+    )
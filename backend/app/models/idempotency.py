@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index, UniqueConstraint
+from app.core.database import Base
+from app.models.training import generate_id
+from datetime import datetime
+
+
+class IdempotencyKey(Base):
+    """
+    Stored outcome of a write made with an `Idempotency-Key` header.
+
+    The row is inserted (state IN_PROGRESS) before the request runs - the
+    unique (principal, key) constraint is what serializes concurrent
+    duplicates - and completed with the response once it finishes. Retries
+    replay the stored response until `expires_at`.
+    """
+    __tablename__ = "idempotency_keys"
+
+    id = Column(String, primary_key=True, default=generate_id)
+    principal = Column(String(255), nullable=False)  # JWT subject (or "anonymous")
+    key = Column(String(255), nullable=False)
+    method = Column(String(10))
+    path = Column(String(255))
+    request_hash = Column(String(64))  # sha256 of the body - same key + different body (or method/path) is rejected
+
+    state = Column(String(20), default="IN_PROGRESS")  # IN_PROGRESS | COMPLETED
+    response_status = Column(Integer, nullable=True)
+    response_headers = Column(Text, nullable=True)  # JSON [[name, value], ...]
+    response_body = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("principal", "key", name="uq_idempotency_principal_key"),
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, DateTime
+from app.core.database import Base
+
+
+class ReplicaHeartbeat(Base):
+    """
+    One row, rewritten on the primary every few seconds by each worker (see
+    app/core/replicas.py). How old a replica's copy of it is = its lag.
+    """
+    __tablename__ = "replica_heartbeat"
+
+    id = Column(Integer, primary_key=True)
+    beat_at = Column(DateTime, nullable=False)
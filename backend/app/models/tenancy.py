@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from app.core.database import Base
+from datetime import datetime
+
+
+class ClubShard(Base):
+    """
+    Shard directory: which database holds a club's rows.
+
+    A club is a head coach and everyone under them (users.coach_id chain);
+    its id is the head coach's user id. Only the main database's copy of
+    this table is read. Clubs without a row live on the main database.
+    """
+    __tablename__ = "club_shards"
+
+    club_id = Column(String, primary_key=True)
+    shard = Column(String(64), nullable=False)
+    state = Column(String(20), default="ACTIVE")  # ACTIVE | MOVING (writes refused while a move cuts over)
+    moves = Column(Integer, default=0)  # bumped on every move: sync tokens from an earlier shard are reset
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
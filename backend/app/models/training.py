@@ -1,14 +1,14 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, DateTime, Date, Index, LargeBinary, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
+from app.core.ids import CompactId, new_id
 from datetime import datetime
-import uuid
 
 
-# Helper to generate unique String IDs
+# Helper to generate unique String IDs (time-ordered UUIDv7, see app/core/ids.py)
 def generate_id():
-    return str(uuid.uuid4())
+    return new_id()
 
 class Drill(Base):
     __tablename__ = "drills"
@@ -39,10 +39,45 @@ class Program(Base):
     # ✅ NEW FIELDS
     program_type = Column(String(50), default="PLAYER_PLAN") # 'PLAYER_PLAN' or 'SQUAD_SESSION'
     squad_id = Column(String, nullable=True) # Linked Squad for Coach Programs
+
+    # Shared, immutable schedule. NULL = legacy program with its own ProgramSession rows
+    template_id = Column(String(64), ForeignKey("program_templates.id"), nullable=True, index=True)
     
     # Relationships
     sessions = relationship("ProgramSession", back_populates="program")
     creator = relationship("User", back_populates="created_programs")
+    template = relationship("ProgramTemplate")
+
+class ProgramTemplate(Base):
+    """
+    Immutable schedule shared by every program with identical content.
+    The primary key is the sha256 of the canonical schedule, so sending the
+    same 8-week plan to 50 players (or re-using it next season) stores it once.
+    """
+    __tablename__ = "program_templates"
+
+    id = Column(String(64), primary_key=True)
+    drill_count = Column(Integer, default=0)
+    total_minutes = Column(Integer, default=0)
+    # Distinct days in the schedule; NULL on templates stored before this column existed
+    session_count = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    sessions = relationship("ProgramTemplateSession", order_by="ProgramTemplateSession.position")
+
+class ProgramTemplateSession(Base):
+    __tablename__ = "program_template_sessions"
+
+    id = Column(String, primary_key=True, default=generate_id)
+    template_id = Column(String(64), ForeignKey("program_templates.id"), index=True)
+    position = Column(Integer)
+    day_order = Column(Integer)
+    drill_id = Column(String, nullable=True)
+    drill_name = Column(String(255))
+    duration_minutes = Column(Integer)
+    notes = Column(Text, nullable=True)
+    target_value = Column(Integer, nullable=True)
+    target_prompt = Column(String(255), nullable=True)
 
 class ProgramSession(Base):
     __tablename__ = "program_sessions"
@@ -73,6 +108,9 @@ class ProgramAssignment(Base):
     assigned_at = Column(DateTime, default=datetime.utcnow)
     status = Column(String(50), default="active")
 
+    # Copy-on-write per-player schedule; NULL = follow the program's template
+    template_id = Column(String(64), ForeignKey("program_templates.id"), nullable=True)
+
     # Relationships (Essential for dashboard queries)
     program = relationship("Program")
     coach = relationship("User", foreign_keys=[coach_id])
@@ -95,7 +133,7 @@ class TrainingLog(Base):
 class SessionLog(Base):
     __tablename__ = "session_logs"
 
-    id = Column(String, primary_key=True, default=generate_id)
+    id = Column(CompactId("session_logs"), primary_key=True, default=generate_id)
     player_id = Column(String, ForeignKey("users.id"))
     program_id = Column(String, ForeignKey("programs.id"), nullable=True)
     session_id = Column(Integer, nullable=True) 
@@ -113,19 +151,37 @@ class SessionLog(Base):
 class DrillPerformance(Base):
     __tablename__ = "drill_performances"
 
-    id = Column(String, primary_key=True, default=generate_id)
-    session_log_id = Column(String, ForeignKey("session_logs.id"))
+    id = Column(CompactId("drill_performances"), primary_key=True, default=generate_id)
+    session_log_id = Column(CompactId("drill_performances"), ForeignKey("session_logs.id"))
     drill_id = Column(String) 
     outcome = Column(String) # "success" or "fail"
     achieved_value = Column(Integer, nullable=True)
 
     session_log = relationship("SessionLog", back_populates="drill_performances")
 
+class SessionArchiveSegment(Base):
+    """
+    Manifest of the cold session archive: one row per player per season
+    (calendar year) whose session logs + drill performances have moved out of
+    the hot tables into columnar files. See app/services/session_archive.py.
+    """
+    __tablename__ = "session_archive_segments"
+
+    player_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    season = Column(Integer, primary_key=True)
+    path = Column(String(255), nullable=False)  # under SESSION_ARCHIVE_DIR; a new directory per rewrite
+    sessions = Column(Integer, default=0)
+    performances = Column(Integer, default=0)
+    achieved_total = Column(Integer, default=0)  # sum of achieved_value, for the squad leaderboard
+    first_at = Column(DateTime)
+    last_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 # ✅ NEW: Squad Attendance Model
 class SquadAttendance(Base):
     __tablename__ = "squad_attendance"
 
-    id = Column(String, primary_key=True, default=generate_id)
+    id = Column(CompactId("squad_attendance"), primary_key=True, default=generate_id)
     squad_id = Column(String, ForeignKey("squads.id"))
     player_id = Column(String, ForeignKey("users.id"))
     date = Column(DateTime, default=datetime.utcnow)
@@ -134,3 +190,72 @@ class SquadAttendance(Base):
     # session_log_id = Column(String, ForeignKey("session_logs.id"), nullable=True)
 
     player = relationship("User")
+
+class AttendanceBitmap(Base):
+    """
+    One calendar year of a player's squad attendance as a day bitmap (bit n =
+    day n of the year, 46 bytes). player_id "*" holds the days the squad met.
+    Maintained by mark_attendance alongside SquadAttendance; see
+    app/services/attendance.py.
+    """
+    __tablename__ = "attendance_bitmaps"
+
+    id = Column(String, primary_key=True, default=generate_id)
+    squad_id = Column(String, ForeignKey("squads.id"), nullable=False)
+    player_id = Column(String, nullable=False)  # users.id, or "*" for the squad
+    year = Column(Integer, nullable=False)
+    bits = Column(LargeBinary, nullable=False)
+    version = Column(Integer, default=0)  # compare-and-swap guard for concurrent marks
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("squad_id", "player_id", "year", name="uq_attendance_bitmap"),
+        Index("ix_attendance_bitmaps_squad_year", "squad_id", "year"),
+    )
+
+class XpLedgerEntry(Base):
+    """
+    Append-only record of every XP award (User.xp is the cached running total).
+    Entries older than the compaction window are folded into XpSnapshot rows
+    by app/services/xp.py.
+    """
+    __tablename__ = "xp_ledger"
+
+    id = Column(String, primary_key=True, default=generate_id)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    amount = Column(Integer, nullable=False)
+    source = Column(String(50))  # SESSION_LOG | OPENING_BALANCE | ADJUSTMENT
+    reference_id = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_xp_ledger_user_created", "user_id", "created_at"),
+        Index("ix_xp_ledger_created", "created_at"),
+    )
+
+class XpSnapshot(Base):
+    """XP earned per user per week (Monday start), built from compacted ledger entries."""
+    __tablename__ = "xp_snapshots"
+
+    id = Column(String, primary_key=True, default=generate_id)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    period_start = Column(Date, nullable=False)
+    amount = Column(Integer, default=0)
+    entries = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "period_start", name="uq_xp_snapshot_user_period"),
+    )
+
+class GeneratedPlan(Base):
+    """
+    AI plan generation results, keyed by a hash of everything that went into
+    the prompt (see app/services/plan_generation.py). Shared by all workers.
+    """
+    __tablename__ = "generated_plans"
+
+    cache_key = Column(String(64), primary_key=True)
+    kind = Column(String(30))   # program | squad_program | squad_session
+    model = Column(String(100))
+    result = Column(Text)       # JSON, in the shape the app's plan builder expects
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
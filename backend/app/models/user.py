@@ -1,11 +1,11 @@
-from sqlalchemy import Column, String, ForeignKey, Integer, DateTime, Boolean
+from sqlalchemy import Column, String, ForeignKey, Integer, DateTime, Boolean, DDL, event, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, backref
 from app.core.database import Base
-import uuid
+from app.core.ids import CompactId, new_id
 
 def generate_id():
-    return str(uuid.uuid4())
+    return new_id()
 
 class User(Base):
     __tablename__ = "users"
@@ -90,14 +90,73 @@ class MatchEntry(Base):
     reflection = Column(String, nullable=True)
     
     coach_feedback = Column(String, nullable=True)
+
+    # ✅ Parsed from `score` on write (app/services/match_stats.py) - player's perspective
+    outcome = Column(String(10), nullable=True)        # "Win" | "Loss" | None (scheduled / unparseable)
+    set_scores = Column(String(255), nullable=True)    # JSON: [[6, 4], [6, 7, 5], ...] (3rd = loser's tiebreak points)
+    sets_won = Column(Integer, nullable=True)
+    sets_lost = Column(Integer, nullable=True)
+    games_won = Column(Integer, nullable=True)
+    games_lost = Column(Integer, nullable=True)
+    tiebreaks_won = Column(Integer, nullable=True)
+    tiebreaks_lost = Column(Integer, nullable=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class PlayerMatchStats(Base):
+    """
+    Per-player match statistics rollup, one row per (user, dimension, key):
+    dimension is overall | surface | environment | format | opponent, key is
+    the normalized value ("" for overall). Maintained incrementally from the
+    match write routes, so stats screens never aggregate the diary.
+    """
+    __tablename__ = "player_match_stats"
+
+    id = Column(String, primary_key=True, default=generate_id)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    dimension = Column(String(20), nullable=False)
+    key = Column(String(255), nullable=False, default="")
+    label = Column(String(255), nullable=True)  # display form of key (e.g. opponent as typed)
+
+    matches = Column(Integer, default=0)
+    wins = Column(Integer, default=0)
+    losses = Column(Integer, default=0)
+    sets_won = Column(Integer, default=0)
+    sets_lost = Column(Integer, default=0)
+    games_won = Column(Integer, default=0)
+    games_lost = Column(Integer, default=0)
+    tiebreaks_won = Column(Integer, default=0)
+    tiebreaks_lost = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "dimension", "key", name="uq_player_match_stats"),
+    )
+
+# Full-text index over the match diary (SQLite FTS5; rowid = match_entries.rowid).
+# Kept in sync by app/services/match_search.py; MySQL uses a FULLTEXT index instead.
+MATCH_FTS_COLUMNS = ("opponent_name", "event_name", "tactics", "reflection", "coach_feedback")
+
+event.listen(
+    MatchEntry.__table__, "after_create",
+    DDL(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS match_entries_fts USING fts5("
+        + ", ".join(MATCH_FTS_COLUMNS) + ", tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ).execute_if(dialect="sqlite"),
+)
+event.listen(
+    MatchEntry.__table__, "before_drop",
+    DDL("DROP TABLE IF EXISTS match_entries_fts").execute_if(dialect="sqlite"),
+)
+
 class Notification(Base):
     __tablename__ = "notifications"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Inbox / unread badge / retention scans (see app/services/notifications.py)
+        Index("ix_notifications_user_read_created", "user_id", "is_read", "created_at"),
+        {'extend_existing': True},
+    )
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(CompactId("notifications"), primary_key=True, default=generate_id)
     user_id = Column(String, ForeignKey("users.id")) # Recipient (Coach)
     
     # ✅ NEW: Who triggered this? (Player ID)
@@ -111,5 +170,29 @@ class Notification(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # ✅ Digest: repeats of the same (type, player, reference) bump count/last_at on one unread row
+    count = Column(Integer, default=1)
+    last_at = Column(DateTime(timezone=True), nullable=True)
+
     # ✅ THE FIX: Add relationship back to User
-    user = relationship("User", back_populates="notifications")
\ No newline at end of file
+    user = relationship("User", back_populates="notifications")
+
+
+class ArchivedNotification(Base):
+    """Read notifications past the retention window (moved by the retention job)."""
+    __tablename__ = "notifications_archive"
+    __table_args__ = (
+        Index("ix_notifications_archive_user_created", "user_id", "created_at"),
+    )
+
+    id = Column(CompactId("notifications_archive"), primary_key=True)
+    user_id = Column(String)
+    related_user_id = Column(String, nullable=True)
+    title = Column(String(255))
+    message = Column(String(500))
+    type = Column(String(50))
+    reference_id = Column(String(255), nullable=True)
+    count = Column(Integer, default=1)
+    created_at = Column(DateTime(timezone=True))
+    last_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
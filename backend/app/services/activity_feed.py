@@ -0,0 +1,183 @@
+"""
+Fan-out-on-write coach activity feed.
+
+Write paths call `publish_activity` inside their own transaction; readers page
+through `read_feed` with an opaque (created_at, id) cursor.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, selectinload
+
+from app.models.activity import ActivityFeedEntry
+from app.models.training import Drill, SessionLog
+from app.models.user import User, MatchEntry
+
+SESSION_LOG = "SESSION_LOG"
+MATCH_LOG = "MATCH_LOG"
+MATCH_RESULT = "MATCH_RESULT"
+PROGRAM_ACCEPTED = "PROGRAM_ACCEPTED"
+
+MAX_PAGE_SIZE = 100
+
+
+# =======================
+# 1. WRITE SIDE
+# =======================
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def publish_activity(db: Session, player: User, type: str, title: str, reference_id: str = None,
+                     data: dict = None, created_at: datetime = None) -> Optional[ActivityFeedEntry]:
+    """Adds a feed row for the player's coach (no commit - rides on the caller's transaction)."""
+    if not player or not player.coach_id:
+        return None
+    entry = ActivityFeedEntry(
+        coach_id=player.coach_id,
+        player_id=player.id,
+        player_name=player.name,
+        type=type,
+        reference_id=reference_id,
+        title=title,
+        data=json.dumps(data, default=_json_default) if data is not None else None,
+        created_at=created_at or datetime.utcnow(),
+    )
+    db.add(entry)
+    return entry
+
+
+def session_log_payload(db: Session, log: SessionLog, performances, drill_names: dict = None) -> dict:
+    """Same shape /coach/activity always returned: the session log with drill names."""
+    names = drill_names
+    if names is None:
+        drill_ids = {p.drill_id for p in performances if p.drill_id}
+        names = dict(db.query(Drill.id, Drill.name).filter(Drill.id.in_(drill_ids)).all()) if drill_ids else {}
+    return {
+        "id": log.id,
+        "program_id": log.program_id,
+        "session_id": log.session_id,
+        "duration_minutes": log.duration_minutes,
+        "rpe": log.rpe,
+        "notes": log.notes,
+        "date_completed": log.date_completed,
+        "drill_performances": [
+            {
+                "id": p.id,
+                "drill_id": p.drill_id,
+                "outcome": p.outcome,
+                "achieved_value": p.achieved_value,
+                "drill_name": names.get(p.drill_id, "Custom Drill"),
+            }
+            for p in performances
+        ],
+    }
+
+
+def match_payload(match: MatchEntry) -> dict:
+    return {
+        "id": match.id,
+        "event_name": match.event_name,
+        "opponent_name": match.opponent_name,
+        "match_format": match.match_format,
+        "round": match.round,
+        "surface": match.surface,
+        "score": match.score,
+        "result": match.result,
+        "date": match.date,
+    }
+
+
+# =======================
+# 2. READ SIDE
+# =======================
+
+def encode_cursor(entry: ActivityFeedEntry) -> str:
+    raw = json.dumps([entry.created_at.isoformat(), entry.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    created_at, entry_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    return datetime.fromisoformat(created_at), entry_id
+
+
+def read_feed(db: Session, coach_id: str, limit: int = 20, cursor: str = None, types: List[str] = None):
+    """Newest-first page of the coach's feed. Returns (entries, next_cursor)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(ActivityFeedEntry).filter(ActivityFeedEntry.coach_id == coach_id)
+    if types:
+        query = query.filter(ActivityFeedEntry.type.in_(types))
+    if cursor:
+        created_at, entry_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            ActivityFeedEntry.created_at < created_at,
+            and_(ActivityFeedEntry.created_at == created_at, ActivityFeedEntry.id < entry_id),
+        ))
+    rows = (
+        query.order_by(ActivityFeedEntry.created_at.desc(), ActivityFeedEntry.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def entry_to_dict(entry: ActivityFeedEntry) -> dict:
+    return {
+        "id": entry.id,
+        "type": entry.type,
+        "player_id": entry.player_id,
+        "player_name": entry.player_name,
+        "reference_id": entry.reference_id,
+        "title": entry.title,
+        "created_at": entry.created_at,
+        "data": json.loads(entry.data) if entry.data else None,
+    }
+
+
+# =======================
+# 3. BACKFILL
+# =======================
+
+def backfill_activity_feed(db: Session, batch_size: int = 500) -> int:
+    """
+    Populate the feed from existing session logs and matches (idempotent:
+    skips references that already have a feed row). Returns rows written.
+    """
+    existing = {ref for (ref,) in db.query(ActivityFeedEntry.reference_id).all()}
+    drill_names = dict(db.query(Drill.id, Drill.name).all())
+    written = 0
+
+    logs = (
+        db.query(SessionLog)
+        .options(selectinload(SessionLog.drill_performances), selectinload(SessionLog.player))
+        .yield_per(batch_size)
+    )
+    for log in logs:
+        if log.id in existing or not log.player:
+            continue
+        payload = session_log_payload(db, log, log.drill_performances, drill_names)
+        if publish_activity(db, log.player, SESSION_LOG, "Logged a training session", log.id,
+                            payload, created_at=log.date_completed):
+            written += 1
+
+    players = {}
+    for match in db.query(MatchEntry).yield_per(batch_size):
+        if match.id in existing:
+            continue
+        if match.user_id not in players:
+            players[match.user_id] = db.query(User).filter(User.id == match.user_id).first()
+        player = players[match.user_id]
+        kind, verb = (MATCH_RESULT, "logged a result") if match.score else (MATCH_LOG, "scheduled a match")
+        if publish_activity(db, player, kind, f"{verb.capitalize()} vs {match.opponent_name}", match.id,
+                            match_payload(match), created_at=match.created_at or match.date):
+            written += 1
+
+    db.commit()
+    return written
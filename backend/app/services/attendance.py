@@ -0,0 +1,247 @@
+"""
+Squad attendance as day bitmaps.
+
+Every (squad, player, calendar year) has one `attendance_bitmaps` row whose
+bits are the days attended (bit n = day n of the year, so a year is 46
+bytes). A row with player_id "*" holds the days the squad met at all - the
+union of every mark. mark_attendance sets the bits in the same transaction
+as the SquadAttendance rows; `rebuild_bitmaps` (manage.py
+rebuild-attendance-bitmaps) regenerates them from the raw table, and
+`ensure_bitmaps` runs it once at startup on a database that has attendance
+but no bitmaps yet (otherwise every count would read 0 until someone did).
+
+Reads load the bitmaps covering a date range and shift them into one
+Python int per player with bit 0 = the first day, then work on whole ranges
+at once:
+
+    attended on squad days  (player & squad).bit_count()
+    streaks                 squad days packed to consecutive bits, then runs of 1s
+    heatmap                 bit-sliced counters: one ripple-carry add per player
+                            gives every day's head count
+
+A season for a 100-player squad is ~100 rows / ~5 KB, and the raw
+squad_attendance table is never read.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.training import AttendanceBitmap, SquadAttendance
+
+SQUAD_DAYS = "*"
+MAX_CAS_RETRIES = 5
+
+
+# =======================
+# 1. ENCODING
+# =======================
+
+def day_index(day: date) -> Tuple[int, int]:
+    """(year, bit) for a calendar day."""
+    return day.year, day.timetuple().tm_yday - 1
+
+
+def to_int(bits: bytes) -> int:
+    return int.from_bytes(bits or b"", "little")
+
+
+def to_bytes(value: int) -> bytes:
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "little")
+
+
+# =======================
+# 2. WRITES
+# =======================
+
+def _set_bit(db: Session, squad_id: str, player_id: str, year: int, bit: int, row: Optional[AttendanceBitmap]):
+    """
+    OR one day into a bitmap row with compare-and-swap on `version` (no lost
+    marks under concurrency). `row` was read FOR UPDATE, and so is every
+    re-read: under MySQL's REPEATABLE READ a plain SELECT would return the
+    same snapshot again and every retry would lose to the concurrent mark.
+    """
+    for _ in range(MAX_CAS_RETRIES):
+        if row is None:
+            try:
+                with db.begin_nested():
+                    db.add(AttendanceBitmap(squad_id=squad_id, player_id=player_id, year=year,
+                                            bits=to_bytes(1 << bit), version=0, updated_at=datetime.utcnow()))
+                return
+            except IntegrityError:
+                pass  # created concurrently - fall through to the update path
+        else:
+            current = to_int(row.bits)
+            if current >> bit & 1:
+                return
+            updated = (
+                db.query(AttendanceBitmap)
+                .filter(AttendanceBitmap.id == row.id, AttendanceBitmap.version == row.version)
+                .update({
+                    AttendanceBitmap.bits: to_bytes(current | 1 << bit),
+                    AttendanceBitmap.version: row.version + 1,
+                    AttendanceBitmap.updated_at: datetime.utcnow(),
+                }, synchronize_session=False)
+            )
+            if updated:
+                return
+        row = db.query(AttendanceBitmap).filter(
+            AttendanceBitmap.squad_id == squad_id, AttendanceBitmap.player_id == player_id, AttendanceBitmap.year == year
+        ).with_for_update().populate_existing().first()
+    raise RuntimeError(f"Attendance bitmap for {squad_id}/{player_id}/{year} kept changing")
+
+
+def record_attendance(db: Session, squad_id: str, player_ids: Iterable[str], day: date):
+    """
+    Set `day` in each player's bitmap and in the squad's. One locking read,
+    then one write per changed row. No commit.
+    """
+    year, bit = day_index(day)
+    owners = list(dict.fromkeys(list(player_ids) + [SQUAD_DAYS]))
+    rows = {
+        row.player_id: row
+        for row in db.query(AttendanceBitmap).filter(
+            AttendanceBitmap.squad_id == squad_id, AttendanceBitmap.year == year, AttendanceBitmap.player_id.in_(owners)
+        ).with_for_update()
+    }
+    for owner in owners:
+        _set_bit(db, squad_id, owner, year, bit, rows.get(owner))
+
+
+def rebuild_bitmaps(db: Session, squad_id: Optional[str] = None) -> int:
+    """Regenerate bitmaps from squad_attendance (all squads, or one). Returns rows written."""
+    query = db.query(SquadAttendance.squad_id, SquadAttendance.player_id, SquadAttendance.date)
+    if squad_id:
+        query = query.filter(SquadAttendance.squad_id == squad_id)
+    values: Dict[Tuple[str, str, int], int] = {}
+    for sid, player_id, when in query.yield_per(5000):
+        if not (sid and player_id and when):
+            continue
+        year, bit = day_index(when.date() if isinstance(when, datetime) else when)
+        for owner in (player_id, SQUAD_DAYS):
+            values[(sid, owner, year)] = values.get((sid, owner, year), 0) | 1 << bit
+
+    stale = db.query(AttendanceBitmap)
+    if squad_id:
+        stale = stale.filter(AttendanceBitmap.squad_id == squad_id)
+    stale.delete(synchronize_session=False)
+    now = datetime.utcnow()
+    db.add_all([
+        AttendanceBitmap(squad_id=sid, player_id=owner, year=year, bits=to_bytes(value), version=0, updated_at=now)
+        for (sid, owner, year), value in values.items()
+    ])
+    db.commit()
+    return len(values)
+
+
+def ensure_bitmaps(db: Session) -> int:
+    """Build the bitmaps once on a database that has attendance rows but no bitmaps (first start after upgrading)."""
+    if db.query(AttendanceBitmap.id).first() is not None or db.query(SquadAttendance.id).first() is None:
+        return 0
+    return rebuild_bitmaps(db)
+
+
+# =======================
+# 3. READS
+# =======================
+
+def load_range(db: Session, squad_id: str, start: date, end: date, player_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    {player_id: bits} for [start, end) with bit 0 = start, squad days under
+    SQUAD_DAYS. One query over at most (years spanned) rows per player.
+    """
+    length = (end - start).days
+    if length <= 0:
+        return {}
+    query = db.query(AttendanceBitmap.player_id, AttendanceBitmap.year, AttendanceBitmap.bits).filter(
+        AttendanceBitmap.squad_id == squad_id, AttendanceBitmap.year.between(start.year, (end - timedelta(days=1)).year)
+    )
+    if player_ids is not None:
+        query = query.filter(AttendanceBitmap.player_id.in_(list(player_ids) + [SQUAD_DAYS]))
+    mask = (1 << length) - 1
+    result: Dict[str, int] = {}
+    for player_id, year, bits in query:
+        offset = (date(year, 1, 1) - start).days
+        value = to_int(bits)
+        value = value << offset if offset >= 0 else value >> -offset
+        result[player_id] = result.get(player_id, 0) | (value & mask)
+    return result
+
+
+def lifetime_counts(db: Session, squad_id: str, player_ids: List[str]) -> Dict[str, int]:
+    """Days attended per player across every year, by popcount."""
+    counts: Dict[str, int] = {}
+    rows = db.query(AttendanceBitmap.player_id, AttendanceBitmap.bits).filter(
+        AttendanceBitmap.squad_id == squad_id, AttendanceBitmap.player_id.in_(player_ids)
+    )
+    for player_id, bits in rows:
+        counts[player_id] = counts.get(player_id, 0) + to_int(bits).bit_count()
+    return counts
+
+
+def pack(bits: int, mask: int) -> Tuple[int, int]:
+    """Keep only the bits at `mask` positions, packed into consecutive bits. Returns (packed, len)."""
+    packed, n = 0, 0
+    while mask:
+        low = mask & -mask
+        if bits & low:
+            packed |= 1 << n
+        n += 1
+        mask ^= low
+    return packed, n
+
+
+def longest_run(bits: int) -> int:
+    """Longest run of consecutive 1s: each `x & (x >> 1)` shortens every run by one."""
+    n = 0
+    while bits:
+        bits &= bits >> 1
+        n += 1
+    return n
+
+
+def streaks(player_bits: int, squad_bits: int) -> Tuple[int, int]:
+    """(current, longest) runs of squad sessions attended in a row - days the squad didn't meet don't break a streak."""
+    packed, n = pack(player_bits & squad_bits, squad_bits)
+    missed = ((1 << n) - 1) & ~packed
+    return n - missed.bit_length(), longest_run(packed)
+
+
+def day_counts(bitmaps: Iterable[int], length: int) -> List[int]:
+    """
+    Head count per day. slices[k] holds bit k of every day's count; adding
+    a player's bitmap is a ripple-carry add across the slices, so the work is
+    O(players x log players) big-int operations, not players x days.
+    """
+    slices: List[int] = []
+    for carry in bitmaps:
+        for k in range(len(slices)):
+            if not carry:
+                break
+            slices[k], carry = slices[k] ^ carry, slices[k] & carry
+        if carry:
+            slices.append(carry)
+    return [sum((s >> day & 1) << k for k, s in enumerate(slices)) for day in range(length)]
+
+
+def last_day(bits: int, start: date) -> Optional[date]:
+    return start + timedelta(days=bits.bit_length() - 1) if bits else None
+
+
+def attendance_stats(bitmaps: Dict[str, int], player_ids: List[str], start: date) -> dict:
+    squad = bitmaps.get(SQUAD_DAYS, 0)
+    sessions = squad.bit_count()
+    players = {}
+    for player_id in player_ids:
+        bits = bitmaps.get(player_id, 0) & squad
+        current, longest = streaks(bits, squad)
+        attended = bits.bit_count()
+        players[player_id] = {
+            "attended": attended,
+            "rate": round(attended / sessions, 3) if sessions else 0.0,
+            "current_streak": current,
+            "longest_streak": longest,
+            "last_attended": last_day(bits, start),
+        }
+    return {"sessions": sessions, "last_session": last_day(squad, start), "players": players}
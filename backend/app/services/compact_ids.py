@@ -0,0 +1,397 @@
+"""
+Online conversion of existing tables to 16-byte ids, and the id benchmark.
+
+`python manage.py migrate-compact-ids` converts each table in
+ids.COMPACT_TABLES the way pt-online-schema-change does, while the app keeps
+serving:
+
+    1. create  <table>__compact with the id columns as BLOB/BINARY(16)
+               (no secondary indexes yet - they'd slow the copy down)
+    2. mirror  AFTER INSERT/UPDATE/DELETE triggers on <table> apply every
+               write to the shadow as well, converting the ids
+    3. copy    existing rows in primary-key order, BATCH rows per
+               transaction (INSERT OR IGNORE: a row the triggers already
+               mirrored is newer than what we'd copy)
+    4. swap    with writers locked out (BEGIN IMMEDIATE on SQLite, LOCK
+               TABLES on MySQL, where every DDL statement commits by
+               itself): compare row counts, rename the shadow into place -
+               on MySQL the old table takes the mirror triggers with it, so
+               no write can miss the shadow - then drop the old table and
+               build the indexes
+
+Existing ids keep their values - clients, sync tombstones and feed entries
+hold them - only their storage changes; rows created after the switch get
+time-ordered UUIDv7s. Steps 1-3 are resumable (re-running skips what is
+done). On MySQL the foreign keys into a swapped table are dropped first and
+re-added once both sides have the same storage.
+
+Workers re-read each table's id storage every ID_STORAGE_CHECK_SECONDS
+(`storage_loop`), so no restart is needed. Until a worker has noticed, its
+text-id writes fail loudly instead of landing as garbage: a guard trigger on
+SQLite, strict sql_mode ("Data too long") on MySQL.
+
+session_logs and drill_performances (whose session_log_id points at it) are
+joined on their ids, so convert them together - the default is every table.
+With SHARDS the command converts every shard in turn; storage is tracked per
+database, so a half-converted fleet works throughout.
+
+`python manage.py bench-ids` inserts the same rows into scratch SQLite
+databases keyed by uuid4 text, UUIDv7 text and UUIDv7 16-byte ids and
+reports insert rate, point-lookup rate and primary-key index size.
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, String, Table, bindparam, create_engine, inspect, select, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.core import ids
+from app.core.background import run_job
+from app.core.database import Base, engine as main_engine
+from app.core.log import get_logger
+from app.core.replicas import REPLICAS
+from app.core.sharding import SHARDS
+
+SHADOW_SUFFIX = "__compact"
+BATCH = 2000
+
+logger = get_logger(__name__)
+
+
+class MigrationError(Exception):
+    pass
+
+
+# =======================
+# 1. SQL PER DIALECT
+# =======================
+
+def _id_columns(table: Table) -> List[str]:
+    return [c.name for c in table.columns if isinstance(c.type, ids.CompactId)]
+
+
+def _convert(dialect: str, expr: str) -> str:
+    if dialect == "mysql":
+        return f"UNHEX(REPLACE({expr}, '-', ''))"
+    return f"compact_id({expr})"  # registered on every SQLite connection (app/core/database.py)
+
+
+def _insert(dialect: str, mode: str) -> str:
+    if dialect == "mysql":
+        return "INSERT IGNORE INTO" if mode == "ignore" else "REPLACE INTO"
+    return "INSERT OR IGNORE INTO" if mode == "ignore" else "INSERT OR REPLACE INTO"
+
+
+def _shadow(table: Table, dialect: str) -> Table:
+    columns = [
+        Column(
+            c.name, ids.binary_column_type(dialect) if isinstance(c.type, ids.CompactId) else c.type,
+            primary_key=c.primary_key, nullable=c.nullable,
+            server_default=c.server_default.arg if c.server_default is not None else None,
+        )
+        for c in table.columns
+    ]
+    return Table(table.name + SHADOW_SUFFIX, MetaData(), *columns)
+
+
+def _row_values(table: Table, dialect: str, prefix: str) -> str:
+    id_columns = _id_columns(table)
+    return ", ".join(
+        _convert(dialect, f"{prefix}{c.name}") if c.name in id_columns else f"{prefix}{c.name}"
+        for c in table.columns
+    )
+
+
+def _triggers(table: Table, dialect: str) -> Dict[str, str]:
+    name, shadow = table.name, table.name + SHADOW_SUFFIX
+    cols = ", ".join(c.name for c in table.columns)
+    old_key = _convert(dialect, "OLD.id")
+    upsert = f"{_insert(dialect, 'replace')} {shadow} ({cols}) VALUES ({_row_values(table, dialect, 'NEW.')})"
+    return {
+        f"{name}__compact_ins": f"CREATE TRIGGER {name}__compact_ins AFTER INSERT ON {name} FOR EACH ROW BEGIN {upsert}; END",
+        f"{name}__compact_upd": (
+            f"CREATE TRIGGER {name}__compact_upd AFTER UPDATE ON {name} FOR EACH ROW BEGIN "
+            f"DELETE FROM {shadow} WHERE id = {old_key}; {upsert}; END"
+        ),
+        f"{name}__compact_del": (
+            f"CREATE TRIGGER {name}__compact_del AFTER DELETE ON {name} FOR EACH ROW BEGIN "
+            f"DELETE FROM {shadow} WHERE id = {old_key}; END"
+        ),
+    }
+
+
+def _guards(table: Table) -> Dict[str, str]:
+    """SQLite only: a worker still binding text ids after the swap fails loudly."""
+    checks = " OR ".join(f"typeof(NEW.{c}) = 'text'" for c in _id_columns(table))
+    return {
+        f"{table.name}__compact_guard_{op.lower()}": (
+            f"CREATE TRIGGER {table.name}__compact_guard_{op.lower()} BEFORE {op} ON {table.name} "
+            f"FOR EACH ROW WHEN {checks} BEGIN SELECT RAISE(ABORT, 'ids are binary now - restart this worker'); END"
+        )
+        for op in ("INSERT", "UPDATE")
+    }
+
+
+# =======================
+# 2. MIGRATION STEPS
+# =======================
+
+def _exists(bind, name: str) -> bool:
+    return inspect(bind).has_table(name)
+
+
+def check_ids(engine, table: Table) -> int:
+    """Rows whose ids aren't 36-character UUIDs (they can't become 16 bytes)."""
+    with engine.connect() as conn:
+        return sum(
+            conn.execute(text(f"SELECT COUNT(*) FROM {table.name} WHERE {c} IS NOT NULL AND LENGTH({c}) != 36")).scalar()
+            for c in _id_columns(table)
+        )
+
+
+def start(engine, table: Table):
+    """Create the shadow table and the mirror triggers (idempotent)."""
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        shadow = _shadow(table, dialect)
+        if not _exists(conn, shadow.name):
+            conn.execute(CreateTable(shadow))
+        for name, ddl in _triggers(table, dialect).items():
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+            conn.exec_driver_sql(ddl)
+
+
+def copy_rows(engine, table: Table, batch_size: int = BATCH) -> int:
+    """Copy existing rows in id order, one short transaction per batch. Returns rows read."""
+    dialect = engine.dialect.name
+    shadow = table.name + SHADOW_SUFFIX
+    cols = ", ".join(c.name for c in table.columns)
+    copy = text(
+        f"{_insert(dialect, 'ignore')} {shadow} ({cols}) "
+        f"SELECT {_row_values(table, dialect, '')} FROM {table.name} WHERE id >= :lo AND id <= :hi"
+    )
+    page = text(f"SELECT id FROM {table.name} WHERE id > :after ORDER BY id LIMIT :n")
+    copied, after = 0, ""
+    while True:
+        with engine.begin() as conn:
+            keys = [k for (k,) in conn.execute(page, {"after": after, "n": batch_size})]
+            if not keys:
+                return copied
+            conn.execute(copy, {"lo": keys[0], "hi": keys[-1]})
+        copied += len(keys)
+        after = keys[-1]
+        logger.info("compact_ids.copied", extra={"table": table.name, "rows": copied})
+
+
+def _incoming_foreign_keys(engine, table: Table) -> List[Tuple[str, str]]:
+    """(child table, constraint name) of the live foreign keys that point at `table`."""
+    inspector = inspect(engine)
+    return [
+        (child, fk["name"])
+        for child in inspector.get_table_names()
+        for fk in inspector.get_foreign_keys(child)
+        if fk["referred_table"] == table.name and fk.get("name") and child != table.name
+    ]
+
+
+def swap(engine, table: Table):
+    """Replace the table with its shadow while writers are locked out (a few ms plus the index builds)."""
+    dialect = engine.dialect
+    shadow = table.name + SHADOW_SUFFIX
+    mysql = dialect.name == "mysql"
+    if mysql:
+        # InnoDB would re-point these at <table>__text on the rename and then refuse to drop it.
+        # They come back in restore_foreign_keys once both sides share a storage type.
+        with engine.begin() as conn:
+            for child, name in _incoming_foreign_keys(engine, table):
+                conn.exec_driver_sql(f"ALTER TABLE {child} DROP FOREIGN KEY {name}")
+        # MySQL commits every DDL statement by itself: LOCK TABLES is what keeps writers out.
+        # The rename comes first and takes the mirror triggers along with the old table, so
+        # there's no moment where a write reaches <table> without reaching the shadow.
+        lock = [f"LOCK TABLES {table.name} WRITE, {shadow} WRITE"]
+        statements = [f"RENAME TABLE {table.name} TO {table.name}__text, {shadow} TO {table.name}", "UNLOCK TABLES"]
+        statements += [f"DROP TRIGGER IF EXISTS {name}" for name in _triggers(table, dialect.name)]
+        statements += [f"DROP TABLE {table.name}__text"]
+    else:
+        # SQLite DDL is transactional: BEGIN IMMEDIATE holds the write lock throughout
+        lock = ["BEGIN IMMEDIATE"]
+        statements = [f"DROP TRIGGER IF EXISTS {name}" for name in _triggers(table, dialect.name)]
+        statements += [f"DROP TABLE {table.name}", f"ALTER TABLE {shadow} RENAME TO {table.name}"]
+        statements += list(_guards(table).values())
+    statements += [str(CreateIndex(index).compile(dialect=dialect)) for index in table.indexes]
+    if not mysql:
+        statements += ["COMMIT"]
+
+    raw = engine.raw_connection()
+    try:
+        if not mysql:
+            # pysqlite doesn't put DDL in a transaction by itself
+            raw.driver_connection.isolation_level = None
+        cursor = raw.cursor()
+        for statement in lock:
+            cursor.execute(statement)
+        cursor.execute(f"SELECT COUNT(*) FROM {table.name}")
+        source = cursor.fetchone()[0]
+        cursor.execute(f"SELECT COUNT(*) FROM {shadow}")
+        target = cursor.fetchone()[0]
+        if source != target:
+            cursor.execute("UNLOCK TABLES" if mysql else "ROLLBACK")
+            raise MigrationError(f"{table.name}: {source} rows but {target} in {shadow} - re-run to copy again")
+        for statement in statements:
+            cursor.execute(statement)
+    finally:
+        if not mysql:
+            raw.driver_connection.isolation_level = ""
+        raw.close()
+    ids.set_binary(engine, table.name, True)
+    ids.forget_compiled(engine)
+
+
+def restore_foreign_keys(engine, tables: List[Table]):
+    """
+    MySQL: put back the model's foreign keys on and into the swapped tables
+    where both columns now have the same storage (a text child of a binary
+    parent waits until it is converted too).
+    """
+    if engine.dialect.name != "mysql":
+        return
+    inspector = inspect(engine)
+    swapped = {t.name for t in tables}
+
+    def binary(table_name, column):
+        return any(c["name"] == column and "BINARY" in str(c["type"]).upper() for c in inspector.get_columns(table_name))
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("SET foreign_key_checks = 0")  # the rows already match: add the constraint in place, unchecked
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            live = {(tuple(fk["constrained_columns"]), fk["referred_table"]) for fk in inspector.get_foreign_keys(table.name)}
+            for fk in table.foreign_key_constraints:
+                parent = fk.referred_table.name
+                columns, referred = [c.name for c in fk.columns], [e.column.name for e in fk.elements]
+                if (table.name not in swapped and parent not in swapped) or (tuple(columns), parent) in live:
+                    continue
+                if any(binary(table.name, c) != binary(parent, r) for c, r in zip(columns, referred)):
+                    continue
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD FOREIGN KEY ({', '.join(columns)}) REFERENCES {parent} ({', '.join(referred)})"
+                )
+        conn.exec_driver_sql("SET foreign_key_checks = 1")
+
+
+def migrate(engine, tables: Optional[List[str]] = None, batch_size: int = BATCH, do_swap: bool = True) -> Dict[str, int]:
+    """Convert `tables` (default: every compact table still on text ids). Returns rows copied per table."""
+    ids.detect_id_storage(engine)
+    names = [t for t in (tables or ids.COMPACT_TABLES) if t not in ids.binary_tables(engine)]
+    unknown = [t for t in names if t not in ids.COMPACT_TABLES]
+    if unknown:
+        raise MigrationError(f"Not a compact-id table: {', '.join(unknown)}")
+    targets = [Base.metadata.tables[name] for name in names if _exists(engine, name)]
+    for table in targets:
+        bad = check_ids(engine, table)
+        if bad:
+            raise MigrationError(f"{table.name}: {bad} ids are not UUIDs and can't be stored in 16 bytes")
+
+    copied = {}
+    for table in targets:
+        start(engine, table)
+        copied[table.name] = copy_rows(engine, table, batch_size)
+    if do_swap:
+        for table in targets:
+            swap(engine, table)
+            logger.info("compact_ids.swapped", extra={"table": table.name, "rows": copied[table.name]})
+        restore_foreign_keys(engine, [Base.metadata.tables[name] for name in ids.COMPACT_TABLES])
+    return copied
+
+
+def engines() -> list:
+    """Every database this worker has an engine for: the main one, the shards in use, the replicas."""
+    return [main_engine, *SHARDS.engines(), *REPLICAS.engines.values()]
+
+
+def detect_all():
+    for bind in engines():
+        ids.detect_id_storage(bind)
+
+
+async def storage_loop(interval: float = ids.CHECK_SECONDS):
+    """Background task started by the app: follow a swap made by another process, on any database."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_job(detect_all)
+        except Exception:
+            logger.exception("compact_ids.storage_check_failed")
+
+
+# =======================
+# 3. BENCHMARK
+# =======================
+
+SCHEMES = {
+    "uuid4 text": (String(), lambda: str(uuid.uuid4())),
+    "uuid7 text": (String(), ids.new_id),
+    "uuid7 16 bytes": (LargeBinary(16), lambda: ids.to_bytes(ids.new_id())),
+}
+
+
+def benchmark(rows: int = 200_000, batch: int = 1000, lookups: int = 20_000, directory: Optional[str] = None) -> List[dict]:
+    """Same session_logs-shaped rows under each id scheme, each in its own scratch SQLite file."""
+    directory = directory or tempfile.mkdtemp(prefix="setplai-ids-")
+    results = []
+    for label, (id_type, make_id) in SCHEMES.items():
+        path = os.path.join(directory, label.replace(" ", "_") + ".db")
+        if os.path.exists(path):
+            os.remove(path)
+        engine = create_engine(f"sqlite:///{path}")
+        table = Table(
+            "session_logs", MetaData(),
+            Column("id", id_type, primary_key=True),
+            Column("player_id", String()),
+            Column("date_completed", DateTime),
+            Column("duration_minutes", Integer),
+            Column("rpe", Integer),
+        )
+        table.create(engine)
+        players = [str(uuid.uuid4()) for _ in range(100)]
+        keys = []
+
+        started = time.perf_counter()
+        for offset in range(0, rows, batch):
+            chunk = [
+                {"id": make_id(), "player_id": random.choice(players), "date_completed": None, "duration_minutes": 30, "rpe": 5}
+                for _ in range(min(batch, rows - offset))
+            ]
+            keys.extend(r["id"] for r in random.sample(chunk, max(1, len(chunk) * lookups // rows)))
+            with engine.begin() as conn:
+                conn.execute(table.insert(), chunk)
+        insert_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            by_id = select(table.c.rpe).where(table.c.id == bindparam("k"))
+            for key in keys:
+                conn.execute(by_id, {"k": key}).first()
+        lookup_seconds = time.perf_counter() - started
+
+        with engine.connect() as conn:
+            sizes = dict(conn.exec_driver_sql("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").all())
+            index_pages = conn.exec_driver_sql(
+                "SELECT COUNT(*), AVG(unused * 1.0 / pgsize) FROM dbstat WHERE name = 'sqlite_autoindex_session_logs_1'"
+            ).first()
+        engine.dispose()
+        results.append({
+            "scheme": label,
+            "inserts_per_second": rows / insert_seconds,
+            "lookups_per_second": len(keys) / lookup_seconds if keys else 0.0,
+            "pk_index_bytes": sizes.get("sqlite_autoindex_session_logs_1", 0),
+            "table_bytes": sizes.get("session_logs", 0),
+            "pk_index_free": float(index_pages[1] or 0),
+        })
+    return results
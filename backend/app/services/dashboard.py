@@ -0,0 +1,245 @@
+"""
+Dashboard aggregation.
+
+GET /api/v1/dashboard returns, in one round trip, the sections the app's
+dashboard used to fetch one request at a time. The caller is authenticated
+once; each section then runs on its own pooled connection in a small shared
+thread pool, so the sections overlap instead of queueing behind each other.
+
+Every section result is cached per (section, user) for the section's TTL.
+A session hook drops a user's cached sections when a committed write
+touches what they show (a new log, a program status change, a
+notification...). Writes this worker didn't see - other workers, bulk SQL -
+are picked up when the TTL runs out, the same trade-off as the leaderboards.
+
+Config (env):
+    DASHBOARD_WORKERS           threads computing sections per process, default 8
+                                (also the most extra DB connections dashboards hold)
+    DASHBOARD_CACHE_ENABLED     default 1
+    DASHBOARD_CACHE_SIZE        cached sections per process, default 10000
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+
+from app.core.log import get_logger
+from app.core.metrics import record_cache
+from app.models.activity import ActivityFeedEntry
+from app.models.training import Program, ProgramAssignment, SessionLog
+from app.models.user import Notification, Squad, SquadMember, User
+
+WORKERS = int(os.getenv("DASHBOARD_WORKERS", "8"))
+CACHE_ENABLED = os.getenv("DASHBOARD_CACHE_ENABLED", "1") != "0"
+CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "10000"))
+ALL_USERS = "*"
+INVALIDATIONS_KEY = "dashboard_invalidations"
+MISS = object()  # sections can be null (no active program), so None can't mean "not cached"
+
+logger = get_logger(__name__)
+
+
+# =======================
+# 1. SECTION CACHE
+# =======================
+
+class SectionCache:
+    """
+    LRU of (section, user_id) -> JSON-ready value with a per-entry expiry.
+    Invalidation bumps a generation, so a value computed before a write
+    committed is never stored after it.
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, object]]" = OrderedDict()
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def generation(self, section: str, user_id: str) -> Tuple[int, int, int]:
+        with self._lock:
+            return self._epoch, self._generations.get((section, user_id), 0), self._generations.get((section, ALL_USERS), 0)
+
+    def get(self, section: str, user_id: str, default=None):
+        key = (section, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, section: str, user_id: str, value, ttl: float, generation: Tuple[int, int, int]):
+        key = (section, user_id)
+        with self._lock:
+            current = (self._epoch, self._generations.get(key, 0), self._generations.get((section, ALL_USERS), 0))
+            if current != generation:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[Tuple[str, str]]):
+        with self._lock:
+            for section, user_id in keys:
+                self._generations[(section, user_id)] = self._generations.get((section, user_id), 0) + 1
+                if user_id == ALL_USERS:
+                    for key in [k for k in self._entries if k[0] == section]:
+                        del self._entries[key]
+                else:
+                    self._entries.pop((section, user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+
+DASHBOARD_CACHE = SectionCache()
+
+
+# =======================
+# 2. INVALIDATION HOOKS
+# =======================
+
+def _touched(obj) -> List[Tuple[str, str]]:
+    """(section, user_id) pairs a flushed object can change."""
+    if isinstance(obj, ProgramAssignment):
+        return [(s, u) for u in (obj.player_id, obj.coach_id) for s in ("programs", "active_program")]
+    if isinstance(obj, Program):
+        return [("programs", obj.creator_id)]
+    if isinstance(obj, SessionLog):
+        return [("session_logs", obj.player_id)]
+    if isinstance(obj, ActivityFeedEntry):
+        return [("activity", obj.coach_id)]
+    if isinstance(obj, Notification):
+        return [("unread", obj.user_id)]
+    if isinstance(obj, Squad):
+        return [("squads", obj.coach_id)]
+    if isinstance(obj, SquadMember):
+        return [("squads", ALL_USERS)]  # the coach isn't on the row; membership changes are rare
+    if isinstance(obj, User):
+        coaches = {obj.coach_id} | set(inspect(obj).attrs["coach_id"].history.deleted or ())
+        return [("profile", obj.id)] + [("athletes", c) for c in coaches if c]
+    return []
+
+
+def _after_flush(session: Session, flush_context):
+    pending = session.info.setdefault(INVALIDATIONS_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        pending.update((section, user_id) for section, user_id in _touched(obj) if user_id)
+
+
+def _after_commit(session: Session):
+    pending = session.info.pop(INVALIDATIONS_KEY, None)
+    if pending:
+        DASHBOARD_CACHE.invalidate(pending)
+
+
+def _after_rollback(session: Session):
+    session.info.pop(INVALIDATIONS_KEY, None)
+
+
+def install_dashboard_hooks():
+    """Drop cached sections when a committed write changes them (idempotent)."""
+    if not event.contains(Session, "after_commit", _after_commit):
+        event.listen(Session, "after_flush", _after_flush)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "after_rollback", _after_rollback)
+
+
+# =======================
+# 3. RUNNING SECTIONS
+# =======================
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="dashboard")
+_FACTORIES: Dict[int, sessionmaker] = {}
+
+
+def _session_factory(bind) -> sessionmaker:
+    factory = _FACTORIES.get(id(bind))
+    if factory is None or factory.kw["bind"] is not bind:
+        factory = _FACTORIES[id(bind)] = sessionmaker(autocommit=False, autoflush=False, bind=bind)
+    return factory
+
+
+def _shares_one_connection(bind) -> bool:
+    # In-memory SQLite: every session uses the same DBAPI connection, so sections take turns
+    return isinstance(bind.pool, (StaticPool, SingletonThreadPool))
+
+
+def _compute(factory: sessionmaker, fn: Callable, user: User):
+    db = factory()
+    try:
+        return jsonable_encoder(fn(db, user))
+    finally:
+        db.close()
+
+
+def build_dashboard(db: Session, user: User, sections: Dict[str, Tuple[Callable, float]]) -> dict:
+    """
+    Run each section (fn(db, user), ttl) and collect the results. `db` only
+    lends its engine: its connection is handed back first, so a dashboard
+    holds at most one connection per running section. A section that fails
+    is reported under "errors" instead of failing the whole response.
+    """
+    bind = db.get_bind()
+    db.close()  # `user` stays usable: its columns are loaded
+    factory = _session_factory(bind)
+
+    results, cached, pending = {}, [], {}
+    for name, (fn, ttl) in sections.items():
+        value = DASHBOARD_CACHE.get(name, user.id, MISS) if CACHE_ENABLED else MISS
+        record_cache(f"dashboard:{name}", value is not MISS)
+        if value is not MISS:
+            results[name] = value
+            cached.append(name)
+        else:
+            pending[name] = (fn, ttl, DASHBOARD_CACHE.generation(name, user.id))
+
+    errors = {}
+
+    def finish(name, run):
+        fn, ttl, generation = pending[name]
+        try:
+            results[name] = value = run()
+        except HTTPException as exc:
+            errors[name] = exc.detail
+            return
+        except Exception:
+            logger.exception("dashboard.section_failed", extra={"section": name, "user_id": user.id})
+            errors[name] = "unavailable"
+            return
+        if CACHE_ENABLED:
+            DASHBOARD_CACHE.put(name, user.id, value, ttl, generation)
+
+    if _shares_one_connection(bind) or len(pending) <= 1:
+        for name, (fn, _, _) in pending.items():
+            finish(name, lambda: _compute(factory, fn, user))
+    else:
+        # Each thread gets a copy of the request context (request id, SQL accounting)
+        futures = {
+            name: _EXECUTOR.submit(contextvars.copy_context().run, _compute, factory, fn, user)
+            for name, (fn, _, _) in pending.items()
+        }
+        for name, future in futures.items():
+            finish(name, future.result)
+
+    return {
+        "role": user.role,
+        "sections": {name: results[name] for name in sections if name in results},
+        "cached": cached,
+        "errors": errors,
+    }
@@ -0,0 +1,228 @@
+"""
+In-memory drill search index.
+
+The drill library is small enough to live in every worker: an inverted index
+over name/description tokens (with a sorted vocabulary for prefix/typeahead
+lookups) plus one id-set per facet value. Searches never touch the database.
+
+The index is built lazily on first use, updated incrementally by
+`create_drill`, and re-synced when the row count in `drills` changes
+(checked at most every RESYNC_SECONDS, to pick up drills added by other
+workers or by seed scripts).
+"""
+import hashlib
+import heapq
+import json
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+import re
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.training import Drill
+
+FACETS = ("category", "difficulty", "is_premium")
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+RESYNC_SECONDS = 5.0
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    if not text:
+        return []
+    normalized = unicodedata.normalize("NFKD", text)
+    normalized = "".join(ch for ch in normalized if not unicodedata.combining(ch)).lower()
+    return _TOKEN_RE.findall(normalized)
+
+
+def drill_to_dict(drill: Drill) -> dict:
+    return {
+        "id": drill.id,
+        "name": drill.name,
+        "category": drill.category,
+        "difficulty": drill.difficulty,
+        "description": drill.description,
+        "default_duration_min": drill.default_duration_min,
+        "video_url": drill.video_url,
+        "is_premium": bool(drill.is_premium),
+        "target_value": drill.target_value,
+        "target_prompt": drill.target_prompt,
+    }
+
+
+class DrillIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        self.built = False
+        self.version = 0
+        self._last_sync_check = 0.0
+        self._catalog = None  # (version, fingerprint, docs)
+
+    def _reset(self):
+        self.docs: Dict[str, dict] = {}
+        self.name_postings: Dict[str, Set[str]] = defaultdict(set)
+        self.desc_postings: Dict[str, Set[str]] = defaultdict(set)
+        self.vocabulary: List[str] = []  # sorted, for prefix ranges
+        self.facets: Dict[str, Dict[object, Set[str]]] = {f: defaultdict(set) for f in FACETS}
+
+    # --- maintenance ---
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self.built = False
+
+    def rebuild(self, db: Session):
+        drills = db.query(Drill).all()
+        with self._lock:
+            self._reset()
+            for drill in drills:
+                self._add_doc(drill_to_dict(drill))
+            self.vocabulary = sorted(set(self.name_postings) | set(self.desc_postings))
+            self.built = True
+            self.version += 1
+            self._last_sync_check = time.monotonic()
+
+    def add(self, drill: Drill):
+        """Incremental update after a drill is created (or edited)."""
+        with self._lock:
+            if not self.built:
+                return  # first search builds everything anyway
+            if drill.id in self.docs:
+                self._remove_doc(drill.id)
+            new_terms = self._add_doc(drill_to_dict(drill))
+            for term in new_terms:
+                idx = bisect_left(self.vocabulary, term)
+                if idx == len(self.vocabulary) or self.vocabulary[idx] != term:
+                    self.vocabulary.insert(idx, term)
+            self.version += 1
+
+    def _add_doc(self, doc: dict) -> Set[str]:
+        drill_id = doc["id"]
+        self.docs[drill_id] = doc
+        terms = set()
+        for token in tokenize(doc["name"]):
+            self.name_postings[token].add(drill_id)
+            terms.add(token)
+        for token in tokenize(doc["description"]):
+            self.desc_postings[token].add(drill_id)
+            terms.add(token)
+        for facet in FACETS:
+            self.facets[facet][doc[facet]].add(drill_id)
+        return terms
+
+    def _remove_doc(self, drill_id: str):
+        doc = self.docs.pop(drill_id)
+        for token in tokenize(doc["name"]):
+            self.name_postings[token].discard(drill_id)
+        for token in tokenize(doc["description"]):
+            self.desc_postings[token].discard(drill_id)
+        for facet in FACETS:
+            self.facets[facet][doc[facet]].discard(drill_id)
+
+    def ensure_fresh(self, db: Session):
+        if not self.built:
+            self.rebuild(db)
+            return
+        now = time.monotonic()
+        if now - self._last_sync_check < RESYNC_SECONDS:
+            return
+        self._last_sync_check = now
+        count = db.query(func.count(Drill.id)).scalar()
+        if count != len(self.docs):
+            self.rebuild(db)
+
+    def catalog(self):
+        """
+        (fingerprint, docs sorted by id) for the whole library. The fingerprint
+        is a content hash, so every worker agrees on it for the same drills
+        (unlike `version`, which is per process). Memoized per version.
+        """
+        with self._lock:
+            if self._catalog is None or self._catalog[0] != self.version:
+                docs = [self.docs[d] for d in sorted(self.docs)]
+                digest = hashlib.sha256(json.dumps(
+                    [[d["id"], d["name"], d["category"], d["difficulty"], d["description"]] for d in docs]
+                ).encode()).hexdigest()
+                self._catalog = (self.version, digest, docs)
+            return self._catalog[1], self._catalog[2]
+
+    # --- querying ---
+
+    def _expand(self, prefix: str) -> List[str]:
+        start = bisect_left(self.vocabulary, prefix)
+        terms = []
+        for term in self.vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _text_scores(self, q: str) -> Optional[Dict[str, float]]:
+        """None = no text query (match all). Every token must prefix-match name or description."""
+        tokens = tokenize(q)
+        if not tokens:
+            return None
+        scores: Optional[Dict[str, float]] = None
+        for token in tokens:
+            token_scores: Dict[str, float] = {}
+            # Weakest matches first so stronger ones overwrite them (best match per drill wins)
+            expanded = sorted(
+                ((DESCRIPTION_WEIGHT if field is self.desc_postings else NAME_WEIGHT) * (1.0 if term == token else 0.5), field, term)
+                for term in self._expand(token)
+                for field in (self.desc_postings, self.name_postings)
+                if field.get(term)
+            )
+            for weight, field, term in expanded:
+                token_scores.update(dict.fromkeys(field[term], weight))
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {d: s + token_scores[d] for d, s in scores.items() if d in token_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def search(self, q: str = "", filters: Dict[str, object] = None, limit: int = 20, offset: int = 0):
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        with self._lock:
+            scores = self._text_scores(q)
+            base = set(self.docs) if scores is None else set(scores)
+
+            filtered_by = {facet: self.facets[facet].get(value, set()) for facet, value in filters.items()}
+            matched = base
+            for ids in filtered_by.values():
+                matched = matched & ids
+
+            # Disjunctive facet counts: each facet is counted with every *other* filter applied
+            facet_counts = {}
+            for facet in FACETS:
+                candidates = base
+                for other, ids in filtered_by.items():
+                    if other != facet:
+                        candidates = candidates & ids
+                facet_counts[facet] = {
+                    str(value).lower() if isinstance(value, bool) else value: len(ids & candidates)
+                    for value, ids in self.facets[facet].items()
+                    if value is not None and ids & candidates
+                }
+
+            # Only the requested page is ordered - typeahead asks for the top few
+            scores = scores or {}
+            page = heapq.nsmallest(
+                offset + limit, matched,
+                key=lambda d: (-scores.get(d, 0), (self.docs[d]["name"] or "").lower()),
+            )
+            items = [self.docs[d] for d in page[offset:]]
+            return {"total": len(matched), "items": items, "facets": facet_counts, "index_version": self.version}
+
+
+DRILL_INDEX = DrillIndex()
@@ -0,0 +1,236 @@
+"""
+XP leaderboards (global, per coach, per squad, per level).
+
+Each scope is an in-memory board: a sorted list of (-xp, user_id) plus a
+user -> xp map, built with one query the first time it is read. Rank is a
+bisect (O(log n)), top-K and "me with N neighbours" are slices, so rank
+lookups never scan the users table.
+
+Boards are kept current incrementally: `award_xp` leaves the XP delta on
+the session, and after the transaction commits every loaded board holding
+that player moves it. Changes that alter membership (new players, coach or
+level changes, squad joins/leaves) simply drop the affected boards, which
+rebuild on next read. Boards also rebuild after LEADERBOARD_TTL_SECONDS,
+which bounds drift from writes made by other worker processes.
+
+With per-club shards the global and level boards are built from every
+shard; coach and squad boards only ever hold one club.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from app.core.metrics import record_cache
+from app.core.sharding import fan_out
+from app.models.user import User, SquadMember
+
+SCOPES = ("global", "coach", "squad", "level")
+# Boards spanning clubs: built from every shard (the others live in one club's shard)
+CROSS_CLUB_SCOPES = ("global", "level")
+TTL_SECONDS = float(os.getenv("LEADERBOARD_TTL_SECONDS", "300"))
+PENDING_KEY = "leaderboard_xp_deltas"
+MEMBERSHIP_KEY = "leaderboard_invalidations"
+
+
+class Board:
+    def __init__(self, scores: Dict[str, int]):
+        self.xp = dict(scores)
+        self.order: List[Tuple[int, str]] = sorted((-xp, uid) for uid, xp in self.xp.items())
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.order)
+
+    def move(self, user_id: str, new_xp: int):
+        old = self.xp.get(user_id)
+        if old is None:
+            return
+        idx = bisect_left(self.order, (-old, user_id))
+        if idx < len(self.order) and self.order[idx] == (-old, user_id):
+            del self.order[idx]
+        self.xp[user_id] = new_xp
+        insort(self.order, (-new_xp, user_id))
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """Competition ranking: ties share a rank (1, 2, 2, 4)."""
+        xp = self.xp.get(user_id)
+        if xp is None:
+            return None
+        return bisect_left(self.order, (-xp, "")) + 1
+
+    def index(self, user_id: str) -> Optional[int]:
+        xp = self.xp.get(user_id)
+        if xp is None:
+            return None
+        return bisect_left(self.order, (-xp, user_id))
+
+    def entries(self, start: int, stop: int):
+        """[(rank, user_id, xp)] for positions start..stop."""
+        start = max(start, 0)
+        return [(self.rank(uid), uid, -neg_xp) for neg_xp, uid in self.order[start:stop]]
+
+
+class LeaderboardService:
+    def __init__(self, ttl: float = TTL_SECONDS):
+        self.ttl = ttl
+        self._boards: Dict[Tuple[str, str], Board] = {}
+        self._lock = threading.RLock()
+
+    # --- building ---
+
+    def _load_scores(self, db: Session, scope: str, key: str) -> Dict[str, int]:
+        query = db.query(User.id, func.coalesce(User.xp, 0)).filter(func.upper(User.role) == "PLAYER")
+        if scope == "coach":
+            query = query.filter(User.coach_id == key)
+        elif scope == "squad":
+            query = query.join(SquadMember, SquadMember.player_id == User.id).filter(SquadMember.squad_id == key)
+        elif scope == "level":
+            query = query.filter(User.level == key)
+        elif scope != "global":
+            raise ValueError(f"Unknown leaderboard scope: {scope}")
+        if scope not in CROSS_CLUB_SCOPES:
+            return dict(query.all())
+        scores = {}
+        for shard_scores in fan_out(db, lambda session: dict(query.with_session(session).all())).values():
+            scores.update(shard_scores)
+        return scores
+
+    def board(self, db: Session, scope: str, key: str = "") -> Board:
+        key = key or ""
+        with self._lock:
+            board = self._boards.get((scope, key))
+            fresh = board is not None and time.monotonic() - board.built_at < self.ttl
+            record_cache("leaderboard", fresh)
+            if fresh:
+                return board
+        # Build outside the lock (one indexed query); last writer wins
+        board = Board(self._load_scores(db, scope, key))
+        with self._lock:
+            self._boards[(scope, key)] = board
+        return board
+
+    # --- incremental maintenance ---
+
+    def apply_deltas(self, deltas: Dict[str, int]):
+        with self._lock:
+            for board in self._boards.values():
+                for user_id, delta in deltas.items():
+                    if user_id in board.xp:
+                        board.move(user_id, board.xp[user_id] + delta)
+
+    def set_xp(self, values: Dict[str, int]):
+        with self._lock:
+            for board in self._boards.values():
+                for user_id, xp in values.items():
+                    if user_id in board.xp:
+                        board.move(user_id, xp)
+
+    def invalidate(self, scopes):
+        with self._lock:
+            for scope_key in scopes:
+                self._boards.pop(scope_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+
+LEADERBOARDS = LeaderboardService()
+
+
+# =======================
+# SESSION HOOKS
+# =======================
+
+def add_pending_xp(db: Session, user_id: str, amount: int):
+    """Called by award_xp: applied to the boards only if the transaction commits."""
+    pending = db.info.setdefault(PENDING_KEY, {})
+    pending[user_id] = pending.get(user_id, 0) + amount
+
+
+def _after_flush(session: Session, flush_context):
+    invalidations = session.info.setdefault(MEMBERSHIP_KEY, {"scopes": set(), "xp": {}})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SquadMember):
+            invalidations["scopes"].add(("squad", obj.squad_id or ""))
+        elif isinstance(obj, User):
+            state = inspect(obj)
+            membership_changed = obj in session.new or obj in session.deleted
+            for attr in ("coach_id", "level", "role"):
+                history = state.attrs[attr].history
+                if history.has_changes():
+                    membership_changed = True
+                    for value in list(history.deleted or ()) + list(history.added or ()):
+                        if attr == "coach_id":
+                            invalidations["scopes"].add(("coach", value or ""))
+                        elif attr == "level":
+                            invalidations["scopes"].add(("level", value or ""))
+            if membership_changed:
+                invalidations["scopes"].update({("global", ""), ("coach", obj.coach_id or ""), ("level", obj.level or "")})
+            xp_history = state.attrs["xp"].history
+            if xp_history.added and isinstance(xp_history.added[0], int):
+                # Plain assignment (seeds, reconcile) - SQL increments arrive via add_pending_xp
+                invalidations["xp"][obj.id] = xp_history.added[0]
+
+
+def _after_commit(session: Session):
+    deltas = session.info.pop(PENDING_KEY, None)
+    invalidations = session.info.pop(MEMBERSHIP_KEY, None)
+    if invalidations:
+        LEADERBOARDS.invalidate(invalidations["scopes"])
+        if invalidations["xp"]:
+            LEADERBOARDS.set_xp(invalidations["xp"])
+    if deltas:
+        LEADERBOARDS.apply_deltas(deltas)
+
+
+def _after_rollback(session: Session):
+    session.info.pop(PENDING_KEY, None)
+    session.info.pop(MEMBERSHIP_KEY, None)
+
+
+def install_leaderboard_hooks():
+    """Keep in-memory boards in step with committed writes (idempotent)."""
+    if not event.contains(Session, "after_commit", _after_commit):
+        event.listen(Session, "after_flush", _after_flush)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "after_rollback", _after_rollback)
+
+
+# =======================
+# READS
+# =======================
+
+def leaderboard_view(db: Session, scope: str, key: str, user: Optional[User], limit: int = 10, around: int = 2) -> dict:
+    board = LEADERBOARDS.board(db, scope, key)
+    top = board.entries(0, limit)
+    me, neighbours = None, []
+    idx = board.index(user.id) if user is not None else None
+    if idx is not None:
+        me = {"rank": board.rank(user.id), "xp": board.xp[user.id]}
+        neighbours = board.entries(idx - around, idx + around + 1)
+
+    user_ids = {uid for _, uid, _ in top + neighbours}
+    names = {}
+    if user_ids:
+        def load_names(session):
+            return dict(session.query(User.id, User.name).filter(User.id.in_(user_ids)).all())
+        for shard_names in (fan_out(db, load_names).values() if scope in CROSS_CLUB_SCOPES else [load_names(db)]):
+            names.update(shard_names)
+
+    def shape(rows):
+        return [{"rank": rank, "player_id": uid, "name": names.get(uid), "xp": xp} for rank, uid, xp in rows]
+
+    return {
+        "scope": scope,
+        "scope_id": key or None,
+        "total": len(board),
+        "top": shape(top),
+        "me": me,
+        "neighbours": shape(neighbours),
+    }
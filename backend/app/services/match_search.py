@@ -0,0 +1,209 @@
+"""
+Full-text search over the match diary.
+
+SQLite: an FTS5 table (match_entries_fts) whose rowid mirrors
+match_entries.rowid, updated by `index_match` inside the writer's transaction
+and ranked with bm25 (opponent > event > tactics > reflection/feedback).
+MySQL: a FULLTEXT index on match_entries queried in BOOLEAN MODE; the index is
+maintained by MySQL itself so `index_match` is a no-op there.
+
+User input is never passed through as query syntax: it is split into word
+tokens and each becomes a quoted prefix term, all of which must match.
+"""
+import re
+from typing import List, Optional
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.orm import Session
+
+from app.core.log import get_logger
+from app.models.user import MatchEntry, MATCH_FTS_COLUMNS
+
+logger = get_logger(__name__)
+
+FTS_TABLE = "match_entries_fts"
+MYSQL_INDEX = "ft_match_entries"
+# bm25 weights, in MATCH_FTS_COLUMNS order
+COLUMN_WEIGHTS = (10.0, 5.0, 2.0, 1.0, 1.0)
+SNIPPET_TOKENS = 12
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _dialect(db_or_engine) -> str:
+    bind = db_or_engine.get_bind() if isinstance(db_or_engine, Session) else db_or_engine
+    return bind.dialect.name
+
+
+def tokenize(q: str) -> List[str]:
+    return _TOKEN_RE.findall(q or "")[:10]
+
+
+# =======================
+# 1. INDEX MAINTENANCE
+# =======================
+
+def ensure_match_search_index(engine):
+    """Create (and populate) the search index for databases that predate it."""
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {"name": FTS_TABLE}
+            ).first()
+            if exists:
+                return
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({', '.join(MATCH_FTS_COLUMNS)}, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+            rebuild_sqlite_index(conn)
+    elif dialect == "mysql":
+        existing = {ix["name"] for ix in inspect(engine).get_indexes("match_entries")}
+        if MYSQL_INDEX not in existing:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE match_entries ADD FULLTEXT INDEX {MYSQL_INDEX} ({', '.join(MATCH_FTS_COLUMNS)})"
+                ))
+
+
+def rebuild_sqlite_index(conn):
+    cols = ", ".join(MATCH_FTS_COLUMNS)
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}(rowid, {cols}) SELECT rowid, {cols} FROM match_entries"))
+
+
+def index_match(db: Session, match: MatchEntry):
+    """Upsert one match into the FTS table. Call after changing any indexed column."""
+    if _dialect(db) != "sqlite":
+        return
+    db.flush()
+    cols = ", ".join(MATCH_FTS_COLUMNS)
+    rowid_sql = "(SELECT rowid FROM match_entries WHERE id = :id)"
+    db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = {rowid_sql}"), {"id": match.id})
+    db.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, {cols}) SELECT rowid, {cols} FROM match_entries WHERE id = :id"),
+        {"id": match.id},
+    )
+
+
+def unindex_matches(db: Session, match_ids: List[str]):
+    """Drop the FTS rows of matches about to be deleted with Core (before the delete: the rowid is looked up)."""
+    if _dialect(db) != "sqlite" or not match_ids:
+        return
+    stmt = text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT rowid FROM match_entries WHERE id IN :ids)")
+    db.execute(stmt.bindparams(bindparam("ids", expanding=True)), {"ids": list(match_ids)})
+
+
+def reindex_matches(db: Session, match_ids: List[str]):
+    """Re-index matches written with Core (bulk copies): index_match for many rows, no flush."""
+    if _dialect(db) != "sqlite" or not match_ids:
+        return
+    unindex_matches(db, match_ids)
+    cols = ", ".join(MATCH_FTS_COLUMNS)
+    stmt = text(f"INSERT INTO {FTS_TABLE}(rowid, {cols}) SELECT rowid, {cols} FROM match_entries WHERE id IN :ids")
+    db.execute(stmt.bindparams(bindparam("ids", expanding=True)), {"ids": list(match_ids)})
+
+
+# =======================
+# 2. QUERIES
+# =======================
+
+def _fts5_query(tokens: List[str], column: Optional[str] = None) -> str:
+    prefix = f"{column} : " if column else ""
+    return " AND ".join(f'{prefix}"{t}"*' for t in tokens)
+
+
+def _python_snippet(row, tokens: List[str]) -> Optional[str]:
+    lowered = [t.lower() for t in tokens]
+    for col in MATCH_FTS_COLUMNS:
+        value = getattr(row, col, None) or ""
+        words = value.split()
+        for i, word in enumerate(words):
+            if any(word.lower().startswith(t) for t in lowered):
+                start = max(0, i - SNIPPET_TOKENS // 2)
+                window = words[start:start + SNIPPET_TOKENS]
+                window = [f"[{w}]" if any(w.lower().startswith(t) for t in lowered) else w for w in window]
+                return ("…" if start else "") + " ".join(window) + ("…" if start + SNIPPET_TOKENS < len(words) else "")
+    return None
+
+
+def search_matches(db: Session, user_ids: List[str], q: str, limit: int = 20, offset: int = 0):
+    """
+    Ranked search scoped to `user_ids`. Returns a list of dicts:
+    {id, user_id, date, event_name, opponent_name, score, result, rank, snippet}
+    """
+    tokens = tokenize(q)
+    if not tokens or not user_ids:
+        return []
+    dialect = _dialect(db)
+    params = {"user_ids": list(user_ids), "limit": limit, "offset": offset}
+
+    if dialect == "sqlite":
+        weights = ", ".join(str(w) for w in COLUMN_WEIGHTS)
+        stmt = text(f"""
+            SELECT m.id, m.user_id, m.date, m.event_name, m.opponent_name, m.score, m.result,
+                   bm25({FTS_TABLE}, {weights}) AS rank,
+                   snippet({FTS_TABLE}, -1, '[', ']', '…', {SNIPPET_TOKENS}) AS snippet
+            FROM {FTS_TABLE} JOIN match_entries m ON m.rowid = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH :q AND m.user_id IN :user_ids
+            ORDER BY rank LIMIT :limit OFFSET :offset
+        """).bindparams(bindparam("user_ids", expanding=True))
+        params["q"] = _fts5_query(tokens)
+        return [dict(row._mapping) for row in db.execute(stmt, params)]
+
+    if dialect == "mysql":
+        cols = ", ".join(MATCH_FTS_COLUMNS)
+        stmt = text(f"""
+            SELECT id, user_id, date, event_name, opponent_name, score, result,
+                   tactics, reflection, coach_feedback,
+                   MATCH({cols}) AGAINST (:q IN BOOLEAN MODE) AS relevance
+            FROM match_entries
+            WHERE MATCH({cols}) AGAINST (:q IN BOOLEAN MODE) AND user_id IN :user_ids
+            ORDER BY relevance DESC LIMIT :limit OFFSET :offset
+        """).bindparams(bindparam("user_ids", expanding=True))
+        params["q"] = " ".join(f"+{t}*" for t in tokens)
+        results = []
+        for row in db.execute(stmt, params):
+            results.append({
+                "id": row.id, "user_id": row.user_id, "date": row.date, "event_name": row.event_name,
+                "opponent_name": row.opponent_name, "score": row.score, "result": row.result,
+                "rank": -float(row.relevance), "snippet": _python_snippet(row, tokens),
+            })
+        return results
+
+    # Other dialects: unindexed fallback so the endpoint still works
+    query = db.query(MatchEntry).filter(MatchEntry.user_id.in_(user_ids))
+    for t in tokens:
+        pattern = f"%{t}%"
+        query = query.filter(
+            MatchEntry.opponent_name.ilike(pattern) | MatchEntry.event_name.ilike(pattern)
+            | MatchEntry.tactics.ilike(pattern) | MatchEntry.reflection.ilike(pattern)
+            | MatchEntry.coach_feedback.ilike(pattern)
+        )
+    rows = query.order_by(MatchEntry.date.desc()).offset(offset).limit(limit).all()
+    return [{
+        "id": m.id, "user_id": m.user_id, "date": m.date, "event_name": m.event_name,
+        "opponent_name": m.opponent_name, "score": m.score, "result": m.result,
+        "rank": 0.0, "snippet": _python_snippet(m, tokens),
+    } for m in rows]
+
+
+def filter_by_opponent(db: Session, query, opponent: str):
+    """Narrow a MatchEntry query to opponent-name prefix matches using the index."""
+    tokens = tokenize(opponent)
+    if not tokens:
+        return query
+    dialect = _dialect(db)
+    if dialect == "sqlite":
+        return query.filter(text(
+            f"match_entries.rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :opp_q)"
+        ).bindparams(opp_q=_fts5_query(tokens, column="opponent_name")))
+    if dialect == "mysql":
+        return query.filter(
+            text(f"MATCH({', '.join(MATCH_FTS_COLUMNS)}) AGAINST (:opp_q IN BOOLEAN MODE)").bindparams(
+                opp_q=" ".join(f"+{t}*" for t in tokens)
+            ),
+            MatchEntry.opponent_name.ilike(f"%{opponent}%"),
+        )
+    return query.filter(MatchEntry.opponent_name.ilike(f"%{opponent}%"))
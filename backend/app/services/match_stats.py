@@ -0,0 +1,269 @@
+"""
+Structured match scores and per-player stats rollups.
+
+`MatchEntry.score` is free text ("6-4 7-6(5)", "4-6, 6-3, [10-7]", "6-2 3-1 ret").
+It is parsed once on write into set/game/tiebreak columns on the match, and
+every completed match contributes counters to `player_match_stats` rows
+(overall, by surface, environment, format and opponent).
+
+Rollups are maintained as deltas: a write computes the match's contribution
+before and after the change and applies the difference with SQL-side
+increments, so concurrent writes for the same player never lose updates.
+"""
+import json
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.user import MatchEntry, PlayerMatchStats
+
+DIMENSIONS = ("overall", "surface", "environment", "format", "opponent")
+COUNTERS = (
+    "matches", "wins", "losses", "sets_won", "sets_lost",
+    "games_won", "games_lost", "tiebreaks_won", "tiebreaks_lost",
+)
+SCORE_FIELDS = ("score", "result", "surface", "environment", "match_format", "opponent_name")
+
+# 6-4 | 7-6(5) | 7-6 (7-5) | [10-8]
+_SET_RE = re.compile(r"(\[)?\s*(\d{1,2})\s*[-–:/]\s*(\d{1,2})\s*(\])?(?:\s*\(\s*(\d{1,2})(?:\s*[-–:/]\s*(\d{1,2}))?\s*\))?")
+_RETIRED_RE = re.compile(r"\b(ret|retired|def|dq)\b", re.IGNORECASE)
+_WALKOVER_RE = re.compile(r"\b(w/?o|walkover)\b", re.IGNORECASE)
+
+
+# =======================
+# 1. PARSING
+# =======================
+
+def parse_score(score: Optional[str]) -> Optional[dict]:
+    """
+    Parse a score (from the player's side) into sets, games and tiebreaks.
+    Returns None when nothing score-like is found.
+
+    A final set to 10+ with neither side reaching 6 games the usual way
+    (or written in [brackets]) is treated as a match tiebreak: it counts as a
+    set and a tiebreak but adds no games.
+    """
+    if not score or _WALKOVER_RE.search(score):
+        return None
+    sets = []
+    for bracket_open, a, b, bracket_close, tb1, tb2 in _SET_RE.findall(score):
+        a, b = int(a), int(b)
+        sets.append({
+            "won": a, "lost": b,
+            "match_tiebreak": bool(bracket_open or bracket_close),
+            "tiebreak_points": [int(tb1)] + ([int(tb2)] if tb2 else []) if tb1 else None,
+        })
+    if not sets:
+        return None
+    last = sets[-1]
+    if len(sets) > 1 and max(last["won"], last["lost"]) >= 10:
+        last["match_tiebreak"] = True
+    retired = bool(_RETIRED_RE.search(score))
+
+    parsed = {"sets_won": 0, "sets_lost": 0, "games_won": 0, "games_lost": 0,
+              "tiebreaks_won": 0, "tiebreaks_lost": 0, "set_scores": [], "retired": retired}
+    for s in sets:
+        won, lost = s["won"], s["lost"]
+        row = [won, lost]
+        if s["tiebreak_points"]:
+            row.append(min(s["tiebreak_points"]))
+        parsed["set_scores"].append(row)
+
+        if won == lost:
+            # Unfinished set (retirement / rain) - games only
+            parsed["games_won"] += won
+            parsed["games_lost"] += lost
+            continue
+        if not s["match_tiebreak"]:
+            parsed["games_won"] += won
+            parsed["games_lost"] += lost
+            finished = max(won, lost) >= 6 and (abs(won - lost) >= 2 or {won, lost} == {6, 7})
+            if not finished:
+                continue
+        player_won_set = won > lost
+        parsed["sets_won" if player_won_set else "sets_lost"] += 1
+        if s["match_tiebreak"] or {won, lost} == {6, 7} or s["tiebreak_points"]:
+            parsed["tiebreaks_won" if player_won_set else "tiebreaks_lost"] += 1
+    return parsed
+
+
+def derive_outcome(parsed: Optional[dict], result: Optional[str]) -> Optional[str]:
+    """
+    Win/Loss from the parsed sets when they are decisive; otherwise fall back
+    to the free-text result (retirements, walkovers, unparseable scores).
+    """
+    if parsed and not parsed["retired"] and parsed["sets_won"] != parsed["sets_lost"]:
+        return "Win" if parsed["sets_won"] > parsed["sets_lost"] else "Loss"
+    text = (result or "").strip().lower()
+    if text.startswith("w"):
+        return "Win"
+    if text.startswith("l"):
+        return "Loss"
+    return None
+
+
+def apply_parsed_score(match: MatchEntry):
+    """Write the structured score columns on the match from score/result."""
+    parsed = parse_score(match.score)
+    match.outcome = derive_outcome(parsed, match.result)
+    if parsed is None:
+        match.set_scores = None
+        match.sets_won = match.sets_lost = match.games_won = match.games_lost = None
+        match.tiebreaks_won = match.tiebreaks_lost = None
+        return
+    match.set_scores = json.dumps(parsed["set_scores"], separators=(",", ":"))
+    for field in ("sets_won", "sets_lost", "games_won", "games_lost", "tiebreaks_won", "tiebreaks_lost"):
+        setattr(match, field, parsed[field])
+
+
+# =======================
+# 2. ROLLUPS
+# =======================
+
+def _normalize(value: Optional[str]) -> str:
+    return " ".join((value or "").split()).lower()
+
+
+def match_contribution(match: MatchEntry) -> Dict[Tuple[str, str], dict]:
+    """(dimension, key) -> counter deltas this match adds. Uncompleted matches add nothing."""
+    if match.outcome is None:
+        return {}
+    counters = {
+        "matches": 1,
+        "wins": 1 if match.outcome == "Win" else 0,
+        "losses": 1 if match.outcome == "Loss" else 0,
+    }
+    for field in ("sets_won", "sets_lost", "games_won", "games_lost", "tiebreaks_won", "tiebreaks_lost"):
+        counters[field] = getattr(match, field) or 0
+
+    keys = {
+        ("overall", ""): None,
+        ("surface", _normalize(match.surface)): match.surface,
+        ("environment", _normalize(match.environment)): match.environment,
+        ("format", _normalize(match.match_format or "Singles")): match.match_format or "Singles",
+        ("opponent", _normalize(match.opponent_name)): match.opponent_name,
+    }
+    return {
+        (dimension, key): dict(counters, label=label)
+        for (dimension, key), label in keys.items()
+        if dimension == "overall" or key
+    }
+
+
+def _apply_deltas(db: Session, user_id: str, deltas: Dict[Tuple[str, str], dict]):
+    for (dimension, key), delta in deltas.items():
+        label = delta.pop("label", None)
+        if not any(delta.values()):
+            continue
+        row_filter = (
+            (PlayerMatchStats.user_id == user_id)
+            & (PlayerMatchStats.dimension == dimension)
+            & (PlayerMatchStats.key == key)
+        )
+        values = {getattr(PlayerMatchStats, c): getattr(PlayerMatchStats, c) + delta.get(c, 0) for c in COUNTERS}
+        if label:
+            values[PlayerMatchStats.label] = label
+        updated = db.query(PlayerMatchStats).filter(row_filter).update(values, synchronize_session=False)
+        if updated:
+            continue
+        try:
+            with db.begin_nested():
+                db.add(PlayerMatchStats(
+                    user_id=user_id, dimension=dimension, key=key, label=label,
+                    **{c: delta.get(c, 0) for c in COUNTERS}
+                ))
+        except IntegrityError:
+            # Lost the insert race - the row exists now, increment it instead
+            db.query(PlayerMatchStats).filter(row_filter).update(values, synchronize_session=False)
+
+
+def record_match_change(db: Session, match: MatchEntry, before: Optional[Dict[Tuple[str, str], dict]] = None):
+    """
+    Re-parse the match and move the owner's rollups by (new - before).
+    `before` is match_contribution() captured prior to mutating the match
+    (None for a new match). Does not commit.
+    """
+    apply_parsed_score(match)
+    after = match_contribution(match)
+    deltas: Dict[Tuple[str, str], dict] = {}
+    for (dimension, key), counters in after.items():
+        deltas[(dimension, key)] = dict(counters)
+    for (dimension, key), counters in (before or {}).items():
+        row = deltas.setdefault((dimension, key), {c: 0 for c in COUNTERS})
+        for c in COUNTERS:
+            row[c] = row.get(c, 0) - counters[c]
+    _apply_deltas(db, match.user_id, deltas)
+
+
+# =======================
+# 3. READS
+# =======================
+
+def _stats_dict(row) -> dict:
+    played_sets = row.sets_won + row.sets_lost
+    played_tiebreaks = row.tiebreaks_won + row.tiebreaks_lost
+    return {
+        "matches": row.matches,
+        "wins": row.wins,
+        "losses": row.losses,
+        "win_pct": round(100.0 * row.wins / row.matches, 1) if row.matches else None,
+        "sets_won": row.sets_won,
+        "sets_lost": row.sets_lost,
+        "set_win_pct": round(100.0 * row.sets_won / played_sets, 1) if played_sets else None,
+        "games_won": row.games_won,
+        "games_lost": row.games_lost,
+        "tiebreaks_won": row.tiebreaks_won,
+        "tiebreaks_lost": row.tiebreaks_lost,
+        "tiebreak_win_pct": round(100.0 * row.tiebreaks_won / played_tiebreaks, 1) if played_tiebreaks else None,
+    }
+
+
+def get_player_stats(db: Session, user_id: str) -> dict:
+    """One indexed read of the player's rollup rows, shaped for the stats screen."""
+    rows = db.query(PlayerMatchStats).filter(PlayerMatchStats.user_id == user_id).all()
+    overall = next((r for r in rows if r.dimension == "overall"), None)
+    result = {
+        "overall": _stats_dict(overall) if overall else _stats_dict(PlayerMatchStats(**{c: 0 for c in COUNTERS})),
+        "by_surface": [],
+        "by_environment": [],
+        "by_format": [],
+        "head_to_head": [],
+    }
+    buckets = {"surface": "by_surface", "environment": "by_environment", "format": "by_format", "opponent": "head_to_head"}
+    for row in rows:
+        if row.dimension in buckets and row.matches:
+            result[buckets[row.dimension]].append(dict(_stats_dict(row), name=row.label or row.key))
+    for name in buckets.values():
+        result[name].sort(key=lambda s: (-s["matches"], s["name"].lower()))
+    return result
+
+
+# =======================
+# 4. BACKFILL
+# =======================
+
+def backfill_match_stats(db: Session, batch_size: int = 500) -> int:
+    """Re-parse every match and rebuild all rollups from scratch. Returns matches processed."""
+    db.query(PlayerMatchStats).delete(synchronize_session=False)
+    totals: Dict[str, Dict[Tuple[str, str], dict]] = defaultdict(dict)
+    processed = 0
+    for match in db.query(MatchEntry).order_by(MatchEntry.id).yield_per(batch_size):
+        apply_parsed_score(match)
+        for dk, counters in match_contribution(match).items():
+            row = totals[match.user_id].setdefault(dk, {c: 0 for c in COUNTERS})
+            for c in COUNTERS:
+                row[c] += counters[c]
+            row["label"] = counters["label"]
+        processed += 1
+    db.flush()
+
+    rows: List[PlayerMatchStats] = []
+    for user_id, per_key in totals.items():
+        for (dimension, key), counters in per_key.items():
+            rows.append(PlayerMatchStats(user_id=user_id, dimension=dimension, key=key, **counters))
+    db.add_all(rows)
+    db.commit()
+    return processed
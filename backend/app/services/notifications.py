@@ -0,0 +1,199 @@
+"""
+Notification digests and retention.
+
+`notify` is how notifications get written. A repeat of the same
+(recipient, type, related player, reference) while an earlier one is still
+unread doesn't add a row: it bumps `count` (SQL-side increment), takes the
+newest title/message and moves `last_at`, so a coach sees one "Match Update"
+x7 instead of seven rows. Sessions don't autoflush, so rows added earlier in
+the same transaction are found through `db.info` and repeated bumps stack.
+
+The retention job (background loop, or `python manage.py notification-retention`):
+
+    1. collapses unread duplicates the write path missed (two writes racing,
+       rows from before digests) into the newest row of each group
+    2. moves read notifications older than NOTIFICATION_RETENTION_DAYS into
+       notifications_archive, NOTIFICATION_ARCHIVE_BATCH rows per transaction
+       (copy + sync tombstone + delete commit together, and no write lock is
+       held for longer than one batch)
+
+Archived rows leave the inbox and the sync feed but stay readable from
+GET /notifications/archive.
+
+Config (env):
+    NOTIFICATION_RETENTION_DAYS       read notifications kept in the inbox, default 30
+    NOTIFICATION_ARCHIVE_BATCH        rows moved per transaction, default 500
+    NOTIFICATION_RETENTION_SECONDS    background job interval, default 3600
+"""
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import func, insert, inspect, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ClauseElement
+
+from app.core.background import run_job
+from app.core.sharding import for_each_shard
+from app.core.log import get_logger
+from app.models.activity import ChangeLogEntry
+from app.models.user import ArchivedNotification, Notification
+from app.services.sync import DELETE
+
+RETENTION = timedelta(days=float(os.getenv("NOTIFICATION_RETENTION_DAYS", "30")))
+ARCHIVE_BATCH = int(os.getenv("NOTIFICATION_ARCHIVE_BATCH", "500"))
+RETENTION_INTERVAL = float(os.getenv("NOTIFICATION_RETENTION_SECONDS", "3600"))
+COLLAPSE_BATCH = 200  # duplicate groups per transaction
+PENDING_DIGESTS = "notification_digests"  # db.info: digest key -> Notification not flushed yet
+
+ARCHIVED_COLUMNS = ("id", "user_id", "related_user_id", "title", "message", "type", "reference_id", "count", "created_at", "last_at")
+
+logger = get_logger(__name__)
+
+
+def last_activity():
+    """When a notification last changed (digest bump or creation) - inbox order and retention age."""
+    return func.coalesce(Notification.last_at, Notification.created_at)
+
+
+def _digest_key(user_id: str, type: str, related_user_id: Optional[str], reference_id: Optional[str]):
+    def same(column, value):
+        return column.is_(None) if value is None else column == value
+    return (
+        Notification.user_id == user_id,
+        Notification.type == type,
+        same(Notification.related_user_id, related_user_id),
+        same(Notification.reference_id, reference_id),
+    )
+
+
+# =======================
+# 1. WRITES
+# =======================
+
+def notify(
+    db: Session, user_id: str, title: str, message: str, type: str,
+    reference_id: Optional[str] = None, related_user_id: Optional[str] = None, now: datetime = None,
+) -> Optional[Notification]:
+    """Create a notification, or fold it into the recipient's unread one with the same key. No commit."""
+    if not user_id:
+        return None
+    now = now or datetime.utcnow()
+    pending = db.info.setdefault(PENDING_DIGESTS, {})
+    key = (user_id, type, related_user_id, reference_id)
+    existing = pending.get(key)
+    if existing is None or existing not in db.new:
+        # Flushed rows are in the table now (and come back as the same instance)
+        existing = (
+            db.query(Notification)
+            .filter(*_digest_key(user_id, type, related_user_id, reference_id), Notification.is_read == False)
+            .order_by(last_activity().desc())
+            .first()
+        )
+    if existing is not None:
+        count = inspect(existing).dict.get("count")
+        if isinstance(count, ClauseElement):
+            existing.count = count + 1  # bumped already in this transaction - add to that
+        elif existing in db.new:
+            existing.count = (count or 1) + 1
+        else:
+            existing.count = func.coalesce(Notification.count, 1) + 1
+        existing.title, existing.message, existing.last_at = title, message, now
+        return existing
+    notif = Notification(
+        user_id=user_id, title=title, message=message, type=type,
+        reference_id=reference_id, related_user_id=related_user_id,
+        count=1, created_at=now, last_at=now,
+    )
+    db.add(notif)
+    pending[key] = notif
+    return notif
+
+
+# =======================
+# 2. RETENTION
+# =======================
+
+def collapse_duplicates(db: Session, batch_size: int = COLLAPSE_BATCH) -> int:
+    """
+    Merge unread rows sharing a digest key into the most recent one (counts
+    summed). ORM deletes, so the sync log gets its tombstones. Returns rows removed.
+    """
+    key = (Notification.user_id, Notification.type, Notification.related_user_id, Notification.reference_id)
+    removed = 0
+    while True:
+        groups = {
+            tuple(row) for row in
+            db.query(*key).filter(Notification.is_read == False).group_by(*key).having(func.count() > 1).limit(batch_size)
+        }
+        if not groups:
+            return removed
+        rows = (
+            db.query(Notification)
+            .filter(Notification.user_id.in_({g[0] for g in groups}), Notification.is_read == False)
+            .order_by(last_activity().desc())
+            .all()
+        )
+        by_key = defaultdict(list)
+        for n in rows:
+            k = (n.user_id, n.type, n.related_user_id, n.reference_id)
+            if k in groups:
+                by_key[k].append(n)
+        for keep, *extra in by_key.values():
+            keep.count = sum(n.count or 1 for n in [keep] + extra)
+            for n in extra:
+                db.delete(n)
+            removed += len(extra)
+        db.commit()
+
+
+def archive_read(db: Session, now: datetime = None, batch_size: int = ARCHIVE_BATCH) -> int:
+    """Move read notifications older than the retention window to the archive. Returns rows moved."""
+    cutoff = (now or datetime.utcnow()) - RETENTION
+    columns = [getattr(Notification, c) for c in ARCHIVED_COLUMNS]
+    moved = 0
+    while True:
+        rows = (
+            db.query(Notification.id, Notification.user_id)
+            .filter(Notification.is_read == True, last_activity() < cutoff)
+            .order_by(Notification.created_at)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return moved
+        ids = [r.id for r in rows]
+        db.execute(
+            insert(ArchivedNotification).from_select(list(ARCHIVED_COLUMNS), select(*columns).where(Notification.id.in_(ids)))
+        )
+        # Bulk delete skips the flush hook, so record the tombstones here
+        db.execute(ChangeLogEntry.__table__.insert(), [
+            {"user_id": r.user_id, "entity": "notifications", "entity_id": r.id, "op": DELETE} for r in rows if r.user_id
+        ])
+        db.query(Notification).filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        moved += len(ids)
+
+
+def run_retention(db: Session, now: datetime = None) -> Tuple[int, int]:
+    """(duplicates collapsed, rows archived)."""
+    return collapse_duplicates(db), archive_read(db, now)
+
+
+async def retention_loop(interval: float = RETENTION_INTERVAL):
+    """Background task started by the app."""
+    def run():
+        # Every shard's notifications (just the main database when unsharded)
+        done = for_each_shard(run_retention).values()
+        return sum(c for c, _ in done), sum(a for _, a in done)
+
+    while True:
+        try:
+            collapsed, archived = await run_job(run)
+            if collapsed or archived:
+                logger.info("notifications.retention", extra={"collapsed": collapsed, "archived": archived})
+        except Exception:
+            logger.exception("notifications.retention_failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,528 @@
+"""
+Server-side AI plan generation.
+
+The app used to call Gemini straight from the phone with the whole drill
+library in every prompt. Generation now happens here, from the drill index
+and the player's profile (level, goals, years_experience - the /auth/me
+fields) plus strengths/weaknesses from their logged drill outcomes.
+
+Every request is reduced to a spec; its hash (profile, goals, history,
+drill-library fingerprint, prompt, config, constraints, model) is the
+cache key:
+
+  * in-process LRU    -> hit, no DB or model call
+  * generated_plans   -> hit, shared by all workers and across restarts
+  * miss              -> one model call; concurrent identical requests in
+                         this process wait for it instead of making their own
+                         (single flight)
+
+Model calls are bounded by a semaphore (PLAN_MODEL_CONCURRENCY) so a burst
+of misses queues here instead of hammering the provider. A request that
+can't get a slot within PLAN_QUEUE_SECONDS gets PlanGenerationBusy (503).
+
+Models:
+    local   deterministic stand-in, no network (tests, benchmarks, dev)
+    gemini  Google Gemini via google-generativeai (needs GEMINI_API_KEY)
+
+Config (env):
+    PLAN_MODEL                 local | gemini, default gemini if GEMINI_API_KEY is set
+    GEMINI_MODEL               default gemini-2.5-flash
+    PLAN_MODEL_CONCURRENCY     concurrent model calls per worker, default 4
+    PLAN_QUEUE_SECONDS         wait for a model slot, default 30
+    PLAN_CACHE_SIZE            in-process LRU entries, default 512
+    PLAN_CACHE_TTL_HOURS       how long a generated plan is reused, default 168
+    PLAN_LOCAL_LATENCY_MS      simulated model latency for the local model, default 0
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.log import get_logger
+from app.core.metrics import REGISTRY, record_cache
+from app.models.training import DrillPerformance, GeneratedPlan, SessionLog
+from app.models.user import User
+from app.services import session_archive
+from app.services.drill_search import DRILL_INDEX, tokenize
+
+PROGRAM, SQUAD_PROGRAM, SQUAD_SESSION = "program", "squad_program", "squad_session"
+KINDS = (PROGRAM, SQUAD_PROGRAM, SQUAD_SESSION)
+# Bump when the prompts or the local model change, so old results aren't reused
+PROMPT_VERSION = 1
+MAX_WEEKS = 12
+
+MODEL_CONCURRENCY = int(os.getenv("PLAN_MODEL_CONCURRENCY", "4"))
+QUEUE_SECONDS = float(os.getenv("PLAN_QUEUE_SECONDS", "30"))
+CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "512"))
+CACHE_TTL = timedelta(hours=float(os.getenv("PLAN_CACHE_TTL_HOURS", "168")))
+# A follower gives up on the in-flight call after the queue wait plus a generous model call
+FOLLOWER_WAIT_SECONDS = QUEUE_SECONDS + 120
+
+MODEL_CALLS = REGISTRY.counter(
+    "plan_model_calls_total", "Plan generation model calls by model and outcome.", ("model", "outcome"),
+)
+MODEL_LATENCY = REGISTRY.histogram(
+    "plan_model_call_seconds", "Plan generation model call latency.", ("model",),
+    buckets=(0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0),
+)
+MODEL_IN_FLIGHT = REGISTRY.gauge(
+    "plan_model_calls_in_flight", "Plan generation model calls currently running.", ("model",),
+)
+COALESCED = REGISTRY.counter(
+    "plan_requests_coalesced_total", "Plan requests that waited on an identical in-flight call.",
+)
+
+logger = get_logger(__name__)
+
+
+class PlanGenerationError(Exception):
+    """The model failed or returned something we can't use."""
+
+
+class PlanGenerationBusy(Exception):
+    """No model slot freed up within PLAN_QUEUE_SECONDS."""
+
+
+# =======================
+# 1. REQUEST SPEC
+# =======================
+
+def split_goals(goals) -> List[str]:
+    if not goals:
+        return []
+    if isinstance(goals, str):
+        goals = goals.split(",")
+    return sorted({g.strip() for g in goals if g and g.strip()}, key=str.lower)
+
+
+def drill_history(db: Session, player_id: str) -> Tuple[List[str], List[str]]:
+    """(strengths, weaknesses): drills the player succeeds at more often than not, and vice versa."""
+    success = func.sum(case((DrillPerformance.outcome == "success", 1), else_=0))
+    rows = (
+        db.query(DrillPerformance.drill_id, success, func.count(DrillPerformance.id))
+        .join(SessionLog, SessionLog.id == DrillPerformance.session_log_id)
+        .filter(SessionLog.player_id == player_id, DrillPerformance.drill_id.isnot(None))
+        .group_by(DrillPerformance.drill_id)
+        .all()
+    )
+    history = {drill_id: (ok, total) for drill_id, ok, total in rows}
+    for drill_id, (ok, total) in session_archive.drill_outcomes(db, player_id).items():
+        hot_ok, hot_total = history.get(drill_id, (0, 0))
+        history[drill_id] = (hot_ok + ok, hot_total + total)
+    strengths = sorted(d for d, (ok, total) in history.items() if ok > total - ok)
+    weaknesses = sorted(d for d, (ok, total) in history.items() if ok < total - ok)
+    return strengths, weaknesses
+
+
+def build_spec(
+    db: Session,
+    kind: str,
+    prompt: str,
+    player: Optional[User] = None,
+    weeks: int = 4,
+    constraints: Optional[dict] = None,
+) -> dict:
+    """Everything the model sees, in canonical form. Its hash is the cache key."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown plan kind: {kind}")
+    DRILL_INDEX.ensure_fresh(db)
+    fingerprint, _ = DRILL_INDEX.catalog()
+    spec = {
+        "v": PROMPT_VERSION,
+        "kind": kind,
+        "prompt": " ".join((prompt or "").split()),
+        "weeks": max(1, min(int(weeks or 4), MAX_WEEKS)) if kind != SQUAD_SESSION else 1,
+        "constraints": {"players": int(constraints["players"]), "courts": int(constraints["courts"])} if constraints else None,
+        "drills": fingerprint,
+        "profile": None,
+    }
+    if player is not None:
+        strengths, weaknesses = drill_history(db, player.id)
+        spec["profile"] = {
+            "level": player.level or "Intermediate",
+            "goals": split_goals(player.goals),
+            "years_experience": player.years_experience or 0,
+            "strengths": strengths,
+            "weaknesses": weaknesses,
+        }
+    return spec
+
+
+def cache_key(spec: dict, model_name: str) -> str:
+    payload = json.dumps({"model": model_name, **spec}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# =======================
+# 2. PROMPTS
+# =======================
+
+def knowledge_base(drills: List[dict]) -> str:
+    return "\n".join(f"{d['id']}: {d['name']} ({d['category']}, {d['difficulty']}) - {d['description']}" for d in drills)
+
+
+def render_prompt(spec: dict, drills: List[dict]) -> Tuple[str, str]:
+    """(system_instruction, contents), as the app used to send them."""
+    library = knowledge_base(drills)
+    constraints = spec["constraints"]
+
+    if spec["kind"] == SQUAD_SESSION:
+        system = f"""
+Adapt a single session.
+Constraints: {constraints['players']} players, {constraints['courts']} courts.
+Drill Library: {library}
+Return JSON: {{ "items": [{{ "drillId": "...", "notes": "..." }}] }}
+"""
+        return system, f"Adapt based on: {spec['prompt']}"
+
+    if spec["kind"] == SQUAD_PROGRAM:
+        system = f"""
+You are an expert tennis coach planning a {spec['weeks']}-week SQUAD training program.
+
+Constraints: {constraints['players']} players on {constraints['courts']} court(s).
+Drill Library: {library}
+
+CRITICAL INSTRUCTIONS:
+1. Select drills that maximize participation for {constraints['players']} players.
+2. If players per court > 4, you MUST prioritize rotation drills, "King of Court", or line feeding drills. Avoid static 1-on-1 drills where players stand around.
+3. Ensure the program has {spec['weeks']} distinct sessions (1 per week).
+4. Each session must have 1 warmup and 3 main drills suited for the group size.
+
+Return JSON format:
+{{"title": "Squad Program Title", "description": "...", "sessions": [{{"title": "...", "items": [{{"drillId": "d1", "targetDurationMin": 15, "notes": "..."}}]}}]}}
+"""
+        return system, f"Create a squad program focusing on: {spec['prompt']}"
+
+    profile = spec["profile"] or {"level": "Intermediate", "goals": [], "years_experience": 0, "strengths": [], "weaknesses": []}
+    goals = f"Player Goals: {', '.join(profile['goals'])}." if profile["goals"] else "Goal: General Improvement"
+    experience = f"Years Experience: {profile['years_experience']} years." if profile["years_experience"] else ""
+    strengths = (f"Player Strengths (from history): {', '.join(profile['strengths'])}."
+                 if profile["strengths"] else "No specific strengths recorded yet.")
+    weaknesses = (f"Player Weaknesses (from history): {', '.join(profile['weaknesses'])}."
+                  if profile["weaknesses"] else "No specific weaknesses recorded yet.")
+    squad = ""
+    if constraints:
+        squad = (f"CONSTRAINT: This is a SQUAD program for {constraints['players']} players on {constraints['courts']} courts.\n"
+                 "Choose drills suitable for large groups (rotations, feeding lines, King of Court).\n"
+                 "Avoid drills where players stand around.")
+    system = f"""
+You are an expert elite tennis coach.
+
+TARGET ATHLETE PROFILE:
+- Level: {profile['level']}
+- {experience}
+- {goals}
+
+PERFORMANCE HISTORY:
+- {strengths}
+- {weaknesses}
+
+DRILL LIBRARY AVAILABLE:
+{library}
+
+{squad}
+
+TASK:
+Create a {spec['weeks']}-session training program (1 session per week).
+Each session must have 1 warmup and 3 main drills.
+
+CRITICAL INSTRUCTIONS:
+1. Select drills that specifically address the "Player Goals" and "Weaknesses" identified above.
+2. Adjust intensity/volume based on "Level" and "Years Experience".
+3. If the goal is specific (e.g. "Serve"), ensure at least 50% of drills focus on that stroke.
+
+Instruction from User: {spec['prompt']}
+
+Return JSON format schema:
+{{"title": "Program Title", "description": "...", "sessions": [{{"title": "...", "items": [{{"drillId": "d1", "targetDurationMin": 15, "notes": "...", "sets": 3, "reps": 10, "mode": "Cooperative"}}]}}]}}
+"""
+    return system, "Generate the JSON."
+
+
+# =======================
+# 3. MODELS
+# =======================
+
+WARMUP_WORDS = {"warmup", "warm", "footwork", "mobility", "sprint", "sprints", "dynamic"}
+GROUP_WORDS = {"king", "rotation", "rotate", "lines", "line", "feeding", "group", "doubles", "live", "queen"}
+LEVELS = ["beginner", "intermediate", "advanced"]
+
+
+class LocalPlanModel:
+    """
+    Deterministic stand-in: scores drills against the goals, prompt, weaknesses
+    and level, then lays out 1 warmup + 3 main drills per session. The same
+    spec always yields the same plan. No network. `latency` (PLAN_LOCAL_LATENCY_MS)
+    fakes a provider round trip for benchmarks.
+    """
+    name = "local"
+
+    def __init__(self, latency: float = float(os.getenv("PLAN_LOCAL_LATENCY_MS", "0")) / 1000):
+        self.latency = latency
+
+    def generate(self, spec: dict, drills: List[dict], system_instruction: str, contents: str) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        rng = random.Random(cache_key(spec, self.name))
+        profile = spec["profile"] or {}
+        focus = set(tokenize(spec["prompt"])) | {t for g in profile.get("goals", []) for t in tokenize(g)}
+        weaknesses = set(profile.get("weaknesses", []))
+        level = (profile.get("level") or "").lower()
+        crowded = bool(spec["constraints"]) and spec["constraints"]["players"] > 4 * max(spec["constraints"]["courts"], 1)
+
+        def words(d):
+            return set(tokenize(d["name"])) | set(tokenize(d["category"]))
+
+        def score(d):
+            w = words(d)
+            s = 3.0 * len(w & focus) + (2.0 if d["id"] in weaknesses else 0.0)
+            if level in LEVELS and (d["difficulty"] or "").lower() in LEVELS:
+                s -= abs(LEVELS.index(level) - LEVELS.index(d["difficulty"].lower())) * 0.5
+            if spec["constraints"]:
+                s += (2.0 if crowded else 1.0) * len(w & GROUP_WORDS)
+            return s + rng.random() * 0.1  # seeded tie-break
+
+        warmups = [d for d in drills if words(d) & WARMUP_WORDS] or drills
+        warmup_ids = {d["id"] for d in warmups}
+        main = [d for d in drills if d["id"] not in warmup_ids] or drills
+        main = sorted(main, key=score, reverse=True)[:max(6, 3 * spec["weeks"])]
+        warmups = sorted(warmups, key=score, reverse=True)[:3]
+        rng.shuffle(main)
+
+        def item(d, minutes, notes):
+            row = {"drillId": d["id"], "targetDurationMin": minutes, "notes": notes}
+            if spec["kind"] == PROGRAM:
+                row.update({"sets": 3, "reps": 10, "mode": "Cooperative" if d["id"] in weaknesses else "Competitive"})
+            return row
+
+        group_note = ""
+        if spec["constraints"]:
+            group_note = f" Run with {spec['constraints']['players']} players across {spec['constraints']['courts']} court(s); rotate every 3 points."
+        sessions = []
+        for week in range(spec["weeks"]):
+            picks = [main[(week * 3 + k) % len(main)] for k in range(3)] if main else []
+            items = [item(warmups[week % len(warmups)], 10, "Warm up." + group_note)] if warmups else []
+            items += [item(d, 15, f"Focus on {d['category'] or 'technique'}." + group_note) for d in picks]
+            sessions.append({"title": f"Week {week + 1}: {picks[0]['name'] if picks else 'Session'}", "items": items})
+
+        if spec["kind"] == SQUAD_SESSION:
+            return {"items": [{"drillId": i["drillId"], "notes": i["notes"]} for i in sessions[0]["items"]]}
+        topic = spec["prompt"] or ", ".join(profile.get("goals", [])) or "General improvement"
+        title = f"{spec['weeks']}-Week {'Squad ' if spec['kind'] == SQUAD_PROGRAM else ''}Plan: {topic[:60]}"
+        return {"title": title, "description": f"Drills chosen for: {topic}.", "sessions": sessions}
+
+
+class GeminiPlanModel:
+    """Google Gemini through google-generativeai (imported lazily - only needed when enabled)."""
+
+    def __init__(self, api_key: str, model_name: str):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.name = f"gemini:{model_name}"
+        self._client = None
+
+    def _model(self):
+        if self._client is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._client = genai.GenerativeModel(self.model_name)
+        return self._client
+
+    def generate(self, spec: dict, drills: List[dict], system_instruction: str, contents: str) -> dict:
+        try:
+            response = self._model().generate_content([system_instruction, contents])
+            return json.loads(_clean_json(response.text))
+        except Exception as exc:
+            raise PlanGenerationError(f"Gemini call failed: {exc}") from exc
+
+
+def _clean_json(text: str) -> str:
+    """Strip ``` fences the model sometimes wraps JSON in."""
+    text = (text or "").strip()
+    match = re.search(r"```(?:json)?\s*(.*?)```", text, re.S)
+    return match.group(1).strip() if match else text
+
+
+def default_model():
+    api_key = os.getenv("GEMINI_API_KEY")
+    choice = os.getenv("PLAN_MODEL") or ("gemini" if api_key else "local")
+    if choice == "gemini":
+        if not api_key:
+            raise RuntimeError("PLAN_MODEL=gemini needs GEMINI_API_KEY")
+        return GeminiPlanModel(api_key, os.getenv("GEMINI_MODEL", "gemini-2.5-flash"))
+    return LocalPlanModel()
+
+
+def validate_plan(kind: str, data, known_ids) -> dict:
+    """Drop items that reference drills we don't have; reject plans left empty."""
+    if not isinstance(data, dict):
+        raise PlanGenerationError("Model did not return a JSON object")
+
+    def clean(items):
+        return [i for i in (items or []) if isinstance(i, dict) and i.get("drillId") in known_ids]
+
+    if kind == SQUAD_SESSION:
+        items = clean(data.get("items"))
+        if not items:
+            raise PlanGenerationError("Model returned no usable drills")
+        return {"items": items}
+    sessions = [
+        {**s, "items": clean(s.get("items"))}
+        for s in (data.get("sessions") or []) if isinstance(s, dict)
+    ]
+    sessions = [s for s in sessions if s["items"]]
+    if not sessions:
+        raise PlanGenerationError("Model returned no usable sessions")
+    return {"title": data.get("title") or "Training Program", "description": data.get("description") or "", "sessions": sessions}
+
+
+# =======================
+# 4. GENERATOR (cache + single flight + concurrency bound)
+# =======================
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PlanGenerator:
+    def __init__(self, model=None, concurrency: int = MODEL_CONCURRENCY, cache_size: int = CACHE_SIZE):
+        self._model = model
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = default_model()
+        return self._model
+
+    # --- in-process LRU ---
+
+    def _cache_get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.time() - entry[0] < CACHE_TTL.total_seconds():
+                self._cache.move_to_end(key)
+                return entry[1]
+            self._cache.pop(key, None)
+            return None
+
+    def _cache_put(self, key: str, plan: dict, stored_at: float = None):
+        with self._lock:
+            self._cache[key] = (stored_at or time.time(), plan)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    # --- shared table ---
+
+    def _load_stored(self, db: Session, key: str) -> Optional[dict]:
+        row = db.query(GeneratedPlan.result, GeneratedPlan.created_at).filter(GeneratedPlan.cache_key == key).first()
+        if row is None or row.created_at < datetime.utcnow() - CACHE_TTL:
+            return None
+        plan = json.loads(row.result)
+        self._cache_put(key, plan, (row.created_at - datetime(1970, 1, 1)).total_seconds())
+        return plan
+
+    def _store(self, db: Session, key: str, kind: str, plan: dict):
+        values = {"kind": kind, "model": self.model.name, "result": json.dumps(plan), "created_at": datetime.utcnow()}
+        try:
+            db.add(GeneratedPlan(cache_key=key, **values))
+            db.commit()
+        except IntegrityError:
+            # An expired row, or another worker stored the same key first
+            db.rollback()
+            db.query(GeneratedPlan).filter(GeneratedPlan.cache_key == key).update(values, synchronize_session=False)
+            db.commit()
+
+    # --- generation ---
+
+    def generate(self, db: Session, spec: dict) -> Tuple[dict, bool]:
+        """(plan, cached). Raises PlanGenerationError / PlanGenerationBusy."""
+        model = self.model
+        key = cache_key(spec, model.name)
+        plan = self._cache_get(key)
+        record_cache("plan_generation", plan is not None)
+        if plan is not None:
+            return plan, True
+        plan = self._load_stored(db, key)
+        if plan is not None:
+            return plan, True
+        # Leader and followers alike: don't hold a pooled connection while the model thinks
+        db.close()
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            COALESCED.inc()
+            if not flight.done.wait(FOLLOWER_WAIT_SECONDS):
+                raise PlanGenerationBusy("Timed out waiting for an identical request")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = self._call_model(model, spec)
+            self._cache_put(key, flight.result)
+            self._store(db, key, spec["kind"], flight.result)
+            return flight.result, False
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def _call_model(self, model, spec: dict) -> dict:
+        if not self._slots.acquire(timeout=QUEUE_SECONDS):
+            MODEL_CALLS.inc(model.name, "busy")
+            raise PlanGenerationBusy("Plan generation is at capacity, try again shortly")
+        MODEL_IN_FLIGHT.inc(model.name)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            _, drills = DRILL_INDEX.catalog()
+            system_instruction, contents = render_prompt(spec, drills)
+            raw = model.generate(spec, drills, system_instruction, contents)
+            plan = validate_plan(spec["kind"], raw, {d["id"] for d in drills})
+            outcome = "ok"
+            return plan
+        finally:
+            elapsed = time.perf_counter() - started
+            self._slots.release()
+            MODEL_IN_FLIGHT.dec(model.name)
+            MODEL_CALLS.inc(model.name, outcome)
+            MODEL_LATENCY.observe(model.name, value=elapsed)
+            logger.info("plan_generation.model_call", extra={
+                "model": model.name, "kind": spec["kind"], "outcome": outcome, "ms": round(elapsed * 1000, 1),
+            })
+
+
+PLAN_GENERATOR = PlanGenerator()
@@ -0,0 +1,235 @@
+"""
+Content-addressed program templates.
+
+A program's schedule is stored once per distinct content in
+`program_templates` / `program_template_sessions` and referenced by
+`Program.template_id`. Templates are immutable, so editing a schedule for one
+player never touches the shared rows: it hashes the new content and points
+that player's assignment at another (possibly already existing) template.
+
+Because templates never change, their schedules are cached in-process with
+no invalidation at all.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.metrics import record_cache
+from app.models.training import Program, ProgramSession, ProgramTemplate, ProgramTemplateSession
+
+SCHEDULE_FIELDS = ("day_order", "drill_id", "drill_name", "duration_minutes", "notes", "target_value", "target_prompt")
+TEMPLATE_CACHE_SIZE = 1024
+
+
+# =======================
+# 1. HASHING
+# =======================
+
+def schedule_from_sessions(sessions) -> List[dict]:
+    """Flatten request sessions (SessionSchema: day + drills) into schedule rows."""
+    rows = []
+    for sess in sessions:
+        for drill in sess.drills:
+            rows.append({
+                "day_order": sess.day,
+                "drill_id": drill.drill_id,
+                "drill_name": drill.drill_name,
+                "duration_minutes": drill.duration,
+                "notes": drill.notes or "",
+                "target_value": drill.target_value,
+                "target_prompt": drill.target_prompt,
+            })
+    return rows
+
+
+def template_hash(rows: List[dict]) -> str:
+    canonical = [[row.get(field) for field in SCHEDULE_FIELDS] for row in rows]
+    return hashlib.sha256(json.dumps(canonical, separators=(",", ":")).encode()).hexdigest()
+
+
+def get_or_create_template(db: Session, rows: List[dict]) -> str:
+    """Returns the template id for this schedule, inserting it only if new."""
+    template_id = template_hash(rows)
+    if db.query(ProgramTemplate.id).filter(ProgramTemplate.id == template_id).first():
+        return template_id
+
+    try:
+        with db.begin_nested():
+            db.add(ProgramTemplate(
+                id=template_id,
+                drill_count=len(rows),
+                total_minutes=sum(r["duration_minutes"] or 0 for r in rows),
+                session_count=len({r["day_order"] for r in rows}),
+            ))
+            db.add_all([
+                ProgramTemplateSession(template_id=template_id, position=i, **row)
+                for i, row in enumerate(rows)
+            ])
+    except IntegrityError:
+        # A concurrent request stored the same content first - identical by definition
+        pass
+    return template_id
+
+
+# =======================
+# 2. CACHED READS
+# =======================
+
+class TemplateCache:
+    """LRU of template_id -> schedule rows. Safe to share: templates are immutable."""
+
+    def __init__(self, maxsize: int = TEMPLATE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, db: Session, template_ids: Iterable[str]) -> Dict[str, List[dict]]:
+        found, missing = {}, []
+        with self._lock:
+            for tid in set(template_ids):
+                if tid in self._data:
+                    self._data.move_to_end(tid)
+                    found[tid] = self._data[tid]
+                    record_cache("program_template", True)
+                else:
+                    missing.append(tid)
+                    record_cache("program_template", False)
+
+        if missing:
+            loaded = {tid: [] for tid in missing}
+            rows = (
+                db.query(ProgramTemplateSession)
+                .filter(ProgramTemplateSession.template_id.in_(missing))
+                .order_by(ProgramTemplateSession.template_id, ProgramTemplateSession.position)
+                .all()
+            )
+            for row in rows:
+                loaded[row.template_id].append({field: getattr(row, field) for field in SCHEDULE_FIELDS})
+            with self._lock:
+                for tid, schedule in loaded.items():
+                    if not schedule:
+                        continue  # not there yet (lagging replica?): don't pin the miss for the cache's lifetime
+                    self._data[tid] = schedule
+                    self._data.move_to_end(tid)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+            found.update(loaded)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+TEMPLATE_CACHE = TemplateCache()
+
+
+def load_program_schedules(db: Session, programs: List[Program], overrides: Dict[str, str] = None) -> Dict[str, List[dict]]:
+    """
+    Schedules for many programs in at most two queries (cache misses + legacy rows).
+    `overrides` maps program_id -> template_id for a player's copy-on-write schedule.
+    """
+    overrides = overrides or {}
+    template_for = {}
+    legacy_ids = []
+    for p in programs:
+        tid = overrides.get(p.id) or p.template_id
+        if tid:
+            template_for[p.id] = tid
+        else:
+            legacy_ids.append(p.id)
+
+    schedules = {p.id: [] for p in programs}
+    if template_for:
+        cached = TEMPLATE_CACHE.get_many(db, template_for.values())
+        for program_id, tid in template_for.items():
+            schedules[program_id] = cached.get(tid, [])
+
+    if legacy_ids:
+        rows = (
+            db.query(ProgramSession)
+            .filter(ProgramSession.program_id.in_(legacy_ids))
+            .order_by(ProgramSession.day_order)
+            .all()
+        )
+        for row in rows:
+            schedules[row.program_id].append({field: getattr(row, field) for field in SCHEDULE_FIELDS})
+    return schedules
+
+
+def program_drill_counts(db: Session, program_ids: Iterable[str]) -> Dict[str, int]:
+    """Number of schedule rows per program, for templated and legacy programs alike."""
+    program_ids = list(program_ids)
+    if not program_ids:
+        return {}
+    counts = dict(
+        db.query(Program.id, ProgramTemplate.drill_count)
+        .join(ProgramTemplate, ProgramTemplate.id == Program.template_id)
+        .filter(Program.id.in_(program_ids))
+        .all()
+    )
+    counts.update(
+        db.query(ProgramSession.program_id, func.count(ProgramSession.id))
+        .filter(ProgramSession.program_id.in_(program_ids))
+        .group_by(ProgramSession.program_id)
+        .all()
+    )
+    return counts
+
+
+def program_schedule_stats(db: Session, programs: List[Program], overrides: Dict[str, str] = None) -> Dict[str, dict]:
+    """
+    {program_id: {session_count, drill_count, total_minutes}} without loading
+    any schedule: template totals are stored on the template row, legacy
+    programs are aggregated in SQL. At most two queries.
+    """
+    overrides = overrides or {}
+    template_for = {p.id: overrides.get(p.id) or p.template_id for p in programs}
+    legacy_ids = [pid for pid, tid in template_for.items() if not tid]
+    empty = {"session_count": 0, "drill_count": 0, "total_minutes": 0}
+    stats = {p.id: dict(empty) for p in programs}
+
+    template_ids = {tid for tid in template_for.values() if tid}
+    if template_ids:
+        # Templates stored before session_count existed are counted on the fly
+        counted_days = (
+            db.query(func.count(func.distinct(ProgramTemplateSession.day_order)))
+            .filter(ProgramTemplateSession.template_id == ProgramTemplate.id)
+            .correlate(ProgramTemplate)
+            .scalar_subquery()
+        )
+        rows = (
+            db.query(ProgramTemplate.id, func.coalesce(ProgramTemplate.session_count, counted_days),
+                     ProgramTemplate.drill_count, ProgramTemplate.total_minutes)
+            .filter(ProgramTemplate.id.in_(template_ids))
+            .all()
+        )
+        by_template = {
+            tid: {"session_count": sessions or 0, "drill_count": drills or 0, "total_minutes": minutes or 0}
+            for tid, sessions, drills, minutes in rows
+        }
+        for program_id, tid in template_for.items():
+            if tid in by_template:
+                stats[program_id] = dict(by_template[tid])
+
+    if legacy_ids:
+        rows = (
+            db.query(
+                ProgramSession.program_id,
+                func.count(func.distinct(ProgramSession.day_order)),
+                func.count(ProgramSession.id),
+                func.coalesce(func.sum(ProgramSession.duration_minutes), 0),
+            )
+            .filter(ProgramSession.program_id.in_(legacy_ids))
+            .group_by(ProgramSession.program_id)
+            .all()
+        )
+        for program_id, sessions, drills, minutes in rows:
+            stats[program_id] = {"session_count": sessions, "drill_count": drills, "total_minutes": int(minutes)}
+    return stats
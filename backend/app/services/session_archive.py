@@ -0,0 +1,431 @@
+"""
+Cold archive for old session history.
+
+session_logs / drill_performances rows older than SESSION_ARCHIVE_AFTER_DAYS
+move out of the database into columnar files, one segment per player per
+season (calendar year):
+
+    SESSION_ARCHIVE_DIR/<player_id>/<season>-<version>/
+        sessions.<column>.npy       id, date, duration, rpe, session, program, notes
+        performances.<column>.npy   log (row in sessions), id, drill, outcome, value
+        strings.json.gz             dictionaries of the coded columns
+
+Every column is a fixed-width NumPy array opened memory-mapped, so a read
+only touches the pages of the columns it uses. Strings (program and drill
+ids, outcomes, notes) are dictionary-coded into int8/16/32 arrays and the
+dictionaries gzipped; missing values are code -1 / INT_NULL. (np.savez
+compression would rule out memory-mapping - the coding is what keeps
+segments small.)
+
+session_archive_segments is the manifest. Segment directories are never
+modified: archiving more of a season writes a new version, and the manifest
+update commits in the same transaction as the hot-row delete, so a reader
+(replicas included) sees each log either hot or archived, never both or
+neither. Superseded directories are removed by a later run once they are
+SESSION_ARCHIVE_GRACE_SECONDS old.
+
+Readers - the log endpoints, squad progress and leaderboard, plan generation -
+add archived history to the hot rows for one manifest query; the squad
+leaderboard's totals come from the manifest alone. /sync doesn't see the
+move: the deletes bypass the ORM, so no tombstones are logged and apps keep
+their copies.
+
+NumPy is only needed once something has been archived (pip install numpy).
+With SHARDS, every shard's manifest points into the same SESSION_ARCHIVE_DIR
+(paths are per player, and move-club carries the manifest rows), so it has
+to be storage every worker can see.
+
+    python manage.py archive-sessions [--days 730]
+
+Config (env):
+    SESSION_ARCHIVE_DIR             default ./session_archive
+    SESSION_ARCHIVE_AFTER_DAYS      logs completed longer ago are archived, default 730
+    SESSION_ARCHIVE_GRACE_SECONDS   superseded segments kept for readers still on them, default 3600
+    SESSION_ARCHIVE_CACHE           segments kept open per worker, default 256
+"""
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.core.ids import new_id
+from app.core.log import get_logger
+from app.core.metrics import record_cache
+from app.core.sharding import for_each_shard
+from app.models.training import DrillPerformance, SessionArchiveSegment, SessionLog
+
+try:
+    import numpy as np
+except ImportError:  # only needed once something has been archived
+    np = None
+
+ARCHIVE_DIR = os.getenv("SESSION_ARCHIVE_DIR", "./session_archive")
+ARCHIVE_AFTER = timedelta(days=float(os.getenv("SESSION_ARCHIVE_AFTER_DAYS", "730")))
+GRACE_SECONDS = float(os.getenv("SESSION_ARCHIVE_GRACE_SECONDS", "3600"))
+CACHE_SIZE = int(os.getenv("SESSION_ARCHIVE_CACHE", "256"))
+BATCH = 500  # ids per DELETE / IN (...)
+
+EPOCH = datetime(1970, 1, 1)
+INT_NULL = -(2 ** 31)
+FORMAT = 1
+SESSION_COLUMNS = ("id", "date", "duration", "rpe", "session", "program", "notes")
+PERFORMANCE_COLUMNS = ("log", "id", "drill", "outcome", "value")
+
+logger = get_logger(__name__)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _numpy():
+    if np is None:
+        raise ArchiveError("The session archive needs NumPy: pip install numpy")
+    return np
+
+
+class ArchivedPerformance(NamedTuple):
+    id: str
+    drill_id: Optional[str]
+    outcome: Optional[str]
+    achieved_value: Optional[int]
+
+
+class ArchivedSessionLog(NamedTuple):
+    """Shaped like a SessionLog row, so the response schemas take either."""
+    id: str
+    player_id: str
+    program_id: Optional[str]
+    session_id: Optional[int]
+    date_completed: datetime
+    duration_minutes: Optional[int]
+    rpe: Optional[int]
+    notes: Optional[str]
+    drill_performances: List[ArchivedPerformance]
+
+
+# =======================
+# 1. SEGMENT FILES
+# =======================
+
+def _ints(values):
+    return np.array([INT_NULL if v is None else v for v in values], dtype=np.int32)
+
+
+def _nullable(value) -> Optional[int]:
+    return None if value == INT_NULL else value
+
+
+def _strings(values):
+    return np.array([v.encode() for v in values], dtype=bytes) if values else np.zeros(0, dtype="S1")
+
+
+def _coded(values) -> Tuple["np.ndarray", List[str]]:
+    """Dictionary-code strings into the narrowest int array that fits (-1 = None)."""
+    dictionary: Dict[str, int] = {}
+    codes = [-1 if v is None else dictionary.setdefault(v, len(dictionary)) for v in values]
+    dtype = np.int8 if len(dictionary) < 2 ** 7 else np.int16 if len(dictionary) < 2 ** 15 else np.int32
+    return np.array(codes, dtype=dtype), list(dictionary)
+
+
+def _decoded(codes, dictionary: List[str]) -> List[Optional[str]]:
+    return [None if c < 0 else dictionary[c] for c in codes.tolist()]
+
+
+class Segment:
+    """One player-season: column arrays (memory-mapped once on disk) and the string dictionaries."""
+
+    def __init__(self, sessions: Dict[str, "np.ndarray"], performances: Dict[str, "np.ndarray"], strings: Dict[str, list]):
+        self.sessions = sessions
+        self.performances = performances
+        self.strings = strings
+
+    @classmethod
+    def build(cls, logs: Iterable[ArchivedSessionLog]) -> "Segment":
+        _numpy()
+        logs = sorted(logs, key=lambda log: (log.date_completed, log.id))
+        perfs = [(i, perf) for i, log in enumerate(logs) for perf in log.drill_performances]
+        program, programs = _coded([log.program_id for log in logs])
+        notes, note_texts = _coded([log.notes for log in logs])
+        drill, drills = _coded([perf.drill_id for _, perf in perfs])
+        outcome, outcomes = _coded([perf.outcome for _, perf in perfs])
+        sessions = {
+            "id": _strings([log.id for log in logs]),
+            "date": np.array([(log.date_completed - EPOCH) // timedelta(microseconds=1) for log in logs], dtype=np.int64),
+            "duration": _ints(log.duration_minutes for log in logs),
+            "rpe": _ints(log.rpe for log in logs),
+            "session": _ints(log.session_id for log in logs),
+            "program": program,
+            "notes": notes,
+        }
+        performances = {
+            "log": np.array([i for i, _ in perfs], dtype=np.int32),
+            "id": _strings([perf.id for _, perf in perfs]),
+            "drill": drill,
+            "outcome": outcome,
+            "value": _ints(perf.achieved_value for _, perf in perfs),
+        }
+        strings = {"format": FORMAT, "program": programs, "notes": note_texts, "drill": drills, "outcome": outcomes}
+        return cls(sessions, performances, strings)
+
+    @classmethod
+    def open(cls, directory: str) -> "Segment":
+        _numpy()
+        with gzip.open(os.path.join(directory, "strings.json.gz"), "rt", encoding="utf-8") as f:
+            strings = json.load(f)
+        if strings.get("format") != FORMAT:
+            raise ArchiveError(f"Unknown archive segment format in {directory}")
+
+        def load(prefix, columns):
+            return {c: np.load(os.path.join(directory, f"{prefix}.{c}.npy"), mmap_mode="r") for c in columns}
+
+        return cls(load("sessions", SESSION_COLUMNS), load("performances", PERFORMANCE_COLUMNS), strings)
+
+    def write(self, directory: str):
+        """Written next to `directory` and renamed into place, so a segment is never seen half-written."""
+        staging = f"{directory}.tmp"
+        os.makedirs(staging)
+        for prefix, columns in (("sessions", self.sessions), ("performances", self.performances)):
+            for name, array in columns.items():
+                np.save(os.path.join(staging, f"{prefix}.{name}.npy"), array)
+        with gzip.open(os.path.join(staging, "strings.json.gz"), "wt", encoding="utf-8") as f:
+            json.dump(self.strings, f, separators=(",", ":"))
+        os.replace(staging, directory)
+
+    def __len__(self):
+        return len(self.sessions["id"])
+
+    @property
+    def performance_count(self) -> int:
+        return len(self.performances["id"])
+
+    @property
+    def achieved_total(self) -> int:
+        values = self.performances["value"]
+        return int(values[values != INT_NULL].sum())
+
+    def logs(self, player_id: str) -> List[ArchivedSessionLog]:
+        s, p = self.sessions, self.performances
+        performances = defaultdict(list)
+        drills, outcomes = _decoded(p["drill"], self.strings["drill"]), _decoded(p["outcome"], self.strings["outcome"])
+        for i, (log, perf_id, value) in enumerate(zip(p["log"].tolist(), p["id"].tolist(), p["value"].tolist())):
+            performances[log].append(ArchivedPerformance(perf_id.decode(), drills[i], outcomes[i], _nullable(value)))
+        programs, notes = _decoded(s["program"], self.strings["program"]), _decoded(s["notes"], self.strings["notes"])
+        return [
+            ArchivedSessionLog(
+                log_id.decode(), player_id, programs[i], _nullable(session), EPOCH + timedelta(microseconds=date),
+                _nullable(duration), _nullable(rpe), notes[i], performances[i],
+            )
+            for i, (log_id, date, duration, rpe, session) in enumerate(zip(
+                s["id"].tolist(), s["date"].tolist(), s["duration"].tolist(), s["rpe"].tolist(), s["session"].tolist(),
+            ))
+        ]
+
+    def program_counts(self) -> Dict[str, int]:
+        codes = np.asarray(self.sessions["program"])
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.strings["program"]))
+        return {program: int(n) for program, n in zip(self.strings["program"], counts) if n}
+
+    def drill_outcomes(self) -> Dict[str, Tuple[int, int]]:
+        """drill_id -> (successes, attempts)."""
+        drill, outcome = np.asarray(self.performances["drill"]), np.asarray(self.performances["outcome"])
+        known = drill >= 0
+        success = self.strings["outcome"].index("success") if "success" in self.strings["outcome"] else -1
+        size = len(self.strings["drill"])
+        attempts = np.bincount(drill[known], minlength=size)
+        successes = np.bincount(drill[known], weights=outcome[known] == success, minlength=size)
+        return {d: (int(ok), int(n)) for d, ok, n in zip(self.strings["drill"], successes, attempts) if n}
+
+
+class SegmentCache:
+    """LRU of open segments by manifest path. Segments are immutable, so nothing is ever invalidated."""
+
+    def __init__(self, root: str = ARCHIVE_DIR, maxsize: int = CACHE_SIZE):
+        self.root = root
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Segment]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Segment:
+        with self._lock:
+            segment = self._data.get(path)
+            if segment is not None:
+                self._data.move_to_end(path)
+        record_cache("session_archive", segment is not None)
+        if segment is None:
+            try:
+                segment = Segment.open(os.path.join(self.root, path))
+            except FileNotFoundError as exc:
+                raise ArchiveError(f"Archive segment {path} is missing from {self.root}") from exc
+            with self._lock:
+                self._data[path] = segment
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return segment
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+SEGMENTS = SegmentCache()
+
+
+# =======================
+# 2. READING
+# =======================
+
+def manifest(db: Session, player_ids: Iterable[str]) -> List[SessionArchiveSegment]:
+    player_ids = list(set(player_ids))
+    if not player_ids:
+        return []
+    return (
+        db.query(SessionArchiveSegment)
+        .filter(SessionArchiveSegment.player_id.in_(player_ids))
+        .order_by(SessionArchiveSegment.player_id, SessionArchiveSegment.season)
+        .all()
+    )
+
+
+def with_archived_logs(db: Session, player_id: str, logs: list) -> list:
+    """The player's hot SessionLog rows plus their archived ones, newest first."""
+    archived = [log for entry in manifest(db, [player_id]) for log in SEGMENTS.get(entry.path).logs(player_id)]
+    if not archived:
+        return logs
+    return sorted([*logs, *archived], key=lambda log: log.date_completed or EPOCH, reverse=True)
+
+
+def player_totals(db: Session, player_ids: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    """player_id -> (archived sessions, archived achieved_value total), from the manifest alone."""
+    totals = defaultdict(lambda: (0, 0))
+    for entry in manifest(db, player_ids):
+        sessions, achieved = totals[entry.player_id]
+        totals[entry.player_id] = (sessions + (entry.sessions or 0), achieved + (entry.achieved_total or 0))
+    return dict(totals)
+
+
+def program_session_counts(db: Session, player_ids: Iterable[str], program_ids: Iterable[str]) -> Counter:
+    """(program_id, player_id) -> archived sessions logged against that program."""
+    program_ids = set(program_ids)
+    counts = Counter()
+    for entry in manifest(db, player_ids):
+        for program_id, n in SEGMENTS.get(entry.path).program_counts().items():
+            if program_id in program_ids:
+                counts[(program_id, entry.player_id)] += n
+    return counts
+
+
+def drill_outcomes(db: Session, player_id: str) -> Dict[str, Tuple[int, int]]:
+    """drill_id -> (successes, attempts) over the player's archived performances."""
+    totals = defaultdict(lambda: (0, 0))
+    for entry in manifest(db, [player_id]):
+        for drill_id, (ok, n) in SEGMENTS.get(entry.path).drill_outcomes().items():
+            totals[drill_id] = (totals[drill_id][0] + ok, totals[drill_id][1] + n)
+    return dict(totals)
+
+
+# =======================
+# 3. ARCHIVING
+# =======================
+
+def _old_logs(db: Session, player_id: str, before: datetime) -> List[ArchivedSessionLog]:
+    rows = db.execute(
+        select(
+            SessionLog.id, SessionLog.player_id, SessionLog.program_id, SessionLog.session_id, SessionLog.date_completed,
+            SessionLog.duration_minutes, SessionLog.rpe, SessionLog.notes,
+        ).where(SessionLog.player_id == player_id, SessionLog.date_completed < before)
+    ).all()
+    logs = {row.id: ArchivedSessionLog(*row, []) for row in rows}
+    ids = list(logs)
+    for i in range(0, len(ids), BATCH):
+        perfs = db.execute(
+            select(DrillPerformance.session_log_id, DrillPerformance.id, DrillPerformance.drill_id,
+                   DrillPerformance.outcome, DrillPerformance.achieved_value)
+            .where(DrillPerformance.session_log_id.in_(ids[i:i + BATCH]))
+            .order_by(DrillPerformance.id)
+        )
+        for log_id, *perf in perfs:
+            logs[log_id].drill_performances.append(ArchivedPerformance(*perf))
+    return list(logs.values())
+
+
+def archive_season(db: Session, player_id: str, season: int, logs: List[ArchivedSessionLog]) -> SessionArchiveSegment:
+    """Write a new version of the player's season segment with `logs` added, then drop them from the hot tables."""
+    entry = db.get(SessionArchiveSegment, (player_id, season))
+    merged = {log.id: log for log in (SEGMENTS.get(entry.path).logs(player_id) if entry is not None else [])}
+    merged.update((log.id, log) for log in logs)
+    segment = Segment.build(merged.values())
+
+    path = f"{player_id}/{season}-{new_id()}"
+    directory = os.path.join(SEGMENTS.root, path)
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    segment.write(directory)
+    try:
+        if entry is None:
+            entry = SessionArchiveSegment(player_id=player_id, season=season)
+            db.add(entry)
+        dates = [log.date_completed for log in merged.values()]
+        entry.path, entry.first_at, entry.last_at = path, min(dates), max(dates)
+        entry.sessions, entry.performances, entry.achieved_total = len(segment), segment.performance_count, segment.achieved_total
+        ids = [log.id for log in logs]
+        for i in range(0, len(ids), BATCH):
+            # Core deletes: no ORM flush, so /sync records no tombstones for them
+            db.execute(delete(DrillPerformance.__table__).where(DrillPerformance.__table__.c.session_log_id.in_(ids[i:i + BATCH])))
+            db.execute(delete(SessionLog.__table__).where(SessionLog.__table__.c.id.in_(ids[i:i + BATCH])))
+        db.commit()
+    except BaseException:
+        db.rollback()
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return entry
+
+
+def archive_history(db: Session, before: Optional[datetime] = None) -> Tuple[int, int]:
+    """Archive every log completed before `before` (default: SESSION_ARCHIVE_AFTER_DAYS ago). (segments written, logs moved)."""
+    _numpy()
+    before = before or datetime.utcnow() - ARCHIVE_AFTER
+    players = db.execute(
+        select(SessionLog.player_id).where(SessionLog.date_completed < before, SessionLog.player_id.isnot(None)).distinct()
+    ).scalars().all()
+    segments = moved = 0
+    for player_id in players:
+        by_season = defaultdict(list)
+        for log in _old_logs(db, player_id, before):
+            by_season[log.date_completed.year].append(log)
+        for season, logs in sorted(by_season.items()):
+            archive_season(db, player_id, season, logs)
+            segments += 1
+            moved += len(logs)
+    if moved:
+        logger.info("session_archive.archived", extra={"segments": segments, "logs": moved, "before": before.isoformat()})
+    return segments, moved
+
+
+def prune(referenced: Iterable[str], grace: float = GRACE_SECONDS) -> int:
+    """Delete segment directories no manifest points at (superseded, or left by a failed run) once `grace` old."""
+    referenced = set(referenced)
+    root, removed = SEGMENTS.root, 0
+    cutoff = time.time() - grace
+    for player_dir in os.listdir(root) if os.path.isdir(root) else []:
+        for name in os.listdir(os.path.join(root, player_dir)):
+            directory = os.path.join(root, player_dir, name)
+            if f"{player_dir}/{name}" not in referenced and os.path.getmtime(directory) < cutoff:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+    return removed
+
+
+def run_archive(before: Optional[datetime] = None) -> Tuple[int, int, int]:
+    """archive_history on every shard, then prune against all their manifests. (segments, logs moved, directories removed)."""
+    done = for_each_shard(lambda db: archive_history(db, before)).values()
+    referenced = for_each_shard(lambda db: db.execute(select(SessionArchiveSegment.path)).scalars().all())
+    removed = prune(path for paths in referenced.values() for path in paths)
+    return sum(s for s, _ in done), sum(m for _, m in done), removed
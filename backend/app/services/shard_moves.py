@@ -0,0 +1,255 @@
+"""
+Moving a club to another shard while it keeps working.
+
+    python manage.py move-club --club <head coach id> --to east
+
+    1. copy      the club's rows to the target while the club uses the source
+    2. freeze    mark the club MOVING in the directory and wait until every
+                 worker has seen it (SHARD_DIRECTORY_TTL_SECONDS): from then on
+                 its writes get 503 + Retry-After, reads still work
+    3. catch up  copy again - only what changed during step 1
+    4. switch    point the directory at the target, unfrozen
+    5. purge     once workers have stopped reading the source (another TTL),
+                 delete the club's rows there
+
+Each copy pass diffs the club's rows on both sides by primary key and
+inserts, updates or deletes only the difference, so passes can be repeated
+and a failed move re-run. The club's rows are read whole per table - clubs
+are thousands of rows, not millions.
+
+match_entries is written with Core, so the SQLite search index is kept in
+step by hand: FTS rows go before their matches are deleted and are rebuilt
+for every match copied, on both shards.
+
+Drills and the program templates the club uses are reference rows every
+shard needs: they are copied when missing and never deleted. change_log is
+not copied (seqs are per database); the switch bumps the club's move count,
+which makes /sync hand its users a reset. Idempotency keys and generated
+plans stay on the main database.
+"""
+import time
+from typing import Dict, List, Set
+
+from sqlalchemy import or_, select, tuple_
+
+from app.core.database import Base
+from app.core.log import get_logger
+from app.core.sharding import ACTIVE, DIRECTORY, MOVING, SHARDS
+from app.services import match_search
+
+GRACE_SECONDS = 2.0  # on top of the directory TTL, for requests admitted just before a freeze
+BATCH = 500
+
+logger = get_logger(__name__)
+
+
+class MoveError(Exception):
+    pass
+
+
+# =======================
+# 1. WHICH ROWS ARE THE CLUB'S
+# =======================
+
+# Never moved: per-database or main-database-only tables
+NOT_MOVED = {"change_log", "club_shards", "idempotency_keys", "generated_plans", "replica_heartbeat"}
+# Copied when missing, never deleted
+REFERENCE = {"drills", "program_templates", "program_template_sessions"}
+
+
+def club_members(session, club_id: str) -> Set[str]:
+    """The head coach and everyone below them in the coach_id tree."""
+    users = Base.metadata.tables["users"]
+    members, frontier = {club_id}, {club_id}
+    while frontier:
+        frontier = {uid for (uid,) in session.execute(select(users.c.id).where(users.c.coach_id.in_(frontier)))} - members
+        members |= frontier
+    return members
+
+
+def club_filters(members: Set[str]) -> Dict[str, object]:
+    """table name -> WHERE clause selecting the club's rows (same clause works on either shard)."""
+    t = Base.metadata.tables
+    members = sorted(members)
+    programs = select(t["programs"].c.id).where(t["programs"].c.creator_id.in_(members))
+    squads = select(t["squads"].c.id).where(t["squads"].c.coach_id.in_(members))
+    logs = select(t["session_logs"].c.id).where(t["session_logs"].c.player_id.in_(members))
+    templates = select(t["programs"].c.template_id).where(t["programs"].c.creator_id.in_(members)).union(
+        select(t["program_assignments"].c.template_id).where(t["program_assignments"].c.player_id.in_(members))
+    )
+
+    def user_column(table, column="user_id"):
+        return t[table].c[column].in_(members)
+
+    def squad_or_player(table):
+        return or_(t[table].c.squad_id.in_(squads), t[table].c.player_id.in_(members))
+
+    return {
+        "users": user_column("users", "id"),
+        "programs": user_column("programs", "creator_id"),
+        "squads": user_column("squads", "coach_id"),
+        "program_assignments": or_(user_column("program_assignments", "player_id"), user_column("program_assignments", "coach_id")),
+        "program_sessions": t["program_sessions"].c.program_id.in_(programs),
+        "session_logs": user_column("session_logs", "player_id"),
+        "training_logs": user_column("training_logs", "player_id"),
+        "drill_performances": t["drill_performances"].c.session_log_id.in_(logs),
+        "squad_members": squad_or_player("squad_members"),
+        "squad_attendance": squad_or_player("squad_attendance"),
+        "attendance_bitmaps": squad_or_player("attendance_bitmaps"),
+        "activity_feed": or_(user_column("activity_feed", "coach_id"), user_column("activity_feed", "player_id")),
+        "match_entries": user_column("match_entries"),
+        "player_match_stats": user_column("player_match_stats"),
+        "xp_ledger": user_column("xp_ledger"),
+        "xp_snapshots": user_column("xp_snapshots"),
+        "notifications": user_column("notifications"),
+        "notifications_archive": user_column("notifications_archive"),
+        "session_archive_segments": user_column("session_archive_segments", "player_id"),  # files are shared
+        # reference rows
+        "drills": None,
+        "program_templates": t["program_templates"].c.id.in_(templates),
+        "program_template_sessions": t["program_template_sessions"].c.template_id.in_(templates),
+    }
+
+
+def _check_covered(filters: Dict[str, object]):
+    missing = [name for name in Base.metadata.tables if name not in filters and name not in NOT_MOVED]
+    if missing:
+        # A new table nobody told the mover about would be silently left behind
+        raise MoveError(f"No club filter for table(s) {', '.join(missing)} - add them to shard_moves.club_filters")
+
+
+# =======================
+# 2. COPYING
+# =======================
+
+def _pk(table):
+    return tuple_(*table.primary_key.columns) if len(table.primary_key.columns) > 1 else list(table.primary_key.columns)[0]
+
+
+def _rows(session, table, where) -> Dict[tuple, tuple]:
+    query = select(table) if where is None else select(table).where(where)
+    keys = [table.c.keys().index(c.name) for c in table.primary_key.columns]
+    return {tuple(row[i] for i in keys): tuple(row) for row in session.execute(query)}
+
+
+def _key_clause(table, keys: List[tuple]):
+    pk = _pk(table)
+    return pk.in_(keys) if len(table.primary_key.columns) > 1 else pk.in_([k[0] for k in keys])
+
+
+def copy_pass(source, target, club_id: str) -> Dict[str, int]:
+    """Make the target's copy of the club match the source. Returns rows written/deleted per table."""
+    filters = club_filters(club_members(source, club_id))
+    _check_covered(filters)
+    tables = [t for t in Base.metadata.sorted_tables if t.name in filters]
+    changed = {}
+
+    # Deletes first, children before parents
+    for table in reversed(tables):
+        if table.name in REFERENCE:
+            continue
+        gone = set(_rows(target, table, filters[table.name])) - set(_rows(source, table, filters[table.name]))
+        for i in range(0, len(gone), BATCH):
+            keys = list(gone)[i:i + BATCH]
+            if table.name == "match_entries":
+                match_search.unindex_matches(target, [k[0] for k in keys])
+            target.execute(table.delete().where(_key_clause(table, keys)))
+        if gone:
+            changed[table.name] = len(gone)
+    target.commit()
+
+    # Then inserts/updates, parents before children
+    for table in tables:
+        where = filters[table.name]
+        src = _rows(source, table, where)
+        if table.name in REFERENCE:
+            # May be on the target already for another club: look them up by key, not by the club filter
+            dst = {k: r for i in range(0, len(src), BATCH)
+                   for k, r in _rows(target, table, _key_clause(table, list(src)[i:i + BATCH])).items()}
+        else:
+            dst = _rows(target, table, where)
+        table_columns = table.c.keys()
+        inserts = [dict(zip(table_columns, row)) for key, row in src.items() if key not in dst]
+        updates = [] if table.name in REFERENCE else [
+            (key, dict(zip(table_columns, row))) for key, row in src.items() if key in dst and dst[key] != row
+        ]
+        for i in range(0, len(inserts), BATCH):
+            target.execute(table.insert(), inserts[i:i + BATCH])
+        for key, values in updates:
+            target.execute(table.update().where(_key_clause(table, [key])).values(values))
+        if table.name == "match_entries":
+            written = [row["id"] for row in inserts] + [key[0] for key, _ in updates]
+            for i in range(0, len(written), BATCH):
+                match_search.reindex_matches(target, written[i:i + BATCH])
+        target.commit()
+        if inserts or updates:
+            changed[table.name] = changed.get(table.name, 0) + len(inserts) + len(updates)
+    return changed
+
+
+def purge(source, club_id: str) -> int:
+    """Delete the club's rows from a shard it has left (reference rows stay)."""
+    filters = club_filters(club_members(source, club_id))
+    _check_covered(filters)
+    deleted = 0
+    for table in reversed(Base.metadata.sorted_tables):
+        if table.name in filters and table.name not in REFERENCE:
+            if table.name == "match_entries":
+                # Otherwise the next match to reuse a rowid would show this club's diary text
+                ids = [match_id for (match_id,) in source.execute(select(table.c.id).where(filters[table.name]))]
+                for i in range(0, len(ids), BATCH):
+                    match_search.unindex_matches(source, ids[i:i + BATCH])
+            deleted += source.execute(table.delete().where(filters[table.name])).rowcount or 0
+    source.commit()
+    return deleted
+
+
+# =======================
+# 3. THE MOVE
+# =======================
+
+def _wait_for_workers(label: str):
+    wait = DIRECTORY.ttl + GRACE_SECONDS
+    logger.info("shard_move.waiting", extra={"step": label, "seconds": wait})
+    time.sleep(wait)
+
+
+def move_club(club_id: str, to: str, purge_source: bool = True, wait=_wait_for_workers) -> dict:
+    """Move one club to shard `to` (see the module docstring for the steps)."""
+    if not SHARDS.enabled:
+        raise MoveError("Sharding is off: set SHARDS first")
+    if to not in SHARDS.names:
+        raise MoveError(f"Unknown shard {to!r}; configured: {', '.join(SHARDS.names)}")
+    DIRECTORY.forget(club_id)
+    placement = DIRECTORY.lookup(club_id)
+    if placement.shard == to:
+        raise MoveError(f"Club {club_id} is already on {to}")
+
+    source = SHARDS.session_factory(placement.shard)()
+    target = SHARDS.session_factory(to)()
+    try:
+        users = Base.metadata.tables["users"]
+        if source.execute(select(users.c.id).where(users.c.id == club_id)).first() is None:
+            raise MoveError(f"No club {club_id} on {placement.shard}")
+
+        copied = copy_pass(source, target, club_id)
+        logger.info("shard_move.copied", extra={"club": club_id, "to": to, "tables": copied})
+
+        DIRECTORY.assign(club_id, placement.shard, MOVING)
+        try:
+            wait("freeze")
+            caught_up = copy_pass(source, target, club_id)
+        except BaseException:
+            DIRECTORY.assign(club_id, placement.shard, ACTIVE)  # unfreeze where it was
+            raise
+        DIRECTORY.assign(club_id, to, ACTIVE)
+        logger.info("shard_move.switched", extra={"club": club_id, "from": placement.shard, "to": to, "tables": caught_up})
+
+        purged = 0
+        if purge_source:
+            wait("purge")
+            purged = purge(source, club_id)
+        return {"from": placement.shard, "to": to, "copied": copied, "caught_up": caught_up, "purged": purged}
+    finally:
+        source.close()
+        target.close()
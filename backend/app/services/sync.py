@@ -0,0 +1,266 @@
+"""
+Change log for delta sync.
+
+A session `after_flush` hook turns every flushed insert/update/delete of a
+synced model into change_log rows - one per user whose collections it
+affects - in the same transaction as the write. Routes don't have to
+remember to record anything, background tasks are covered too, and a
+rolled-back write never leaves a phantom change behind.
+
+`read_changes` pages the log for one user by seq and collapses it to the
+latest op per entity; the /sync router turns that into payloads.
+
+seq is allocated at insert but a row only becomes visible at commit, so on
+MySQL seq 11 can be readable while seq 10 is still in flight. A cursor that
+advanced to 11 would never see 10. Reads therefore stop at the first row
+younger than SYNC_SETTLE_SECONDS: everything before it has committed (or
+never will), and the rest is picked up by the next sync.
+
+The retention job (background loop, or `python manage.py purge-change-log`)
+deletes the rows before the first one younger than SYNC_RETENTION_DAYS,
+SYNC_PURGE_BATCH per transaction, and always keeps the newest row: the
+oldest seq left is the purge horizon, and a token from before it gets `reset: true` (the client
+may have missed tombstones) instead of a silently incomplete delta.
+
+Config (env):
+    SYNC_SETTLE_SECONDS   hold-back for recent changes, default 10 - keep it
+                          above the longest write transaction
+    SYNC_RETENTION_DAYS   change log kept for delta sync, default 30 - an app
+                          offline for longer does a full fetch
+    SYNC_PURGE_BATCH      rows deleted per transaction, default 5000
+    SYNC_PURGE_SECONDS    background job interval, default 3600
+"""
+import asyncio
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, event, func, select
+from sqlalchemy.orm import Session
+
+from app.core.background import run_job
+from app.core.log import get_logger
+from app.core.sharding import for_each_shard
+from app.models.activity import ChangeLogEntry
+from app.models.training import Drill, DrillPerformance, Program, ProgramAssignment, SessionLog
+from app.models.user import MatchEntry, Notification, Squad, SquadMember, User
+
+BROADCAST = "*"
+UPSERT, DELETE = "upsert", "delete"
+MAX_PAGE_SIZE = 1000
+SETTLE = timedelta(seconds=float(os.getenv("SYNC_SETTLE_SECONDS", "10")))
+RETENTION = timedelta(days=float(os.getenv("SYNC_RETENTION_DAYS", "30")))
+PURGE_BATCH = int(os.getenv("SYNC_PURGE_BATCH", "5000"))
+PURGE_INTERVAL = float(os.getenv("SYNC_PURGE_SECONDS", "3600"))
+
+logger = get_logger(__name__)
+
+
+# =======================
+# 1. WHO SEES WHAT
+# =======================
+
+class _Lookups:
+    """Memoized audience lookups, run on the flush's own connection."""
+
+    def __init__(self, session: Session):
+        self.conn = session.connection()
+        self._cache = {}
+
+    def seed(self, key, values):
+        self._cache[key] = values
+
+    def _scalars(self, key, stmt):
+        if key not in self._cache:
+            self._cache[key] = [r for (r,) in self.conn.execute(stmt).all() if r]
+        return self._cache[key]
+
+    def log_player(self, session_log_id):
+        return self._scalars(("log", session_log_id), select(SessionLog.player_id).where(SessionLog.id == session_log_id))
+
+    def program_players(self, program_id):
+        return self._scalars(("program", program_id), select(ProgramAssignment.player_id).where(ProgramAssignment.program_id == program_id))
+
+    def squad_coach(self, squad_id):
+        return self._scalars(("squad_coach", squad_id), select(Squad.coach_id).where(Squad.id == squad_id))
+
+    def squad_members(self, squad_id):
+        return self._scalars(("squad_members", squad_id), select(SquadMember.player_id).where(SquadMember.squad_id == squad_id))
+
+
+def _changes_for(obj, op, lookups: _Lookups) -> List[Tuple[str, str, str, str]]:
+    """(user_id, entity, entity_id, op) rows for one flushed object."""
+    if isinstance(obj, MatchEntry):
+        return [(obj.user_id, "matches", obj.id, op)]
+    if isinstance(obj, SessionLog):
+        return [(obj.player_id, "session_logs", obj.id, op)]
+    if isinstance(obj, DrillPerformance):
+        # A performance is part of its log: the log changed
+        return [(pid, "session_logs", obj.session_log_id, UPSERT) for pid in lookups.log_player(obj.session_log_id)]
+    if isinstance(obj, Notification):
+        return [(obj.user_id, "notifications", obj.id, op)]
+    if isinstance(obj, Program):
+        users = [obj.creator_id] + ([] if op == DELETE else lookups.program_players(obj.id))
+        return [(uid, "programs", obj.id, op) for uid in users]
+    if isinstance(obj, ProgramAssignment):
+        # The coach's program changed; for the player it appeared or went away
+        return [(obj.coach_id, "programs", obj.program_id, UPSERT), (obj.player_id, "programs", obj.program_id, op)]
+    if isinstance(obj, Squad):
+        users = [obj.coach_id] + ([] if op == DELETE else lookups.squad_members(obj.id))
+        return [(uid, "squads", obj.id, op) for uid in users]
+    if isinstance(obj, SquadMember):
+        rows = [(coach_id, "squads", obj.squad_id, UPSERT) for coach_id in lookups.squad_coach(obj.squad_id)]
+        return rows + [(obj.player_id, "squads", obj.squad_id, op)]
+    if isinstance(obj, User):
+        return [(obj.id, "profile", obj.id, op)]
+    if isinstance(obj, Drill):
+        return [(BROADCAST, "drills", obj.id, op)]
+    return []
+
+
+def _after_flush(session: Session, flush_context):
+    flushed = [(obj, UPSERT) for obj in session.new]
+    flushed += [(obj, UPSERT) for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    flushed += [(obj, DELETE) for obj in session.deleted]
+    if not flushed:
+        return
+
+    lookups = _Lookups(session)
+    for obj, _ in flushed:
+        if isinstance(obj, SessionLog):
+            # Performances flushed with their log (batch uploads) need no lookup
+            lookups.seed(("log", obj.id), [obj.player_id])
+    latest: Dict[Tuple[str, str, str], str] = {}
+    for obj, op in flushed:
+        for user_id, entity, entity_id, row_op in _changes_for(obj, op, lookups):
+            if user_id and entity_id:
+                latest[(user_id, entity, entity_id)] = row_op
+    if latest:
+        lookups.conn.execute(ChangeLogEntry.__table__.insert(), [
+            {"user_id": u, "entity": e, "entity_id": i, "op": op}
+            for (u, e, i), op in latest.items()
+        ])
+
+
+def install_change_log():
+    """Record changes for every ORM Session in the process (idempotent)."""
+    if not event.contains(Session, "after_flush", _after_flush):
+        event.listen(Session, "after_flush", _after_flush)
+
+
+# =======================
+# 2. READ SIDE
+# =======================
+
+def encode_token(seq: int, epoch: int = 0) -> str:
+    # epoch: the club's shard move count - seqs are per database, so a move invalidates old tokens
+    value = [seq, epoch] if epoch else [seq]
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def decode_token(token: str) -> Tuple[int, int]:
+    """(seq, epoch)"""
+    padded = token + "=" * (-len(token) % 4)
+    seq, *epoch = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if len(epoch) > 1:
+        raise ValueError("Invalid sync token")
+    return int(seq), int(epoch[0]) if epoch else 0
+
+
+def _settled(created_at: Optional[datetime], cutoff: datetime) -> bool:
+    return created_at is None or created_at <= cutoff
+
+
+def latest_seq(db: Session, user_id: str) -> int:
+    """Highest seq with nothing unsettled at or below it - the start token after a full fetch."""
+    cutoff = datetime.utcnow() - SETTLE
+    newest, first_recent = db.query(
+        func.max(ChangeLogEntry.seq),
+        func.min(case((ChangeLogEntry.created_at > cutoff, ChangeLogEntry.seq))),
+    ).filter(ChangeLogEntry.user_id.in_([user_id, BROADCAST])).one()
+    return first_recent - 1 if first_recent is not None else newest or 0
+
+
+def is_expired(db: Session, since: int) -> bool:
+    """True if rows after `since` may have been purged - the client has to start over."""
+    oldest = db.query(func.min(ChangeLogEntry.seq)).scalar()
+    return oldest is not None and since < oldest - 1
+
+
+def read_changes(db: Session, user_id: str, since: int, limit: int = 500):
+    """
+    Next page of the user's change log after `since`.
+    Returns ({entity: {entity_id: op}}, last_seq, has_more) - only the latest
+    op per entity is kept, so an entity edited 50 times is sent once. The page
+    ends before the first row younger than SETTLE (see the module docstring).
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cutoff = datetime.utcnow() - SETTLE
+    rows = (
+        db.query(ChangeLogEntry.seq, ChangeLogEntry.entity, ChangeLogEntry.entity_id, ChangeLogEntry.op, ChangeLogEntry.created_at)
+        .filter(ChangeLogEntry.user_id.in_([user_id, BROADCAST]), ChangeLogEntry.seq > since)
+        .order_by(ChangeLogEntry.seq)
+        .limit(limit + 1)
+        .all()
+    )
+    settled = 0
+    while settled < len(rows) and _settled(rows[settled].created_at, cutoff):
+        settled += 1
+    has_more = settled > limit
+    rows = rows[:min(settled, limit)]
+    changes: Dict[str, Dict[str, str]] = {}
+    for _, entity, entity_id, op, _ in rows:
+        changes.setdefault(entity, {})[entity_id] = op
+    last_seq = rows[-1].seq if rows else since
+    return changes, last_seq, has_more
+
+
+# =======================
+# 3. RETENTION
+# =======================
+
+def purge_change_log(db: Session, now: datetime = None, batch_size: int = PURGE_BATCH) -> int:
+    """
+    Delete change log rows older than the retention window. Returns rows deleted.
+    Only a prefix of seqs goes (everything before the first row still inside
+    the window, and never the newest row), so the oldest seq left is exactly
+    the horizon `is_expired` checks against.
+    """
+    cutoff = (now or datetime.utcnow()) - RETENTION
+    boundary = (
+        db.query(func.min(ChangeLogEntry.seq)).filter(ChangeLogEntry.created_at >= cutoff).scalar()
+        or db.query(func.max(ChangeLogEntry.seq)).scalar()
+    )
+    deleted = 0
+    while boundary is not None:
+        seqs = [seq for (seq,) in (
+            db.query(ChangeLogEntry.seq)
+            .filter(ChangeLogEntry.seq < boundary)
+            .order_by(ChangeLogEntry.seq)
+            .limit(batch_size)
+            .all()
+        )]
+        if not seqs:
+            break
+        db.query(ChangeLogEntry).filter(ChangeLogEntry.seq.in_(seqs)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(seqs)
+    return deleted
+
+
+async def purge_loop(interval: float = PURGE_INTERVAL):
+    """Background task started by the app."""
+    def run():
+        # seqs are per database: every shard keeps its own horizon
+        return sum(for_each_shard(purge_change_log).values())
+
+    while True:
+        try:
+            deleted = await run_job(run)
+            if deleted:
+                logger.info("sync.change_log_purged", extra={"deleted": deleted})
+        except Exception:
+            logger.exception("sync.purge_failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,237 @@
+"""
+XP ledger.
+
+Every award appends an `xp_ledger` row (who, how much, why) and bumps the
+cached total with an SQL-side increment (UPDATE users SET xp = xp + n), in
+the caller's transaction - no read-modify-write on a stale ORM value, so
+concurrent sessions can't lose XP.
+
+Ledger rows older than XP_COMPACT_AFTER_DAYS are periodically folded into
+weekly `xp_snapshots` and deleted, so "XP this week / this season" reads a
+handful of snapshot rows plus the recent ledger instead of a user's whole
+history. Once compacted, history resolves to whole weeks.
+
+Config (env):
+    XP_COMPACT_AFTER_DAYS       ledger rows kept un-compacted, default 56
+    XP_COMPACT_INTERVAL_SECONDS background compaction interval, default 3600
+    XP_SEASON_START_MONTH       first month of the season, default 1 (January)
+"""
+import asyncio
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ClauseElement
+
+from app.core.background import run_job
+from app.core.sharding import for_each_shard
+from app.core.log import get_logger
+from app.models.training import XpLedgerEntry, XpSnapshot
+from app.models.user import User
+from app.services.leaderboard import add_pending_xp
+
+SESSION_LOG = "SESSION_LOG"
+OPENING_BALANCE = "OPENING_BALANCE"
+ADJUSTMENT = "ADJUSTMENT"
+
+COMPACT_AFTER = timedelta(days=int(os.getenv("XP_COMPACT_AFTER_DAYS", "56")))
+COMPACT_INTERVAL = float(os.getenv("XP_COMPACT_INTERVAL_SECONDS", "3600"))
+SEASON_START_MONTH = int(os.getenv("XP_SEASON_START_MONTH", "1"))
+COMPACT_BATCH = 5000
+# Opening balances are dated before any real activity so they never show up in "this week"
+OPENING_BALANCE_AT = datetime(1970, 1, 5)
+
+logger = get_logger(__name__)
+
+
+# =======================
+# 1. AWARDS
+# =======================
+
+def award_xp(db: Session, player: User, awards: Iterable[Tuple[int, str, Optional[str]]], at: datetime = None) -> int:
+    """
+    Append one ledger row per (amount, source, reference_id) and apply their
+    sum to User.xp as a single SQL-side increment. No commit. Returns the sum.
+    Awards made earlier in the same transaction are added to, not replaced.
+    """
+    at = at or datetime.utcnow()
+    entries = [
+        XpLedgerEntry(user_id=player.id, amount=amount, source=source, reference_id=reference_id, created_at=at)
+        for amount, source, reference_id in awards if amount
+    ]
+    total = sum(e.amount for e in entries)
+    if entries:
+        db.add_all(entries)
+        pending = inspect(player).dict.get("xp")
+        base = pending if isinstance(pending, ClauseElement) else func.coalesce(User.xp, 0)
+        player.xp = base + total
+        add_pending_xp(db, player.id, total)
+    return total
+
+
+# =======================
+# 2. PERIOD QUERIES
+# =======================
+
+def week_start(day) -> date:
+    day = day.date() if isinstance(day, datetime) else day
+    return day - timedelta(days=day.weekday())
+
+
+def period_bounds(period: str, now: datetime = None) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """week | month | season | all -> [start, end) in UTC."""
+    now = now or datetime.utcnow()
+    if period == "week":
+        start = datetime.combine(week_start(now), datetime.min.time())
+    elif period == "month":
+        start = datetime(now.year, now.month, 1)
+    elif period == "season":
+        year = now.year if now.month >= SEASON_START_MONTH else now.year - 1
+        start = datetime(year, SEASON_START_MONTH, 1)
+    elif period == "all":
+        return None, None
+    else:
+        raise ValueError(f"Unknown period: {period}")
+    return start, None
+
+
+def xp_between(db: Session, user_id: str, start: Optional[datetime], end: Optional[datetime] = None) -> int:
+    """XP earned in [start, end): weekly snapshots for compacted history + raw ledger rows."""
+    snaps = db.query(func.coalesce(func.sum(XpSnapshot.amount), 0)).filter(XpSnapshot.user_id == user_id)
+    ledger = db.query(func.coalesce(func.sum(XpLedgerEntry.amount), 0)).filter(XpLedgerEntry.user_id == user_id)
+    if start is not None:
+        # A compacted week counts if it starts inside the range
+        snaps = snaps.filter(XpSnapshot.period_start >= start.date())
+        ledger = ledger.filter(XpLedgerEntry.created_at >= start)
+    if end is not None:
+        snaps = snaps.filter(XpSnapshot.period_start < end.date())
+        ledger = ledger.filter(XpLedgerEntry.created_at < end)
+    return int(snaps.scalar() or 0) + int(ledger.scalar() or 0)
+
+
+def xp_summary(db: Session, user: User, recent: int = 20) -> dict:
+    periods = {name: xp_between(db, user.id, *period_bounds(name)) for name in ("week", "month", "season")}
+    entries = (
+        db.query(XpLedgerEntry)
+        .filter(XpLedgerEntry.user_id == user.id)
+        .order_by(XpLedgerEntry.created_at.desc())
+        .limit(recent)
+        .all()
+    )
+    return {
+        "total": user.xp or 0,
+        "this_week": periods["week"],
+        "this_month": periods["month"],
+        "this_season": periods["season"],
+        "recent": [
+            {"amount": e.amount, "source": e.source, "reference_id": e.reference_id, "created_at": e.created_at}
+            for e in entries
+        ],
+    }
+
+
+# =======================
+# 3. COMPACTION
+# =======================
+
+def compaction_cutoff(now: datetime = None) -> datetime:
+    """Only whole weeks entirely older than the window are compacted."""
+    now = now or datetime.utcnow()
+    return datetime.combine(week_start(now - COMPACT_AFTER), datetime.min.time())
+
+
+def _add_to_snapshot(db: Session, user_id: str, period: date, amount: int, count: int):
+    row_filter = (XpSnapshot.user_id == user_id) & (XpSnapshot.period_start == period)
+    values = {XpSnapshot.amount: XpSnapshot.amount + amount, XpSnapshot.entries: XpSnapshot.entries + count}
+    if db.query(XpSnapshot).filter(row_filter).update(values, synchronize_session=False):
+        return
+    try:
+        with db.begin_nested():
+            db.add(XpSnapshot(user_id=user_id, period_start=period, amount=amount, entries=count))
+    except IntegrityError:
+        db.query(XpSnapshot).filter(row_filter).update(values, synchronize_session=False)
+
+
+def compact_ledger(db: Session, now: datetime = None, batch_size: int = COMPACT_BATCH) -> int:
+    """
+    Fold ledger rows older than the cutoff into weekly snapshots, one batch
+    per transaction (snapshot increment + delete commit together, so a crash
+    never double counts). Returns ledger rows compacted.
+    """
+    cutoff = compaction_cutoff(now)
+    compacted = 0
+    while True:
+        rows = (
+            db.query(XpLedgerEntry.id, XpLedgerEntry.user_id, XpLedgerEntry.amount, XpLedgerEntry.created_at)
+            .filter(XpLedgerEntry.created_at < cutoff)
+            .order_by(XpLedgerEntry.created_at)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return compacted
+        totals = defaultdict(lambda: [0, 0])
+        for _, user_id, amount, created_at in rows:
+            bucket = totals[(user_id, week_start(created_at))]
+            bucket[0] += amount
+            bucket[1] += 1
+        for (user_id, period), (amount, count) in totals.items():
+            _add_to_snapshot(db, user_id, period, amount, count)
+        db.query(XpLedgerEntry).filter(XpLedgerEntry.id.in_([r.id for r in rows])).delete(synchronize_session=False)
+        db.commit()
+        compacted += len(rows)
+
+
+async def compaction_loop(interval: float = COMPACT_INTERVAL):
+    """Background task started by the app."""
+    def run():
+        return sum(for_each_shard(compact_ledger).values())
+
+    while True:
+        try:
+            compacted = await run_job(run)
+            if compacted:
+                logger.info("xp.ledger_compacted", extra={"entries": compacted})
+        except Exception:
+            logger.exception("xp.compaction_failed")
+        await asyncio.sleep(interval)
+
+
+# =======================
+# 4. BACKFILL / RECONCILE
+# =======================
+
+def backfill_opening_balances(db: Session) -> int:
+    """Give users whose XP predates the ledger one OPENING_BALANCE entry. Returns users backfilled."""
+    has_history = (
+        db.query(XpLedgerEntry.user_id).union(db.query(XpSnapshot.user_id))
+    )
+    known = {user_id for (user_id,) in has_history.all()}
+    users: List[User] = db.query(User).filter(User.xp > 0).all()
+    rows = [
+        XpLedgerEntry(user_id=u.id, amount=u.xp, source=OPENING_BALANCE, created_at=OPENING_BALANCE_AT)
+        for u in users if u.id not in known
+    ]
+    db.add_all(rows)
+    db.commit()
+    return len(rows)
+
+
+def reconcile_totals(db: Session) -> int:
+    """Reset cached User.xp to snapshots + ledger where they drifted. Returns users fixed."""
+    sums = defaultdict(int)
+    for user_id, amount in db.query(XpSnapshot.user_id, func.sum(XpSnapshot.amount)).group_by(XpSnapshot.user_id):
+        sums[user_id] += int(amount or 0)
+    for user_id, amount in db.query(XpLedgerEntry.user_id, func.sum(XpLedgerEntry.amount)).group_by(XpLedgerEntry.user_id):
+        sums[user_id] += int(amount or 0)
+    fixed = 0
+    for user in db.query(User).filter(User.id.in_(list(sums))).all():
+        if (user.xp or 0) != sums[user.id]:
+            user.xp = sums[user.id]
+            fixed += 1
+    db.commit()
+    return fixed
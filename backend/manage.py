@@ -0,0 +1,364 @@
+"""
+Maintenance commands.
+
+    python manage.py backfill-feed          # build the coach activity feed from existing rows
+    python manage.py backfill-match-stats   # parse match scores + rebuild player stats rollups
+    python manage.py purge-idempotency-keys # delete expired Idempotency-Key rows now
+    python manage.py backfill-xp-ledger     # opening-balance ledger rows for pre-ledger XP
+    python manage.py compact-xp-ledger      # fold old ledger rows into weekly snapshots
+    python manage.py reconcile-xp           # reset cached User.xp from snapshots + ledger
+    python manage.py rebuild-attendance-bitmaps # regenerate attendance day bitmaps from squad_attendance
+    python manage.py notification-retention # collapse unread duplicates + archive old read notifications
+    python manage.py purge-change-log       # delete /sync change log rows past SYNC_RETENTION_DAYS
+    python manage.py migrate-compact-ids    # online switch of the high-volume tables to 16-byte ids (every shard)
+    python manage.py bench-ids --rows 200000 # insert rate / index size: uuid4 vs UUIDv7 text vs 16 bytes
+    python manage.py move-club --club <id> --to east # move a club to another shard, online
+    python manage.py archive-sessions --days 730 # move old session history to the columnar cold archive
+    python manage.py bench-plan-generation  # cache/coalescing benchmark on the local plan model
+    python manage.py serve --workers 4      # production server (uvloop/httptools, one process per core)
+    python manage.py bench-serve            # requests/sec with 1..N workers
+
+The data commands run against every shard in turn (just the main database
+unless SHARDS is set); idempotency keys and generated plans live on the main
+database only.
+"""
+import argparse
+import os
+import sys
+
+from app.core.database import SessionLocal, Base, add_missing_columns
+from app.core.ids import CHECK_SECONDS as ID_CHECK_SECONDS, detect_id_storage
+from app.core.sharding import SHARDS, for_each_shard
+from app.models import user, training, activity, idempotency, replication, tenancy  # noqa: F401  (register tables)
+
+
+def backfill_feed(args):
+    from app.services.activity_feed import backfill_activity_feed
+    written = sum(for_each_shard(backfill_activity_feed).values())
+    print(f"✅ Activity feed backfilled: {written} entries")
+
+
+def backfill_match_stats(args):
+    from app.services.match_stats import backfill_match_stats as backfill
+    processed = sum(for_each_shard(backfill).values())
+    print(f"✅ Match stats rebuilt from {processed} matches")
+
+
+def purge_idempotency_keys(args):
+    from app.core.idempotency import purge_expired_keys
+    deleted = purge_expired_keys()
+    print(f"✅ Purged {deleted} expired idempotency keys")
+
+
+def backfill_xp_ledger(args):
+    from app.services.xp import backfill_opening_balances
+    print(f"✅ Opening balances written for {sum(for_each_shard(backfill_opening_balances).values())} users")
+
+
+def compact_xp_ledger(args):
+    from app.services.xp import compact_ledger
+    print(f"✅ Compacted {sum(for_each_shard(compact_ledger).values())} XP ledger entries")
+
+
+def reconcile_xp(args):
+    from app.services.xp import reconcile_totals
+    print(f"✅ Reconciled XP totals for {sum(for_each_shard(reconcile_totals).values())} users")
+
+
+def bench_plan_generation(args):
+    """
+    Fire --requests plan requests from --threads threads over --distinct
+    prompts at the local model (simulated latency --latency-ms), against the
+    drills in the configured database. Uses a throwaway generator, so the
+    generated_plans table is the only shared state touched.
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from app.services import plan_generation as pg
+
+    generator = pg.PlanGenerator(model=pg.LocalPlanModel(latency=args.latency_ms / 1000))
+    db = SessionLocal()
+    try:
+        specs = [pg.build_spec(db, pg.SQUAD_PROGRAM, f"bench focus {i}", constraints={"players": 8, "courts": 2})
+                 for i in range(args.distinct)]
+        keys = [pg.cache_key(spec, generator.model.name) for spec in specs]
+        db.query(pg.GeneratedPlan).filter(pg.GeneratedPlan.cache_key.in_(keys)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+    def one(i):
+        session = SessionLocal()
+        started = time.perf_counter()
+        try:
+            generator.generate(session, specs[i % len(specs)])
+        finally:
+            session.close()
+        return time.perf_counter() - started
+
+    calls_before = pg.MODEL_CALLS.get(generator.model.name, "ok")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        latencies = sorted(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    calls = pg.MODEL_CALLS.get(generator.model.name, "ok") - calls_before
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"✅ {args.requests} requests, {args.distinct} distinct -> {int(calls)} model calls "
+          f"in {elapsed:.2f}s ({args.requests / elapsed:.0f} req/s), p50 {pct(0.5):.1f}ms p95 {pct(0.95):.1f}ms")
+
+
+def rebuild_attendance_bitmaps(args):
+    from app.services.attendance import rebuild_bitmaps
+    print(f"✅ Wrote {sum(for_each_shard(rebuild_bitmaps).values())} attendance bitmaps")
+
+
+def notification_retention(args):
+    from app.services.notifications import run_retention
+    done = for_each_shard(run_retention).values()
+    collapsed, archived = sum(c for c, _ in done), sum(a for _, a in done)
+    print(f"✅ Collapsed {collapsed} duplicate notifications, archived {archived}")
+
+
+def purge_change_log(args):
+    from app.services.sync import purge_change_log
+    print(f"✅ Purged {sum(for_each_shard(purge_change_log).values())} change log rows")
+
+
+def migrate_compact_ids(args):
+    from app.services.compact_ids import MigrationError, migrate
+    copied = {}
+    for name in SHARDS.names:
+        try:
+            copied[name] = migrate(SHARDS.engine(name), tables=args.table or None, batch_size=args.batch_size, do_swap=not args.no_swap)
+        except MigrationError as exc:
+            sys.exit(f"❌ {name}: {exc}")
+        for table, rows in copied[name].items():
+            print(f"✅ {name}: {table}: {rows} rows copied" + ("" if args.no_swap else ", now on 16-byte ids"))
+    if not any(copied.values()):
+        print("✅ Nothing to convert")
+    elif not args.no_swap:
+        print(f"✅ Running workers switch to the new storage within {ID_CHECK_SECONDS:.0f}s (ID_STORAGE_CHECK_SECONDS)")
+
+
+def bench_ids(args):
+    from app.services.compact_ids import benchmark
+    results = benchmark(rows=args.rows)
+    baseline = results[0]
+    for r in results:
+        print(f"✅ {r['scheme']:<15} {r['inserts_per_second']:9.0f} inserts/s  {r['lookups_per_second']:8.0f} lookups/s  "
+              f"pk index {r['pk_index_bytes'] / 1e6:6.1f} MB (x{r['pk_index_bytes'] / baseline['pk_index_bytes']:.2f}, "
+              f"{r['pk_index_free']:.0%} free)  table {r['table_bytes'] / 1e6:6.1f} MB")
+
+
+def move_club(args):
+    from app.services.shard_moves import MoveError, move_club as move
+    if not args.club or not args.to:
+        sys.exit("❌ move-club needs --club and --to")
+    try:
+        result = move(args.club, args.to, purge_source=not args.keep_source)
+    except MoveError as exc:
+        sys.exit(f"❌ {exc}")
+    rows = sum(result["copied"].values()) + sum(result["caught_up"].values())
+    print(f"✅ Club {args.club} moved {result['from']} -> {result['to']}: {rows} rows written, "
+          f"{result['purged']} rows removed from {result['from']}")
+
+
+def archive_sessions(args):
+    from datetime import datetime, timedelta
+    from app.services.session_archive import ArchiveError, run_archive
+    before = datetime.utcnow() - timedelta(days=args.days) if args.days is not None else None
+    try:
+        segments, moved, removed = run_archive(before)
+    except ArchiveError as exc:
+        sys.exit(f"❌ {exc}")
+    print(f"✅ Archived {moved} session logs into {segments} player-season segments, pruned {removed} old segment(s)")
+
+
+def _event_loop_and_parser():
+    """uvloop / httptools when installed (uvicorn[standard]), else the pure-python fallbacks."""
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "h11"
+    return loop, http
+
+
+def serve(args):
+    """
+    Migrate once, then hand the socket to uvicorn's worker processes. Each
+    worker builds its own app and connection pool via app.main:create_app.
+    SIGTERM/SIGINT stop accepting, drain in-flight requests for up to
+    --graceful-timeout seconds, then run the app's shutdown (background jobs
+    finish their batch, pools close, logs flush).
+    """
+    import uvicorn
+    from app.core.database import IS_MEMORY_SQLITE
+    from app.main import SCHEMA_READY_ENV, prepare_database
+
+    workers = args.workers or int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+    if workers > 1 and IS_MEMORY_SQLITE:
+        sys.exit("An in-memory SQLite database can't be shared between workers - set DATABASE_URL or use --workers 1")
+
+    prepare_database()
+    os.environ[SCHEMA_READY_ENV] = "1"  # inherited by the workers
+    loop, http = _event_loop_and_parser()
+    print(f"✅ Serving on {args.host}:{args.port} with {workers} worker(s), loop={loop}, http={http}")
+    uvicorn.run(
+        "app.main:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+        access_log=False,  # RequestIdMiddleware + /metrics already cover every request
+    )
+
+
+def _bench_client(url, duration, results):
+    import http.client
+    from urllib.parse import urlsplit
+    import time
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=10)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    done = errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            conn.request("GET", path)  # keep-alive: one connection per client
+            response = conn.getresponse()
+            response.read()
+            if response.status < 400:
+                done += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+    results.put((done, errors))
+
+
+def bench_serve(args):
+    """
+    Start `serve` with 1, 2, 4 ... --max-workers workers on a scratch port and
+    drive --connections keep-alive clients (separate processes) at --path for
+    --duration seconds each. Use a file database: workers need to share it.
+    """
+    import multiprocessing
+    import subprocess
+    import time
+    import urllib.request
+
+    max_workers = args.max_workers or os.cpu_count() or 1
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+
+    baseline = None
+    for workers in counts:
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "serve", "--workers", str(workers), "--port", str(args.port)],
+            # One client IP hammering one route: measure throughput, not the rate limiter
+            env={"RATE_LIMIT_ENABLED": "0", **os.environ, "LOG_LEVEL": "WARNING"}, stdout=subprocess.DEVNULL,
+        )
+        url = f"http://127.0.0.1:{args.port}{args.path}"
+        try:
+            for _ in range(100):
+                try:
+                    urllib.request.urlopen(url, timeout=1).read()
+                    break
+                except OSError:
+                    time.sleep(0.2)
+            time.sleep(0.5 * workers)  # let every worker finish starting up
+            results = multiprocessing.Queue()
+            clients = [multiprocessing.Process(target=_bench_client, args=(url, args.duration, results))
+                       for _ in range(args.connections)]
+            for client in clients:
+                client.start()
+            totals = [results.get() for _ in clients]
+            for client in clients:
+                client.join()
+        finally:
+            server.terminate()
+            server.wait()
+        done = sum(t[0] for t in totals)
+        errors = sum(t[1] for t in totals)
+        rps = done / args.duration
+        baseline = baseline or rps
+        print(f"✅ workers={workers:<3} {rps:8.0f} req/s  x{rps / baseline:.2f}  errors={errors}")
+
+
+COMMANDS = {
+    "backfill-feed": backfill_feed,
+    "backfill-match-stats": backfill_match_stats,
+    "purge-idempotency-keys": purge_idempotency_keys,
+    "backfill-xp-ledger": backfill_xp_ledger,
+    "compact-xp-ledger": compact_xp_ledger,
+    "reconcile-xp": reconcile_xp,
+    "rebuild-attendance-bitmaps": rebuild_attendance_bitmaps,
+    "notification-retention": notification_retention,
+    "purge-change-log": purge_change_log,
+    "migrate-compact-ids": migrate_compact_ids,
+    "bench-ids": bench_ids,
+    "move-club": move_club,
+    "archive-sessions": archive_sessions,
+    "bench-plan-generation": bench_plan_generation,
+    "serve": serve,
+    "bench-serve": bench_serve,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Setplai backend maintenance")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    bench = parser.add_argument_group("bench-plan-generation")
+    bench.add_argument("--requests", type=int, default=500)
+    bench.add_argument("--distinct", type=int, default=10)
+    bench.add_argument("--threads", type=int, default=32)
+    bench.add_argument("--latency-ms", type=float, default=200)
+    compact = parser.add_argument_group("migrate-compact-ids / bench-ids")
+    compact.add_argument("--table", action="append", help="only this table (repeatable; default: all compact tables)")
+    compact.add_argument("--batch-size", type=int, default=2000, help="rows copied per transaction")
+    compact.add_argument("--no-swap", action="store_true", help="copy and keep mirroring, but don't switch tables yet")
+    compact.add_argument("--rows", type=int, default=200_000, help="bench-ids: rows inserted per id scheme")
+    shards = parser.add_argument_group("move-club")
+    shards.add_argument("--club", help="the club's head coach user id")
+    shards.add_argument("--to", help="target shard name (see SHARDS)")
+    shards.add_argument("--keep-source", action="store_true", help="leave the club's rows on the old shard")
+    archive = parser.add_argument_group("archive-sessions")
+    archive.add_argument("--days", type=float, help="archive logs completed more than this many days ago (default: $SESSION_ARCHIVE_AFTER_DAYS)")
+    server = parser.add_argument_group("serve / bench-serve")
+    server.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    server.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    server.add_argument("--workers", type=int, default=0, help="default: $WEB_CONCURRENCY or the CPU count")
+    server.add_argument("--keep-alive", type=int, default=15, help="seconds an idle keep-alive connection stays open")
+    server.add_argument("--backlog", type=int, default=2048, help="listen() queue for connections not yet accepted")
+    server.add_argument("--graceful-timeout", type=int, default=30, help="seconds to drain in-flight requests on shutdown")
+    server.add_argument("--max-workers", type=int, default=0, help="bench-serve: largest worker count (default: CPU count)")
+    server.add_argument("--connections", type=int, default=16, help="bench-serve: concurrent keep-alive clients")
+    server.add_argument("--duration", type=float, default=10, help="bench-serve: seconds per worker count")
+    server.add_argument("--path", default="/api/v1/drills/search?q=serve&limit=10", help="bench-serve: URL path to hit")
+    args = parser.parse_args()
+
+    for name in SHARDS.names:
+        Base.metadata.create_all(bind=SHARDS.engine(name))
+        add_missing_columns(SHARDS.engine(name))
+        detect_id_storage(SHARDS.engine(name))
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Shared fixtures for the backend test-suite.
+
+The query-budget harness lives here: every test gets a fresh in-memory
+SQLite database wired into the app through the get_db override, plus a
+statement counter hooked into SQLAlchemy engine events.
+"""
+import os
+import sys
+
+# Keep the app's module-level engine off the real setplai_db.db file
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+# Plan generation uses the deterministic local model - no network in tests
+os.environ["PLAN_MODEL"] = "local"
+# /sync holds back changes for a few seconds; the tests read what they just wrote
+os.environ["SYNC_SETTLE_SECONDS"] = "0"
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.main import app
+from app.core.database import Base, get_db, get_read_db
+from app.core.security import create_access_token
+from app.services.program_templates import TEMPLATE_CACHE
+from app.services.drill_search import DRILL_INDEX
+from app.services.leaderboard import LEADERBOARDS
+from app.services.plan_generation import PLAN_GENERATOR
+from app.core.rate_limit import STORE as RATE_LIMIT_STORE
+from app.services.dashboard import DASHBOARD_CACHE
+
+# Small vs scaled dataset sizes used by the N+1 check
+SCALE_N = 3
+SCALE_FACTOR = 10
+
+
+class QueryCounter:
+    """Counts SQL statements executed on an engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.active = False
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        self.active = True
+        return self
+
+    def __exit__(self, *exc):
+        self.active = False
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+class TestDatabase:
+    """A fresh in-memory database bound to the app for the life of one test."""
+
+    __test__ = False
+
+    def __init__(self):
+        self.engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=self.engine)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.counter = QueryCounter(self.engine)
+
+    def override_get_db(self):
+        db = self.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def dispose(self):
+        self.engine.dispose()
+
+
+def bind_test_database() -> TestDatabase:
+    """A fresh TestDatabase behind get_db / get_read_db, with the in-process caches emptied."""
+    test_db = TestDatabase()
+    # In-process caches would otherwise carry state (and make reruns cheaper) across databases
+    TEMPLATE_CACHE.clear()
+    DRILL_INDEX.clear()
+    LEADERBOARDS.clear()
+    PLAN_GENERATOR.clear()
+    RATE_LIMIT_STORE.clear()
+    DASHBOARD_CACHE.clear()
+    app.dependency_overrides[get_db] = test_db.override_get_db
+    app.dependency_overrides[get_read_db] = test_db.override_get_db
+    return test_db
+
+
+def unbind_test_database():
+    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_read_db, None)
+
+
+def auth_headers(email, role="PLAYER"):
+    token = create_access_token(data={"sub": email, "role": role})
+    return {"Authorization": f"Bearer {token}"}
+
+
+class QueryBudget:
+    """
+    Runs one request against datasets of N and N*SCALE_FACTOR rows and
+    checks that the statement count (a) fits the declared budget and
+    (b) does not grow with the dataset - i.e. there is no N+1 loop.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.db = None
+
+    def _fresh_db(self):
+        if self.db is not None:
+            self.db.dispose()
+        self.db = bind_test_database()
+        return self.db
+
+    def measure(self, seed, request, n):
+        """seed(session, n) -> context; request(client, context) -> response"""
+        test_db = self._fresh_db()
+        session = test_db.SessionLocal()
+        try:
+            context = seed(session, n)
+            session.commit()
+        finally:
+            session.close()
+
+        client = TestClient(app)
+        with test_db.counter:
+            response = request(client, context)
+        assert response.status_code < 400, f"{response.status_code}: {response.text}"
+        return test_db.counter.statements
+
+    def check(self, seed, request, n=SCALE_N):
+        small = self.measure(seed, request, n)
+        large = self.measure(seed, request, n * SCALE_FACTOR)
+
+        assert len(small) <= self.budget, (
+            f"Query budget exceeded: {len(small)} > {self.budget}\n" + "\n---\n".join(small)
+        )
+        assert len(large) == len(small), (
+            f"Statement count grows with dataset size ({len(small)} at N={n}, "
+            f"{len(large)} at N={n * SCALE_FACTOR}) - likely an N+1 loop"
+        )
+        return len(small)
+
+    def close(self):
+        unbind_test_database()
+        if self.db is not None:
+            self.db.dispose()
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "query_budget(n): maximum SQL statements the request under test may issue"
+    )
+
+
+@pytest.fixture
+def query_budget(request):
+    """Declare the budget with @pytest.mark.query_budget(n) on the test."""
+    marker = request.node.get_closest_marker("query_budget")
+    if marker is None:
+        pytest.fail("query_budget fixture requires @pytest.mark.query_budget(n)")
+    harness = QueryBudget(marker.args[0])
+    yield harness
+    harness.close()
+
+
+@pytest.fixture
+def test_db():
+    """Behaviour tests: a fresh database wired into the app (no statement budget)."""
+    database = bind_test_database()
+    yield database
+    unbind_test_database()
+    database.dispose()
+
+
+@pytest.fixture
+def client(test_db):
+    return TestClient(app)
+
+
+@pytest.fixture
+def db(test_db):
+    """A session on the test database, for seeding and for checking what requests wrote."""
+    session = test_db.SessionLocal()
+    yield session
+    session.close()
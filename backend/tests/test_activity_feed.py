@@ -0,0 +1,73 @@
+"""Coach activity feed: keyset paging over equal timestamps, filters and bad cursors."""
+from datetime import datetime, timedelta
+
+from app.models.activity import ActivityFeedEntry
+from app.models.user import User
+from tests.conftest import auth_headers
+
+T = datetime(2026, 5, 1, 12, 0)
+
+
+def seed(db):
+    db.add_all([
+        User(id="coach", email="coach@test.com", role="COACH"),
+        User(id="other", email="other@test.com", role="COACH"),
+        User(id="p1", email="p1@test.com", role="PLAYER", coach_id="coach"),
+    ])
+    # Bursts that share a created_at (a batch upload, a backfill) are where offset/timestamp cursors break
+    stamps = [T] * 4 + [T + timedelta(minutes=1)] * 5 + [T + timedelta(minutes=2)] * 2
+    db.add_all([
+        ActivityFeedEntry(id=f"e{n:02d}", coach_id="coach", player_id="p1", type="MATCH_LOG" if n % 3 == 0 else "SESSION_LOG",
+                          title=f"Entry {n}", created_at=at)
+        for n, at in enumerate(stamps)
+    ])
+    db.add(ActivityFeedEntry(id="theirs", coach_id="other", player_id="p9", type="SESSION_LOG", created_at=T))
+    db.commit()
+
+
+def page(client, **params):
+    response = client.get("/api/v1/coach/feed", params=params, headers=auth_headers("coach@test.com", "COACH"))
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return [item["id"] for item in body["items"]], body["next_cursor"]
+
+
+def walk(client, cursor=None, **params):
+    seen = []
+    while True:
+        ids, cursor = page(client, **params, **({"cursor": cursor} if cursor else {}))
+        seen += ids
+        if cursor is None:
+            return seen
+
+
+def test_pages_cover_every_entry_once_across_equal_timestamps(client, db):
+    seed(db)
+    newest_first = sorted(db.query(ActivityFeedEntry).filter_by(coach_id="coach"), key=lambda e: (e.created_at, e.id), reverse=True)
+    expected = [e.id for e in newest_first]
+    for limit in (1, 3, 4, 11, 50):
+        assert walk(client, limit=limit) == expected
+
+    # Exactly a page left: no trailing empty page
+    _, cursor = page(client, limit=9)
+    ids, cursor = page(client, limit=2, cursor=cursor)
+    assert (len(ids), cursor) == (2, None)
+
+
+def test_new_entries_dont_shift_a_walk_in_progress(client, db):
+    seed(db)
+    first, cursor = page(client, limit=4)
+    db.add(ActivityFeedEntry(id="e99", coach_id="coach", player_id="p1", type="SESSION_LOG", created_at=T + timedelta(minutes=5)))
+    db.add(ActivityFeedEntry(id="e05a", coach_id="coach", player_id="p1", type="SESSION_LOG", created_at=T + timedelta(minutes=1)))
+    db.commit()
+    rest = walk(client, limit=4, cursor=cursor)
+    assert "e99" not in rest and len(set(first + rest)) == len(first + rest) == 12
+    assert "e05a" in rest  # same created_at as the cursor but a lower id: still ahead of it
+
+
+def test_type_filter_and_bad_cursors(client, db):
+    seed(db)
+    assert walk(client, limit=2, types="MATCH_LOG") == ["e09", "e06", "e03", "e00"]
+    response = client.get("/api/v1/coach/feed", params={"cursor": "not-a-cursor"}, headers=auth_headers("coach@test.com", "COACH"))
+    assert response.status_code == 400
+    assert client.get("/api/v1/coach/feed", headers=auth_headers("p1@test.com")).status_code == 403
@@ -0,0 +1,72 @@
+"""Squad attendance: stats and streaks from the day bitmaps, and the first-start rebuild."""
+from datetime import date, datetime
+
+from app.models.training import AttendanceBitmap, SquadAttendance
+from app.models.user import Squad, SquadMember, User
+from app.services import attendance
+from tests.conftest import auth_headers
+
+# Squad sessions across a new year; nobody trains on the days in between
+SESSION_DAYS = [date(2025, 12, 29), date(2025, 12, 31), date(2026, 1, 2), date(2026, 1, 5), date(2026, 1, 7)]
+ATTENDED = {"a": [0, 1, 2, 3, 4], "b": [0, 1, 3, 4], "c": [2]}
+
+
+def seed_squad(db):
+    db.add(User(id="coach", email="coach@test.com", role="COACH", name="Coach"))
+    db.add_all([User(id=pid, email=f"{pid}@test.com", role="PLAYER", name=pid.upper(), coach_id="coach") for pid in ATTENDED])
+    db.add(Squad(id="squad", name="Squad", coach_id="coach"))
+    db.add_all([SquadMember(squad_id="squad", player_id=pid) for pid in ATTENDED])
+    db.commit()
+
+
+def test_stats_and_streaks_follow_the_marks(client, db):
+    seed_squad(db)
+    coach = auth_headers("coach@test.com", "COACH")
+    for i, day in enumerate(SESSION_DAYS):
+        players = [pid for pid, days in ATTENDED.items() if i in days]
+        marked = client.post("/api/v1/squads/squad/attendance", json={"player_ids": players, "date": f"{day}T18:00:00"}, headers=coach)
+        assert marked.json()["marked"] == len(players)
+    # Marking the same day twice changes nothing
+    assert client.post("/api/v1/squads/squad/attendance", json={"player_ids": ["a"], "date": "2026-01-07T19:00:00"}, headers=coach).json()["marked"] == 0
+
+    stats = client.get("/api/v1/squads/squad/attendance/stats", params={"start": "2025-12-01", "end": "2026-01-31"}, headers=coach).json()
+    assert stats["sessions"] == 5
+    assert stats["last_session"] == "2026-01-07"
+    members = {m["player_id"]: m for m in stats["members"]}
+    assert [m["player_id"] for m in stats["members"]] == ["a", "b", "c"]
+    assert {pid: (m["attended"], m["rate"], m["current_streak"], m["longest_streak"]) for pid, m in members.items()} == {
+        "a": (5, 1.0, 5, 5),
+        "b": (4, 0.8, 2, 2),  # missed the third session
+        "c": (1, 0.2, 0, 1),
+    }
+    assert members["c"]["last_attended"] == "2026-01-02"
+    assert stats["squad_rate"] == round(10 / 15, 3)
+
+    # Only January: the December sessions drop out of the range
+    january = client.get("/api/v1/squads/squad/attendance/stats", params={"start": "2026-01-01", "end": "2026-01-31"}, headers=coach).json()
+    assert january["sessions"] == 3
+    assert {m["player_id"]: m["longest_streak"] for m in january["members"]} == {"a": 3, "b": 2, "c": 1}
+
+    heatmap = client.get("/api/v1/squads/squad/attendance/heatmap", params={"start": "2025-12-29", "end": "2026-01-07"}, headers=coach).json()
+    assert heatmap["session_days"] == [str(day) for day in SESSION_DAYS]
+    assert [heatmap["counts"][(day - SESSION_DAYS[0]).days] for day in SESSION_DAYS] == [2, 2, 2, 2, 2]
+
+    leaderboard = client.get("/api/v1/squads/squad/leaderboard", headers=coach).json()
+    assert {row["player_id"]: row["attendance_count"] for row in leaderboard} == {"a": 5, "b": 4, "c": 1}
+
+
+def test_existing_attendance_gets_bitmaps_on_first_start(client, db):
+    """A database from before the bitmaps: raw rows only, so counts would read 0."""
+    seed_squad(db)
+    db.add_all([
+        SquadAttendance(squad_id="squad", player_id=pid, date=datetime.combine(SESSION_DAYS[i], datetime.min.time()))
+        for pid, days in ATTENDED.items() for i in days
+    ])
+    db.commit()
+
+    assert attendance.ensure_bitmaps(db) == 3 + 4  # per player and the squad row, per year (c only came in 2026)
+    assert attendance.ensure_bitmaps(db) == 0  # only once
+    assert db.query(AttendanceBitmap).count() == 7
+
+    leaderboard = client.get("/api/v1/squads/squad/leaderboard", headers=auth_headers("coach@test.com", "COACH")).json()
+    assert {row["player_id"]: row["attendance_count"] for row in leaderboard} == {"a": 5, "b": 4, "c": 1}
@@ -0,0 +1,16 @@
+"""Registration: which roles can sign themselves up."""
+import pytest
+from pydantic import ValidationError
+
+from app.api.v1.auth import UserCreate
+
+
+def test_nobody_registers_as_admin(client, test_db):
+    for role in ("ADMIN", "admin", "superuser"):
+        response = client.post("/api/v1/auth/register", json={"email": f"{role}@test.com", "password": "secret", "role": role})
+        assert response.status_code == 422
+
+    assert UserCreate(email="c@test.com", password="secret", role="coach").role == "coach"
+    assert UserCreate(email="p@test.com", password="secret").role == "player"
+    with pytest.raises(ValidationError):
+        UserCreate(email="a@test.com", password="secret", role="Admin")
@@ -0,0 +1,110 @@
+"""16-byte id storage: the online migration and the CompactId round trip."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import sessionmaker
+
+from app.core import ids
+from app.core.database import Base, make_engine
+from app.models.training import DrillPerformance, SessionLog
+from app.models.user import User
+from app.services import compact_ids
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'ids.db'}")
+    Base.metadata.create_all(engine)
+    ids.detect_id_storage(engine)
+    yield engine
+    engine.dispose()
+
+
+def add_log(session, log_id, perf_ids=()):
+    session.add(SessionLog(id=log_id, player_id="p1", duration_minutes=10, rpe=5, date_completed=datetime.utcnow()))
+    session.add_all([DrillPerformance(id=pid, session_log_id=log_id, drill_id="d1", outcome="success") for pid in perf_ids])
+
+
+def test_uuid7_ids_are_time_ordered():
+    generated = [ids.new_id() for _ in range(5000)]
+    assert generated == sorted(generated)
+    assert all(ids.is_uuid(i) and i[14] == "7" for i in generated)
+    assert ids.from_bytes(ids.to_bytes(generated[0])) == generated[0]
+
+
+def test_migration_keeps_ids_and_mirrors_writes(file_engine):
+    Session = sessionmaker(bind=file_engine)
+    db = Session()
+    db.add(User(id="p1", email="p1@test.com", role="PLAYER", name="P1"))
+    kept, updated, deleted = ids.new_id(), ids.new_id(), ids.new_id()
+    for log_id in (kept, updated, deleted):
+        add_log(db, log_id, [ids.new_id()])
+    db.commit()
+
+    tables = [Base.metadata.tables[name] for name in ("session_logs", "drill_performances")]
+    for table in tables:
+        compact_ids.start(file_engine, table)
+        compact_ids.copy_rows(file_engine, table, batch_size=2)
+
+    # Writes between the copy and the swap reach the shadow through the triggers
+    late = ids.new_id()
+    add_log(db, late, [ids.new_id()])
+    db.get(SessionLog, updated).rpe = 9
+    db.query(DrillPerformance).filter(DrillPerformance.session_log_id == deleted).delete()
+    db.query(SessionLog).filter(SessionLog.id == deleted).delete()
+    db.commit()
+    db.close()
+
+    for table in tables:
+        compact_ids.swap(file_engine, table)
+
+    with file_engine.connect() as conn:
+        assert conn.execute(text("SELECT DISTINCT typeof(id) FROM session_logs")).scalars().all() == ["blob"]
+        assert conn.execute(text("SELECT DISTINCT typeof(session_log_id) FROM drill_performances")).scalars().all() == ["blob"]
+
+    db = Session()
+    logs = {log.id: log for log in db.query(SessionLog)}
+    assert set(logs) == {kept, updated, late}  # the same string ids, read back from 16 bytes
+    assert logs[updated].rpe == 9
+    assert db.get(SessionLog, late).id == late
+    assert {p.session_log_id for p in db.query(DrillPerformance).join(SessionLog)} == {kept, updated, late}
+    fresh = ids.new_id()
+    add_log(db, fresh, [ids.new_id()])
+    db.commit()
+    assert db.get(SessionLog, fresh).drill_performances[0].session_log_id == fresh
+    db.close()
+
+    # A worker that hasn't noticed the swap can't write text ids into the binary table
+    with pytest.raises(DatabaseError, match="ids are binary now"):
+        with file_engine.begin() as conn:
+            conn.execute(text("INSERT INTO session_logs (id, player_id) VALUES (:id, 'p1')"), {"id": ids.new_id()})
+
+
+def test_workers_follow_a_swap_made_elsewhere(file_engine):
+    compact_ids.migrate(file_engine, tables=["notifications"])
+    ids.set_binary(file_engine, "notifications", False)  # this worker still thinks text
+    ids.detect_id_storage(file_engine)  # what storage_loop runs
+    assert ids.binary_tables(file_engine) == {"notifications"}
+
+
+def test_storage_is_tracked_per_database(file_engine, tmp_path):
+    """A shard still on text ids next to one already converted."""
+    other = make_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    Base.metadata.create_all(other)
+    ids.detect_id_storage(other)
+    compact_ids.migrate(file_engine, tables=["session_logs"])
+
+    assert "session_logs" in ids.binary_tables(file_engine)
+    assert "session_logs" not in ids.binary_tables(other)
+    for bind in (file_engine, other):
+        db = sessionmaker(bind=bind)()
+        log_id = ids.new_id()
+        db.add(SessionLog(id=log_id, player_id="p1", duration_minutes=5, rpe=1))
+        db.commit()
+        assert db.get(SessionLog, log_id).id == log_id
+        db.close()
+    with other.connect() as conn:
+        assert conn.execute(text("SELECT typeof(id) FROM session_logs")).scalar() == "text"
+    other.dispose()
@@ -0,0 +1,82 @@
+"""Dashboard: field masks, the per-section cache and what invalidates it."""
+from datetime import datetime
+
+from app.models.training import SessionLog
+from app.models.user import Notification, User
+from app.services.dashboard import SectionCache
+from tests.conftest import auth_headers
+
+
+def seed(db):
+    db.add_all([
+        User(id="coach", email="coach@test.com", role="COACH", name="Coach"),
+        User(id="p1", email="p1@test.com", role="PLAYER", name="P1", coach_id="coach"),
+        User(id="p2", email="p2@test.com", role="PLAYER", name="P2", coach_id="coach"),
+    ])
+    db.commit()
+
+
+def dashboard(client, email, role="PLAYER", **params):
+    return client.get("/api/v1/dashboard", params=params, headers=auth_headers(email, role))
+
+
+def cached(response):
+    return set(filter(None, response.headers["X-Dashboard-Cached"].split(",")))
+
+
+def test_fields_pick_sections_for_the_callers_role(client, db):
+    seed(db)
+    player = dashboard(client, "p1@test.com").json()
+    assert set(player["sections"]) == {"profile", "active_program", "session_logs", "programs", "unread"}
+    assert player["errors"] == {} and player["sections"]["profile"]["id"] == "p1"
+
+    masked = dashboard(client, "p1@test.com", fields="unread, profile").json()
+    assert set(masked["sections"]) == {"unread", "profile"}
+    coach = dashboard(client, "coach@test.com", "COACH", fields="athletes").json()
+    assert {a["id"] for a in coach["sections"]["athletes"]} == {"p1", "p2"}
+
+    # Coach-only sections aren't offered to players, and typos are rejected
+    assert dashboard(client, "p1@test.com", fields="athletes").status_code == 400
+    assert dashboard(client, "p1@test.com", fields="profile,unred").status_code == 400
+
+
+def test_committed_writes_drop_only_the_sections_they_touch(client, db):
+    seed(db)
+    assert cached(dashboard(client, "p1@test.com")) == set()
+    warm = dashboard(client, "p1@test.com")
+    # active_program is null (nothing assigned) and still comes from the cache
+    assert warm.json()["sections"]["active_program"] is None
+    assert cached(warm) == {"profile", "active_program", "session_logs", "programs", "unread"}
+    dashboard(client, "p2@test.com")
+
+    db.add(Notification(user_id="p1", title="Hi", message="New plan", type="PROGRAM"))
+    db.add(SessionLog(player_id="p1", date_completed=datetime.utcnow(), duration_minutes=30, rpe=5))
+    db.commit()
+
+    fresh = dashboard(client, "p1@test.com")
+    assert cached(fresh) == {"profile", "active_program", "programs"}
+    assert fresh.json()["sections"]["unread"]["total"] == 1
+    assert len(fresh.json()["sections"]["session_logs"]) == 1
+    assert fresh.headers["ETag"] != warm.headers["ETag"]
+    # Nobody else's cache moved
+    assert cached(dashboard(client, "p2@test.com")) == {"profile", "active_program", "session_logs", "programs", "unread"}
+
+    # Moving a player off the roster refreshes the coach's athlete list
+    dashboard(client, "coach@test.com", "COACH")
+    db.get(User, "p2").coach_id = None
+    db.commit()
+    coach = dashboard(client, "coach@test.com", "COACH")
+    assert "athletes" not in cached(coach) and [a["id"] for a in coach.json()["sections"]["athletes"]] == ["p1"]
+
+
+def test_a_value_computed_before_an_invalidation_is_not_stored():
+    cache = SectionCache()
+    generation = cache.generation("unread", "p1")
+    cache.invalidate([("unread", "p1")])  # a write commits while the section is being computed
+    cache.put("unread", "p1", {"total": 0}, ttl=30, generation=generation)
+    assert cache.get("unread", "p1") is None
+
+    cache.put("unread", "p1", {"total": 1}, ttl=30, generation=cache.generation("unread", "p1"))
+    assert cache.get("unread", "p1") == {"total": 1}
+    cache.invalidate([("unread", "*")])  # everyone's copy of the section
+    assert cache.get("unread", "p1") is None
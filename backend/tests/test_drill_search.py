@@ -0,0 +1,61 @@
+"""Drill search index: prefix ranking, disjunctive facet counts and incremental adds."""
+from app.models.training import Drill
+from app.services.drill_search import DrillIndex
+
+DRILLS = [
+    dict(id="d1", name="Serve Toss", category="Serve", difficulty="Beginner", is_premium=False, description="Toss practice"),
+    dict(id="d2", name="Serving Targets", category="Serve", difficulty="Advanced", is_premium=True, description="Aim for the corners"),
+    dict(id="d3", name="Volley Drill", category="Net", difficulty="Beginner", is_premium=False, description="Serve then volley"),
+    dict(id="d4", name="Deep Rally", category="Baseline", difficulty="Intermediate", is_premium=False, description="Keep it deep"),
+]
+
+
+def built(db):
+    db.add_all([Drill(**fields) for fields in DRILLS])
+    db.commit()
+    index = DrillIndex()
+    index.ensure_fresh(db)
+    return index
+
+
+def ids(result):
+    return [d["id"] for d in result["items"]]
+
+
+def test_name_and_exact_matches_rank_first(db):
+    index = built(db)
+    # exact in a name (d1) > exact in a description (d3); "serving" isn't a prefix match
+    assert ids(index.search("serve")) == ["d1", "d3"]
+    # prefix in a name (d1, d2 - ties go by name) > prefix in a description (d3)
+    assert ids(index.search("SERV")) == ["d1", "d2", "d3"]
+    assert ids(index.search("toss")) == ["d1"]  # name and description both match: the best one counts
+    # Every token has to match somewhere
+    assert ids(index.search("serv corners")) == ["d2"]
+    assert ids(index.search("deep ral")) == ["d4"]
+    assert index.search("serve lob")["total"] == 0
+    assert ids(index.search("", limit=2, offset=1)) == ["d1", "d2"]  # no query: by name, after "Deep Rally"
+
+
+def test_each_facet_is_counted_without_its_own_filter(db):
+    index = built(db)
+    result = index.search("serv", filters={"category": "Serve"})
+    assert (result["total"], ids(result)) == (2, ["d1", "d2"])
+    # Picking another category is still offered, with what it would return
+    assert result["facets"]["category"] == {"Serve": 2, "Net": 1}
+    assert result["facets"]["difficulty"] == {"Beginner": 1, "Advanced": 1}
+    assert result["facets"]["is_premium"] == {"false": 1, "true": 1}
+
+    result = index.search("serv", filters={"category": "Serve", "difficulty": "Beginner"})
+    assert ids(result) == ["d1"]
+    assert result["facets"]["category"] == {"Serve": 1, "Net": 1}  # difficulty applied, category not
+    assert result["facets"]["difficulty"] == {"Beginner": 1, "Advanced": 1}  # category applied, difficulty not
+    assert result["facets"]["is_premium"] == {"false": 1}
+
+
+def test_new_drills_are_searchable_without_a_rebuild(db):
+    index = built(db)
+    version = index.version
+    index.add(Drill(id="d5", name="Serve and Volley", category="Net", difficulty="Advanced", is_premium=False))
+    assert index.version == version + 1
+    assert ids(index.search("serve vol")) == ["d5", "d3"]
+    assert index.search("", filters={"category": "Net"})["facets"]["difficulty"] == {"Beginner": 1, "Advanced": 1}
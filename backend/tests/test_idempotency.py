@@ -0,0 +1,92 @@
+"""Idempotency-Key: replays, mismatched reuse and released keys."""
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, make_engine
+from app.core.idempotency import IdempotencyMiddleware
+from app.models.idempotency import IdempotencyKey
+from tests.conftest import auth_headers
+
+
+@pytest.fixture
+def keyed(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'keys.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    calls = {"orders": 0, "refunds": 0, "flaky": 0}
+    api = FastAPI()
+
+    @api.post("/orders")
+    async def orders(request: Request):
+        calls["orders"] += 1
+        return {"order": calls["orders"], "body": (await request.body()).decode()}
+
+    @api.post("/refunds")
+    def refunds():
+        calls["refunds"] += 1
+        return {"refund": calls["refunds"]}
+
+    @api.post("/flaky")
+    def flaky():
+        calls["flaky"] += 1
+        if calls["flaky"] == 1:
+            return JSONResponse({"detail": "database went away"}, status_code=503)
+        return {"attempt": calls["flaky"]}
+
+    routes = (("POST", "/orders"), ("POST", "/refunds"), ("POST", "/flaky"))
+    client = TestClient(IdempotencyMiddleware(api, routes=routes, session_factory=Session))
+    yield client, calls, Session
+    engine.dispose()
+
+
+def keyed_headers(key, email="p1@test.com"):
+    return {**auth_headers(email), "Idempotency-Key": key}
+
+
+def test_retry_replays_the_stored_response(keyed):
+    client, calls, _ = keyed
+    first = client.post("/orders", content=b"ball", headers=keyed_headers("k1"))
+    retry = client.post("/orders", content=b"ball", headers=keyed_headers("k1"))
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json() == {"order": 1, "body": "ball"}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert calls["orders"] == 1
+    # Keys are per user: someone else's k1 is a new request
+    assert client.post("/orders", content=b"ball", headers=keyed_headers("k1", "p2@test.com")).json()["order"] == 2
+
+
+def test_reused_key_with_a_different_body_is_rejected(keyed):
+    client, calls, _ = keyed
+    client.post("/orders", content=b"ball", headers=keyed_headers("k1"))
+    reused = client.post("/orders", content=b"racket", headers=keyed_headers("k1"))
+    assert reused.status_code == 422
+    assert calls["orders"] == 1
+
+
+def test_reused_key_on_another_route_is_rejected(keyed):
+    client, calls, _ = keyed
+    assert client.post("/orders", headers=keyed_headers("k1")).status_code == 200
+    reused = client.post("/refunds", headers=keyed_headers("k1"))  # same (empty) body
+    assert reused.status_code == 422
+    assert "POST /orders" in reused.json()["detail"]
+    assert calls["refunds"] == 0
+
+
+def test_server_errors_release_the_key(keyed):
+    client, calls, Session = keyed
+    failed = client.post("/flaky", headers=keyed_headers("k1"))
+    assert failed.status_code == 503
+    db = Session()
+    assert db.query(IdempotencyKey).count() == 0
+    db.close()
+
+    retry = client.post("/flaky", headers=keyed_headers("k1"))
+    assert retry.status_code == 200 and retry.json() == {"attempt": 2}
+    assert "Idempotent-Replayed" not in retry.headers
+    assert client.post("/flaky", headers=keyed_headers("k1")).json() == {"attempt": 2}  # now stored
+    assert calls["flaky"] == 2
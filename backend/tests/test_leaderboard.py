@@ -0,0 +1,56 @@
+"""Leaderboards: competition ranks at ties, neighbours at the edges and live XP moves."""
+from app.models.user import User
+from app.services import xp
+from tests.conftest import auth_headers
+
+XP = {"a": 500, "b": 300, "c": 300, "d": 300, "e": 100, "f": 0}
+
+
+def seed(db):
+    db.add(User(id="coach", email="coach@test.com", role="COACH", xp=9999))  # coaches aren't ranked
+    db.add_all([User(id=uid, email=f"{uid}@test.com", role="PLAYER", name=uid.upper(), xp=points) for uid, points in XP.items()])
+    db.commit()
+
+
+def board(client, email, role="PLAYER", **params):
+    return client.get("/api/v1/leaderboard", params=params, headers=auth_headers(email, role)).json()
+
+
+def ranks(rows):
+    return [(row["rank"], row["player_id"]) for row in rows]
+
+
+def test_ties_share_a_rank_and_neighbours_clip_at_the_edges(client, db):
+    seed(db)
+    view = board(client, "c@test.com", limit=4, around=1)
+    assert view["total"] == 6
+    assert ranks(view["top"]) == [(1, "a"), (2, "b"), (2, "c"), (2, "d")]
+    assert view["me"] == {"rank": 2, "xp": 300}
+    assert ranks(view["neighbours"]) == [(2, "b"), (2, "c"), (2, "d")]
+
+    # The ends of the board have fewer neighbours on one side
+    assert ranks(board(client, "a@test.com", around=2)["neighbours"]) == [(1, "a"), (2, "b"), (2, "c")]
+    assert ranks(board(client, "f@test.com", around=2)["neighbours"]) == [(2, "d"), (5, "e"), (6, "f")]
+    assert ranks(board(client, "e@test.com", around=0)["neighbours"]) == [(5, "e")]
+
+    # Someone who isn't on the board sees it without a rank
+    coach = board(client, "coach@test.com", "COACH")
+    assert (coach["me"], coach["neighbours"], coach["total"]) == (None, [], 6)
+
+
+def test_committed_xp_moves_players_on_a_loaded_board(client, db):
+    seed(db)
+    board(client, "c@test.com")  # load it
+    xp.award_xp(db, db.get(User, "c"), [(250, xp.SESSION_LOG, "log")])
+    xp.award_xp(db, db.get(User, "f"), [(100, xp.SESSION_LOG, "log")])
+    db.commit()
+
+    view = board(client, "d@test.com", around=1)
+    assert ranks(view["top"]) == [(1, "c"), (2, "a"), (3, "b"), (3, "d"), (5, "e"), (5, "f")]
+    assert [row["xp"] for row in view["top"]] == [550, 500, 300, 300, 100, 100]
+    assert view["me"] == {"rank": 3, "xp": 300} and ranks(view["neighbours"]) == [(3, "b"), (3, "d"), (5, "e")]
+
+    # A rolled-back award never reaches the board
+    xp.award_xp(db, db.get(User, "e"), [(1000, xp.SESSION_LOG, "log")])
+    db.rollback()
+    assert board(client, "e@test.com")["me"] == {"rank": 5, "xp": 100}
@@ -0,0 +1,92 @@
+"""Matches: search scoping, score parsing and the stats rollups."""
+from datetime import datetime
+
+from app.models.user import MatchEntry, User
+from app.services.match_search import rebuild_sqlite_index
+from app.services.match_stats import backfill_match_stats, derive_outcome, parse_score
+from tests.conftest import auth_headers
+
+
+def seed(db, test_db):
+    db.add_all([
+        User(id="coach", email="coach@test.com", role="COACH"),
+        User(id="rival-coach", email="rival@test.com", role="COACH"),
+        User(id="p1", email="p1@test.com", role="PLAYER", coach_id="coach"),
+        User(id="p2", email="p2@test.com", role="PLAYER", coach_id="rival-coach"),
+    ])
+    db.add_all([
+        MatchEntry(id=f"m-{pid}", user_id=pid, date=datetime(2026, 5, 1), event_name="Spring Open", opponent_name="Nadal", score="6-4 6-4", result="Win")
+        for pid in ("p1", "p2")
+    ])
+    db.commit()
+    with test_db.engine.begin() as conn:
+        rebuild_sqlite_index(conn)  # the API indexes on write; these rows were added directly
+
+
+def search(client, email, role, **params):
+    return client.get("/api/v1/matches/search", params={"q": "nadal", **params}, headers=auth_headers(email, role))
+
+
+def test_coach_searches_only_their_own_athletes(client, db, test_db):
+    seed(db, test_db)
+    assert [m["id"] for m in search(client, "coach@test.com", "COACH", player_id="p1").json()] == ["m-p1"]
+    assert [m["id"] for m in search(client, "coach@test.com", "COACH", scope="roster").json()] == ["m-p1"]
+
+    other = search(client, "coach@test.com", "COACH", player_id="p2")
+    assert other.status_code == 404
+
+
+def test_players_only_see_their_own_matches(client, db, test_db):
+    seed(db, test_db)
+    # player_id is ignored for players
+    assert [m["id"] for m in search(client, "p1@test.com", "PLAYER", player_id="p2").json()] == ["m-p1"]
+
+
+def test_scores_are_parsed_into_sets_games_and_tiebreaks():
+    two_sets = parse_score("6-4 7-6(5)")
+    assert two_sets["set_scores"] == [[6, 4], [7, 6, 5]]
+    assert (two_sets["sets_won"], two_sets["games_won"], two_sets["games_lost"], two_sets["tiebreaks_won"]) == (2, 13, 10, 1)
+
+    # A deciding match tiebreak is a set and a tiebreak, but no games
+    super_tb = parse_score("4-6, 6-3, [10-7]")
+    assert (super_tb["sets_won"], super_tb["sets_lost"], super_tb["games_won"], super_tb["games_lost"]) == (2, 1, 10, 9)
+    assert (super_tb["tiebreaks_won"], super_tb["tiebreaks_lost"]) == (1, 0)
+
+    retired = parse_score("6-2 3-1 ret")
+    assert retired["retired"] and (retired["sets_won"], retired["games_won"], retired["games_lost"]) == (1, 9, 3)
+    assert derive_outcome(retired, "Loss") == "Loss"  # a retirement keeps the entered result
+    assert parse_score("w/o") is None and derive_outcome(None, "won") == "Win"
+
+
+def test_stats_rollups_follow_creates_and_edits(client, db):
+    db.add(User(id="p1", email="p1@test.com", role="PLAYER", name="P1"))
+    db.commit()
+    player = auth_headers("p1@test.com")
+
+    def log(opponent, surface, score):
+        body = {"event_name": "League", "round": "R1", "opponent_name": opponent, "surface": surface, "score": score}
+        return client.post("/api/v1/matches/", json=body, headers=player).json()["id"]
+
+    log("Nadal", "Clay", "6-4 6-4")
+    rematch = log("Nadal", "Hard", "3-6 4-6")
+    log("Murray", "Hard", "6-7(3) 6-3 [10-8]")
+
+    stats = client.get("/api/v1/matches/stats", headers=player).json()
+    assert (stats["overall"]["matches"], stats["overall"]["wins"], stats["overall"]["losses"]) == (3, 2, 1)
+    assert (stats["overall"]["tiebreaks_won"], stats["overall"]["tiebreaks_lost"]) == (1, 1)
+    assert {s["name"]: (s["wins"], s["losses"]) for s in stats["head_to_head"]} == {"Nadal": (1, 1), "Murray": (1, 0)}
+
+    # Editing the score moves the counters (the old contribution comes off)
+    client.patch(f"/api/v1/matches/{rematch}", json={"score": "6-3 6-4"}, headers=player)
+    stats = client.get("/api/v1/matches/stats", headers=player).json()
+    assert (stats["overall"]["wins"], stats["overall"]["losses"], stats["overall"]["win_pct"]) == (3, 0, 100.0)
+    assert {s["name"]: (s["matches"], s["wins"]) for s in stats["by_surface"]} == {"Hard": (2, 2), "Clay": (1, 1)}
+
+
+def test_coaches_read_stats_only_for_their_own_athletes(client, db, test_db):
+    seed(db, test_db)
+    backfill_match_stats(db)  # rollups are kept by the API; the seed wrote directly
+    coach = auth_headers("coach@test.com", "COACH")
+    mine = client.get("/api/v1/matches/stats", params={"player_id": "p1"}, headers=coach)
+    assert (mine.status_code, mine.json()["overall"]["matches"]) == (200, 1)
+    assert client.get("/api/v1/matches/stats", params={"player_id": "p2"}, headers=coach).status_code == 404
@@ -0,0 +1,47 @@
+"""/metrics: per-route request and SQL accounting, and the exposition format."""
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core import metrics
+from app.core.database import make_engine
+from app.main import app
+
+ROUTE = "/metrics-test/items/{item_id}"
+
+
+def test_requests_and_sql_are_counted_per_route_template(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    metrics.instrument_engine(engine)
+    api = FastAPI()
+
+    @api.get(ROUTE)
+    def item(item_id: int):
+        if item_id < 0:
+            raise HTTPException(404, "No such item")
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        return {"id": item_id}
+
+    client = TestClient(metrics.MetricsMiddleware(api))
+    for item_id in (1, 2, 3, -1):
+        client.get(f"/metrics-test/items/{item_id}")
+    engine.dispose()
+
+    # One series for every id: the label is the template, never the raw URL
+    assert metrics.HTTP_REQUESTS.get("GET", ROUTE, "200") == 3
+    assert metrics.HTTP_REQUESTS.get("GET", ROUTE, "404") == 1
+    assert metrics.SQL_STATEMENTS.get(ROUTE) == 6
+    assert metrics.SQL_PER_REQUEST.count(ROUTE) == 4
+    assert metrics.HTTP_LATENCY.count("GET", ROUTE) == 4
+    assert metrics.HTTP_IN_FLIGHT.get("GET") == 0
+
+    rendered = TestClient(app).get("/metrics")
+    assert rendered.headers["content-type"].startswith("text/plain")
+    lines = rendered.text.splitlines()
+    assert "# TYPE http_requests_total counter" in lines
+    assert f'http_requests_total{{method="GET",route="{ROUTE}",status="200"}} 3' in lines
+    assert f'db_statements_per_request_bucket{{route="{ROUTE}",le="2"}} 4' in lines  # 2, 2, 2 and 0 statements
+    assert f'db_statements_per_request_bucket{{route="{ROUTE}",le="1"}} 1' in lines
+    assert f'db_statements_per_request_count{{route="{ROUTE}"}} 4' in lines
@@ -0,0 +1,38 @@
+"""Notification digests: repeats fold into one unread row."""
+from app.models.user import Notification, User
+from app.services.notifications import notify
+
+
+def inbox(db, user_id="coach"):
+    db.expire_all()
+    return sorted((n.reference_id, n.count, n.message, n.is_read) for n in db.query(Notification).filter(Notification.user_id == user_id))
+
+
+def test_repeats_in_one_transaction_fold_into_one_row(db):
+    db.add(User(id="coach", email="coach@test.com", role="COACH"))
+    for i in range(3):
+        notify(db, "coach", "Session logged", f"log {i}", "SESSION_LOG", "p1", "p1")  # nothing flushed in between
+    notify(db, "coach", "Session logged", "other player", "SESSION_LOG", "p2", "p2")
+    db.commit()
+    assert inbox(db) == [("p1", 3, "log 2", False), ("p2", 1, "other player", False)]
+
+
+def test_bumps_of_a_stored_row_add_up(db):
+    db.add(User(id="coach", email="coach@test.com", role="COACH"))
+    notify(db, "coach", "Match update", "first", "MATCH", "p1", "p1")
+    db.commit()
+
+    db.close()  # a later request: the row is loaded, then bumped twice before the commit
+    notify(db, "coach", "Match update", "second", "MATCH", "p1", "p1")
+    notify(db, "coach", "Match update", "third", "MATCH", "p1", "p1")
+    db.commit()
+    assert inbox(db) == [("p1", 3, "third", False)]
+
+    # Once read, the next one starts a new row
+    db.query(Notification).update({Notification.is_read: True})
+    db.commit()
+    notify(db, "coach", "Match update", "fourth", "MATCH", "p1", "p1")
+    db.flush()
+    notify(db, "coach", "Match update", "fifth", "MATCH", "p1", "p1")  # found by the query after a flush
+    db.commit()
+    assert inbox(db) == [("p1", 2, "fifth", False), ("p1", 3, "third", True)]
@@ -0,0 +1,113 @@
+"""Plan generation: cache hits at both levels and coalescing of identical requests."""
+import threading
+import time
+
+import pytest
+
+from app.models.training import Drill
+from app.models.user import User
+from app.services import plan_generation
+from app.services.plan_generation import PROGRAM, LocalPlanModel, PlanGenerator, build_spec
+
+
+class CountingModel(LocalPlanModel):
+    """The local model, counting calls and optionally held until `gate` opens."""
+
+    def __init__(self, gate: threading.Event = None, fail: bool = False):
+        super().__init__(latency=0)
+        self.calls = 0
+        self.gate = gate
+        self.fail = fail
+
+    def generate(self, *args):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            raise plan_generation.PlanGenerationError("model unavailable")
+        return super().generate(*args)
+
+
+def seed(db):
+    db.add(User(id="p1", email="p1@test.com", role="PLAYER", level="Beginner", goals="Better serve"))
+    db.add_all([
+        Drill(id=f"d{n}", name=name, category=category, difficulty="Beginner")
+        for n, (name, category) in enumerate([("Dynamic Warmup", "Fitness"), ("Serve Toss", "Serve"), ("Volley Drill", "Net"), ("Deep Rally", "Baseline")])
+    ])
+    db.commit()
+    return db.get(User, "p1")
+
+
+def test_repeats_are_served_from_memory_then_from_the_shared_table(db):
+    player = seed(db)
+    spec = build_spec(db, PROGRAM, "kick serve", player, weeks=2)
+    model = CountingModel()
+    generator = PlanGenerator(model=model)
+
+    plan, cached = generator.generate(db, spec)
+    assert (cached, model.calls, len(plan["sessions"])) == (False, 1, 2)
+    assert generator.generate(db, build_spec(db, PROGRAM, "  kick   serve ", player, weeks=2)) == (plan, True)
+    assert model.calls == 1
+
+    # Another worker (empty LRU) finds it in generated_plans
+    other_model = CountingModel()
+    assert PlanGenerator(model=other_model).generate(db, spec) == (plan, True)
+    assert other_model.calls == 0
+
+    # Anything the model would see is part of the key
+    generator.generate(db, build_spec(db, PROGRAM, "kick serve", player, weeks=3))
+    db.add(Drill(id="d9", name="Kick Serve Targets", category="Serve", difficulty="Beginner"))
+    db.commit()
+    plan_generation.DRILL_INDEX.rebuild(db)
+    generator.generate(db, build_spec(db, PROGRAM, "kick serve", player, weeks=2))
+    assert model.calls == 3
+
+
+def generate_together(test_db, generator, spec, n):
+    results, errors = [None] * n, [None] * n
+
+    def run(i):
+        db = test_db.SessionLocal()
+        try:
+            results[i] = generator.generate(db, spec)
+        except Exception as exc:
+            errors[i] = exc
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def wait_for_followers(before, n):
+    deadline = time.monotonic() + 5
+    while plan_generation.COALESCED.get() < before + n and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_identical_concurrent_requests_share_one_model_call(db, test_db, fail):
+    spec = build_spec(db, PROGRAM, "volley", seed(db))
+    gate = threading.Event()
+    model = CountingModel(gate, fail=fail)
+    generator = PlanGenerator(model=model)
+
+    before = plan_generation.COALESCED.get()
+    threads, results, errors = generate_together(test_db, generator, spec, 5)
+    wait_for_followers(before, 4)  # everyone but the leader is waiting on its flight
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert model.calls == 1
+    assert plan_generation.COALESCED.get() - before == 4
+    if fail:
+        # The leader's error reaches every follower, and nothing is cached
+        assert results == [None] * 5 and all(isinstance(e, plan_generation.PlanGenerationError) for e in errors)
+        assert generator._cache_get(plan_generation.cache_key(spec, model.name)) is None
+    else:
+        assert errors == [None] * 5
+        assert sorted(cached for _, cached in results) == [False, True, True, True, True]
+        assert all(plan == results[0][0] for plan, _ in results)
@@ -0,0 +1,79 @@
+"""Request profiler: who gets profiled and what the speedscope file holds."""
+import json
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.core import profiling
+from app.core.database import make_engine
+from tests.conftest import auth_headers
+
+
+def crunch(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(200))
+    return total
+
+
+@pytest.fixture
+def profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_INTERVAL", 0.002)
+    engine = make_engine(f"sqlite:///{tmp_path / 'profiled.db'}")
+    profiling.instrument_engine(engine)
+    api = FastAPI()
+
+    @api.get("/cpu")
+    def cpu():
+        # Sync endpoint: runs on a worker thread and never touches the database
+        return {"total": crunch(0.15)}
+
+    @api.get("/sql")
+    def sql():
+        with engine.connect() as conn:
+            return {"one": conn.execute(text("SELECT 1")).scalar()}
+
+    yield TestClient(profiling.ProfilingMiddleware(api))
+    engine.dispose()
+
+
+def load(profile_id):
+    with open(profiling.profile_path(profile_id)) as f:
+        return json.load(f)
+
+
+def test_worker_thread_cpu_is_sampled_without_any_sql(profiled):
+    response = profiled.get("/cpu", headers={**auth_headers("admin@test.com", "ADMIN"), "X-Profile": "1"})
+    profile_id = response.headers["X-Profile-ID"]
+
+    summary = profiling.get_profile_summary(profile_id)
+    assert (summary["status"], summary["reason"], summary["sql_count"]) == (200, "requested", 0)
+    assert summary["samples"] > 0
+
+    speedscope = load(profile_id)
+    names = [frame["name"] for frame in speedscope["shared"]["frames"]]
+    cpu_profile = speedscope["profiles"][0]
+    crunch_samples = sum(
+        weight for sample, weight in zip(cpu_profile["samples"], cpu_profile["weights"])
+        if any(names[i] == "crunch" for i in sample)
+    )
+    # The request was almost all crunch() on the worker thread (the GIL decides how often the sampler gets in)
+    assert crunch_samples >= 0.5 * sum(cpu_profile["weights"]) > 0
+
+
+def test_sql_timeline_and_who_gets_profiled(profiled):
+    admin = auth_headers("admin@test.com", "ADMIN")
+    response = profiled.get("/sql", params={"__profile": "1"}, headers=admin)
+    speedscope = load(response.headers["X-Profile-ID"])
+    timeline = speedscope["profiles"][1]
+    assert [event["type"] for event in timeline["events"]] == ["O", "C"]
+    assert speedscope["shared"]["frames"][timeline["events"][0]["frame"]] == {"name": "SELECT 1", "file": "sql", "line": 0}
+
+    # Only admins can ask for a profile
+    assert "X-Profile-ID" not in profiled.get("/sql", headers={**auth_headers("p1@test.com"), "X-Profile": "1"}).headers
+    assert "X-Profile-ID" not in profiled.get("/sql").headers
@@ -0,0 +1,112 @@
+"""Programs: listing errors, template copy-on-write and conditional GETs."""
+from app.api.v1 import training
+from app.models.training import Program, ProgramTemplate
+from app.models.user import User
+from tests.conftest import auth_headers
+
+
+def test_a_failed_program_fetch_is_a_500_not_null(client, db, monkeypatch):
+    db.add(User(id="p1", email="p1@test.com", role="PLAYER"))
+    db.commit()
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(training, "serialize_programs", broken)
+    response = client.get("/api/v1/programs", headers=auth_headers("p1@test.com"))
+    assert (response.status_code, response.json()) == (500, {"detail": "Could not load programs"})
+
+
+def sessions(*drills):
+    return [{"day": 1, "drills": [{"drill_name": name, "duration": 10} for name in drills]}]
+
+
+def create_program(client, db):
+    db.add_all([
+        User(id="coach", email="coach@test.com", role="COACH", name="Coach"),
+        User(id="p1", email="p1@test.com", role="PLAYER", name="P1", coach_id="coach"),
+        User(id="p2", email="p2@test.com", role="PLAYER", name="P2", coach_id="coach"),
+    ])
+    db.commit()
+    body = {"title": "Base", "assigned_to": ["p1", "p2"], "status": "ACTIVE", "sessions": sessions("Serve", "Volley")}
+    return client.post("/api/v1/programs", json=body, headers=auth_headers("coach@test.com", "COACH")).json()["program_id"]
+
+
+def drills_seen(client, program_id, email, role="PLAYER"):
+    program = client.get(f"/api/v1/programs/{program_id}", headers=auth_headers(email, role)).json()
+    return [row["drill_name"] for row in program["schedule"]]
+
+
+def test_one_players_schedule_is_copied_on_write(client, db):
+    program_id = create_program(client, db)
+    coach = auth_headers("coach@test.com", "COACH")
+    url = f"/api/v1/programs/{program_id}/players/p1/schedule"
+    base_template = db.get(Program, program_id).template_id
+
+    override = client.put(url, json={"sessions": sessions("Serve", "Lob")}, headers=coach).json()
+    assert override["custom_schedule"] and override["template_id"] != base_template
+    assert drills_seen(client, program_id, "p1@test.com") == ["Serve", "Lob"]
+    # The shared template is untouched: everyone else still sees it
+    assert drills_seen(client, program_id, "p2@test.com") == ["Serve", "Volley"]
+    assert drills_seen(client, program_id, "coach@test.com", "COACH") == ["Serve", "Volley"]
+    assert {a["id"]: a["custom_schedule"] for a in client.get(f"/api/v1/programs/{program_id}", headers=coach).json()["assigned_to"]} == {
+        "p1": True, "p2": False,
+    }
+
+    # The same edited content for another player reuses the stored template
+    again = client.put(f"/api/v1/programs/{program_id}/players/p2/schedule", json={"sessions": sessions("Serve", "Lob")}, headers=coach).json()
+    assert again["template_id"] == override["template_id"]
+    assert db.query(ProgramTemplate).count() == 2
+
+    # DELETE drops the override; writing the program's own schedule back does too
+    assert client.delete(url, headers=coach).json()["custom_schedule"] is False
+    assert drills_seen(client, program_id, "p1@test.com") == ["Serve", "Volley"]
+    reset = client.put(f"/api/v1/programs/{program_id}/players/p2/schedule", json={"sessions": sessions("Serve", "Volley")}, headers=coach).json()
+    assert (reset["template_id"], reset["custom_schedule"]) == (base_template, False)
+    assert drills_seen(client, program_id, "p2@test.com") == ["Serve", "Volley"]
+
+    # Only the program's coach can override, and only for its assignees
+    assert client.put(url, json={"sessions": sessions("Lob")}, headers=auth_headers("p1@test.com")).status_code == 404
+    assert client.put(f"/api/v1/programs/{program_id}/players/p3/schedule", json={"sessions": sessions("Lob")}, headers=coach).status_code == 404
+
+
+def test_program_reads_revalidate_with_etags(client, db):
+    program_id = create_program(client, db)
+    url = f"/api/v1/programs/{program_id}"
+    p1, p2 = auth_headers("p1@test.com"), auth_headers("p2@test.com")
+
+    first = client.get(url, headers=p1)
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    for sent in (etag, f"W/{etag}", f'"stale", {etag}', "*"):
+        cached = client.get(url, headers={**p1, "If-None-Match": sent})
+        assert (cached.status_code, cached.content, cached.headers["ETag"]) == (304, b"", etag)
+    assert client.get(url, headers={**p1, "If-None-Match": '"stale"'}).status_code == 200
+
+    # Byte-identical views share a tag
+    assert client.get(url, headers=p2).headers["ETag"] == etag
+
+    # Any change to what p1 would see changes the tag
+    client.patch(f"{url}/status", json={"status": "COMPLETED"}, headers=p1)
+    edited = client.get(url, headers={**p1, "If-None-Match": etag})
+    assert edited.status_code == 200 and edited.json()["status"] == "COMPLETED"
+    assert edited.headers["ETag"] != etag
+    coach = auth_headers("coach@test.com", "COACH")
+    client.put(f"{url}/players/p1/schedule", json={"sessions": sessions("Lob")}, headers=coach)
+    rescheduled = client.get(url, headers={**p1, "If-None-Match": edited.headers["ETag"]})
+    assert rescheduled.status_code == 200 and [d["drill_name"] for d in rescheduled.json()["schedule"]] == ["Lob"]
+
+
+def test_summaries_count_without_shipping_schedules(client, db):
+    program_id = create_program(client, db)
+    coach = auth_headers("coach@test.com", "COACH")
+    client.patch(f"/api/v1/programs/{program_id}/status", json={"status": "COMPLETED"}, headers=auth_headers("p2@test.com"))
+    client.put(f"/api/v1/programs/{program_id}/players/p1/schedule", json={"sessions": sessions("Lob")}, headers=coach)
+
+    [summary] = client.get("/api/v1/programs/summary", headers=coach).json()
+    assert "schedule" not in summary and "assigned_to" not in summary
+    assert (summary["drill_count"], summary["total_minutes"], summary["assignee_count"]) == (2, 20, 2)
+    assert summary["status_counts"] == {"ACTIVE": 1, "COMPLETED": 1}
+    # A player's summary follows their own (overridden) schedule
+    [mine] = client.get("/api/v1/programs/summary", headers=auth_headers("p1@test.com")).json()
+    assert (mine["custom_schedule"], mine["drill_count"], mine["status"]) == (True, 1, "ACTIVE")
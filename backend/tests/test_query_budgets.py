@@ -0,0 +1,184 @@
+"""
+Query budgets for the hot read endpoints.
+
+Each test seeds a dataset of N and 10N rows and fails if the request
+exceeds its declared statement budget or if the statement count grows
+with the dataset (an N+1 regression).
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.user import User, Squad, SquadMember
+from app.models.training import (
+    Drill, Program, ProgramSession, ProgramAssignment, SessionLog, DrillPerformance, SquadAttendance,
+)
+from app.services import activity_feed, attendance, notifications
+from app.services.program_templates import get_or_create_template
+from tests.conftest import auth_headers
+
+
+def seed_roster(db, n):
+    """A coach with n players, n drills, n programs (3 sessions each) and one squad."""
+    coach = User(id="coach", email="coach@test.com", role="COACH", name="Coach", xp=0)
+    db.add(coach)
+    players = [
+        User(id=f"player{i}", email=f"player{i}@test.com", role="PLAYER", name=f"Player {i}", coach_id=coach.id, xp=i)
+        for i in range(n)
+    ]
+    db.add_all(players)
+    db.add_all([Drill(id=f"drill{i}", name=f"Drill {i}", category="Serve", difficulty="Beginner") for i in range(n)])
+
+    squad = Squad(id="squad", name="Squad", coach_id=coach.id)
+    db.add(squad)
+    db.add_all([SquadMember(squad_id=squad.id, player_id=p.id) for p in players])
+
+    now = datetime.utcnow()
+    for i in range(n):
+        program = Program(id=f"prog{i}", title=f"Program {i}", creator_id=coach.id, squad_id=squad.id, created_at=now + timedelta(minutes=i))
+        db.add(program)
+        schedule = [dict(day_order=d, drill_id=f"drill{i}", drill_name=f"Drill {i}", duration_minutes=10) for d in range(3)]
+        if i % 2:
+            # Mix shared templates with legacy per-program rows
+            program.template_id = get_or_create_template(db, [dict(row, notes="", target_value=None, target_prompt=None) for row in schedule])
+        else:
+            db.add_all([ProgramSession(program_id=program.id, **row) for row in schedule])
+        db.add_all([ProgramAssignment(program_id=program.id, coach_id=coach.id, player_id=p.id, status="ACTIVE") for p in players])
+
+    db.add_all([SquadAttendance(squad_id=squad.id, player_id=p.id, date=now) for p in players])
+    attendance.record_attendance(db, squad.id, [p.id for p in players], now.date())
+    for p in players:
+        for j in range(2):
+            log = SessionLog(id=f"log-{p.id}-{j}", player_id=p.id, program_id=f"prog{j % n}", duration_minutes=30, rpe=5, date_completed=now - timedelta(hours=j))
+            db.add(log)
+            perfs = [DrillPerformance(id=f"perf-{log.id}-{k}", session_log_id=log.id, drill_id=f"drill{k % n}", outcome="success", achieved_value=k) for k in range(2)]
+            db.add_all(perfs)
+            activity_feed.publish_activity(db, p, activity_feed.SESSION_LOG, "Logged a training session", log.id,
+                                           activity_feed.session_log_payload(db, log, perfs, drill_names={}), created_at=log.date_completed)
+            # Both logs land in one digest row per player
+            notifications.notify(db, coach.id, "Session logged", f"{p.name} logged a session", "SESSION_LOG", p.id, p.id)
+
+    return {
+        "coach": auth_headers(coach.email, coach.role),
+        "player": auth_headers(players[0].email, players[0].role),
+        "squad_id": squad.id,
+    }
+
+
+def get_as(role, url):
+    def request(client, ctx):
+        return client.get(url.format(**ctx), headers=ctx[role])
+    return request
+
+
+# +1 statement each for the template cache miss alongside legacy program_sessions
+@pytest.mark.query_budget(6)
+def test_programs_as_coach(query_budget):
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/programs"))
+
+
+@pytest.mark.query_budget(7)
+def test_programs_as_player(query_budget):
+    query_budget.check(seed_roster, get_as("player", "/api/v1/programs"))
+
+
+# +1 for the cold archive manifest (archived sessions count towards progress)
+@pytest.mark.query_budget(8)
+def test_my_squads(query_budget):
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/squads"))
+
+
+@pytest.mark.query_budget(5)
+def test_squad_leaderboard(query_budget):
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/squads/{squad_id}/leaderboard"))
+
+
+@pytest.mark.query_budget(2)
+def test_coach_activity(query_budget):
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/coach/activity"))
+
+
+@pytest.mark.query_budget(2)
+def test_coach_feed(query_budget):
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/coach/feed?limit=5"))
+
+
+# +1 for the cold archive manifest
+@pytest.mark.query_budget(4)
+def test_my_session_logs(query_budget):
+    query_budget.check(seed_roster, get_as("player", "/api/v1/my-session-logs"))
+
+
+@pytest.mark.query_budget(1)
+def test_drill_search(query_budget):
+    # Cold index: one load of the drill table, then everything is in memory
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/drills/search?q=dri&category=Serve"))
+
+
+@pytest.mark.query_budget(19)
+def test_sync_from_scratch(query_budget):
+    # Every collection changed at once: one batched load per collection, independent of N
+    # (squads cost what /squads does - same payload, program progress included - plus the purge horizon check)
+    query_budget.check(seed_roster, get_as("player", "/api/v1/sync?since=WzBd"))
+
+
+@pytest.mark.query_budget(3)
+def test_global_leaderboard(query_budget):
+    # Cold board: one query to build it, one for the names on the page
+    query_budget.check(seed_roster, get_as("player", "/api/v1/leaderboard?around=2"))
+
+
+@pytest.mark.query_budget(6)
+def test_generate_program(query_budget):
+    # Cold caches: user, drill index, drill history, stored-plan lookup, then insert + commit of the result
+    def request(client, ctx):
+        return client.post("/api/v1/ai/programs", json={"prompt": "serve consistency", "weeks": 4}, headers=ctx["player"])
+    query_budget.check(seed_roster, request)
+
+
+@pytest.mark.query_budget(5)
+def test_program_summaries_as_coach(query_budget):
+    # user, programs + creator names, template totals, legacy totals, status breakdown
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/programs/summary"))
+
+
+@pytest.mark.query_budget(5)
+def test_program_summaries_as_player(query_budget):
+    query_budget.check(seed_roster, get_as("player", "/api/v1/programs/summary"))
+
+
+@pytest.mark.query_budget(7)
+def test_program_detail_as_player(query_budget):
+    query_budget.check(seed_roster, get_as("player", "/api/v1/programs/prog1"))
+
+
+@pytest.mark.query_budget(4)
+def test_attendance_stats(query_budget):
+    # user, squad, members, one bitmap read for the whole range
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/squads/{squad_id}/attendance/stats"))
+
+
+@pytest.mark.query_budget(4)
+def test_attendance_heatmap(query_budget):
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/squads/{squad_id}/attendance/heatmap"))
+
+
+@pytest.mark.query_budget(2)
+def test_unread_notification_counts(query_budget):
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/notifications/unread-counts"))
+
+
+@pytest.mark.query_budget(2)
+def test_notification_inbox(query_budget):
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/notifications/"))
+
+
+# One auth lookup, then each section's own queries (vs. five requests authenticating five times)
+@pytest.mark.query_budget(15)
+def test_player_dashboard(query_budget):
+    query_budget.check(seed_roster, get_as("player", "/api/v1/dashboard"))
+
+
+@pytest.mark.query_budget(16)
+def test_coach_dashboard(query_budget):
+    query_budget.check(seed_roster, get_as("coach", "/api/v1/dashboard"))
@@ -0,0 +1,97 @@
+"""Rate limiting (429) and admission control (503)."""
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import rate_limit
+from app.core.rate_limit import AdmissionControl, LocalBucketStore, RateLimitMiddleware
+from tests.conftest import auth_headers
+
+POLLED = ("/api/v1/sync", "/api/v1/notifications/unread-counts")
+
+
+def limited(limits, admission=None):
+    api = FastAPI()
+
+    @api.get("/api/v1/sync")
+    def sync():
+        return {"ok": True}
+
+    @api.get("/api/v1/notifications/unread-counts")
+    def unread():
+        return {"ok": True}
+
+    @api.get("/api/v1/drills")
+    def drills():
+        return {"ok": True}
+
+    @api.post("/api/v1/auth/login")
+    def login():
+        return {"ok": True}
+
+    middleware = RateLimitMiddleware(api, limits=limits, store=LocalBucketStore(), polling_routes=POLLED,
+                                     admission=admission or AdmissionControl(limit=0), enabled=True)
+    return TestClient(middleware), middleware
+
+
+def per_minute(n):
+    return rate_limit.parse_limit(f"{n}/60")
+
+
+def test_empty_bucket_gets_429_with_retry_after():
+    client, _ = limited({rate_limit.READ: per_minute(2)})
+    player = auth_headers("p1@test.com")
+    assert [client.get("/api/v1/drills", headers=player).status_code for _ in range(2)] == [200, 200]
+
+    refused = client.get("/api/v1/drills", headers=player)
+    assert refused.status_code == 429
+    assert 1 <= int(refused.headers["Retry-After"]) <= 30  # one token every 30 s
+    # Buckets are per user; classes without a limit aren't charged
+    assert client.get("/api/v1/drills", headers=auth_headers("p2@test.com")).status_code == 200
+    assert client.get("/api/v1/sync", headers=player).status_code == 200
+
+
+def test_each_polled_route_has_its_own_bucket():
+    client, _ = limited({rate_limit.POLL: per_minute(2)})
+    player = auth_headers("p1@test.com")
+    assert [client.get("/api/v1/sync", headers=player).status_code for _ in range(3)] == [200, 200, 429]
+    # The badge keeps polling while /sync is being throttled
+    assert [client.get("/api/v1/notifications/unread-counts", headers=player).status_code for _ in range(2)] == [200, 200]
+
+
+def test_auth_is_limited_per_ip_whatever_the_token():
+    client, _ = limited({rate_limit.AUTH: per_minute(1)})
+    assert client.post("/api/v1/auth/login", headers=auth_headers("p1@test.com")).status_code == 200
+    assert client.post("/api/v1/auth/login", headers=auth_headers("p2@test.com")).status_code == 429
+
+
+def test_full_house_sheds_with_503():
+    admission = AdmissionControl(limit=2, queue_size=0, queue_seconds=0.01, poll_share=0.5)
+    client, _ = limited({}, admission)
+    admission.in_flight = 1  # one request already running
+
+    polled = client.get("/api/v1/sync")
+    assert polled.status_code == 503 and polled.headers["Retry-After"] == "1"  # polls only get half the slots
+    assert client.get("/api/v1/drills").status_code == 200
+    assert admission.in_flight == 1  # the slot was given back
+
+    admission.in_flight = 2
+    assert client.get("/api/v1/drills").status_code == 503  # no queue to wait in
+
+
+def test_freed_slot_goes_to_the_longest_waiter():
+    async def scenario():
+        admission = AdmissionControl(limit=1, queue_size=2, queue_seconds=1)
+        assert await admission.acquire(rate_limit.READ) is None
+        waiter = asyncio.ensure_future(admission.acquire(rate_limit.WRITE))
+        await asyncio.sleep(0)
+        assert await admission.acquire(rate_limit.POLL) == "overloaded"  # polls never queue
+        admission.release()
+        assert await waiter is None
+        assert admission.in_flight == 1
+        # Nobody releases this time: the waiter gives up after queue_seconds
+        admission.queue_seconds = 0.01
+        assert await admission.acquire(rate_limit.READ) == "queue_timeout"
+
+    asyncio.run(scenario())
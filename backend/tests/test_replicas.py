@@ -0,0 +1,76 @@
+"""Read replicas: where GETs read from, read-your-writes and the lag cut-off."""
+import time
+from datetime import datetime
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core import replicas
+from app.core.database import Base, get_read_db, make_engine
+from app.models.replication import ReplicaHeartbeat
+from tests.conftest import auth_headers
+
+
+@pytest.fixture
+def replica_setup(tmp_path):
+    primary = make_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    Base.metadata.create_all(primary)
+    replica_set = replicas.ReplicaSet({"r1": f"sqlite:///{tmp_path / 'replica.db'}"}, max_lag=10, enabled=True)
+    Base.metadata.create_all(replica_set.engines["r1"])
+    yield replica_set, sessionmaker(bind=primary)
+    replica_set.dispose()
+    primary.dispose()
+
+
+def routed(replica_set, sticky_seconds=60):
+    api = FastAPI()
+
+    @api.get("/where")
+    def where(db: Session = Depends(get_read_db)):
+        return {"replica": str(db.get_bind().url).endswith("replica.db")}
+
+    @api.post("/save")
+    def save():
+        return {"ok": True}
+
+    middleware = replicas.ReadRoutingMiddleware(api, replicas=replica_set, sticky=replicas.LocalStickyStore(), sticky_seconds=sticky_seconds)
+    return TestClient(middleware)
+
+
+def reads_replica(client, email):
+    return client.get("/where", headers=auth_headers(email)).json()["replica"]
+
+
+def test_writers_read_their_own_writes_from_the_primary(replica_setup):
+    client = routed(replica_setup[0], sticky_seconds=0.2)
+    assert reads_replica(client, "p1@test.com")
+
+    client.post("/save", headers=auth_headers("p1@test.com"))
+    assert not reads_replica(client, "p1@test.com")
+    assert reads_replica(client, "p2@test.com")  # only the writer is pinned
+
+    time.sleep(0.3)
+    assert reads_replica(client, "p1@test.com")
+
+    # Anonymous writes have nobody to pin
+    client.post("/save")
+    assert client.get("/where").json()["replica"]
+
+
+def test_lagging_replicas_are_skipped(replica_setup):
+    replica_set, primary_factory = replica_setup
+    client = routed(replica_set)
+
+    # No heartbeat has reached the replica yet
+    assert replica_set.check_lag(primary_factory) == {"r1": float("inf")}
+    assert not reads_replica(client, "p1@test.com")
+
+    # Replication catches up: the replica sees a recent beat
+    replica = replica_set.factories["r1"]()
+    replica.merge(ReplicaHeartbeat(id=1, beat_at=datetime.utcnow()))
+    replica.commit()
+    replica.close()
+    assert replica_set.check_lag(primary_factory)["r1"] < 10
+    assert reads_replica(client, "p1@test.com")
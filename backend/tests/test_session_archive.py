@@ -0,0 +1,148 @@
+"""Session cold archive: what readers see after archiving, pruning and failed writes."""
+import os
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from app.models.training import DrillPerformance, Program, SessionArchiveSegment, SessionLog
+from app.models.user import User
+from app.services import session_archive
+
+CUTOFF = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_archive.SEGMENTS, "root", str(tmp_path))
+    session_archive.SEGMENTS.clear()
+    yield tmp_path
+    session_archive.SEGMENTS.clear()
+
+
+def seed(db):
+    db.add_all([User(id="p1", email="p1@test.com", role="PLAYER"), User(id="p2", email="p2@test.com", role="PLAYER")])
+    db.add_all([Program(id="prog-a", title="A", creator_id="p1"), Program(id="prog-b", title="B", creator_id="p1")])
+    rows = [
+        # player, program, completed, performances (drill, outcome, value)
+        ("p1", "prog-a", datetime(2023, 3, 1), [("serve", "success", 8), ("volley", "fail", None)]),
+        ("p1", "prog-a", datetime(2023, 9, 1), [("serve", "fail", 3)]),
+        ("p1", "prog-b", datetime(2024, 2, 1), [("serve", "success", 10), ("lob", "success", 4)]),
+        ("p1", None, datetime(2024, 6, 1), []),
+        ("p1", "prog-a", datetime(2025, 6, 1), [("serve", "success", 7)]),  # recent: stays hot
+        ("p2", "prog-b", datetime(2024, 5, 1), [("volley", "success", 5)]),
+    ]
+    for n, (player, program, completed, perfs) in enumerate(rows):
+        log = SessionLog(id=f"log-{n}", player_id=player, program_id=program, session_id=n, date_completed=completed,
+                         duration_minutes=30 + n, rpe=n % 10, notes=f"note {n}" if n % 2 else None)
+        log.drill_performances = [
+            DrillPerformance(id=f"perf-{n}-{i}", drill_id=drill, outcome=outcome, achieved_value=value)
+            for i, (drill, outcome, value) in enumerate(perfs)
+        ]
+        db.add(log)
+    db.commit()
+
+
+def hot_logs(db, player_id):
+    return db.query(SessionLog).filter(SessionLog.player_id == player_id).all()
+
+
+def shape(logs):
+    return sorted(
+        (log.id, log.program_id, log.session_id, log.date_completed, log.duration_minutes, log.rpe, log.notes,
+         sorted((p.id, p.drill_id, p.outcome, p.achieved_value) for p in log.drill_performances))
+        for log in logs
+    )
+
+
+def old_totals(db):
+    """What the archive readers should report, computed from the hot rows before archiving."""
+    old = db.query(SessionLog).filter(SessionLog.date_completed < CUTOFF).all()
+    totals, programs, outcomes = {}, Counter(), {}
+    for log in old:
+        sessions, achieved = totals.get(log.player_id, (0, 0))
+        totals[log.player_id] = (sessions + 1, achieved + sum(p.achieved_value or 0 for p in log.drill_performances))
+        if log.program_id:
+            programs[(log.program_id, log.player_id)] += 1
+        for p in log.drill_performances if log.player_id == "p1" else []:
+            ok, n = outcomes.get(p.drill_id, (0, 0))
+            outcomes[p.drill_id] = (ok + (p.outcome == "success"), n + 1)
+    return totals, programs, outcomes
+
+
+def test_archived_history_reads_back_like_the_hot_rows(db, archive_dir):
+    seed(db)
+    before = {player: shape(hot_logs(db, player)) for player in ("p1", "p2")}
+    totals, programs, outcomes = old_totals(db)
+
+    assert session_archive.archive_history(db, before=CUTOFF) == (3, 5)  # p1 2023 + 2024, p2 2024
+    db.expire_all()
+    assert [log.id for log in hot_logs(db, "p1")] == ["log-4"]
+    assert db.query(DrillPerformance).count() == 1
+
+    for player in ("p1", "p2"):
+        merged = session_archive.with_archived_logs(db, player, hot_logs(db, player))
+        assert shape(merged) == before[player]
+        assert [log.date_completed for log in merged] == sorted((log.date_completed for log in merged), reverse=True)
+    assert session_archive.player_totals(db, ["p1", "p2"]) == totals == {"p1": (4, 25), "p2": (1, 5)}
+    assert session_archive.program_session_counts(db, ["p1", "p2"], ["prog-a", "prog-b"]) == programs
+    assert session_archive.drill_outcomes(db, "p1") == outcomes == {"serve": (2, 3), "volley": (0, 1), "lob": (1, 1)}
+
+    # Archiving more of a season writes a new version that keeps the earlier logs
+    db.add(SessionLog(id="late", player_id="p1", program_id="prog-a", date_completed=datetime(2024, 12, 1)))
+    db.commit()
+    first = db.get(SessionArchiveSegment, ("p1", 2024)).path
+    assert session_archive.archive_history(db, before=CUTOFF) == (1, 1)
+    entry = db.get(SessionArchiveSegment, ("p1", 2024))
+    assert entry.path != first and entry.sessions == 3
+    assert session_archive.player_totals(db, ["p1"]) == {"p1": (5, 25)}
+
+
+def test_prune_removes_only_unreferenced_directories_past_the_grace(db, archive_dir):
+    seed(db)
+    session_archive.archive_history(db, before=CUTOFF)
+    superseded = db.get(SessionArchiveSegment, ("p1", 2024)).path
+    db.add(SessionLog(id="late", player_id="p1", date_completed=datetime(2024, 12, 1)))
+    db.commit()
+    session_archive.archive_history(db, before=CUTOFF)
+
+    referenced = [entry.path for entry in db.query(SessionArchiveSegment)]
+    assert superseded not in referenced
+    # Readers may still be on the old version: nothing goes inside the grace period
+    assert session_archive.prune(referenced, grace=3600) == 0
+    assert session_archive.prune(referenced, grace=0) == 1
+    assert not os.path.exists(archive_dir / superseded)
+    assert all(os.path.isdir(archive_dir / path) for path in referenced)
+    session_archive.SEGMENTS.clear()
+    assert len(session_archive.with_archived_logs(db, "p1", hot_logs(db, "p1"))) == 6
+
+
+def test_a_failed_segment_write_keeps_the_hot_rows(db, archive_dir, monkeypatch):
+    seed(db)
+    before = shape(hot_logs(db, "p1"))
+
+    def full_disk(self, directory):
+        os.makedirs(f"{directory}.tmp")
+        raise OSError(28, "No space left on device")
+
+    with monkeypatch.context() as patched, pytest.raises(OSError):
+        patched.setattr(session_archive.Segment, "write", full_disk)
+        session_archive.archive_history(db, before=CUTOFF)
+    db.rollback()
+    db.expire_all()
+    assert shape(hot_logs(db, "p1")) == before
+    assert db.query(SessionArchiveSegment).count() == 0
+
+    # A failed manifest commit takes its (fully written) segment with it
+    def failing_commit():
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(db, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        session_archive.archive_history(db, before=CUTOFF)
+    db.expire_all()
+    assert shape(hot_logs(db, "p1")) == before
+    assert not any(name for name in os.listdir(archive_dir / "p1") if not name.endswith(".tmp"))
+
+    # The staging directory left by the first failure is swept once past the grace
+    assert session_archive.prune([], grace=0) == 1
@@ -0,0 +1,35 @@
+"""Session logging: the offline batch upload."""
+from app.models.training import SessionLog, XpLedgerEntry
+from app.models.user import User
+from tests.conftest import auth_headers
+
+
+def test_batch_upload_mixed_valid_and_invalid(client, db, test_db):
+    db.add(User(id="p1", email="p1@test.com", role="PLAYER", name="P1", xp=0))
+    db.commit()
+    batch = {"sessions": [
+        {"client_id": "a", "duration_minutes": 30, "rpe": 5},
+        {"client_id": "b", "duration_minutes": 10, "rpe": 11},  # rpe out of range
+        {"client_id": "c", "duration_minutes": 20, "rpe": 7, "drill_performances": [{"drill_id": "d1", "outcome": "success", "achieved_value": 3}]},
+        {"client_id": "d", "duration_minutes": -5, "rpe": 2},  # negative duration
+    ]}
+
+    with test_db.counter:
+        response = client.post("/api/v1/sessions/batch", json=batch, headers=auth_headers("p1@test.com"))
+    assert response.status_code == 200, response.text
+    body = response.json()
+
+    assert [(r["client_id"], r["status"]) for r in body["results"]] == [("a", "created"), ("b", "rejected"), ("c", "created"), ("d", "rejected")]
+    assert [r["index"] for r in body["results"]] == [0, 1, 2, 3]
+    assert body["created"] == 2
+    assert len(batch["sessions"]) - body["created"] == 2
+    assert body["xp_earned"] == 300 + 200
+    assert body["xp"] == 500
+
+    # One increment on the cached total, one ledger row per created session
+    increments = [s for s in test_db.counter.statements if s.startswith("UPDATE users SET xp")]
+    assert len(increments) == 1
+    db.expire_all()
+    assert db.get(User, "p1").xp == 500
+    assert db.query(SessionLog).filter(SessionLog.player_id == "p1").count() == 2
+    assert sorted(amount for (amount,) in db.query(XpLedgerEntry.amount).filter(XpLedgerEntry.user_id == "p1")) == [200, 300]
@@ -0,0 +1,139 @@
+"""Per-club shards: request routing, the write freeze and an online club move."""
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core import sharding
+from app.core.database import Base, get_db, make_engine
+from app.core.security import create_access_token
+from app.models.training import SessionLog
+from app.models.user import MatchEntry, User
+from app.services import match_search, shard_moves
+
+
+@pytest.fixture
+def shards(tmp_path):
+    registry = sharding.ShardRegistry({name: f"sqlite:///{tmp_path / name}.db" for name in ("east", "west")})
+    main = make_engine(f"sqlite:///{tmp_path / 'main.db'}")
+    for bind in (main, registry.engine("east"), registry.engine("west")):
+        Base.metadata.create_all(bind)
+    directory = sharding.ShardDirectory(ttl=60, session_factory=sessionmaker(bind=main))
+    yield registry, directory
+    registry.dispose()
+    main.dispose()
+
+
+def routed(registry, directory):
+    api = FastAPI()
+
+    @api.get("/where")
+    def where(db: Session = Depends(get_db)):
+        return {"database": str(db.get_bind().url), "shard": sharding.CURRENT_PLACEMENT.get().shard}
+
+    @api.post("/write")
+    def write():
+        return {"ok": True}
+
+    return TestClient(sharding.ShardRoutingMiddleware(api, registry=registry, directory=directory))
+
+
+def bearer(club=None):
+    claims = {"sub": "p@test.com", **({sharding.CLUB_CLAIM: club} if club else {})}
+    return {"Authorization": f"Bearer {create_access_token(claims)}"}
+
+
+def test_requests_use_their_clubs_shard(shards):
+    registry, directory = shards
+    directory.assign("club-east", "east")
+    client = routed(registry, directory)
+
+    east = client.get("/where", headers=bearer("club-east")).json()
+    assert east["shard"] == "east" and east["database"].endswith("east.db")
+    # Unlisted clubs and tokens from before sharding stay on the main database
+    for headers in (bearer("club-elsewhere"), bearer(), {}):
+        assert client.get("/where", headers=headers).json()["shard"] == sharding.DEFAULT_SHARD
+
+
+def test_writes_wait_while_a_club_moves(shards):
+    registry, directory = shards
+    directory.assign("club-east", "east", sharding.MOVING)
+    client = routed(registry, directory)
+
+    refused = client.post("/write", headers=bearer("club-east"))
+    assert refused.status_code == 503
+    assert int(refused.headers["Retry-After"]) >= 1
+    assert client.get("/where", headers=bearer("club-east")).status_code == 200  # reads carry on
+    assert client.post("/write", headers=bearer("club-other")).status_code == 200
+
+
+def test_club_of_follows_the_coach_chain(shards):
+    registry, _ = shards
+    db = registry.session_factory("east")()
+    db.add_all([
+        User(id="head", email="head@test.com", role="COACH"),
+        User(id="assistant", email="assistant@test.com", role="COACH", coach_id="head"),
+        User(id="player", email="player@test.com", role="PLAYER", coach_id="assistant"),
+    ])
+    db.commit()
+    assert sharding.club_of(db, db.get(User, "player")) == "head"
+    assert sharding.club_of(db, db.get(User, "head")) == "head"
+    db.close()
+
+
+def test_move_club_copies_switches_and_purges(shards, monkeypatch):
+    registry, directory = shards
+    monkeypatch.setattr(shard_moves, "SHARDS", registry)
+    monkeypatch.setattr(shard_moves, "DIRECTORY", directory)
+    directory.assign("head", "east")
+    east = registry.session_factory("east")()
+    east.add_all([
+        User(id="head", email="head@test.com", role="COACH"),
+        User(id="player", email="player@test.com", role="PLAYER", coach_id="head"),
+        User(id="stranger", email="stranger@test.com", role="PLAYER"),
+        SessionLog(id="log1", player_id="player", duration_minutes=30, rpe=5),
+    ])
+    east.commit()
+
+    frozen = []
+    result = shard_moves.move_club("head", "west", wait=lambda step: frozen.append(directory.lookup("head").state))
+
+    assert frozen == [sharding.MOVING, sharding.ACTIVE]  # writes refused during the catch-up, not after the switch
+    placement = directory.lookup("head")
+    assert (placement.shard, placement.state, placement.moves) == ("west", sharding.ACTIVE, 2)
+    west = registry.session_factory("west")()
+    assert {u.id for u in west.query(User)} == {"head", "player"}
+    assert west.get(SessionLog, "log1").player_id == "player"
+    east.expire_all()
+    assert {u.id for u in east.query(User)} == {"stranger"}  # purged, other clubs untouched
+    assert result["purged"] == 3
+    west.close()
+    east.close()
+
+
+def test_moved_matches_stay_searchable_and_leave_no_index_behind(shards, monkeypatch):
+    registry, directory = shards
+    monkeypatch.setattr(shard_moves, "SHARDS", registry)
+    monkeypatch.setattr(shard_moves, "DIRECTORY", directory)
+    directory.assign("head", "east")
+    east = registry.session_factory("east")()
+    east.add_all([
+        User(id="head", email="head@test.com", role="COACH"),
+        User(id="player", email="player@test.com", role="PLAYER", coach_id="head"),
+        User(id="stranger", email="stranger@test.com", role="PLAYER"),
+    ])
+    diary = MatchEntry(id="m1", user_id="player", event_name="Club night", opponent_name="Federer")
+    east.add(diary)
+    match_search.index_match(east, diary)
+    east.commit()
+
+    shard_moves.move_club("head", "west", wait=lambda step: None)
+
+    west = registry.session_factory("west")()
+    assert [m["id"] for m in match_search.search_matches(west, ["player"], "Federer")] == ["m1"]
+    # A new match on the source takes the purged row's rowid before it is indexed
+    east.add(MatchEntry(id="m2", user_id="stranger", event_name="Ladder", opponent_name="Someone"))
+    east.commit()
+    assert match_search.search_matches(east, ["stranger"], "Federer") == []
+    west.close()
+    east.close()
@@ -0,0 +1,70 @@
+"""Delta sync: the settle window on the change log cursor, and payload shapes."""
+from datetime import datetime, timedelta
+
+from app.models.activity import ChangeLogEntry
+from app.models.user import Squad, SquadMember, User
+from app.services import sync
+from tests.conftest import auth_headers
+
+
+def test_cursor_stops_before_changes_that_may_still_commit(db, monkeypatch):
+    monkeypatch.setattr(sync, "SETTLE", timedelta(seconds=30))
+    now = datetime.utcnow()
+    db.execute(ChangeLogEntry.__table__.insert(), [
+        {"seq": 1, "user_id": "p1", "entity": "matches", "entity_id": "m1", "op": "upsert", "created_at": now - timedelta(minutes=5)},
+        # seq 2 was allocated recently; on MySQL seq 3 can be visible before it commits
+        {"seq": 2, "user_id": "p1", "entity": "matches", "entity_id": "m2", "op": "upsert", "created_at": now},
+        {"seq": 3, "user_id": sync.BROADCAST, "entity": "drills", "entity_id": "d1", "op": "upsert", "created_at": now - timedelta(minutes=1)},
+    ])
+    db.commit()
+
+    changes, last_seq, has_more = sync.read_changes(db, "p1", 0)
+    assert (changes, last_seq, has_more) == ({"matches": {"m1": "upsert"}}, 1, False)
+    assert sync.latest_seq(db, "p1") == 1  # a reset token must not jump past seq 2 either
+
+    monkeypatch.setattr(sync, "SETTLE", timedelta(0))
+    changes, last_seq, has_more = sync.read_changes(db, "p1", last_seq, limit=1)
+    assert (changes, last_seq, has_more) == ({"matches": {"m2": "upsert"}}, 2, True)
+    changes, last_seq, has_more = sync.read_changes(db, "p1", last_seq, limit=1)
+    assert (changes, last_seq, has_more) == ({"drills": {"d1": "upsert"}}, 3, False)
+    assert sync.latest_seq(db, "p1") == 3
+
+
+def test_synced_squads_match_the_squads_endpoint(client, db):
+    db.add(User(id="coach", email="coach@test.com", role="COACH", name="Coach"))
+    db.add(User(id="p1", email="p1@test.com", role="PLAYER", name="P1", coach_id="coach"))
+    db.add(Squad(id="squad", name="Juniors", level="Beginner", coach_id="coach"))
+    db.add(SquadMember(squad_id="squad", player_id="p1"))
+    db.commit()
+    headers = auth_headers("coach@test.com", "COACH")
+
+    synced = client.get("/api/v1/sync", params={"since": sync.encode_token(0)}, headers=headers).json()
+    assert synced["changes"]["squads"] == {"upserts": client.get("/api/v1/squads", headers=headers).json(), "deletes": []}
+    assert synced["changes"]["squads"]["upserts"][0]["member_count"] == 1
+
+
+def test_tokens_from_before_the_purge_horizon_are_reset(client, db):
+    db.add(User(id="p1", email="p1@test.com", role="PLAYER", name="P1"))
+    db.commit()
+    old = datetime.utcnow() - sync.RETENTION - timedelta(days=1)
+    db.query(ChangeLogEntry).update({"created_at": old})  # the profile row
+    db.execute(ChangeLogEntry.__table__.insert(), [
+        {"user_id": "p1", "entity": "matches", "entity_id": f"m{n}", "op": "delete", "created_at": old} for n in range(5)
+    ])
+    db.commit()
+    headers = auth_headers("p1@test.com")
+
+    def sync_since(seq):
+        return client.get("/api/v1/sync", params={"since": sync.encode_token(seq)}, headers=headers).json()
+
+    newest = sync.latest_seq(db, "p1")
+    assert not sync_since(newest - 3)["reset"]
+
+    # Everything old goes but the newest row, which marks where the log now starts
+    assert sync.purge_change_log(db, batch_size=2) == 5
+    assert sync.purge_change_log(db) == 0
+    assert db.query(ChangeLogEntry.seq).all() == [(newest,)]
+    stale = sync_since(newest - 3)
+    assert stale["reset"] and stale["next"] == sync.encode_token(newest)
+    assert sync_since(newest - 1)["changes"] == {"matches": {"upserts": [], "deletes": ["m4"]}}
+    assert not sync_since(newest)["reset"]
@@ -0,0 +1,44 @@
+"""XP ledger: awards, weekly compaction and reconciling the cached total."""
+from datetime import date, datetime, timedelta
+
+from app.models.training import XpLedgerEntry, XpSnapshot
+from app.models.user import User
+from app.services import xp
+
+NOW = datetime(2026, 6, 17, 12, 0)  # a Wednesday
+
+
+def test_compaction_keeps_every_period_total(db):
+    player = User(id="p1", email="p1@test.com", role="PLAYER", xp=0)
+    db.add(player)
+    db.commit()
+    old_monday = NOW - timedelta(days=100)
+    xp.award_xp(db, player, [(100, xp.SESSION_LOG, "a"), (50, xp.SESSION_LOG, "b")], at=old_monday)
+    xp.award_xp(db, player, [(30, xp.SESSION_LOG, "c")], at=old_monday + timedelta(days=1))
+    xp.award_xp(db, player, [(20, xp.SESSION_LOG, "d"), (0, xp.SESSION_LOG, "nothing")], at=NOW - timedelta(days=1))
+    db.commit()
+    db.refresh(player)
+    assert player.xp == 200
+    assert db.query(XpLedgerEntry).count() == 4  # zero awards leave no row
+
+    before = {period: xp.xp_between(db, "p1", *xp.period_bounds(period, NOW)) for period in ("week", "season", "all")}
+    assert xp.compact_ledger(db, now=NOW) == 3
+    assert xp.compact_ledger(db, now=NOW) == 0
+
+    snapshots = db.query(XpSnapshot.period_start, XpSnapshot.amount, XpSnapshot.entries).all()
+    assert snapshots == [(xp.week_start(old_monday), 180, 3)]
+    assert [e.reference_id for e in db.query(XpLedgerEntry)] == ["d"]  # recent rows stay raw
+    assert {period: xp.xp_between(db, "p1", *xp.period_bounds(period, NOW)) for period in before} == before == {
+        "week": 20, "season": 200, "all": 200,
+    }
+
+
+def test_reconcile_resets_drifted_totals(db):
+    db.add_all([User(id="p1", email="p1@test.com", role="PLAYER", xp=999), User(id="p2", email="p2@test.com", role="PLAYER", xp=40)])
+    db.add(XpSnapshot(user_id="p1", period_start=date(2026, 1, 5), amount=300, entries=2))
+    db.add(XpLedgerEntry(user_id="p1", amount=25, source=xp.SESSION_LOG, created_at=NOW))
+    db.add(XpLedgerEntry(user_id="p2", amount=40, source=xp.SESSION_LOG, created_at=NOW))
+    db.commit()
+
+    assert xp.reconcile_totals(db) == 1
+    assert {u.id: u.xp for u in db.query(User)} == {"p1": 325, "p2": 40}